@@ -0,0 +1,153 @@
+"""
+Adaptive adb timeouts - derived per device and operation from the latency actually observed
+
+    policy = TimeoutPolicy()
+    timeout = policy.timeout("signal", device_id, SIGNAL_TIMEOUT)
+    ...
+    policy.observe("signal", device_id, process.elapsed)   # or policy.timed_out(...)
+
+Each (device, operation) pair keeps a smoothed latency and its mean
+deviation, updated the way TCP estimates its retransmission timeout
+(Jacobson/Karels): timeout = smoothed + K * deviation, clamped to the
+operation's floor and ceiling. Until MIN_SAMPLES calls have finished the
+fixed default is used. A timeout doubles the next one (up to the ceiling)
+until a call completes again, so a device that merely got slower is not
+failed over and over.
+"""
+
+import threading
+
+from fpk_metrics import REGISTRY
+
+# Smoothing gains for the latency and its deviation
+ALPHA = 0.125
+BETA = 0.25
+
+# Deviations added on top of the smoothed latency
+K = 4.0
+
+# Completed calls needed before the estimate replaces the fixed default
+MIN_SAMPLES = 5
+
+# Operation -> (floor, ceiling) in seconds; the ceilings leave room for hubs slower than the old constants
+OPERATION_LIMITS = {
+    "version": (1.0, 10.0),
+    "devices": (1.0, 20.0),
+    "shell": (1.0, 20.0),
+    "signal": (1.0, 20.0),
+    "button": (1.5, 20.0),
+    "push": (3.0, 60.0),
+    "chmod": (1.0, 30.0),
+    "screencap": (1.0, 30.0),
+    "batch_write": (0.01, 1.0),  # per write on top of one signal invocation
+    "press": (0.01, 2.0),  # per press on top of one button invocation
+}
+DEFAULT_LIMITS = (1.0, 30.0)
+
+
+class LatencyEstimator:
+    """Smoothed latency and mean deviation of one operation on one device."""
+
+    __slots__ = ("floor", "ceiling", "smoothed", "deviation", "samples", "backoff", "timeouts")
+
+    def __init__(self, floor, ceiling):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.smoothed = None
+        self.deviation = 0.0
+        self.samples = 0
+        self.backoff = 0  # timeouts since the last completed call
+        self.timeouts = 0
+
+    def observe(self, seconds):
+        if self.smoothed is None:
+            self.smoothed = seconds
+            self.deviation = seconds / 2.0
+        else:
+            self.deviation += BETA * (abs(seconds - self.smoothed) - self.deviation)
+            self.smoothed += ALPHA * (seconds - self.smoothed)
+        self.samples += 1
+        self.backoff = 0
+
+    def timeout(self, default):
+        if self.samples < MIN_SAMPLES:
+            value = default
+        else:
+            value = self.smoothed + K * self.deviation
+        value *= 2 ** self.backoff
+        return min(self.ceiling, max(self.floor, value))
+
+
+class TimeoutPolicy:
+    """Latency estimates per (device, operation), shared by every caller of one client."""
+
+    def __init__(self, limits=None):
+        self.limits = dict(OPERATION_LIMITS, **(limits or {}))
+        self._estimators = {}
+        self._lock = threading.Lock()
+
+    def _estimator(self, operation, device_id):
+        key = (device_id, operation)
+        estimator = self._estimators.get(key)
+        if estimator is None:
+            floor, ceiling = self.limits.get(operation, DEFAULT_LIMITS)
+            estimator = self._estimators[key] = LatencyEstimator(floor, ceiling)
+        return estimator
+
+    def timeout(self, operation, device_id, default):
+        """Timeout in seconds for the next call (default until enough calls were seen)."""
+        with self._lock:
+            return self._estimator(operation, device_id).timeout(default)
+
+    def mean(self, operation, device_id):
+        """Smoothed latency in seconds (None before the first completed call)."""
+        with self._lock:
+            return self._estimator(operation, device_id).smoothed
+
+    def observe(self, operation, device_id, seconds):
+        """Feed the elapsed time of a completed call."""
+        with self._lock:
+            self._estimator(operation, device_id).observe(seconds)
+
+    def observe_batch(self, device_id, count, seconds, operation="signal", per_item="batch_write"):
+        """Split the elapsed time of a count-item batch into the invocation cost and a per-item cost."""
+        with self._lock:
+            invocation = self._estimator(operation, device_id)
+            item = self._estimator(per_item, device_id)
+            if invocation.smoothed is not None:
+                item.observe(max(0.0, seconds - invocation.smoothed) / count)
+            if item.smoothed is not None:
+                invocation.observe(max(0.0, seconds - item.smoothed * count))
+            elif count == 1 or invocation.smoothed is None:
+                invocation.observe(seconds)
+
+    def batch_timeout(self, device_id, count, default, per_item_default,
+                      operation="signal", per_item="batch_write"):
+        """Timeout for one invocation carrying count items."""
+        with self._lock:
+            return (self._estimator(operation, device_id).timeout(default)
+                    + count * self._estimator(per_item, device_id).timeout(per_item_default))
+
+    def timed_out(self, operation, device_id):
+        """A call hit its timeout: back off the next one."""
+        with self._lock:
+            estimator = self._estimator(operation, device_id)
+            estimator.timeouts += 1
+            estimator.backoff = min(estimator.backoff + 1, 5)
+        REGISTRY.inc("adaptive_timeouts_total", operation=operation)
+
+    def snapshot(self):
+        """Current estimates as dicts (for /status)."""
+        with self._lock:
+            return [{
+                "device_id": device_id,
+                "operation": operation,
+                "samples": estimator.samples,
+                "latency_ms": None if estimator.smoothed is None else round(estimator.smoothed * 1000.0, 1),
+                "deviation_ms": round(estimator.deviation * 1000.0, 1),
+                "timeout_s": round(estimator.timeout(None), 3) if estimator.samples >= MIN_SAMPLES else None,
+                "timeouts": estimator.timeouts,
+            } for (device_id, operation), estimator in sorted(self._estimators.items())]
+
+
+REGISTRY.describe("adaptive_timeouts_total", "counter", "adb calls that hit their adaptive timeout, by operation")
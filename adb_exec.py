@@ -0,0 +1,188 @@
+"""
+ADB execution layer - runs adb directly from argv lists (no shell process)
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+from fpk_metrics import REGISTRY
+from fpk_trace import TRACER
+from process_manager import PROCESSES
+
+# Windows code page used by the existing tool output (commonly Korean)
+OUTPUT_ENCODING = 'cp949'
+
+# Remote location of the MFL helper script (the default; the capability probe may pick another dir)
+REMOTE_SCRIPT_NAME = "mfl_total.sh"
+REMOTE_SCRIPT_DIR = "/tmp/"
+REMOTE_SCRIPT_PATH = REMOTE_SCRIPT_DIR + REMOTE_SCRIPT_NAME
+
+# Do not flash a console window for every adb call on Windows
+if sys.platform == "win32":
+    CREATION_FLAGS = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+else:
+    CREATION_FLAGS = 0
+
+
+def resolve_adb_binary(adb_folder=""):
+    """Resolve the adb executable once (adb1.exe in a custom folder, otherwise adb on PATH).
+
+    Returns (binary, warning). warning is None unless a custom folder was
+    configured but adb1.exe could not be found inside it.
+    """
+    if adb_folder and os.path.exists(adb_folder):
+        adb_exe = os.path.join(adb_folder, "adb1.exe")
+        if os.path.exists(adb_exe):
+            return adb_exe, None
+        return "adb", f"adb1.exe not found in the specified folder: {adb_folder}"
+    return "adb", None
+
+
+def format_argv(argv):
+    """Render an argv list as a printable command line (for logs only)."""
+    return subprocess.list2cmdline([str(arg) for arg in argv])
+
+
+class AdbCommandTemplates:
+    """Pre-resolved argv prefixes for one adb binary and device serial.
+
+    Building a command is a tuple concatenation; nothing is quoted or parsed
+    and no shell is involved, so the same templates are reused for every call.
+    script_via_sh runs the script as `sh <path>` (for directories where
+    chmod is not permitted).
+    """
+
+    def __init__(self, binary, serial, script_dir=REMOTE_SCRIPT_DIR, script_via_sh=False):
+        self.binary = binary
+        self.serial = serial
+        self.script_dir = script_dir
+        self.script_via_sh = script_via_sh
+        self.script_path = script_dir + REMOTE_SCRIPT_NAME
+
+        # Server-wide commands (no -s: list/version must not target a device)
+        self.base = (binary,)
+        self.version = (binary, "version")
+        self.devices = (binary, "devices")
+
+        # Device-bound commands
+        self.device = (binary, "-s", serial)
+        self.shell = self.device + ("shell",)
+        self.push_prefix = self.device + ("push",)
+        self.ipc_sender = self.shell + ("IpcSender", "--dpid")
+        self.mfl_script = self.shell + (("sh", self.script_path) if script_via_sh else (self.script_path,))
+        self.mfl_batch = self.mfl_script + ("batch",)
+        self.shell_echo = self.shell + ("echo", "ADB Shell Test")
+        self.chmod_script = self.shell + ("chmod", "+x", self.script_path)
+        # exec-out streams the raw frame without the shell's tty/newline translation
+        self.screencap = self.device + ("exec-out", "screencap")
+
+    def key(self):
+        """Identity of these templates (used to decide when to rebuild them)."""
+        return (self.binary, self.serial, self.script_dir, self.script_via_sh)
+
+    def signal(self, dpid, value):
+        """adb -s <serial> shell IpcSender --dpid <dpid> 0 <value>"""
+        return self.ipc_sender + (dpid, "0", str(value))
+
+    def mfl_button(self, button_name, count=1):
+        """adb -s <serial> shell <script path> <button> [count]"""
+        if count > 1:
+            return self.mfl_script + (button_name, str(count))
+        return self.mfl_script + (button_name,)
+
+    def push(self, local_path, remote_dir=None):
+        """adb -s <serial> push <local> <remote> (default: the script directory)"""
+        return self.push_prefix + (local_path, remote_dir or self.script_dir)
+
+    def shell_command(self, *args):
+        """adb -s <serial> shell <args...>"""
+        return self.shell + tuple(str(arg) for arg in args)
+
+
+class AdbResult:
+    """Outcome of one adb invocation."""
+
+    __slots__ = ("argv", "returncode", "stdout", "stderr", "elapsed")
+
+    def __init__(self, argv, returncode, stdout, stderr, elapsed):
+        self.argv = argv
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
+def is_device_parse_error(stdout, stderr):
+    """True if the device rejected the DPID (not registered in can_dpid_msg_lut)."""
+    combined_output = f"{stdout or ''}\n{stderr or ''}".strip()
+    return (
+        "[CMessage][ParsingDPID]" in combined_output
+        and "can_dpid_msg_lut" in combined_output
+    )
+
+
+def adb_subcommand(argv):
+    """adb subcommand of an argv list (shell, push, devices, ...) for metrics labels."""
+    index = 3 if len(argv) > 2 and argv[1] == "-s" else 1
+    return argv[index] if len(argv) > index else "help"
+
+
+def run_adb(argv, timeout=None, cwd=None, input_text=None, binary=False):
+    """Run adb directly from an argv list and wait for it.
+
+    Raises subprocess.TimeoutExpired / FileNotFoundError / OSError like
+    subprocess does, so callers keep their existing error handling.
+    binary: stdout is returned as bytes exactly as read from the pipe
+    (screenshots); stderr is still decoded text.
+    """
+    subcommand = adb_subcommand(argv)
+    REGISTRY.inc("adb_spawns_total", subcommand=subcommand)
+    started = time.perf_counter()
+    try:
+        # On timeout the manager kills and reaps the adb process tree before re-raising
+        with TRACER.span(f"adb {subcommand}", cat="adb"):
+            process, stdout, stderr = PROCESSES.run(
+                argv,
+                timeout=timeout,
+                input=input_text,
+                stdin=subprocess.PIPE if input_text is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                creationflags=CREATION_FLAGS,
+                **({} if binary else {"text": True, "encoding": OUTPUT_ENCODING, "errors": 'replace'}),
+            )
+    except subprocess.TimeoutExpired:
+        REGISTRY.inc("adb_timeouts_total", subcommand=subcommand)
+        raise
+    if binary:
+        stderr = stderr.decode(OUTPUT_ENCODING, errors='replace')
+    elapsed = time.perf_counter() - started
+    REGISTRY.observe("adb_command_seconds", elapsed, subcommand=subcommand)
+    return AdbResult(argv, process.returncode, stdout, stderr, elapsed)
+
+
+def open_adb_session(argv, cwd=None):
+    """Start a persistent adb process (e.g. `adb shell` reading commands from stdin).
+
+    stdout and stderr share one pipe. Stop it with PROCESSES.close(process).
+    """
+    REGISTRY.inc("adb_spawns_total", subcommand=adb_subcommand(argv))
+    return PROCESSES.spawn(
+        argv,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding=OUTPUT_ENCODING,
+        errors='replace',
+        bufsize=1,
+        cwd=cwd,
+        creationflags=CREATION_FLAGS,
+    )
@@ -0,0 +1,277 @@
+"""
+adb server lifecycle - start the server once in the background, watch it, re-warm after restarts
+
+The first adb command after boot (or after another tool ran `adb kill-server`)
+pays "daemon not running; starting now" inside whatever check or signal hits
+it first. AdbServerManager runs `adb start-server` off the UI path at
+startup, then keeps one connection to the server open on the adb host
+protocol (host:track-devices). The server pushes the device list over it on
+every change, and the connection drops the moment the server dies, so a
+restart is noticed at once: the server is started again and on_ready runs
+to re-warm the device connection before the next user command.
+
+Host services other than track-devices are answered and closed by the
+server, so that tracking connection is the one long-lived connection; the
+device list it carries replaces the `adb devices` spawn of every status
+check while it is up.
+"""
+
+import os
+import socket
+import threading
+import time
+
+from adb_exec import run_adb
+from fpk_metrics import REGISTRY
+
+DEFAULT_SERVER_PORT = 5037
+SERVER_PORT_ENV = "ANDROID_ADB_SERVER_PORT"
+
+# Seconds for one host-protocol connect/reply
+CONNECT_TIMEOUT = 2.0
+
+# Seconds `adb start-server` may take (a cold start can be slow on Windows)
+START_TIMEOUT = 30
+
+# Seconds between attempts while the server cannot be started/reached
+RETRY_SECONDS = 10.0
+
+
+class AdbProtocolError(Exception):
+    """The adb server answered FAIL or broke the host protocol."""
+
+
+def server_port():
+    try:
+        return int(os.environ.get(SERVER_PORT_ENV, DEFAULT_SERVER_PORT))
+    except ValueError:
+        return DEFAULT_SERVER_PORT
+
+
+def _recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("adb server closed the connection")
+        data += chunk
+    return data
+
+
+def _read_payload(sock):
+    """Read one length-prefixed (4 hex digits) payload."""
+    length = int(_recv_exact(sock, 4), 16)
+    return _recv_exact(sock, length).decode("utf-8", "replace")
+
+
+def open_host_service(service, port=None, timeout=CONNECT_TIMEOUT):
+    """Connect to the server and request a host service; returns the socket after OKAY."""
+    sock = socket.create_connection(("127.0.0.1", port or server_port()), timeout=timeout)
+    try:
+        request = service.encode("ascii")
+        sock.sendall(b"%04x" % len(request) + request)
+        status = _recv_exact(sock, 4)
+        if status == b"FAIL":
+            raise AdbProtocolError(_read_payload(sock))
+        if status != b"OKAY":
+            raise AdbProtocolError(f"Unexpected reply {status!r} to {service}")
+        return sock
+    except Exception:
+        sock.close()
+        raise
+
+
+def host_query(service, port=None, timeout=CONNECT_TIMEOUT):
+    """One-shot host service with a payload reply (host:version, host:devices)."""
+    sock = open_host_service(service, port, timeout)
+    with sock:
+        return _read_payload(sock)
+
+
+def parse_device_list(payload):
+    """"serial\\tstate" lines -> {serial: state}."""
+    devices = {}
+    for line in payload.splitlines():
+        serial, sep, state = line.strip().partition("\t")
+        if sep:
+            devices[serial] = state
+    return devices
+
+
+class AdbServerManager:
+    """Owns the adb server for the tool's lifetime.
+
+    binary: callable returning the adb executable to start the server with
+        (re-read on every start, so a changed ADB folder is picked up).
+    on_ready(restarted): called from the watcher thread once the server is
+        up, to re-warm device connections.
+    log: optional callable(message).
+
+    state is starting, running, restarting, unavailable (no server reachable
+    on the port, e.g. a wrapped or simulated adb) or stopped.
+    """
+
+    def __init__(self, binary, on_ready=None, log=None, port=None):
+        self.binary = binary
+        self.on_ready = on_ready
+        self.log = log or (lambda message: None)
+        self.port = port or server_port()
+        self.state = "stopped"
+        self.version = None  # server protocol version
+        self.started_at = None  # when this tool started the server, or first saw it after a restart
+        self.started_by_us = False
+        self.restarts = 0
+        self.verified_binary = None  # binary whose start-server succeeded
+        self.devices = {}  # serial -> state, pushed by the server
+        self._tracking = False
+        self._sock = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self.state = "starting"
+        self._thread = threading.Thread(target=self._run, name="adb-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop watching (the adb server itself keeps running for other tools)."""
+        self._stop.set()
+        self.state = "stopped"
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    @property
+    def tracking(self):
+        """True while the device list is pushed by the live server."""
+        return self._tracking
+
+    def device_state(self, serial):
+        """Server-reported state of a device (None = not listed), or raises LookupError when not tracking."""
+        if not self._tracking:
+            raise LookupError("adb server is not being tracked")
+        return self.devices.get(serial)
+
+    def binary_ok(self, binary):
+        """True if the server was started (or confirmed) with this adb binary."""
+        return self._tracking and self.verified_binary == binary
+
+    def _ensure_server(self):
+        """Run `adb start-server` (a no-op when it is up) and read the server version; True if reachable."""
+        binary = self.binary()
+        try:
+            process = run_adb((binary, "start-server"), timeout=START_TIMEOUT)
+        except Exception as e:
+            self.log(f"[ADB Server] start-server failed: {e}")
+            return False
+        if process.returncode != 0:
+            self.log(f"[ADB Server] start-server failed (code {process.returncode}): "
+                     f"{(process.stderr or process.stdout).strip()[:200]}")
+            return False
+        self.verified_binary = binary
+        started = "daemon started successfully" in (process.stdout + process.stderr)
+        try:
+            self.version = int(host_query("host:version", self.port), 16)
+        except (OSError, ValueError, AdbProtocolError):
+            return False
+        if started or self.started_at is None:
+            self.started_at = time.time()
+            self.started_by_us = started
+        if started:
+            self.log(f"[ADB Server] Started adb server in {process.elapsed:.1f}s")
+        return True
+
+    def _run(self):
+        restarted = False
+        while not self._stop.is_set():
+            if not self._ensure_server():
+                if self.state != "unavailable":
+                    self.log(f"[ADB Server] No adb server on port {self.port}; using per-command adb checks")
+                self.state = "unavailable"
+                self._stop.wait(RETRY_SECONDS)
+                continue
+            self.state = "running"
+            REGISTRY.set("adb_server_up", 1)
+            tracked = self._watch(restarted)
+            REGISTRY.set("adb_server_up", 0)
+            if self._stop.is_set():
+                return
+            if not tracked:
+                # The server answers but refuses tracking; do not spin on start-server
+                self.state = "unavailable"
+                self._stop.wait(RETRY_SECONDS)
+                continue
+            self.restarts += 1
+            REGISTRY.inc("adb_server_restarts_total")
+            self.state = "restarting"
+            self.started_at = None
+            self.log("[ADB Server] adb server went away; restarting it")
+            restarted = True
+
+    def _watch(self, restarted):
+        """Follow host:track-devices until the server drops the connection; False if it never started."""
+        try:
+            sock = open_host_service("host:track-devices", self.port)
+        except (OSError, AdbProtocolError):
+            return False
+        self._sock = sock
+        try:
+            sock.settimeout(None)
+            # The first payload is the current device list; warm up once it is known
+            self.devices = parse_device_list(_read_payload(sock))
+            self._tracking = True
+            if self.on_ready:
+                threading.Thread(target=self._warm, args=(restarted,), name="adb-warm", daemon=True).start()
+            while not self._stop.is_set():
+                self.devices = parse_device_list(_read_payload(sock))
+        except (OSError, ValueError):
+            pass
+        finally:
+            tracked = self._tracking
+            self._tracking = False
+            self._sock = None
+            sock.close()
+        return tracked
+
+    def _warm(self, restarted):
+        try:
+            self.on_ready(restarted)
+        except Exception as e:
+            self.log(f"[ADB Server] Re-warm failed: {e}")
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "port": self.port,
+            "version": self.version,
+            "started_at": self.started_at,
+            "started_by_us": self.started_by_us,
+            "restarts": self.restarts,
+            "devices": dict(self.devices) if self._tracking else None,
+        }
+
+    def describe(self):
+        """One-line status for the UI."""
+        if self.state == "unavailable":
+            return f"No adb server on port {self.port} (per-command checks)"
+        if self.state in ("starting", "stopped") or self.started_at is None:
+            return f"adb server {self.state}"
+        since = time.strftime("%H:%M:%S", time.localtime(self.started_at))
+        origin = "started" if self.started_by_us else "up"
+        text = f"adb server {self.state}, {origin} {since}"
+        if self.version is not None:
+            text += f" (v{self.version})"
+        if self.restarts:
+            text += f", {self.restarts} restart{'s' if self.restarts != 1 else ''}"
+        return text
+
+
+REGISTRY.describe("adb_server_up", "gauge", "1 while the adb server is tracked over the host protocol")
+REGISTRY.describe("adb_server_restarts_total", "counter", "adb server restarts noticed by the tracker")
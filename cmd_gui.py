@@ -5,13 +5,56 @@ CMD GUI Tool - Windows command execution GUI program
 
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, ttk
-import subprocess
 import threading
 import os
 import sys
 import time
 from datetime import datetime
 import re
+import queue
+
+from adb_exec import format_argv
+from adb_server import AdbServerManager
+from fpk_api import AutomationApiServer
+from fpk_broker import BrokerClient
+from fpk_capture import FrameCapture
+from fpk_client import DEFAULT_DEVICE_ID, MFL_BUTTONS, PRESETS, FpkClient, format_age, validate_signal
+from fpk_metrics import REGISTRY, MetricsServer
+from fpk_monitor import DeviceMonitor
+from fpk_screen import ScreenVerifier
+from fpk_soak import SoakRun, format_progress
+from fpk_trace import TRACER
+from host_jobs import HostJobManager
+from process_manager import PROCESSES
+from rate_limit import RateLimiter
+
+# Default timeout (seconds) for host commands started from the Jobs window
+HOST_JOB_DEFAULT_TIMEOUT = 600
+
+# Key autorepeat coalescing: repeats arriving within the window (or while a
+# press is still running on the device) are sent as one "press N times" call
+KEY_REPEAT_WINDOW_MS = 40
+KEY_BURST_MAX_RATE = 8  # Max button invocations per second
+KEY_BURST_MAX_COUNT = 20  # Max presses merged into one invocation
+
+# Device write rate limits (token buckets: writes per second, burst). Writes
+# beyond them wait in the send path instead of flooding the target's IPC.
+DEVICE_WRITE_LIMIT = (250, 100)  # All IPC writes to the device (None = unlimited)
+DPID_WRITE_LIMITS = {}  # DPID name or fnmatch pattern (e.g. "DP_ID_HMI_ZPM_*") -> (rate, burst)
+
+# Frame capture around actions (--capture): screenshots per second, seconds kept before/after a trigger
+CAPTURE_FPS = 2
+CAPTURE_PRE_SECONDS = 5
+CAPTURE_POST_SECONDS = 5
+CAPTURE_MAX_BYTES = 64 * 1024 * 1024  # Memory cap of the frame ring
+
+# Device resource monitor chart
+MONITOR_CHART_SECONDS = 120  # Time span shown in the live chart
+MONITOR_REFRESH_MS = 500
+
+# Signal statistics window: label -> window length in seconds (None = everything kept)
+STATS_WINDOWS = {"1 min": 60, "10 min": 600, "1 hour": 3600, "All": None}
+STATS_REFRESH_MS = 1000
 
 class CMDGui:
     def __init__(self, root):
@@ -32,14 +75,61 @@ class CMDGui:
         # Initial setup
         self.current_directory = os.getcwd()
         self.dir_history = []  # Directory history
-        self.adb_folder = ""  # ADB folder path (empty = use PATH)
         self.settings_file = os.path.join(self.current_directory, "adb_settings.txt")
         self.settings_window = None  # Settings window reference
-        self.device_id = "ABC-0123456789"  # Fixed device ID
+        self.jobs_window = None  # Host jobs window reference
+        self.monitor_window = None  # Device monitor window reference
+        self.monitor = None  # DeviceMonitor while sampling
+        self.stats_window = None  # Signal statistics window reference
+        self.soak_window = None  # Soak test window reference
+        self.soak = None  # SoakRun in progress
+        self.trace_path = ""  # Chrome trace output (set by --trace)
+        self.broker = None  # BrokerClient while attached to a device broker (--broker)
+        self.screen_verifier = None  # ScreenVerifier when reference screens are configured (--screen-refs)
+        self.screen_pending = set()  # ids of actions whose screen check is already scheduled
+        self.frame_capture = None  # FrameCapture while recording clips around actions (--capture)
+
+        # Device logic lives in the Tk-free client; the GUI only renders its results.
+        # The client's queue coalesces held-key repeats; while the device is
+        # disconnected, keypresses and signal sends are held and sent on reconnect.
+        self.client = FpkClient(
+            device_id=DEFAULT_DEVICE_ID,  # Fixed device ID
+            log=self.log_from_thread,
+            coalesce_window=KEY_REPEAT_WINDOW_MS / 1000.0,
+            max_rate=KEY_BURST_MAX_RATE,
+            max_burst=KEY_BURST_MAX_COUNT,
+            hold_offline=True,
+            rate_limiter=RateLimiter(DEVICE_WRITE_LIMIT, DPID_WRITE_LIMITS),
+        )
+        self.command_queue = self.client.queue
+        self.adb_folder = ""  # ADB folder path (empty = use PATH)
+
+        # Host command jobs (output is streamed through a queue into the Tk loop)
+        self.job_output_queue = queue.Queue()
+        self.job_manager = HostJobManager(
+            default_timeout=HOST_JOB_DEFAULT_TIMEOUT,
+            on_output=lambda job, stream_name, text: self.job_output_queue.put((job, stream_name, text)),
+            on_exit=lambda job: self.job_output_queue.put((job, None, None)),
+        )
+        self.root.after(100, self.pump_job_output)
+
+        REGISTRY.gauge_callback("command_queue_depth", lambda: self.command_queue.depth,
+                                "Device commands waiting or executing")
+        REGISTRY.gauge_callback("host_jobs_running", lambda: len(self.job_manager.running_jobs()),
+                                "Host command jobs still running")
+        REGISTRY.gauge_callback("offline_queue_depth", lambda: self.client.offline.depth,
+                                "Commands held until the device is back")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_app_close)
 
         # Load saved ADB folder settings
         self.load_adb_settings()
 
+        # Own the adb server: start it off the UI path and re-warm the device after restarts
+        self.adb_server = AdbServerManager(lambda: self.client.templates.binary, on_ready=self.warm_device,
+                                           log=self.log_from_thread)
+        self.client.server = self.adb_server
+        self.adb_server.start()
+
         # Check ADB status on startup (run after 0.5s)
         self.root.after(500, self.update_all_adb_status)
         
@@ -47,6 +137,19 @@ class CMDGui:
         self.all_connected = False  # Track overall connection state
         self.start_periodic_connection_check()
         
+    @property
+    def adb_folder(self):
+        """ADB folder path (empty = use PATH); stored on the client."""
+        return self.client.adb_folder
+
+    @adb_folder.setter
+    def adb_folder(self, folder):
+        self.client.adb_folder = folder
+
+    @property
+    def device_id(self):
+        return self.client.device_id
+
     def setup_styles(self):
         """Configure GUI styles."""
         style = ttk.Style()
@@ -67,6 +170,20 @@ class CMDGui:
                                  command=self.open_settings)
         settings_btn.grid(row=0, column=0, pady=5, padx=(0, 10), ipady=8)
 
+        # Host command jobs button
+        jobs_btn = ttk.Button(settings_frame, text="Jobs",
+                             command=self.open_jobs_window)
+        jobs_btn.grid(row=0, column=3, pady=5, padx=(10, 0), ipady=8)
+
+        # Test tools menu (device monitor, signal statistics, soak runs)
+        tools_btn = ttk.Menubutton(settings_frame, text="Tools")
+        tools_menu = tk.Menu(tools_btn, tearoff=0)
+        tools_menu.add_command(label="Device Monitor", command=self.open_monitor_window)
+        tools_menu.add_command(label="Signal Statistics", command=self.open_stats_window)
+        tools_menu.add_command(label="Soak Test", command=self.open_soak_window)
+        tools_btn["menu"] = tools_menu
+        tools_btn.grid(row=0, column=4, pady=5, padx=(5, 0), ipady=8)
+
         # Connection status message
         self.connection_status_label = ttk.Label(settings_frame, text="Checking connection...",
                  foreground="orange", font=('Arial', 9, 'bold'))
@@ -173,6 +290,7 @@ class CMDGui:
             wrap=tk.WORD
         )
         self.output_text.grid(row=1, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.output_text.tag_configure('job_stderr', foreground="red")
 
 
 
@@ -283,228 +401,21 @@ class CMDGui:
         except Exception as e:
             self.log_to_output(f"[Settings Save Error] {str(e)}")
 
-    def get_adb_command(self, command=""):
-        """Build an ADB command (includes device id, optional custom adb folder)."""
-        # Determine base adb path
-        if self.adb_folder and os.path.exists(self.adb_folder):
-            # Use adb1.exe from the specified folder
-            adb_exe = os.path.join(self.adb_folder, "adb1.exe")
-            if os.path.exists(adb_exe):
-                base_cmd = f'"{adb_exe}"'
-            else:
-                # Fall back to default command if adb1.exe isn't found
-                self.log_to_output(f"[Warning] adb1.exe not found in the specified folder: {self.adb_folder}")
-                base_cmd = "adb"
-        else:
-            # Use default adb command (search on PATH)
-            base_cmd = "adb"
-        
-        # Add device id
-        if command:
-            return f"{base_cmd} -s {self.device_id} {command}"
-        else:
-            return f"{base_cmd} -s {self.device_id}"
+    def log_from_thread(self, message):
+        """Append a log message from a worker thread (marshalled into the Tk loop)."""
+        self.root.after(0, self.log_to_output, message)
 
     def check_adb_installation(self):
         """Check whether ADB is installed/available."""
-        try:
-            # Run adb command to verify installation
-            adb_cmd = self.get_adb_command()
-            if self.adb_folder:
-                self.log_to_output(f"[ADB Check] Selected ADB folder: {self.adb_folder}")
-            else:
-                self.log_to_output("[ADB Check] Using default ADB command (searching PATH)")
-            self.log_to_output(f"[ADB Check] Command: {adb_cmd}")
-
-            process = subprocess.Popen(
-                adb_cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='cp949',
-                cwd=self.current_directory
-            )
-            stdout, stderr = process.communicate(timeout=10)
-
-            # Log outputs
-            self.log_to_output(f"[ADB Check] Return code: {process.returncode}")
-            if stdout.strip():
-                self.log_to_output(f"[ADB Check] STDOUT:\n{stdout}")
-            if stderr.strip():
-                self.log_to_output(f"[ADB Check] STDERR:\n{stderr}")
-
-            # Determine ADB availability
-            # 1) Return code 9009 = command not found (Windows)
-            if process.returncode == 9009:
-                self.log_to_output("[ADB Check] ❌ Command not found (return code: 9009)")
-                return False, "Cannot find the ADB command. It may not be installed or not on PATH."
-
-            # 2) Specific error message in stderr
-            if "'adb' is not recognized" in stderr:
-                self.log_to_output("[ADB Check] ❌ Command not recognized")
-                return False, "ADB command is not recognized. It may not be installed or not on PATH."
-
-            # 3) If it prints "Android Debug Bridge", it's installed
-            if "Android Debug Bridge" in stdout or "Android Debug Bridge" in stderr:
-                self.log_to_output("[ADB Check] ✅ ADB detected (" + "Android Debug Bridge" + " found)")
-                return True, "ADB is installed and available."
-
-            # 4) If return code is 1 and help/usage is shown, treat as installed
-            if process.returncode == 1 and ("usage:" in stdout.lower() or "usage:" in stderr.lower()):
-                self.log_to_output("[ADB Check] ✅ ADB detected (usage/help shown)")
-                return True, "ADB is installed and available."
-
-            # 5) Extra verification: run `adb version`
-            self.log_to_output("[ADB Check] Extra verification: running `adb version`...")
-            try:
-                version_cmd = self.get_adb_command("version")
-                version_process = subprocess.Popen(
-                    version_cmd,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    encoding='cp949',
-                    cwd=self.current_directory
-                )
-                version_stdout, version_stderr = version_process.communicate(timeout=5)
-
-                self.log_to_output(f"[ADB Check] adb version return code: {version_process.returncode}")
-                if version_stdout.strip():
-                    self.log_to_output(f"[ADB Check] adb version STDOUT:\n{version_stdout}")
-                if version_stderr.strip():
-                    self.log_to_output(f"[ADB Check] adb version STDERR:\n{version_stderr}")
-
-                if version_process.returncode == 0 and ("Android Debug Bridge" in version_stdout or "version" in version_stdout.lower()):
-                    self.log_to_output("[ADB Check] ✅ ADB detected (`adb version` succeeded)")
-                    return True, "ADB is installed and available."
-
-            except Exception as ve:
-                self.log_to_output(f"[ADB Check] adb version failed: {str(ve)}")
-
-            # 6) Otherwise assume not installed/available
-            self.log_to_output(f"[ADB Check] ❌ ADB check failed (return code: {process.returncode})")
-            return False, f"Cannot determine ADB installation status. (return code: {process.returncode})"
-
-        except subprocess.TimeoutExpired:
-            self.log_to_output("[ADB Check] ❌ Timeout")
-            return False, "ADB command timed out"
-        except FileNotFoundError:
-            self.log_to_output("[ADB Check] ❌ File not found (FileNotFoundError)")
-            return False, "ADB may not be installed or not on PATH."
-        except OSError as e:
-            if e.errno == 2:  # No such file or directory
-                self.log_to_output("[ADB Check] ❌ File not found (OSError)")
-                return False, "Cannot find the ADB executable."
-            else:
-                self.log_to_output(f"[ADB Check] ❌ OS error: {str(e)}")
-                return False, f"System error: {str(e)}"
-        except Exception as e:
-            self.log_to_output(f"[ADB Check] ❌ Exception: {str(e)}")
-            return False, f"Error while checking ADB: {str(e)}"
+        return self.client.check_installation(log=self.log_from_thread)
 
     def check_adb_devices(self):
         """Check ADB device connection status."""
-        try:
-            # Check connected devices via `adb devices`
-            self.log_to_output("[Device Check] Running `adb devices`...")
-
-            devices_cmd = self.get_adb_command("devices")
-            process = subprocess.Popen(
-                devices_cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='cp949',
-                cwd=self.current_directory
-            )
-            stdout, stderr = process.communicate(timeout=15)
-
-            # Log outputs
-            self.log_to_output(f"[Device Check] Return code: {process.returncode}")
-            if stdout.strip():
-                self.log_to_output(f"[Device Check] STDOUT:\n{stdout}")
-            if stderr.strip():
-                self.log_to_output(f"[Device Check] STDERR:\n{stderr}")
-
-            if process.returncode == 0:
-                lines = stdout.strip().split('\n')
-                devices = []
-                for line in lines[1:]:  # First line is "List of devices attached"
-                    if line.strip() and '\t' in line:
-                        device_info = line.strip().split('\t')
-                        if len(device_info) >= 2:
-                            devices.append((device_info[0], device_info[1]))
-
-                if devices:
-                    device_list = []
-                    for device_id, status in devices:
-                        device_list.append(f"{device_id} ({status})")
-                    self.log_to_output(f"[Device Check] ✅ Devices found: {len(devices)}")
-                    return True, f"Connected devices: {', '.join(device_list)}"
-                else:
-                    self.log_to_output("[Device Check] ❌ No connected devices")
-                    return False, "No devices are connected."
-            else:
-                self.log_to_output("[Device Check] ❌ Failed to run `adb devices`")
-                return False, f"Failed to run `adb devices`: {stderr}"
-
-        except subprocess.TimeoutExpired:
-            self.log_to_output("[Device Check] ❌ Timeout")
-            return False, "`adb devices` timed out"
-        except Exception as e:
-            self.log_to_output(f"[Device Check] ❌ Exception: {str(e)}")
-            return False, f"Error while checking devices: {str(e)}"
+        return self.client.check_devices(log=self.log_from_thread)
 
     def check_adb_shell(self):
         """Test ADB shell connectivity."""
-        try:
-            # Test shell connectivity using `adb shell echo`
-            self.log_to_output('[Shell Test] Running `adb shell echo "ADB Shell Test"`...')
-
-            shell_cmd = self.get_adb_command('shell echo "ADB Shell Test"')
-            process = subprocess.Popen(
-                shell_cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='cp949',
-                cwd=self.current_directory
-            )
-            stdout, stderr = process.communicate(timeout=15)
-
-            # Log outputs
-            self.log_to_output(f"[Shell Test] Return code: {process.returncode}")
-            if stdout.strip():
-                self.log_to_output(f"[Shell Test] STDOUT:\n{stdout}")
-            if stderr.strip():
-                self.log_to_output(f"[Shell Test] STDERR:\n{stderr}")
-
-            if process.returncode == 0 and "ADB Shell Test" in stdout:
-                self.log_to_output("[Shell Test] ✅ Shell connected")
-                return True, "ADB Shell connectivity is working."
-            elif "no devices/emulators found" in stderr:
-                self.log_to_output("[Shell Test] ❌ No device")
-                return False, "No connected device; cannot run the shell test."
-            elif "device unauthorized" in stderr:
-                self.log_to_output("[Shell Test] ❌ Device unauthorized")
-                return False, "Device is unauthorized. Confirm USB debugging authorization."
-            elif "device offline" in stderr:
-                self.log_to_output("[Shell Test] ❌ Device offline")
-                return False, "Device is offline."
-            else:
-                self.log_to_output("[Shell Test] ❌ Shell connection failed")
-                return False, f"ADB Shell connection failed: {stderr}"
-
-        except subprocess.TimeoutExpired:
-            self.log_to_output("[Shell Test] ❌ Timeout")
-            return False, "ADB Shell command timed out"
-        except Exception as e:
-            self.log_to_output(f"[Shell Test] ❌ Exception: {str(e)}")
-            return False, f"Error while testing ADB Shell: {str(e)}"
+        return self.client.check_shell(log=self.log_from_thread)
 
     def open_settings(self):
         """Open the settings window."""
@@ -517,7 +428,7 @@ class CMDGui:
         settings_window = tk.Toplevel(self.root)
         self.settings_window = settings_window
         settings_window.title("Settings - ADB Status")
-        settings_window.geometry("510x480")
+        settings_window.geometry("510x520")
         settings_window.resizable(False, False)
 
         # Clear reference when the window closes
@@ -539,9 +450,9 @@ class CMDGui:
 
         # Center the settings window over the main window
         settings_x = main_x + (main_width - 510) // 2
-        settings_y = main_y + (main_height - 480) // 2
+        settings_y = main_y + (main_height - 520) // 2
 
-        settings_window.geometry(f"510x480+{settings_x}+{settings_y}")
+        settings_window.geometry(f"510x520+{settings_x}+{settings_y}")
 
         # Settings content frame
         settings_frame = ttk.Frame(settings_window, padding="20")
@@ -583,6 +494,11 @@ class CMDGui:
                                          font=('Arial', 10))
         self.adb_status_label.pack(pady=2)
 
+        # adb server state (start time, restarts)
+        self.adb_server_label = ttk.Label(adb_frame, text=self.adb_server.describe(),
+                                          font=('Arial', 9), foreground="gray")
+        self.adb_server_label.pack(pady=(0, 2))
+
         # Device connection status frame
         device_frame = ttk.LabelFrame(settings_frame, text="Device Status", padding="10")
         device_frame.pack(fill=tk.X, pady=(0, 5))
@@ -601,6 +517,10 @@ class CMDGui:
                                           font=('Arial', 10))
         self.shell_status_label.pack(pady=2)
 
+        # What the capability probe found on this connection
+        self.capabilities_label = ttk.Label(shell_frame, text="", font=('Arial', 9), foreground="gray")
+        self.capabilities_label.pack(pady=(0, 2))
+
         # Re-check all status button
         ttk.Button(settings_frame, text="Re-check All Status",
                   command=lambda: self.update_all_adb_status()).pack(pady=5)
@@ -609,42 +529,63 @@ class CMDGui:
         ttk.Button(settings_frame, text="Close",
                   command=on_close).pack(pady=(10, 0), ipady=8)
 
-        # Initial overall ADB status check
-        self.update_all_adb_status()
+        # Show the cached status at once; only re-check (without redeploying) if it is stale
+        def refresh_ages():
+            if self.settings_window is settings_window and settings_window.winfo_exists():
+                self.refresh_settings_status()
+                settings_window.after(1000, refresh_ages)
+
+        refresh_ages()
+        if self.client.status_cache.is_stale():
+            self.update_all_adb_status(deploy=False)
+
+    def refresh_settings_status(self):
+        """Render cached check results (with their age) into the settings window."""
+        if self.settings_window is None or not self.settings_window.winfo_exists():
+            return
+        self.adb_server_label.config(text=self.adb_server.describe())
+        caps = self.client.capabilities
+        self.capabilities_label.config(text=caps.describe() if caps is not None else "Device not probed yet",
+                                       wraplength=440)
+        cache = self.client.status_cache
+        for check, label in (("adb", self.adb_status_label),
+                             ("device", self.device_status_label),
+                             ("shell", self.shell_status_label)):
+            entry = cache.get(check)
+            if entry is None:
+                continue  # Keep the "Checking..." text until the first result arrives
+            ok, message, checked_at = entry
+            icon = "✅" if ok else "❌"
+            label.config(text=f"{icon} {message} ({format_age(time.time() - checked_at)})",
+                         foreground="green" if ok else "red", wraplength=440)
 
     def start_periodic_connection_check(self):
         """Periodically check overall connection status (every 3 seconds)."""
         self.last_shell_status = False  # Track previous state
         
+        check_running = threading.Event()
+
         def periodic_check():
             # Quietly check overall connection status
             def check_all_thread():
-                # 1) Check ADB installation
-                adb_installed = self.check_adb_installation_silent()
-                
-                if adb_installed:
-                    # 2) Check specific device connection (ID: ABC-0123456789)
-                    device_connected = self.check_adb_devices_silent()
-                    
-                    if device_connected:
-                        # 3) ADB Shell test
-                        shell_working, _ = self.check_adb_shell_silent()
-                        
-                        if shell_working is not None:
-                            # Update overall status
-                            all_ok = shell_working
-                            self.root.after(0, lambda: self.update_connection_status(adb_installed, device_connected, shell_working, all_ok))
-                        else:
-                            # If shell check fails, keep previous state
-                            pass
-                    else:
-                        self.root.after(0, lambda: self.update_connection_status(adb_installed, device_connected, False, False))
-                else:
-                    self.root.after(0, lambda: self.update_connection_status(adb_installed, False, False, False))
+                try:
+                    # ADB installation -> configured device -> shell test
+                    status = self.client.status()
+                finally:
+                    check_running.clear()
+                if status.shell_working is None:
+                    # If shell check fails, keep previous state
+                    return
+                self.root.after(0, lambda: self.update_connection_status(
+                    status.adb_installed, status.device_connected, status.shell_working, status.ready))
             
-            thread = threading.Thread(target=check_all_thread)
-            thread.daemon = True
-            thread.start()
+            # Skip this round while the previous check is still waiting on a slow device,
+            # and entirely while a broker polls the device and pushes its state
+            if self.broker is None and not check_running.is_set():
+                check_running.set()
+                thread = threading.Thread(target=check_all_thread)
+                thread.daemon = True
+                thread.start()
             
             # Repeat every 3 seconds regardless of connection status
             self.root.after(3000, periodic_check)
@@ -652,84 +593,6 @@ class CMDGui:
         # First run
         periodic_check()
 
-    def check_adb_installation_silent(self):
-        """Check ADB installation status (silent, no logs)."""
-        try:
-            adb_cmd = self.get_adb_command("version")
-            process = subprocess.Popen(
-                adb_cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='cp949',
-                cwd=self.current_directory
-            )
-            stdout, stderr = process.communicate(timeout=5)
-            return process.returncode == 0 and ("Android Debug Bridge" in stdout or "version" in stdout.lower())
-        except:
-            return False
-
-    def check_adb_devices_silent(self):
-        """Check device connection status (silent, no logs) - only checks the configured device id."""
-        try:
-            devices_cmd = self.get_adb_command("devices")
-            # List all devices without the -s option
-            devices_cmd = devices_cmd.replace(f"-s {self.device_id} ", "")
-            
-            process = subprocess.Popen(
-                devices_cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='cp949',
-                cwd=self.current_directory
-            )
-            stdout, stderr = process.communicate(timeout=5)
-            
-            if process.returncode == 0:
-                lines = stdout.strip().split('\n')
-                for line in lines[1:]:  # First line is "List of devices attached"
-                    if line.strip() and '\t' in line:
-                        device_info = line.strip().split('\t')
-                        if len(device_info) >= 2:
-                            device_id = device_info[0]
-                            device_status = device_info[1]
-                            # Check the configured device id and its status
-                            if device_id == self.device_id:
-                                return device_status == 'device'
-            return False
-        except:
-            return False
-
-    def check_adb_shell_silent(self):
-        """Test ADB shell connectivity (silent, no logs)."""
-        try:
-            shell_cmd = self.get_adb_command('shell echo "ADB Shell Test"')
-            process = subprocess.Popen(
-                shell_cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='cp949',
-                cwd=self.current_directory
-            )
-            stdout, stderr = process.communicate(timeout=5)
-
-            if process.returncode == 0 and "ADB Shell Test" in stdout:
-                return True, "Connected"
-            else:
-                return False, "Not connected"
-
-        except subprocess.TimeoutExpired:
-            # Treat timeout as a connection failure
-            return False, "Timeout"
-        except Exception as e:
-            # For other exceptions, keep the previous state (return None)
-            return None, str(e)
-
     def update_status_light(self, is_working):
         """Update only the traffic-light color (silent)."""
         if hasattr(self, 'status_canvas'):
@@ -751,7 +614,24 @@ class CMDGui:
                 self.connection_status_label.config(text="❌ Shell connection failed", foreground="red")
             else:
                 self.connection_status_label.config(text="✅ Ready", foreground="green")
+            held = self.client.offline.depth
+            if held and not all_ok:
+                self.connection_status_label.config(
+                    text=self.connection_status_label.cget("text") + f" ({held} held)")
         
+        # Export connection state for the metrics endpoint
+        REGISTRY.set("adb_installed", int(bool(adb_installed)))
+        REGISTRY.set("device_connected", int(bool(device_connected)))
+        REGISTRY.set("shell_working", int(bool(shell_working)))
+        REGISTRY.set("connection_ready", int(bool(all_ok)))
+
+        self.last_connection_status = {
+            "adb_installed": bool(adb_installed),
+            "device_connected": bool(device_connected),
+            "shell_working": bool(shell_working),
+            "checked_at": time.time(),
+        }
+
         # Save previous connection state
         previous_status = self.all_connected if hasattr(self, 'all_connected') else False
         
@@ -767,132 +647,57 @@ class CMDGui:
         
         # Log when connection is lost
         if previous_status and not all_ok:
+            REGISTRY.inc("disconnects_total")
             self.output_text.insert(tk.END, f"[Disconnected] Device connection was lost.\n")
+            self.output_text.insert(tk.END, "[Offline] Keypresses and signals are held until it is back.\n")
             self.output_text.see(tk.END)
 
+    @property
+    def sender(self):
+        """Where device commands go: the attached broker, otherwise the local client."""
+        return self.broker if self.broker is not None else self.client
+
+    def attach_broker(self, port):
+        """Route device commands through a running broker and follow its status pushes."""
+        self.broker = BrokerClient(port, name="cmd_gui", device_id=self.device_id)
+        # The broker owns the adb server and the health checks from here on
+        self.adb_server.stop()
+        self.broker.subscribe(lambda status: self.root.after(0, lambda: self.show_broker_status(status)))
+
+    def show_broker_status(self, status):
+        """Render a status pushed by the broker (None: the broker went away)."""
+        if status is None:
+            if self.broker is not None:
+                self.broker = None
+                self.adb_server.start()
+                self.log_to_output("[Broker] Connection to the broker lost; checking the device directly")
+            return
+        if status.get("ready") is None:
+            return  # The broker has not decided yet
+        self.update_connection_status(status["adb_installed"], status["device_connected"],
+                                      status["shell_working"], status["ready"])
+
+    def warm_device(self, restarted):
+        """Runs after the adb server came up: open the device connection before the next command."""
+        shell_working, _ = self.client.probe_shell()
+        if restarted:
+            state = "ready" if shell_working else "not reachable yet"
+            self.log_from_thread(f"[ADB Server] Server restarted; device connection re-warmed ({state})")
+
     def upload_mfl_script_silent(self):
-        """Create and upload mfl_total.sh silently."""
-        def upload_thread():
-            try:
-                script_path = os.path.join(self.current_directory, "mfl_total.sh")
-                
-                # Create the script if missing
-                if not os.path.exists(script_path):
-                    self.create_mfl_script_file_only(script_path)
-                
-                # 1) Upload
-                push_cmd = self.get_adb_command(f'push "{script_path}" /tmp/')
-                push_process = subprocess.Popen(
-                    push_cmd,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    encoding='cp949',
-                    cwd=self.current_directory
-                )
-                push_stdout, push_stderr = push_process.communicate(timeout=30)
-                
-                if push_process.returncode != 0:
-                    # Stop on upload failure
-                    return
-                
-                # 2) Grant execute permission (only if upload succeeded)
-                chmod_cmd = self.get_adb_command('shell chmod +x /tmp/mfl_total.sh')
-                chmod_process = subprocess.Popen(
-                    chmod_cmd,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    encoding='cp949',
-                    cwd=self.current_directory
-                )
-                chmod_stdout, chmod_stderr = chmod_process.communicate(timeout=15)
-                
-                # Ignore chmod result (some systems may restrict permission changes)
-                    
-            except subprocess.TimeoutExpired:
-                # Exit silently even on timeout
-                pass
-            except Exception as e:
-                # Exit silently on other exceptions
-                pass
-        
-        thread = threading.Thread(target=upload_thread)
+        """Probe the device and upload mfl_total.sh silently unless it already has the current version."""
+        if self.broker is not None:
+            return  # The broker deploys when the device comes back
+        thread = threading.Thread(target=self.client.ensure_script)
         thread.daemon = True
         thread.start()
 
     def create_mfl_script_file_only(self, script_path):
         """Create only the mfl_total.sh file (no logs)."""
-        script_content = '''#!/bin/bash
-
-if [ "$1" = "up" ]; then
-    echo "up."
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "down" ]; then
-    echo "down"
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "menuup" ]; then
-    echo "menuup"
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "menudown" ]; then
-    echo "menudown"
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "ok" ]; then
-    echo "ok"
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "view" ]; then
-    echo "view"
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "fas" ]; then
-    echo "fas"
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "signal" ]; then
-    dpid="$2"
-    value="$3"
-    if [ -z "$dpid" ] || [ -z "$value" ]; then
-        echo "Usage: $0 signal <DPID_NAME> <VALUE>"
-        exit 1
-    fi
-    echo "signal: $dpid = $value"
-    IpcSender --dpid "$dpid" 0 "$value" > /dev/null 2>&1
-else
-    echo "Unknown Command."
-fi
-'''
-        with open(script_path, 'w', encoding='utf-8', newline='\n') as f:
-            f.write(script_content)
-        
-        try:
-            import stat
-            os.chmod(script_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IROTH)
-        except:
-            pass
+        self.client.write_script(script_path)
 
-    def update_all_adb_status(self):
-        """Update overall ADB status."""
+    def update_all_adb_status(self, deploy=True):
+        """Update overall ADB status (deploy=False: checks only, no script upload)."""
         # Show start message in main output
         self.output_text.insert(tk.END, "[Settings] Starting full ADB status check...\n")
         self.output_text.see(tk.END)
@@ -910,11 +715,13 @@ fi
 
                 # 3) ADB Shell test
                 shell_working, shell_message = self.check_adb_shell()
-                self.root.after(0, lambda: self.show_shell_result(shell_working, shell_message))
+                self.root.after(0, lambda: self.show_shell_result(shell_working, shell_message, deploy))
             else:
                 # If ADB is not installed, skip the remaining tests
+                self.client.status_cache.update("device", False, "ADB is not installed, so device status cannot be checked.")
+                self.client.status_cache.update("shell", False, "ADB is not installed, so the shell test cannot be run.")
                 self.root.after(0, lambda: self.show_device_result(False, "ADB is not installed, so device status cannot be checked."))
-                self.root.after(0, lambda: self.show_shell_result(False, "ADB is not installed, so the shell test cannot be run."))
+                self.root.after(0, lambda: self.show_shell_result(False, "ADB is not installed, so the shell test cannot be run.", deploy))
 
         thread = threading.Thread(target=check_all_adb_thread)
         thread.daemon = True
@@ -922,12 +729,8 @@ fi
 
     def show_adb_install_result(self, is_installed, message):
         """Show ADB installation check result."""
-        # Update settings window status label
-        if hasattr(self, 'adb_status_label'):
-            if is_installed:
-                self.adb_status_label.config(text=f"✅ {message}", foreground="green")
-            else:
-                self.adb_status_label.config(text=f"❌ {message}", foreground="red")
+        # Update settings window status labels from the cache
+        self.refresh_settings_status()
 
         # Also show result in the main output
         if is_installed:
@@ -940,12 +743,8 @@ fi
 
     def show_device_result(self, is_connected, message):
         """Show device connection check result."""
-        # Update settings window status label
-        if hasattr(self, 'device_status_label'):
-            if is_connected:
-                self.device_status_label.config(text=f"✅ {message}", foreground="green")
-            else:
-                self.device_status_label.config(text=f"❌ {message}", foreground="red")
+        # Update settings window status labels from the cache
+        self.refresh_settings_status()
 
         # Also show result in the main output
         if is_connected:
@@ -957,14 +756,10 @@ fi
 
         self.output_text.see(tk.END)
 
-    def show_shell_result(self, is_working, message):
+    def show_shell_result(self, is_working, message, deploy=True):
         """Show ADB Shell test result."""
-        # Update settings window status label
-        if hasattr(self, 'shell_status_label'):
-            if is_working:
-                self.shell_status_label.config(text=f"✅ {message}", foreground="green")
-            else:
-                self.shell_status_label.config(text=f"❌ {message}", foreground="red")
+        # Update settings window status labels from the cache
+        self.refresh_settings_status()
 
         # Update main window traffic light
         if hasattr(self, 'status_canvas'):
@@ -987,6 +782,8 @@ fi
         self.output_text.see(tk.END)
 
         # Upload the script only after all checks pass and shell connection succeeds
+        if not deploy or self.broker is not None:
+            return
         if is_working:
             self.create_mfl_script()
         else:
@@ -1060,78 +857,7 @@ fi
     def create_mfl_script(self):
         """Create the mfl_total.sh shell script file."""
         try:
-            script_path = os.path.join(self.current_directory, "mfl_total.sh")
-
-            # Generate shell script content (user-provided content)
-            script_content = '''#!/bin/bash
-
-if [ "$1" = "up" ]; then
-    echo "up."
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "down" ]; then
-    echo "down"
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "menuup" ]; then
-    echo "menuup"
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "menudown" ]; then
-    echo "menudown"
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "ok" ]; then
-    echo "ok"
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "view" ]; then
-    echo "view"
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "fas" ]; then
-    echo "fas"
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "signal" ]; then
-    dpid="$2"
-    value="$3"
-    if [ -z "$dpid" ] || [ -z "$value" ]; then
-        echo "Usage: $0 signal <DPID_NAME> <VALUE>"
-        exit 1
-    fi
-    echo "signal: $dpid = $value"
-    IpcSender --dpid "$dpid" 0 "$value" > /dev/null 2>&1
-else
-    echo "Unknown Command."
-fi
-'''
-
-            # Save file
-            with open(script_path, 'w', encoding='utf-8', newline='\n') as f:
-                f.write(script_content)
-
-            # Grant execute permission (primarily on Unix-like systems)
-            try:
-                import stat
-                os.chmod(script_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IROTH)
-            except:
-                pass  # chmod behavior may be limited on Windows
-
+            script_path = self.client.write_script()
             self.log_to_output(f"[Script Created] mfl_total.sh was created: {script_path}")
 
             # Upload to the device only if ADB Shell connectivity is confirmed
@@ -1143,83 +869,14 @@ fi
     def create_mfl_script_local_only(self):
         """Create the mfl_total.sh shell script (local only, no upload)."""
         try:
-            script_path = os.path.join(self.current_directory, "mfl_total.sh")
+            script_path = self.client.default_script_path()
 
             # Do not recreate if it already exists
             if os.path.exists(script_path):
                 self.log_to_output(f"[Script] mfl_total.sh already exists: {script_path}")
                 return
 
-            # Generate script content
-            script_content = '''#!/bin/bash
-
-if [ "$1" = "up" ]; then
-    echo "up."
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_UP_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "down" ]; then
-    echo "down"
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_DOWN_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "menuup" ]; then
-    echo "menuup"
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_UP_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "menudown" ]; then
-    echo "menudown"
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_MENU_DOWN_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "ok" ]; then
-    echo "ok"
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_OK_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "view" ]; then
-    echo "view"
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_VIEW_SHORT_PRESS_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "fas" ]; then
-    echo "fas"
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_PRESS 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_PRESS 0 0 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_RELEASE 0 1 > /dev/null 2>&1
-    IpcSender --dpid DP_ID_HMI_FAS_TASTER_SHORT_RELEASE 0 0 > /dev/null 2>&1
-elif [ "$1" = "signal" ]; then
-    dpid="$2"
-    value="$3"
-    if [ -z "$dpid" ] || [ -z "$value" ]; then
-        echo "Usage: $0 signal <DPID_NAME> <VALUE>"
-        exit 1
-    fi
-    echo "signal: $dpid = $value"
-    IpcSender --dpid "$dpid" 0 "$value" > /dev/null 2>&1
-else
-    echo "Unknown Command."
-fi
-'''
-
-            # Save file
-            with open(script_path, 'w', encoding='utf-8', newline='\n') as f:
-                f.write(script_content)
-
-            # Grant execute permission
-            try:
-                import stat
-                os.chmod(script_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IROTH)
-            except:
-                pass
-
+            self.client.write_script(script_path)
             self.log_to_output(f"[Script] mfl_total.sh was created: {script_path}")
             self.log_to_output("[Script] It will be uploaded automatically after the device connects.")
 
@@ -1227,71 +884,10 @@ fi
             self.log_to_output(f"[Script Create Error] {str(e)}")
 
     def upload_script_to_device(self, script_path):
-        """Upload script to the device and grant execute permission."""
-        try:
-            # 1. Upload the script via adb push
-            self.log_to_output("[Script Upload] Uploading mfl_total.sh to the device...")
-            push_cmd = self.get_adb_command(f'push "{script_path}" /tmp/')
-
-            push_process = subprocess.Popen(
-                push_cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='cp949',
-                cwd=self.current_directory
-            )
-            push_stdout, push_stderr = push_process.communicate(timeout=30)
-
-            self.log_to_output(f"[Script Upload] Return code: {push_process.returncode}")
-            if push_stdout.strip():
-                self.log_to_output(f"[Script Upload] STDOUT:\n{push_stdout}")
-            if push_stderr.strip():
-                self.log_to_output(f"[Script Upload] STDERR:\n{push_stderr}")
-
-            if push_process.returncode == 0:
-                self.log_to_output("[Script Upload] ✅ Upload succeeded")
-            else:
-                self.log_to_output("[Script Upload] ❌ Upload failed")
-                if "no devices/emulators found" in push_stderr:
-                    self.log_to_output("[Script Upload] No device is connected.")
-                elif "device unauthorized" in push_stderr:
-                    self.log_to_output("[Script Upload] Device authorization is required.")
-                # Even if upload fails, still try chmod (file may already exist)
-
-            # 2. Grant execute permission via chmod +x (attempt regardless of upload result)
-            self.log_to_output("[Chmod] Granting execute permission to /tmp/mfl_total.sh...")
-            chmod_cmd = self.get_adb_command('shell chmod +x /tmp/mfl_total.sh')
-
-            chmod_process = subprocess.Popen(
-                chmod_cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='cp949',
-                cwd=self.current_directory
-            )
-            chmod_stdout, chmod_stderr = chmod_process.communicate(timeout=15)
-
-            self.log_to_output(f"[Chmod] Return code: {chmod_process.returncode}")
-            if chmod_stdout.strip():
-                self.log_to_output(f"[Chmod] STDOUT:\n{chmod_stdout}")
-            if chmod_stderr.strip():
-                self.log_to_output(f"[Chmod] STDERR:\n{chmod_stderr}")
-
-            if chmod_process.returncode == 0:
-                self.log_to_output("[Chmod] ✅ Execute permission granted")
-                self.log_to_output("[Deploy] ✅ mfl_total.sh deployed to device")
-                self.log_to_output("[Usage] On the device: /tmp/mfl_total.sh [up|down|menuup|menudown|ok|view|fas]")
-            else:
-                self.log_to_output("[Chmod] ❌ Failed to grant execute permission")
-
-        except subprocess.TimeoutExpired:
-            self.log_to_output("[Script Upload] ❌ Upload timed out")
-        except Exception as e:
-            self.log_to_output(f"[Script Upload Error] {str(e)}")
+        """Upload script to the device and grant execute permission (log streamed to the output)."""
+        thread = threading.Thread(target=self.client.deploy, args=(script_path, self.log_from_thread))
+        thread.daemon = True
+        thread.start()
 
     # Keypad functions
     def go_home(self):
@@ -1371,358 +967,128 @@ fi
                 pass
             return
 
-        # adb shell IpcSender --dpid <name> 0 <value>
-        # NOTE: Do not use host-side redirection like `> /dev/null` on Windows.
-        shell_cmd = f'shell IpcSender --dpid {signal_name} 0 {signal_value}'
-        adb_cmd = self.get_adb_command(shell_cmd)
+        adb_cmd = self.client.templates.signal(signal_name, signal_value)
 
         self.output_text.insert(tk.END, f"[SIGNAL] {signal_name} = {signal_value}\n")
-        self.output_text.insert(tk.END, f"Command: {adb_cmd}\n")
+        self.output_text.insert(tk.END, f"Command: {format_argv(adb_cmd)}\n")
         self.output_text.see(tk.END)
+        self.queue_signal(signal_name, signal_value)
+
+    def log_if_held(self, label):
+        """Note in the output that a command was held because the device is offline."""
+        online = self.all_connected if self.broker is not None else self.client.online
+        if not online:
+            self.log_from_thread(f"[Offline] Holding {label} until the device is back")
+
+    def queue_signal(self, signal_name, signal_value):
+        """Queue one IpcSender write on the device command queue; returns the queue entry."""
+        self.log_if_held(f"{signal_name} = {signal_value}")
+        trace_id, requested_at = TRACER.new_operation(), time.perf_counter()
+        return self.sender.submit_signal(
+            signal_name, signal_value, trace_id=trace_id,
+            on_done=lambda result: self.show_result_from_thread(result, trace_id, requested_at))
+
+    def show_result_from_thread(self, result, trace_id=None, requested_at=None):
+        """Render an OperationResult from a worker thread (marshalled into the Tk loop)."""
+        scheduled_at = time.perf_counter()
+
+        if self.broker is not None and self.frame_capture is not None:
+            # Broker results never pass through the local client's result listeners
+            self.frame_capture.on_result(result)
+
+        def render():
+            render_start = time.perf_counter()
+            with TRACER.span("render", cat="ui", kind=result.kind, name=result.name):
+                if result.kind == "button":
+                    self.show_mfl_result(result)
+                else:
+                    self.show_signal_result(result)
+            if trace_id is not None:
+                # Whole lifecycle: keypress/request -> queue -> adb -> Tk callback -> rendered
+                TRACER.async_span("ui dispatch", scheduled_at, render_start, trace_id)
+                TRACER.async_span(f"{result.kind} {result.name}", requested_at, time.perf_counter(), trace_id,
+                                  ok=result.ok, error_class=result.error_class)
 
-        def execute_thread():
-            try:
-                process = subprocess.Popen(
-                    adb_cmd,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    encoding='cp949',
-                    cwd=self.current_directory
-                )
-                stdout, stderr = process.communicate(timeout=10)
-                self.root.after(0, lambda: self.show_signal_result(signal_name, signal_value, stdout, stderr, process.returncode))
-            except subprocess.TimeoutExpired:
-                self.root.after(0, lambda: self.show_signal_error(signal_name, signal_value, "Command execution timed out"))
-            except Exception as e:
-                self.root.after(0, lambda: self.show_signal_error(signal_name, signal_value, str(e)))
-
-        thread = threading.Thread(target=execute_thread)
-        thread.daemon = True
-        thread.start()
+        self.root.after(0, render)
 
     def send_adas_preset(self):
         """Preset: send a batch of ADAS-related DPIDs/values."""
-        pairs = [
-            ("DP_ID_S_FOD_STATE_ACC", "1"),
-            ("DP_ID_B_TA_FOD_STATUS", "1"),
-            ("DP_ID_DP_LDW_VERBAUT", "1"),
-            ("DP_ID_B_LDW_LERNMODUS_SEITENABHAENGIG", "15"),
-            ("DP_ID_B_ACC_STATUSICON", "5"),
-            ("DP_ID_B_TA_AKTIV_HMI", "1"),
-            ("DP_ID_B_TA_HMI_EGO_LI_TYP", "3"),
-            ("DP_ID_B_TA_HMI_EGO_RE_TYP", "3"),
-            ("DP_ID_B_TA_HMI_NACHB_LI_TYP", "2"),
-            ("DP_ID_B_TA_HMI_NACHB_RE_TYP", "2"),
-            ("DP_ID_B_TA_HMI_TAZOOMSTUFEAKTIV", "1"),
-            ("DP_ID_B_TA_HMI_SEG1_KRUEMMUNG", "2048"),
-            ("DP_ID_B_TA_HMI_SEG2_KRUEMMUNG", "2048"),
-            ("DP_ID_B_TA_HMI_SEG1_GIERWINKEL", "2048"),
-            ("DP_ID_B_TA_HMI_SEG2_BEGINN", "0"),
-            ("DP_ID_B_TA_HMI_EGOOBJ_DY", "64"),
-        ]
-
-        self.output_text.insert(tk.END, "[PRESET] ADAS batch send\n")
-        self.output_text.see(tk.END)
-
-        def execute_thread():
-            for signal_name, signal_value in pairs:
-                try:
-                    shell_cmd = f'shell IpcSender --dpid {signal_name} 0 {signal_value}'
-                    adb_cmd = self.get_adb_command(shell_cmd)
-                    process = subprocess.Popen(
-                        adb_cmd,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        encoding='cp949',
-                        cwd=self.current_directory,
-                    )
-                    stdout, stderr = process.communicate(timeout=10)
-                    self.root.after(
-                        0,
-                        lambda n=signal_name, v=signal_value, out=stdout, err=stderr, rc=process.returncode: self.show_signal_result(
-                            n, v, out, err, rc
-                        ),
-                    )
-                except subprocess.TimeoutExpired:
-                    self.root.after(0, lambda n=signal_name, v=signal_value: self.show_signal_error(n, v, "Command execution timed out"))
-                except Exception as e:
-                    self.root.after(0, lambda n=signal_name, v=signal_value, msg=str(e): self.show_signal_error(n, v, msg))
-
-        thread = threading.Thread(target=execute_thread)
-        thread.daemon = True
-        thread.start()
+        self.run_preset("adas")
 
     def send_navigation_preset(self):
         """Preset: send a batch of Navigation-related DPIDs/values."""
-        pairs = [
-            ("DP_ID_BAP_NAVI_VIDEOSTREAMS_AVAILABLE", "1"),
-            ("DP_ID_BAP_NAVI_ACTIVERGTYPE_RGTYPE", "3"),
-            ("DP_ID_HMI_NAVI_VIDEOSTREAM_VIDEODATA_READY", "1"),
-            ("DP_ID_BAP_NAVIGATION_AVAILABLE", "1"),
-            ("DP_ID_BAP_NAVI_FSG_OPERATIONSTATE_OP_STATE", "0"),
-        ]
-
-        self.output_text.insert(tk.END, "[PRESET] Navigation batch send\n")
-        self.output_text.see(tk.END)
-
-        def execute_thread():
-            for signal_name, signal_value in pairs:
-                try:
-                    shell_cmd = f'shell IpcSender --dpid {signal_name} 0 {signal_value}'
-                    adb_cmd = self.get_adb_command(shell_cmd)
-                    process = subprocess.Popen(
-                        adb_cmd,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        encoding='cp949',
-                        cwd=self.current_directory,
-                    )
-                    stdout, stderr = process.communicate(timeout=10)
-                    self.root.after(
-                        0,
-                        lambda n=signal_name, v=signal_value, out=stdout, err=stderr, rc=process.returncode: self.show_signal_result(
-                            n, v, out, err, rc
-                        ),
-                    )
-                except subprocess.TimeoutExpired:
-                    self.root.after(
-                        0,
-                        lambda n=signal_name, v=signal_value: self.show_signal_error(
-                            n, v, "Command execution timed out"
-                        ),
-                    )
-                except Exception as e:
-                    self.root.after(
-                        0,
-                        lambda n=signal_name, v=signal_value, msg=str(e): self.show_signal_error(
-                            n, v, msg
-                        ),
-                    )
-
-        thread = threading.Thread(target=execute_thread)
-        thread.daemon = True
-        thread.start()
+        self.run_preset("navigation")
 
     def send_long_view_preset(self):
         """Key 11: send the LONG VIEW press/release sequence (twice)."""
-        pairs = [
-            ("DP_ID_HMI_VIEW_LONG_PRESS", "1"),
-            ("DP_ID_HMI_VIEW_LONG_PRESS", "0"),
-            ("DP_ID_HMI_VIEW_LONG_PRESS_RELEASE", "1"),
-            ("DP_ID_HMI_VIEW_LONG_PRESS_RELEASE", "0"),
-        ]
-
-        self.output_text.insert(tk.END, "[KEY] LONG VIEW (11) sequence send\n")
-        self.output_text.see(tk.END)
-
-        def execute_thread():
-            for signal_name, signal_value in pairs:
-                try:
-                    shell_cmd = f'shell IpcSender --dpid {signal_name} 0 {signal_value}'
-                    adb_cmd = self.get_adb_command(shell_cmd)
-                    process = subprocess.Popen(
-                        adb_cmd,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        encoding='cp949',
-                        cwd=self.current_directory,
-                    )
-                    stdout, stderr = process.communicate(timeout=10)
-                    self.root.after(
-                        0,
-                        lambda n=signal_name, v=signal_value, out=stdout, err=stderr, rc=process.returncode: self.show_signal_result(
-                            n, v, out, err, rc
-                        ),
-                    )
-                except subprocess.TimeoutExpired:
-                    self.root.after(
-                        0,
-                        lambda n=signal_name, v=signal_value: self.show_signal_error(
-                            n, v, "Command execution timed out"
-                        ),
-                    )
-                except Exception as e:
-                    self.root.after(
-                        0,
-                        lambda n=signal_name, v=signal_value, msg=str(e): self.show_signal_error(
-                            n, v, msg
-                        ),
-                    )
-
-        thread = threading.Thread(target=execute_thread)
-        thread.daemon = True
-        thread.start()
+        self.run_preset("long_view")
 
     def send_custom_12_preset(self):
         """Key 12: send a small custom batch of DPIDs/values."""
-        # Scripted sequence with explicit waits (ms) between steps
-        steps = [
-            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
-            ("WAIT", "1000"), 
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),                            
-            ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
-
-            ("WAIT", "300"), 
-
-        ]
-
-        self.output_text.insert(tk.END, "[PRESET] CUSTOM (12) batch send\n")
-        self.output_text.see(tk.END)
-
-        def execute_thread():
-            for signal_name, signal_value in steps:
-                if signal_name == "WAIT":
-                    try:
-                        wait_ms = int(str(signal_value).strip())
-                    except Exception:
-                        wait_ms = 0
-
-                    # Log wait (must be done on the UI thread)
-                    self.root.after(0, lambda ms=wait_ms: self.output_text.insert(tk.END, f"[PRESET] wait {ms} ms\n"))
-                    self.root.after(0, lambda: self.output_text.see(tk.END))
+        self.run_preset("custom_12")
+
+    def run_preset(self, preset_name):
+        """Run a preset from PRESETS in the background; returns its PresetRun."""
+        title, steps = PRESETS[preset_name]
+        self.root.after(0, lambda: self.log_to_output(title))
+
+        def on_wait(wait_ms):
+            # Log wait (must be done on the UI thread)
+            self.root.after(0, lambda: self.log_to_output(f"[PRESET] wait {wait_ms} ms"))
+
+        def on_state(run):
+            # Device drops suspend the preset; it resumes from its last confirmed step
+            if run.state == "suspended":
+                message = (f"[PRESET] Device lost at step {run.checkpoint}/{run.total_steps}; "
+                           "waiting for it to come back...")
+            elif run.state == "running":
+                message = f"[PRESET] Device back; resuming from step {run.checkpoint}/{run.total_steps}"
+                if run.reapplied:
+                    message += f" (re-applied {run.reapplied} signals)"
+            else:
+                message = f"[PRESET] Device did not come back; stopped at step {run.checkpoint}/{run.total_steps}"
+            self.root.after(0, lambda: self.log_to_output(message))
+
+        run = self.sender.start_preset(preset_name, on_result=self.show_result_from_thread, on_wait=on_wait,
+                                       on_state=on_state)
+        self.verify_screen_after(preset_name, run)
+        return run
+
+    def verify_screen_after(self, name, action):
+        """Once action (PresetRun or queue entry) finished, compare the screen with reference name if it exists."""
+        verifier = self.screen_verifier
+        if verifier is None or action is None or id(action) in self.screen_pending \
+                or not verifier.references.exists(name):
+            return
+        self.screen_pending.add(id(action))
 
-                    if wait_ms > 0:
-                        time.sleep(wait_ms / 1000.0)
-                    continue
+        def verify_thread():
+            try:
+                action.wait()
+                self.log_from_thread(verifier.verify(name).describe())
+            finally:
+                self.screen_pending.discard(id(action))
 
-                try:
-                    shell_cmd = f'shell IpcSender --dpid {signal_name} 0 {signal_value}'
-                    adb_cmd = self.get_adb_command(shell_cmd)
-                    process = subprocess.Popen(
-                        adb_cmd,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        encoding='cp949',
-                        cwd=self.current_directory,
-                    )
-                    stdout, stderr = process.communicate(timeout=10)
-                    self.root.after(
-                        0,
-                        lambda n=signal_name, v=signal_value, out=stdout, err=stderr, rc=process.returncode: self.show_signal_result(
-                            n, v, out, err, rc
-                        ),
-                    )
-                except subprocess.TimeoutExpired:
-                    self.root.after(
-                        0,
-                        lambda n=signal_name, v=signal_value: self.show_signal_error(
-                            n, v, "Command execution timed out"
-                        ),
-                    )
-                except Exception as e:
-                    self.root.after(
-                        0,
-                        lambda n=signal_name, v=signal_value, msg=str(e): self.show_signal_error(
-                            n, v, msg
-                        ),
-                    )
-
-        thread = threading.Thread(target=execute_thread)
+        thread = threading.Thread(target=verify_thread)
         thread.daemon = True
         thread.start()
 
-    def show_signal_result(self, signal_name, signal_value, stdout, stderr, returncode):
-        """Show the result of sending a user signal."""
-        combined_output = f"{stdout or ''}\n{stderr or ''}".strip()
-        device_parse_error = (
-            "[CMessage][ParsingDPID]" in combined_output
-            and "can_dpid_msg_lut" in combined_output
-        )
+    def show_signal_result(self, result):
+        """Show the result of sending a user signal (an OperationResult)."""
+        signal_name, signal_value = result.name, result.value
+        if result.error_class in ("timeout", "error"):
+            self.show_signal_error(signal_name, signal_value, result.error)
+            return
+
+        stdout, stderr = result.stdout, result.stderr
+        device_parse_error = result.error_class == "parse_error"
 
-        if returncode == 0 and not device_parse_error:
+        if result.ok:
             self.output_text.insert(tk.END, f"✅ SIGNAL sent: {signal_name} = {signal_value}\n")
             if stdout.strip():
                 self.output_text.insert(tk.END, f"Output: {stdout.strip()}\n")
         else:
-            self.output_text.insert(tk.END, f"❌ SIGNAL failed (code: {returncode}): {signal_name} = {signal_value}\n")
+            self.output_text.insert(tk.END, f"❌ SIGNAL failed (code: {result.returncode}): {signal_name} = {signal_value}\n")
             if device_parse_error:
                 self.output_text.insert(
                     tk.END,
@@ -1737,7 +1103,7 @@ fi
                 self.output_text.insert(tk.END, f"Error: {stderr.strip()}\n")
             if stdout.strip() and device_parse_error:
                 self.output_text.insert(tk.END, f"Output: {stdout.strip()}\n")
-            if "no devices" in stderr.lower() or "unauthorized" in stderr.lower() or "offline" in stderr.lower():
+            if result.error_class in ("no_device", "unauthorized", "offline"):
                 self.output_text.insert(tk.END, "Check connection status. (Click Settings)\n")
 
         self.output_text.insert(tk.END, "-" * 40 + "\n")
@@ -1746,7 +1112,7 @@ fi
     def show_signal_error(self, signal_name, signal_value, error_msg):
         """Show an error for sending a user signal."""
         self.output_text.insert(tk.END, f"❌ SIGNAL error: {signal_name} = {signal_value} / {error_msg}\n")
-        if "timeout" in error_msg.lower() or "no devices" in error_msg.lower():
+        if "timeout" in error_msg.lower() or "timed out" in error_msg.lower() or "no devices" in error_msg.lower():
             self.output_text.insert(tk.END, "Check connection status. (Click Settings)\n")
         self.output_text.insert(tk.END, "-" * 40 + "\n")
         self.output_text.see(tk.END)
@@ -1783,58 +1149,621 @@ fi
             self.output_text.see(tk.END)
     
     def execute_command(self, command):
-        """Run a command and display the result."""
-        try:
-            # Execute command in Windows environment
-            process = subprocess.Popen(
-                command,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='cp949',  # Windows code page (commonly used for Korean output)
-                cwd=self.current_directory,
-                universal_newlines=True
-            )
-            
-            # Capture output
-            stdout, stderr = process.communicate()
-            
-            # Update UI on the main thread
-            self.root.after(0, self.show_result, stdout, stderr, process.returncode)
-            
-        except Exception as e:
-            self.root.after(0, self.show_error, str(e))
-    
-    def show_result(self, stdout, stderr, returncode):
-        """Show command execution result."""
-        if stdout:
-            self.output_text.insert(tk.END, stdout)
-        
-        if stderr:
-            self.output_text.insert(tk.END, f"\nError output:\n{stderr}")
-        
-        if returncode != 0:
-            self.output_text.insert(tk.END, f"\nExit code: {returncode}\n")
-        
-        self.output_text.insert(tk.END, "\n" + "="*60 + "\n")
+        """Run a host command as a job; its output is streamed into the output area."""
+        command = command.strip()
+        if not command:
+            return None
+        if command == "cd" or command.startswith("cd "):
+            self.handle_cd_command(command)
+            return None
+
+        timeout = self.job_manager.default_timeout
+        if hasattr(self, 'job_timeout_var'):
+            timeout_text = self.job_timeout_var.get().strip()
+            try:
+                timeout = float(timeout_text) if timeout_text else None
+            except ValueError:
+                self.output_text.insert(tk.END, f"[JOB] Invalid timeout '{timeout_text}', using {timeout}s\n")
+
+        job = self.job_manager.start(command, cwd=self.current_directory, timeout=timeout)
+        self.output_text.insert(tk.END, f"[JOB #{job.job_id}] {command}\n")
         self.output_text.see(tk.END)
-        
-        # Re-enable run button (keypad 5)
-        if hasattr(self, 'keypad_btns') and (1, 1) in self.keypad_btns:
-            self.keypad_btns[(1, 1)].config(state=tk.NORMAL)
-        self.cmd_entry.focus()
-    
-    def show_error(self, error):
-        """Show an error message."""
-        self.output_text.insert(tk.END, f"\nExecution error: {error}\n")
+        self.refresh_jobs_list()
+        return job
+
+    def pump_job_output(self):
+        """Move streamed job output into the output area (runs on the Tk loop)."""
+        inserted = False
+        try:
+            # Bound the work per tick so a chatty job cannot freeze the GUI
+            for _ in range(200):
+                job, stream_name, text = self.job_output_queue.get_nowait()
+                if stream_name is None:
+                    self.show_job_exit(job)
+                else:
+                    self.output_text.insert(tk.END, text, ('job_stderr',) if stream_name == "stderr" else ())
+                inserted = True
+        except queue.Empty:
+            pass
+        if inserted:
+            self.output_text.see(tk.END)
+        self.root.after(50 if inserted else 100, self.pump_job_output)
+
+    def show_job_exit(self, job):
+        """Show how a host command job ended."""
+        if job.state == "error":
+            self.output_text.insert(tk.END, f"\n[JOB #{job.job_id}] Execution error: {job.error}\n")
+        elif job.state == "done":
+            self.output_text.insert(tk.END, f"\n[JOB #{job.job_id}] Exit code: {job.returncode} ({job.elapsed:.1f}s)\n")
+        else:
+            self.output_text.insert(tk.END, f"\n[JOB #{job.job_id}] {job.state} after {job.elapsed:.1f}s\n")
         self.output_text.insert(tk.END, "="*60 + "\n")
         self.output_text.see(tk.END)
-        
-        if hasattr(self, 'keypad_btns') and (1, 1) in self.keypad_btns:
-            self.keypad_btns[(1, 1)].config(state=tk.NORMAL)
-        self.cmd_entry.focus()
-    
+        self.refresh_jobs_list()
+
+    def open_jobs_window(self):
+        """Open the host command jobs window (run, list, cancel, kill)."""
+        if self.jobs_window is not None and self.jobs_window.winfo_exists():
+            self.jobs_window.focus()
+            self.jobs_window.lift()
+            return
+
+        jobs_window = tk.Toplevel(self.root)
+        self.jobs_window = jobs_window
+        jobs_window.title("Host Command Jobs")
+        jobs_window.geometry("520x320")
+        jobs_window.transient(self.root)
+
+        def on_close():
+            self.jobs_window = None
+            jobs_window.destroy()
+
+        jobs_window.protocol("WM_DELETE_WINDOW", on_close)
+
+        jobs_frame = ttk.Frame(jobs_window, padding="10")
+        jobs_frame.pack(fill=tk.BOTH, expand=True)
+
+        # Command input + timeout
+        input_frame = ttk.Frame(jobs_frame)
+        input_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(input_frame, text="Command:").grid(row=0, column=0, sticky=tk.W)
+        self.job_command_var = tk.StringVar()
+        command_entry = ttk.Entry(input_frame, textvariable=self.job_command_var, width=40)
+        command_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(6, 6))
+
+        ttk.Label(input_frame, text="Timeout (s):").grid(row=0, column=2, sticky=tk.W)
+        self.job_timeout_var = tk.StringVar(value=str(HOST_JOB_DEFAULT_TIMEOUT))
+        ttk.Entry(input_frame, textvariable=self.job_timeout_var, width=6).grid(row=0, column=3, padx=(6, 6))
+
+        def run_job():
+            self.execute_command(self.job_command_var.get())
+
+        ttk.Button(input_frame, text="Run", command=run_job).grid(row=0, column=4)
+        command_entry.bind('<Return>', lambda e: run_job())
+        input_frame.columnconfigure(1, weight=1)
+
+        # Running jobs
+        ttk.Label(jobs_frame, text="Running jobs:").pack(anchor=tk.W)
+        self.jobs_listbox = tk.Listbox(jobs_frame, height=8, font=('Consolas', 9))
+        self.jobs_listbox.pack(fill=tk.BOTH, expand=True)
+
+        def selected_job_id():
+            selection = self.jobs_listbox.curselection()
+            if not selection:
+                return None
+            return self.jobs_listbox_ids[selection[0]]
+
+        buttons_frame = ttk.Frame(jobs_frame)
+        buttons_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(buttons_frame, text="Cancel",
+                  command=lambda: self.job_manager.cancel(selected_job_id())).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(buttons_frame, text="Kill",
+                  command=lambda: self.job_manager.kill(selected_job_id())).pack(side=tk.LEFT)
+        ttk.Button(buttons_frame, text="Close", command=on_close).pack(side=tk.RIGHT)
+
+        command_entry.focus_set()
+        self.refresh_jobs_list()
+
+        # Keep elapsed times current while the window is open
+        def periodic_refresh():
+            if self.jobs_window is jobs_window and jobs_window.winfo_exists():
+                self.refresh_jobs_list()
+                jobs_window.after(500, periodic_refresh)
+
+        jobs_window.after(500, periodic_refresh)
+
+    def refresh_jobs_list(self):
+        """Refresh the running jobs list (if the jobs window is open)."""
+        if self.jobs_window is None or not hasattr(self, 'jobs_listbox'):
+            return
+        try:
+            if not self.jobs_listbox.winfo_exists():
+                return
+        except tk.TclError:
+            return
+
+        selection = self.jobs_listbox.curselection()
+        selected_id = self.jobs_listbox_ids[selection[0]] if selection else None
+
+        jobs = self.job_manager.running_jobs()
+        self.jobs_listbox_ids = [job.job_id for job in jobs]
+        self.jobs_listbox.delete(0, tk.END)
+        for index, job in enumerate(jobs):
+            self.jobs_listbox.insert(tk.END, job.describe())
+            if job.job_id == selected_id:
+                self.jobs_listbox.selection_set(index)
+
+    def open_monitor_window(self):
+        """Open the device resource monitor (CPU/memory chart with the sent signals)."""
+        if self.monitor_window is not None and self.monitor_window.winfo_exists():
+            self.monitor_window.focus()
+            self.monitor_window.lift()
+            return
+
+        monitor_window = tk.Toplevel(self.root)
+        self.monitor_window = monitor_window
+        monitor_window.title("Device Monitor")
+        monitor_window.geometry("560x360")
+        monitor_window.transient(self.root)
+
+        def on_close():
+            # Sampling continues in the background until Stop
+            self.monitor_window = None
+            monitor_window.destroy()
+
+        monitor_window.protocol("WM_DELETE_WINDOW", on_close)
+
+        monitor_frame = ttk.Frame(monitor_window, padding="10")
+        monitor_frame.pack(fill=tk.BOTH, expand=True)
+
+        # Interval + processes to follow
+        input_frame = ttk.Frame(monitor_frame)
+        input_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(input_frame, text="Interval (s):").grid(row=0, column=0, sticky=tk.W)
+        self.monitor_interval_var = tk.StringVar(value="1.0")
+        ttk.Entry(input_frame, textvariable=self.monitor_interval_var, width=6).grid(row=0, column=1, padx=(6, 6))
+
+        ttk.Label(input_frame, text="Processes:").grid(row=0, column=2, sticky=tk.W)
+        self.monitor_processes_var = tk.StringVar()
+        ttk.Entry(input_frame, textvariable=self.monitor_processes_var, width=24).grid(
+            row=0, column=3, sticky=(tk.W, tk.E), padx=(6, 6))
+
+        ttk.Button(input_frame, text="Start", command=self.start_monitor).grid(row=0, column=4, padx=(0, 5))
+        ttk.Button(input_frame, text="Stop", command=self.stop_monitor).grid(row=0, column=5)
+        input_frame.columnconfigure(3, weight=1)
+
+        # Live chart: CPU (blue), memory (green), one tick per sent signal/button (red = failed)
+        self.monitor_canvas = tk.Canvas(monitor_frame, height=200, background="white", highlightthickness=1)
+        self.monitor_canvas.pack(fill=tk.BOTH, expand=True)
+
+        self.monitor_status_label = ttk.Label(monitor_frame, text="Not sampling", font=('Consolas', 9))
+        self.monitor_status_label.pack(anchor=tk.W, pady=(5, 0))
+
+        buttons_frame = ttk.Frame(monitor_frame)
+        buttons_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(buttons_frame, text="Export...", command=self.export_monitor).pack(side=tk.LEFT)
+        ttk.Button(buttons_frame, text="Close", command=on_close).pack(side=tk.RIGHT)
+
+        def periodic_refresh():
+            if self.monitor_window is monitor_window and monitor_window.winfo_exists():
+                self.draw_monitor_chart()
+                monitor_window.after(MONITOR_REFRESH_MS, periodic_refresh)
+
+        periodic_refresh()
+
+    def start_monitor(self):
+        """Start sampling device load with the settings from the monitor window."""
+        if self.monitor is not None and self.monitor.running:
+            return
+        try:
+            interval = float(self.monitor_interval_var.get())
+        except ValueError:
+            messagebox.showerror("Device Monitor", "Interval must be a number of seconds.")
+            return
+        processes = [name.strip() for name in self.monitor_processes_var.get().replace(",", " ").split()]
+        self.monitor = DeviceMonitor(self.client, interval, processes)
+        self.monitor.start()
+        self.log_to_output(f"[MONITOR] Sampling every {self.monitor.interval:g}s"
+                           + (f" ({', '.join(processes)})" if processes else ""))
+
+    def stop_monitor(self):
+        if self.monitor is None or not self.monitor.running:
+            return
+        monitor = self.monitor
+        threading.Thread(target=monitor.stop, daemon=True).start()
+        self.log_to_output(f"[MONITOR] Stopped after {len(monitor.series)} samples")
+
+    def export_monitor(self):
+        """Save the samples and the sent-signal timeline as JSON."""
+        if self.monitor is None or not self.monitor.series:
+            messagebox.showinfo("Device Monitor", "No samples to export yet.")
+            return
+        from tkinter import filedialog
+        default_name = f"monitor_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        path = filedialog.asksaveasfilename(parent=self.monitor_window, initialdir=self.current_directory,
+                                            initialfile=default_name, defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            self.monitor.export(path)
+            self.log_to_output(f"[MONITOR] Exported to {path}")
+        except OSError as e:
+            messagebox.showerror("Device Monitor", f"Could not write {path}: {e}")
+
+    def draw_monitor_chart(self):
+        """Redraw the last MONITOR_CHART_SECONDS of samples and sent operations."""
+        canvas = self.monitor_canvas
+        canvas.delete("all")
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        if width < 50 or height < 50:
+            return
+        plot_bottom = height - 14  # Signal ticks go below the plot
+        now = time.time()
+        start = now - MONITOR_CHART_SECONDS
+
+        def x_of(t):
+            return (t - start) / MONITOR_CHART_SECONDS * width
+
+        def y_of(percent):
+            return plot_bottom - min(100.0, max(0.0, percent)) / 100.0 * (plot_bottom - 4)
+
+        for percent in (25, 50, 75):
+            canvas.create_line(0, y_of(percent), width, y_of(percent), fill="#e0e0e0")
+            canvas.create_text(2, y_of(percent), text=f"{percent}%", anchor=tk.W, fill="gray", font=('Arial', 7))
+
+        monitor = self.monitor
+        samples = monitor.samples(start) if monitor is not None else []
+        for series, color in ((lambda s: s.cpu_percent, "blue"), (lambda s: s.mem_percent, "green")):
+            points = []
+            for sample in samples:
+                value = series(sample)
+                if value is not None:
+                    points.extend((x_of(sample.t), y_of(value)))
+            if len(points) >= 4:
+                canvas.create_line(*points, fill=color, width=2)
+
+        for t, _, _, result, _ in self.client.ledger.events(start):
+            x = x_of(t)
+            canvas.create_line(x, height - 12, x, height - 2, fill="darkorange" if result == "ok" else "red")
+
+        if monitor is None or not monitor.running:
+            status = "Not sampling"
+        elif samples:
+            latest = samples[-1]
+            status = f"CPU {latest.cpu_percent or 0:.1f}%  Mem {latest.mem_used_kb // 1024} MB"
+            for name, (cpu_percent, rss_kb) in latest.processes.items():
+                status += f"  {name} " + ("-" if cpu_percent is None else f"{cpu_percent:.1f}% {rss_kb // 1024} MB")
+        else:
+            status = f"Waiting for samples... {monitor.last_error}"
+        self.monitor_status_label.config(text=status)
+
+    def open_stats_window(self):
+        """Open the signal statistics window (per-DPID counts, errors and latency from the ledger)."""
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.focus()
+            self.stats_window.lift()
+            return
+
+        stats_window = tk.Toplevel(self.root)
+        self.stats_window = stats_window
+        stats_window.title("Signal Statistics")
+        stats_window.geometry("600x470")
+        stats_window.transient(self.root)
+
+        def on_close():
+            self.stats_window = None
+            stats_window.destroy()
+
+        stats_window.protocol("WM_DELETE_WINDOW", on_close)
+
+        stats_frame = ttk.Frame(stats_window, padding="10")
+        stats_frame.pack(fill=tk.BOTH, expand=True)
+
+        top_frame = ttk.Frame(stats_frame)
+        top_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Label(top_frame, text="Window:").pack(side=tk.LEFT)
+        self.stats_window_var = tk.StringVar(value="10 min")
+        ttk.Combobox(top_frame, textvariable=self.stats_window_var, values=list(STATS_WINDOWS),
+                     state="readonly", width=8).pack(side=tk.LEFT, padx=(6, 0))
+
+        columns = ("count", "errors", "error_rate", "p50", "p99")
+        self.stats_tree = ttk.Treeview(stats_frame, columns=columns, height=10)
+        self.stats_tree.heading("#0", text="DPID")
+        self.stats_tree.column("#0", width=260)
+        for column, title in zip(columns, ("Count", "Errors", "Error %", "p50 ms", "p99 ms")):
+            self.stats_tree.heading(column, text=title)
+            self.stats_tree.column(column, width=60, anchor=tk.E)
+        self.stats_tree.pack(fill=tk.BOTH, expand=True)
+
+        self.stats_status_label = ttk.Label(stats_frame, text="", font=('Consolas', 9))
+        self.stats_status_label.pack(anchor=tk.W, pady=(5, 0))
+
+        # Rate limiter buckets
+        self.limits_label = ttk.Label(stats_frame, text="", font=('Arial', 9))
+        self.limits_label.pack(anchor=tk.W, pady=(8, 2))
+        limit_columns = ("rate", "burst", "tokens", "owed", "writes", "waits", "waited")
+        self.limits_tree = ttk.Treeview(stats_frame, columns=limit_columns, height=3)
+        self.limits_tree.heading("#0", text="Limit")
+        self.limits_tree.column("#0", width=190)
+        for column, title in zip(limit_columns, ("Rate/s", "Burst", "Tokens", "Owed", "Writes", "Waits",
+                                                  "Waited s")):
+            self.limits_tree.heading(column, text=title)
+            self.limits_tree.column(column, width=52, anchor=tk.E)
+        self.limits_tree.pack(fill=tk.X)
+
+        buttons_frame = ttk.Frame(stats_frame)
+        buttons_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(buttons_frame, text="Export CSV...", command=self.export_stats).pack(side=tk.LEFT)
+        ttk.Button(buttons_frame, text="Close", command=on_close).pack(side=tk.RIGHT)
+
+        def periodic_refresh():
+            if self.stats_window is stats_window and stats_window.winfo_exists():
+                self.refresh_stats()
+                stats_window.after(STATS_REFRESH_MS, periodic_refresh)
+
+        periodic_refresh()
+
+    def stats_since(self):
+        """Start of the selected statistics window (epoch seconds, None = everything)."""
+        seconds = STATS_WINDOWS.get(self.stats_window_var.get())
+        return None if seconds is None else time.time() - seconds
+
+    def refresh_stats(self):
+        """Query the ledger in a thread (large windows scan millions of events), then fill the table."""
+        if getattr(self, 'stats_query_running', False):
+            return
+        self.stats_query_running = True
+        since = self.stats_since()
+
+        def query_thread():
+            try:
+                rows = self.client.ledger.summary(since)
+            finally:
+                self.stats_query_running = False
+            self.root.after(0, lambda: self.show_stats(rows))
+
+        threading.Thread(target=query_thread, daemon=True).start()
+
+    def show_stats(self, rows):
+        if self.stats_window is None or not self.stats_window.winfo_exists():
+            return
+        ledger = self.client.ledger
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        for row in rows:
+            self.stats_tree.insert("", tk.END, text=row["name"], values=(
+                row["count"], row["errors"], f"{row['error_rate'] * 100:.1f}",
+                "-" if row["p50_ms"] is None else f"{row['p50_ms']:.1f}",
+                "-" if row["p99_ms"] is None else f"{row['p99_ms']:.1f}",
+            ))
+        self.stats_status_label.config(
+            text=f"{len(ledger)} events kept ({ledger.memory_bytes() / 1048576:.1f} MB), {ledger.dropped} dropped")
+        self.show_rate_limits()
+
+    def show_rate_limits(self):
+        """Fill the limiter table (token level, waits) in the statistics window."""
+        limiter = self.client.limiter
+        self.limits_label.config(text=limiter.describe())
+        self.limits_tree.delete(*self.limits_tree.get_children())
+        for row in limiter.snapshot():
+            self.limits_tree.insert("", tk.END, text=f"{row['scope']}: {row['key']}", values=(
+                f"{row['rate']:g}", f"{row['burst']:g}", f"{row['tokens']:.0f}", f"{row['owed']:.0f}",
+                row["writes"], row["waits"], f"{row['waited']:.2f}",
+            ))
+
+    def export_stats(self):
+        """Save the ledger events of the selected window as CSV."""
+        from tkinter import filedialog
+        default_name = f"signals_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        path = filedialog.asksaveasfilename(parent=self.stats_window, initialdir=self.current_directory,
+                                            initialfile=default_name, defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            rows = self.client.ledger.export_csv(path, self.stats_since())
+            self.log_to_output(f"[STATS] Exported {rows} events to {path}")
+        except OSError as e:
+            messagebox.showerror("Signal Statistics", f"Could not write {path}: {e}")
+
+    def open_soak_window(self):
+        """Open the soak test window (loop a preset unattended, riding out disconnects)."""
+        if self.soak_window is not None and self.soak_window.winfo_exists():
+            self.soak_window.focus()
+            self.soak_window.lift()
+            return
+
+        soak_window = tk.Toplevel(self.root)
+        self.soak_window = soak_window
+        soak_window.title("Soak Test")
+        soak_window.geometry("520x300")
+        soak_window.transient(self.root)
+
+        def on_close():
+            # A running soak continues; reopen the window to see it
+            self.soak_window = None
+            soak_window.destroy()
+
+        soak_window.protocol("WM_DELETE_WINDOW", on_close)
+
+        soak_frame = ttk.Frame(soak_window, padding="10")
+        soak_frame.pack(fill=tk.BOTH, expand=True)
+
+        input_frame = ttk.Frame(soak_frame)
+        input_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Label(input_frame, text="Preset:").grid(row=0, column=0, sticky=tk.W)
+        self.soak_preset_var = tk.StringVar(value="custom_12")
+        ttk.Combobox(input_frame, textvariable=self.soak_preset_var, values=list(PRESETS),
+                     state="readonly", width=12).grid(row=0, column=1, padx=(6, 10))
+        ttk.Label(input_frame, text="Hours:").grid(row=0, column=2, sticky=tk.W)
+        self.soak_hours_var = tk.StringVar(value="8")
+        ttk.Entry(input_frame, textvariable=self.soak_hours_var, width=6).grid(row=0, column=3, padx=(6, 10))
+        ttk.Label(input_frame, text="Iterations:").grid(row=0, column=4, sticky=tk.W)
+        self.soak_iterations_var = tk.StringVar()
+        ttk.Entry(input_frame, textvariable=self.soak_iterations_var, width=8).grid(row=0, column=5, padx=(6, 0))
+
+        self.soak_status_label = ttk.Label(soak_frame, text="Not running", font=('Consolas', 9),
+                                           justify=tk.LEFT, wraplength=480)
+        self.soak_status_label.pack(fill=tk.BOTH, expand=True, anchor=tk.NW)
+
+        buttons_frame = ttk.Frame(soak_frame)
+        buttons_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(buttons_frame, text="Start", command=self.start_soak).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(buttons_frame, text="Stop", command=self.stop_soak).pack(side=tk.LEFT)
+        ttk.Button(buttons_frame, text="Close", command=on_close).pack(side=tk.RIGHT)
+
+        def periodic_refresh():
+            if self.soak_window is soak_window and soak_window.winfo_exists():
+                self.refresh_soak_status()
+                soak_window.after(1000, periodic_refresh)
+
+        periodic_refresh()
+
+    def start_soak(self):
+        if self.soak is not None and self.soak.running:
+            messagebox.showinfo("Soak Test", "A soak test is already running.")
+            return
+        try:
+            hours = float(self.soak_hours_var.get()) if self.soak_hours_var.get().strip() else None
+            iterations = int(self.soak_iterations_var.get()) if self.soak_iterations_var.get().strip() else None
+            self.soak = SoakRun(self.client, self.soak_preset_var.get(),
+                                duration=hours * 3600 if hours else None, iterations=iterations,
+                                log=self.log_from_thread)
+        except ValueError as e:
+            messagebox.showerror("Soak Test", str(e))
+            return
+        self.soak.start()
+
+    def stop_soak(self):
+        if self.soak is not None and self.soak.running:
+            self.soak.stop()
+            self.log_to_output("[SOAK] Stopping after the current step...")
+
+    def refresh_soak_status(self):
+        if self.soak is None:
+            return
+        progress = self.soak.progress()
+        lines = [format_progress(progress)]
+        if progress["errors"]:
+            lines.append("Errors: " + ", ".join(f"{name} {count}" for name, count in progress["errors"].items()))
+        lines.append(f"Downtime {progress['downtime']:.0f}s, redeploys {progress['redeploys']}, "
+                     f"threads {progress['threads']}, adb live {PROCESSES.counts()['live']}")
+        if self.soak.failure_details:
+            lines.append("Last failure: " + self.soak.failure_details[-1])
+        self.soak_status_label.config(text="\n".join(lines))
+
+    def call_in_ui(self, func, timeout=5.0):
+        """Run func on the Tk loop and wait for its result (for non-Tk threads)."""
+        done = threading.Event()
+        outcome = {}
+
+        def run():
+            try:
+                outcome['result'] = func()
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                done.set()
+
+        self.root.after(0, run)
+        if not done.wait(timeout):
+            raise TimeoutError("GUI did not respond")
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+
+    # Automation API backend (called from API server threads)
+    def api_validate(self, op, args):
+        """Raise ValueError if an API request would be refused (nothing is queued)."""
+        if op == "press":
+            button_name, count = args
+            if button_name not in MFL_BUTTONS:
+                raise ValueError(f"Unknown button: {button_name} (valid: {', '.join(MFL_BUTTONS)})")
+            if not 1 <= count <= KEY_BURST_MAX_COUNT:
+                raise ValueError(f"count must be between 1 and {KEY_BURST_MAX_COUNT}")
+        elif op == "signal":
+            validate_signal(*args)
+        elif op == "preset" and args[0] not in PRESETS:
+            raise ValueError(f"Unknown preset: {args[0]} (valid: {', '.join(PRESETS)})")
+
+    def api_press(self, button_name, count=1):
+        """Press an MFL button count times; returns the queue entry."""
+        self.api_validate("press", (button_name, count))
+        self.root.after(0, lambda: self.log_to_output(f"[API] {button_name.upper()} x{count}"))
+        entry = self.execute_mfl_command(button_name, count)
+        if entry is None:
+            raise ValueError(f"Could not queue button: {button_name}")
+        return entry
+
+    def api_signal(self, signal_name, signal_value):
+        """Send one DPID value; returns the queue entry."""
+        self.api_validate("signal", (signal_name, signal_value))
+        self.root.after(0, lambda: self.log_to_output(f"[API] [SIGNAL] {signal_name} = {signal_value}"))
+        return self.queue_signal(signal_name, signal_value)
+
+    def api_preset(self, preset_name):
+        """Start a preset; returns its PresetRun."""
+        self.api_validate("preset", (preset_name,))
+        return self.run_preset(preset_name)
+
+    def api_status(self):
+        """Connection and queue state as a dict."""
+        status = dict(getattr(self, 'last_connection_status', {}))
+        screen_checks = None
+        if self.screen_verifier is not None:
+            screen_checks = [check.to_dict() for check in list(self.screen_verifier.history)[-10:]]
+        status.update({
+            "ready": bool(self.all_connected),
+            "device_id": self.device_id,
+            "adb_folder": self.adb_folder,
+            "queue_depth": self.command_queue.depth,
+            "host_jobs_running": len(self.job_manager.running_jobs()),
+            "adb_processes": PROCESSES.counts(),
+            "ledger_events": len(self.client.ledger),
+            "offline_held": self.client.offline.depth,
+            "adb_server": self.adb_server.to_dict(),
+            "rate_limits": self.client.limiter.snapshot(),
+            "timeouts": self.client.timeouts.snapshot(),
+            "capabilities": self.client.capabilities.to_dict() if self.client.capabilities else None,
+            "checks": self.client.status_cache.to_dict(),
+            "broker": {"port": self.broker.port, "client_id": self.broker.client_id} if self.broker else None,
+            "screen_checks": screen_checks,
+            "capture": self.frame_capture.to_dict() if self.frame_capture else None,
+        })
+        return status
+
+    def api_log_tail(self, lines=100):
+        """Last lines of the output area."""
+        lines = max(1, min(int(lines), 5000))
+        text = self.call_in_ui(lambda: self.output_text.get(f"end-{lines + 1}l", tk.END))
+        return text.rstrip("\n").split("\n")
+
+    def api_catalog(self):
+        """Available presets and button verbs."""
+        return {"presets": list(PRESETS), "buttons": list(MFL_BUTTONS)}
+
+    def on_app_close(self):
+        """Stop running host jobs and close the application."""
+        self.job_manager.kill_all()
+        if self.broker is not None:
+            self.broker.close()
+        self.adb_server.stop()
+        if self.monitor is not None:
+            self.monitor.stop()
+        if self.soak is not None:
+            self.soak.stop()
+        if self.frame_capture is not None:
+            self.frame_capture.stop()
+        self.client.close()
+        if TRACER.enabled and self.trace_path:
+            try:
+                TRACER.save(self.trace_path)
+            except OSError:
+                pass
+        self.root.destroy()
+
     def clear_output(self):
         """Clear the output window."""
         self.output_text.delete(1.0, tk.END)
@@ -1846,75 +1775,101 @@ fi
         self.output_text.insert(tk.END, "[9] Run VIEW\n")
         self.execute_mfl_command("view")
 
-    def execute_mfl_command(self, button_name):
-        """Execute an MFL script command."""
+    def execute_mfl_command(self, button_name, count=1):
+        """Queue an MFL script command (repeated presses are coalesced into one invocation)."""
         try:
-            # Build adb shell /tmp/mfl_total.sh [button_name] command
-            mfl_cmd = self.get_adb_command(f'shell /tmp/mfl_total.sh {button_name}')
-            self.output_text.insert(tk.END, f"Command: {mfl_cmd}\n")
-            self.output_text.see(tk.END)
-
-            # Execute in a separate thread
-            def execute_thread():
-                try:
-                    process = subprocess.Popen(
-                        mfl_cmd,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        encoding='cp949',
-                        cwd=self.current_directory
-                    )
-                    stdout, stderr = process.communicate(timeout=10)
-
-                    # Show results on the main thread
-                    self.root.after(0, lambda: self.show_mfl_result(button_name, stdout, stderr, process.returncode))
-
-                except subprocess.TimeoutExpired:
-                    self.root.after(0, lambda: self.show_mfl_error(button_name, "Command execution timed out", True))
-                except Exception as e:
-                    self.root.after(0, lambda: self.show_mfl_error(button_name, str(e), True))
-
-            thread = threading.Thread(target=execute_thread)
-            thread.daemon = True
-            thread.start()
-
+            self.log_if_held(button_name.upper())
+            trace_id, pressed_at = TRACER.new_operation(), time.perf_counter()
+            entry = self.sender.submit_press(
+                button_name, count, trace_id=trace_id,
+                on_done=lambda result: self.show_result_from_thread(result, trace_id, pressed_at))
+            # Held-key repeats coalesce into one entry, so the screen is checked once after the burst
+            self.verify_screen_after(button_name, entry)
+            return entry
         except Exception as e:
-            self.output_text.insert(tk.END, f"MFL command error: {str(e)}\n")
-            self.output_text.see(tk.END)
+            # Also called from API server threads: the output widget is only touched from the Tk loop
+            self.log_from_thread(f"MFL command error: {str(e)}")
+            return None
+
+    def show_mfl_result(self, result):
+        """Show the result of executing an MFL command (an OperationResult)."""
+        button_name, count = result.name, result.value
+        self.log_to_output(f"Command: {format_argv(self.client.templates.mfl_button(button_name, count))}")
+        if result.error_class in ("timeout", "error"):
+            self.show_mfl_error(button_name, result.error, True, count)
+            return
 
-    def show_mfl_result(self, button_name, stdout, stderr, returncode):
-        """Show the result of executing an MFL command."""
-        if returncode == 0:
-            self.output_text.insert(tk.END, f"✅ {button_name.upper()} executed successfully\n")
-            if stdout.strip():
-                self.output_text.insert(tk.END, f"Output: {stdout.strip()}\n")
+        button_label = button_name.upper() if count == 1 else f"{button_name.upper()} x{count}"
+        if result.ok:
+            self.output_text.insert(tk.END, f"✅ {button_label} executed successfully\n")
+            if result.stdout.strip():
+                self.output_text.insert(tk.END, f"Output: {result.stdout.strip()}\n")
         else:
-            self.output_text.insert(tk.END, f"❌ {button_name.upper()} failed (code: {returncode})\n")
-            if stderr.strip():
-                self.output_text.insert(tk.END, f"Error: {stderr.strip()}\n")
+            self.output_text.insert(tk.END, f"❌ {button_label} failed (code: {result.returncode})\n")
+            if result.stderr.strip():
+                self.output_text.insert(tk.END, f"Error: {result.stderr.strip()}\n")
             
             # Show guidance only for connectivity-related issues
-            if "no devices" in stderr or "unauthorized" in stderr or "offline" in stderr:
+            if result.error_class in ("no_device", "unauthorized", "offline"):
                 self.output_text.insert(tk.END, "Check connection status. (Click Settings)\n")
 
         self.output_text.insert(tk.END, "-" * 40 + "\n")
         self.output_text.see(tk.END)
 
-    def show_mfl_error(self, button_name, error_msg, open_settings=False):
+    def show_mfl_error(self, button_name, error_msg, open_settings=False, count=1):
         """Show an error for executing an MFL command."""
-        self.output_text.insert(tk.END, f"❌ {button_name.upper()} error: {error_msg}\n")
+        button_label = button_name.upper() if count == 1 else f"{button_name.upper()} x{count}"
+        self.output_text.insert(tk.END, f"❌ {button_label} error: {error_msg}\n")
 
         # Show guidance only for timeout/connectivity issues
-        if "timeout" in error_msg.lower() or "no devices" in error_msg.lower():
+        if "timeout" in error_msg.lower() or "timed out" in error_msg.lower() or "no devices" in error_msg.lower():
             self.output_text.insert(tk.END, "Check connection status. (Click Settings)\n")
 
         self.output_text.insert(tk.END, "-" * 40 + "\n")
         self.output_text.see(tk.END)
 
+def parse_args(argv=None):
+    """Parse command-line options."""
+    import argparse
+    parser = argparse.ArgumentParser(description="FPK ADB CMD Sender")
+    parser.add_argument(
+        "--metrics-port", type=int,
+        default=int(os.environ.get("FPK_METRICS_PORT", "0") or 0),
+        help="Serve Prometheus metrics on 127.0.0.1:PORT/metrics (0 = disabled; env FPK_METRICS_PORT)",
+    )
+    parser.add_argument(
+        "--api-port", type=int,
+        default=int(os.environ.get("FPK_API_PORT", "0") or 0),
+        help="Serve the automation API on 127.0.0.1:PORT (0 = disabled; env FPK_API_PORT)",
+    )
+    parser.add_argument(
+        "--broker", type=int,
+        default=int(os.environ.get("FPK_BROKER_PORT", "0") or 0), metavar="PORT",
+        help="Attach to the device broker on 127.0.0.1:PORT instead of polling the device (env FPK_BROKER_PORT)",
+    )
+    parser.add_argument(
+        "--screen-refs", default=os.environ.get("FPK_SCREEN_REFS", ""), metavar="DIR",
+        help="Compare the screen with DIR/<preset or button>.png after each action that has one "
+             "(env FPK_SCREEN_REFS)",
+    )
+    parser.add_argument(
+        "--capture", default=os.environ.get("FPK_CAPTURE", ""), metavar="DIR",
+        help="Record the screen continuously and save the frames around every action and error to DIR "
+             "(env FPK_CAPTURE)",
+    )
+    parser.add_argument(
+        "--trace", default=os.environ.get("FPK_TRACE", ""), metavar="FILE",
+        help="Record operation spans and write Chrome trace JSON to FILE on exit (env FPK_TRACE)",
+    )
+    return parser.parse_args(argv)
+
 def main():
     """Main entry point."""
+    args = parse_args()
+
+    if args.trace:
+        TRACER.enable()
+
     # Create Tkinter root window
     root = tk.Tk()
     
@@ -1939,6 +1894,51 @@ def main():
     app.output_text.insert(tk.END, "12:CUSTOM\n")
     app.output_text.insert(tk.END, "0:Clear Log\n")
     app.output_text.insert(tk.END, "="*60 + "\n")
+
+    # Optional metrics endpoint (served from its own thread)
+    if args.metrics_port:
+        try:
+            MetricsServer(port=args.metrics_port).start()
+            app.log_to_output(f"[Metrics] Serving http://127.0.0.1:{args.metrics_port}/metrics")
+        except OSError as e:
+            app.log_to_output(f"[Metrics] Could not start metrics endpoint: {str(e)}")
+
+    if args.trace:
+        app.trace_path = os.path.abspath(args.trace)
+        app.log_to_output(f"[Trace] Recording spans; written to {app.trace_path} on exit")
+
+    # Optional screenshot verification after presets and keypad actions
+    if args.screen_refs:
+        app.screen_verifier = ScreenVerifier(app.client, os.path.abspath(args.screen_refs))
+        names = app.screen_verifier.references.names()
+        app.log_to_output(f"[SCREEN] Verifying against {len(names)} reference(s) in {args.screen_refs}"
+                          + (f": {', '.join(names)}" if names else ""))
+
+    # Optional frame capture around actions (pre/post-trigger clips)
+    if args.capture:
+        app.frame_capture = FrameCapture(
+            app.client, CAPTURE_FPS, pre=CAPTURE_PRE_SECONDS, post=CAPTURE_POST_SECONDS,
+            out_dir=os.path.abspath(args.capture), max_bytes=CAPTURE_MAX_BYTES,
+            on_clip=lambda clip: app.log_from_thread(
+                f"[CAPTURE] {len(clip.frames)} frames around {clip.label} saved to {clip.path}")).start()
+        app.log_to_output(f"[CAPTURE] Recording at {CAPTURE_FPS} fps; clips of "
+                          f"{CAPTURE_PRE_SECONDS}s before/{CAPTURE_POST_SECONDS}s after each action -> {args.capture}")
+
+    # Optional device broker (shares one device session with other tools)
+    if args.broker:
+        try:
+            app.attach_broker(args.broker)
+            app.log_to_output(f"[Broker] Attached to 127.0.0.1:{args.broker}; the broker polls and deploys")
+        except OSError as e:
+            app.log_to_output(f"[Broker] Could not attach, checking the device directly: {str(e)}")
+
+    # Optional automation API (requests share the GUI's device command queue)
+    if args.api_port:
+        try:
+            AutomationApiServer(app, port=args.api_port).start()
+            app.log_to_output(f"[API] Serving http://127.0.0.1:{args.api_port}/")
+        except OSError as e:
+            app.log_to_output(f"[API] Could not start automation API: {str(e)}")
     
     # Set initial focus
     app.cmd_entry.focus()
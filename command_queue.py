@@ -0,0 +1,205 @@
+"""
+Device command queue - serial execution with coalescing of repeated button presses
+"""
+
+import collections
+import threading
+import time
+
+from fpk_trace import TRACER
+
+
+class QueuedCommand:
+    """One pending device operation.
+
+    func(count) performs the operation and returns its result; count is how
+    many coalesced presses this entry stands for. Callers that need the
+    outcome can wait() on the entry and then read result/error and timings.
+    """
+
+    __slots__ = ("func", "on_done", "coalesce_key", "count", "label", "trace_id", "queued_at",
+                 "started_at", "finished_at", "result", "error", "_done", "_callbacks", "_lock")
+
+    def __init__(self, func, on_done=None, coalesce_key=None, count=1, label="", trace_id=None):
+        self.func = func
+        self.on_done = on_done
+        self.coalesce_key = coalesce_key
+        self.count = count
+        self.label = label
+        self.trace_id = trace_id
+        self.queued_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def wait(self, timeout=None):
+        """Block until the entry has run (True) or the wait times out (False)."""
+        return self._done.wait(timeout)
+
+    def add_done_callback(self, callback):
+        """Call callback(entry) once the entry is done (right away if it already is).
+
+        Unlike on_done, any number of callers can watch one (coalesced) entry.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        _call_quietly(callback, self)
+
+    def _set_done(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            _call_quietly(callback, self)
+
+    def finish(self, result=None, error=None):
+        """Record the outcome, call on_done and wake the waiters."""
+        self.result = result
+        self.error = error
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+        if self.on_done:
+            try:
+                self.on_done(self, result, error)
+            except Exception:
+                pass
+        self._set_done()
+
+    @property
+    def queue_seconds(self):
+        """Time spent waiting in the queue."""
+        return (self.started_at or time.perf_counter()) - self.queued_at
+
+    @property
+    def exec_seconds(self):
+        """Time spent executing (0 until started)."""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+
+def _call_quietly(callback, entry):
+    try:
+        callback(entry)
+    except Exception:
+        pass
+
+
+class CommandQueue:
+    """Runs device operations one at a time, in submission order, on a worker thread.
+
+    Entries submitted with a coalesce_key merge into the newest pending entry
+    when that entry has the same key (e.g. a held arrow key), so N repeats
+    become one "press N times" invocation. Order between different keys is
+    preserved.
+
+    coalesce_window: seconds a coalescible entry waits after it was queued,
+        to collect the repeats that follow it (0 = run immediately).
+    max_rate: maximum coalescible invocations per second (None = unlimited).
+        Repeats arriving while the queue is throttled are merged, not dropped.
+    max_burst: upper bound for one merged count.
+    """
+
+    def __init__(self, coalesce_window=0.0, max_rate=None, max_burst=50, name="device-queue"):
+        self.coalesce_window = coalesce_window
+        self.max_rate = max_rate
+        self.max_burst = max_burst
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._last_burst_start = 0.0
+        self._busy = False
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    @property
+    def depth(self):
+        """Number of entries waiting (plus the one currently executing)."""
+        with self._cond:
+            return len(self._pending) + (1 if self._busy else 0)
+
+    def submit(self, func, on_done=None, coalesce_key=None, count=1, label="", trace_id=None):
+        """Queue an operation. on_done(entry, result, error) runs on the worker thread.
+
+        A submission merged into a pending entry returns that entry; its
+        on_done is kept and called with the merged entry's outcome.
+        trace_id: fpk_trace operation id the queue wait is recorded under.
+        """
+        with self._cond:
+            if coalesce_key is not None and self._pending:
+                tail = self._pending[-1]
+                if tail.coalesce_key == coalesce_key and tail.count + count <= self.max_burst:
+                    tail.count += count
+                    if on_done is not None:
+                        tail.add_done_callback(lambda entry: on_done(entry, entry.result, entry.error))
+                    return tail
+            entry = QueuedCommand(func, on_done, coalesce_key, count, label, trace_id)
+            self._pending.append(entry)
+            self._cond.notify()
+            return entry
+
+    def stop(self):
+        """Stop the worker after the current entry; pending entries are dropped."""
+        with self._cond:
+            self._stopped = True
+            dropped = list(self._pending)
+            self._pending.clear()
+            self._cond.notify()
+        for entry in dropped:
+            entry.error = RuntimeError("Command queue stopped")
+            entry._set_done()
+
+    def _next_entry(self):
+        """Wait for the next entry, honouring the coalescing window and rate limit."""
+        with self._cond:
+            while True:
+                if self._stopped:
+                    return None
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+
+                head = self._pending[0]
+                if head.coalesce_key is None:
+                    self._busy = True
+                    return self._pending.popleft()
+
+                # Leave the head in the queue while waiting so repeats can merge into it
+                now = time.perf_counter()
+                ready_at = head.queued_at + self.coalesce_window
+                if self.max_rate:
+                    ready_at = max(ready_at, self._last_burst_start + 1.0 / self.max_rate)
+                if now < ready_at:
+                    self._cond.wait(ready_at - now)
+                    continue
+
+                self._last_burst_start = now
+                self._busy = True
+                return self._pending.popleft()
+
+    def _run(self):
+        while True:
+            entry = self._next_entry()
+            if entry is None:
+                return
+            entry.started_at = time.perf_counter()
+            try:
+                entry.result = entry.func(entry.count)
+            except Exception as e:
+                entry.error = e
+            finally:
+                entry.finished_at = time.perf_counter()
+                with self._cond:
+                    self._busy = False
+            if TRACER.enabled:
+                TRACER.async_span("queued", entry.queued_at, entry.started_at,
+                                  entry.trace_id or TRACER.new_operation(), label=entry.label)
+                TRACER.complete(f"execute {entry.label}", entry.started_at, entry.finished_at,
+                                "queue", count=entry.count)
+            entry.finish(entry.result, entry.error)
@@ -0,0 +1,362 @@
+"""
+Automation API - local HTTP/JSON server for driving the keypad, signals and presets
+
+Endpoints (all JSON unless noted):
+    GET  /status                 connection state, queue depth, running jobs
+    GET  /log?lines=N            tail of the output log
+    GET  /presets                preset names and MFL button verbs
+    GET  /events                 Server-Sent Events stream of request results
+    POST /press   {"button": "up", "count": 1, "wait": true}
+    POST /signal  {"dpid": "DP_ID_...", "value": 1, "wait": true}
+    POST /preset  {"name": "adas", "wait": true}
+    POST /batch   {"requests": [{"op": "press", ...}, ...], "wait": true}
+
+Requests are submitted to the same device command queue as the GUI. With
+"wait": false the call returns 202 at once and the result is published on
+/events only, so a test runner can pipeline many requests.
+"""
+
+import itertools
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from fpk_metrics import REGISTRY
+
+# Seconds a waiting request may take before the API reports it as timed out
+DEFAULT_WAIT_TIMEOUT = 60.0
+
+# Events buffered per /events subscriber before old ones are dropped
+EVENT_BUFFER_SIZE = 1000
+
+REGISTRY.describe("api_requests_total", "counter", "Automation API requests, by operation and result")
+REGISTRY.describe("api_request_seconds", "summary", "Automation API request latency, by operation")
+
+
+class ApiError(Exception):
+    """Client error reported as an HTTP 4xx response."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class EventHub:
+    """Fan-out of result events to /events subscribers (slow subscribers lose old events)."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=EVENT_BUFFER_SIZE)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                try:
+                    subscriber.get_nowait()
+                    subscriber.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+
+
+def _ms(seconds):
+    return round(seconds * 1000.0, 3)
+
+
+class AutomationApi:
+    """Request handling independent of HTTP (the request handler delegates to it).
+
+    backend must provide:
+        api_press(button, count) -> queue entry (result: fpk_client.OperationResult)
+        api_signal(dpid, value) -> queue entry (result: fpk_client.OperationResult)
+        api_preset(name) -> PresetRun
+        api_status() -> dict
+        api_log_tail(lines) -> list of str
+        api_catalog() -> dict (preset names, button verbs)
+    and raise ValueError for invalid arguments. It may also provide
+    api_validate(op, args), raising ValueError, to check a request without
+    queuing anything; /batch then checks every request before the first is
+    submitted.
+    """
+
+    def __init__(self, backend, wait_timeout=DEFAULT_WAIT_TIMEOUT):
+        self.backend = backend
+        self.wait_timeout = wait_timeout
+        self.events = EventHub()
+        self._ids = itertools.count(1)
+
+    def parse(self, request):
+        """(op, args) of a request dict, checked with the backend's api_validate when it has one."""
+        if not isinstance(request, dict):
+            raise ApiError("Each request must be a JSON object")
+        op = request.get("op")
+        try:
+            if op == "press":
+                args = (str(request.get("button", "")), int(request.get("count", 1)))
+            elif op == "signal":
+                args = (str(request.get("dpid", "")), str(request.get("value", "")))
+            elif op == "preset":
+                args = (str(request.get("name", "")),)
+            else:
+                raise ApiError(f"Unknown op: {op!r}")
+            validate = getattr(self.backend, "api_validate", None)
+            if validate is not None:
+                validate(op, args)
+        except (ValueError, TypeError) as e:
+            raise ApiError(str(e))
+        return op, args
+
+    def submit(self, parsed, received_at=None):
+        """Submit a parsed request; returns (request_id, op, waitable, received_at)."""
+        received_at = time.perf_counter() if received_at is None else received_at
+        op, args = parsed
+        try:
+            if op == "press":
+                waitable = self.backend.api_press(*args)
+            elif op == "signal":
+                waitable = self.backend.api_signal(*args)
+            else:
+                waitable = self.backend.api_preset(*args)
+        except (ValueError, TypeError) as e:
+            raise ApiError(str(e))
+        return next(self._ids), op, waitable, received_at
+
+    def complete(self, request_id, op, waitable, received_at, wait=True):
+        """Wait for a submitted request (if asked) and build its result dict."""
+        if wait and not waitable.wait(self.wait_timeout):
+            result = {"id": request_id, "op": op, "ok": False, "error": "API wait timed out", "latency_ms": {}}
+        else:
+            result = self.describe(request_id, op, waitable)
+        result["latency_ms"]["total"] = _ms(time.perf_counter() - received_at)
+        return result
+
+    def describe(self, request_id, op, waitable):
+        """Result dict for a finished queue entry or preset run."""
+        if op == "preset":
+            return {
+                "id": request_id,
+                "op": op,
+                "name": waitable.name,
+                "ok": waitable.failures == 0,
+                "steps_sent": waitable.steps_sent,
+                "failures": waitable.failures,
+                "latency_ms": {"exec": _ms(waitable.elapsed)},
+            }
+
+        result = {
+            "id": request_id,
+            "op": op,
+            "label": waitable.label,
+            "count": waitable.count,
+            "latency_ms": {"queue": _ms(waitable.queue_seconds), "exec": _ms(waitable.exec_seconds)},
+        }
+        if waitable.error is not None:
+            result["ok"] = False
+            result["error"] = str(waitable.error) or type(waitable.error).__name__
+            return result
+
+        operation = waitable.result
+        result["ok"] = operation.ok
+        result["returncode"] = operation.returncode
+        result["stdout"] = operation.stdout.strip()
+        result["stderr"] = operation.stderr.strip()
+        if not operation.ok:
+            result["error_class"] = operation.error_class
+            if operation.error_class == "parse_error":
+                result["error"] = "DPID not registered in can_dpid_msg_lut"
+            elif operation.error:
+                result["error"] = operation.error
+        return result
+
+    def publish_when_done(self, request_id, op, waitable, received_at):
+        """Publish a request's result on /events once it finishes (for wait=false).
+
+        Runs from the entry's completion callback, so queued requests cost no thread.
+        """
+        waitable.add_done_callback(
+            lambda done: self.publish(self.complete(request_id, op, done, received_at, wait=False)))
+
+    def publish(self, result):
+        REGISTRY.inc("api_requests_total", op=result["op"], result="ok" if result.get("ok") else "failed")
+        REGISTRY.observe("api_request_seconds", result["latency_ms"]["total"] / 1000.0, op=result["op"])
+        self.events.publish(result)
+
+    def handle(self, request, wait=True):
+        """Submit one request and return (status, body)."""
+        received_at = time.perf_counter()
+        submitted = self.submit(self.parse(request), received_at)
+        if not wait:
+            self.publish_when_done(*submitted)
+            return 202, {"id": submitted[0], "op": submitted[1], "queued": True}
+        result = self.complete(*submitted, wait=True)
+        self.publish(result)
+        return 200, result
+
+    def handle_batch(self, requests, wait=True):
+        """Submit all requests first (pipelined on the queue), then collect results in order."""
+        if not isinstance(requests, list):
+            raise ApiError("'requests' must be a list")
+        received_at = time.perf_counter()
+        # Nothing is queued unless the whole batch is valid
+        parsed = []
+        for index, request in enumerate(requests):
+            try:
+                parsed.append(self.parse(request))
+            except ApiError as e:
+                raise ApiError(f"requests[{index}]: {e}", e.status)
+        submitted = []
+        for index, item in enumerate(parsed):
+            try:
+                submitted.append(self.submit(item, received_at))
+            except ApiError as e:
+                # Refused by the backend after validation: the queued part still reports on /events
+                for queued in submitted:
+                    self.publish_when_done(*queued)
+                raise ApiError(f"requests[{index}]: {e} (requests before it were queued, "
+                               f"ids {[queued[0] for queued in submitted]})", e.status)
+        if not wait:
+            for item in submitted:
+                self.publish_when_done(*item)
+            return 202, {"ids": [item[0] for item in submitted], "queued": True}
+        results = []
+        for item in submitted:
+            result = self.complete(*item, wait=True)
+            self.publish(result)
+            results.append(result)
+        return 200, {"ok": all(result.get("ok") for result in results), "results": results}
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive for high request rates
+    disable_nagle_algorithm = True  # Headers and body go out as separate writes
+    api = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise ApiError("Invalid Content-Length")
+        if length < 0:
+            raise ApiError("Invalid Content-Length")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ApiError(f"Invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise ApiError("Request body must be a JSON object")
+        return body
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            if url.path == "/status":
+                self._send_json(200, self.api.backend.api_status())
+            elif url.path == "/log":
+                lines = int(parse_qs(url.query).get("lines", ["100"])[0])
+                self._send_json(200, {"lines": self.api.backend.api_log_tail(lines)})
+            elif url.path == "/presets":
+                self._send_json(200, self.api.backend.api_catalog())
+            elif url.path == "/events":
+                self._stream_events()
+            else:
+                self._send_json(404, {"error": f"Unknown path: {url.path}"})
+        except ApiError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        try:
+            body = self._read_json()
+            wait = body.get("wait", True)
+            if not isinstance(wait, bool):
+                raise ApiError("'wait' must be true or false")
+            if url.path == "/batch":
+                status, response = self.api.handle_batch(body.get("requests"), wait)
+            elif url.path in ("/press", "/signal", "/preset"):
+                body["op"] = url.path[1:]
+                status, response = self.api.handle(body, wait)
+            else:
+                status, response = 404, {"error": f"Unknown path: {url.path}"}
+            self._send_json(status, response)
+        except ApiError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+
+    def _stream_events(self):
+        """Server-Sent Events: one `data: {json}` message per finished request."""
+        subscriber = self.api.events.subscribe()
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.flush()
+            while True:
+                try:
+                    event = subscriber.get(timeout=15)
+                    message = f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                except queue.Empty:
+                    message = ": keepalive\n\n"
+                self.wfile.write(message.encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            self.api.events.unsubscribe(subscriber)
+
+
+class AutomationApiServer:
+    """Serves an AutomationApi over HTTP from daemon threads (127.0.0.1 only by default)."""
+
+    def __init__(self, backend, host="127.0.0.1", port=8765, wait_timeout=DEFAULT_WAIT_TIMEOUT):
+        self.api = AutomationApi(backend, wait_timeout)
+        handler = type("ApiHandler", (_ApiHandler,), {"api": self.api})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="automation-api", daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
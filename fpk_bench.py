@@ -0,0 +1,176 @@
+"""
+Spawn-cost benchmark - per-signal cost of the ways a DPID write can reach the device
+
+    python fpk_bench.py --signals 50 --dpid DP_ID_HMI_ZPM_ANZEIGEID --out bench.json
+    PATH=/tmp/fpk-sim-bin:$PATH python fpk_bench.py      # against fpk_sim
+
+Modes, each sending the same writes one at a time:
+
+- shell:   the old path, `Popen("adb -s ... shell IpcSender ...", shell=True)`;
+           a cmd.exe or /bin/sh process in front of every adb
+- argv:    run_adb() from the prebuilt templates, adb exec'd directly
+- session: one persistent `adb shell` (open_adb_session) fed a command line
+           per write; no process spawn per write at all
+
+The report gives the per-signal mean/p50/p90/max in ms and each mode's
+speedup over shell.
+"""
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+from adb_exec import CREATION_FLAGS, OUTPUT_ENCODING, open_adb_session, run_adb
+from fpk_client import DEFAULT_DEVICE_ID, FpkClient, validate_signal
+from fpk_metrics import quantile
+from process_manager import PROCESSES
+
+MODES = ("shell", "argv", "session")
+
+DEFAULT_SIGNALS = 30
+DEFAULT_DPID = "DP_ID_HMI_ZPM_ANZEIGEID"
+
+# Seconds one write may take before the run is abandoned
+SIGNAL_TIMEOUT = 10
+
+# Printed after every write on the persistent shell, followed by the exit code
+SESSION_MARKER = "@@FPK_BENCH"
+
+
+def _command_line(argv):
+    """argv as the command string the pre-template code handed to the shell."""
+    if sys.platform == "win32":
+        return subprocess.list2cmdline(argv)
+    return shlex.join(argv)
+
+
+def bench_shell(templates, values, dpid):
+    times, ok = [], 0
+    for value in values:
+        started = time.perf_counter()
+        process = subprocess.run(_command_line(templates.signal(dpid, value)), shell=True, capture_output=True,
+                                 text=True, encoding=OUTPUT_ENCODING, errors="replace", timeout=SIGNAL_TIMEOUT,
+                                 creationflags=CREATION_FLAGS)
+        times.append(time.perf_counter() - started)
+        ok += process.returncode == 0
+    return times, ok
+
+
+def bench_argv(templates, values, dpid):
+    times, ok = [], 0
+    for value in values:
+        process = run_adb(templates.signal(dpid, value), timeout=SIGNAL_TIMEOUT)
+        times.append(process.elapsed)
+        ok += process.returncode == 0
+    return times, ok
+
+
+def bench_session(templates, values, dpid):
+    process = open_adb_session(templates.shell)
+    times, ok = [], 0
+    try:
+        # IpcSender argv without the `adb -s <serial> shell` prefix
+        command = templates.signal(dpid, "0")[len(templates.shell):-1]
+        for value in values:
+            started = time.perf_counter()
+            process.stdin.write(" ".join(command + (str(value),)) + f"; echo {SESSION_MARKER} $?\n")
+            process.stdin.flush()
+            while True:
+                line = process.stdout.readline()
+                if not line:
+                    raise RuntimeError("The adb shell session ended")
+                if line.startswith(SESSION_MARKER):
+                    break
+            times.append(time.perf_counter() - started)
+            ok += line.split()[-1] == "0"
+    finally:
+        # Let the shell finish its last line before the process is stopped
+        try:
+            process.stdin.write("exit\n")
+            process.stdin.close()
+            process.wait(SIGNAL_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        PROCESSES.close(process)
+    return times, ok
+
+
+BENCHES = {"shell": bench_shell, "argv": bench_argv, "session": bench_session}
+
+
+def run_benchmark(client, signals=DEFAULT_SIGNALS, dpid=DEFAULT_DPID, modes=MODES):
+    """Send signals writes per mode; returns the report dict."""
+    validate_signal(dpid, "0")
+    values = [str(index % 2) for index in range(signals)]
+    results = {}
+    for mode in modes:
+        times, ok = BENCHES[mode](client.templates, values, dpid)
+        ordered = sorted(times)
+        results[mode] = {
+            "signals": len(times),
+            "ok": ok,
+            "total_s": round(sum(times), 3),
+            "per_signal_ms": {
+                "mean": round(sum(times) / len(times) * 1000.0, 3),
+                "p50": round(quantile(ordered, 0.5) * 1000.0, 3),
+                "p90": round(quantile(ordered, 0.9) * 1000.0, 3),
+                "max": round(ordered[-1] * 1000.0, 3),
+            },
+        }
+    if "shell" in results:
+        baseline = results["shell"]["per_signal_ms"]["mean"]
+        for result in results.values():
+            mean = result["per_signal_ms"]["mean"]
+            result["speedup_vs_shell"] = round(baseline / mean, 2) if mean else None
+    return {"device_id": client.device_id, "dpid": dpid, "platform": sys.platform, "modes": results}
+
+
+def format_report(report):
+    lines = [f"[BENCH] {report['dpid']} on {report['device_id']} ({report['platform']})"]
+    for mode, result in report["modes"].items():
+        ms = result["per_signal_ms"]
+        speedup = result.get("speedup_vs_shell")
+        lines.append(f"[BENCH] {mode:<8} mean {ms['mean']:8.2f} ms  p50 {ms['p50']:8.2f}  p90 {ms['p90']:8.2f}  "
+                     f"ok {result['ok']}/{result['signals']}"
+                     + (f"  x{speedup:g} vs shell" if speedup is not None else ""))
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Per-signal adb spawn cost benchmark")
+    parser.add_argument("--signals", type=int, default=DEFAULT_SIGNALS, help="Writes per mode")
+    parser.add_argument("--dpid", default=DEFAULT_DPID, help="DPID to write (values alternate 0/1)")
+    parser.add_argument("--mode", action="append", choices=MODES, help="Mode to run (repeatable, default: all)")
+    parser.add_argument("--device-id", default=DEFAULT_DEVICE_ID, help="adb serial of the target")
+    parser.add_argument("--adb-folder", default="", help="Folder containing adb1.exe (default: adb on PATH)")
+    parser.add_argument("--out", default="", help="Also write the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.signals < 1:
+        print("[BENCH] --signals must be at least 1", file=sys.stderr)
+        return 2
+    client = FpkClient(device_id=args.device_id, adb_folder=args.adb_folder)
+    try:
+        if not client.status().ready:
+            print("[BENCH] Device not ready", file=sys.stderr)
+            return 1
+        report = run_benchmark(client, args.signals, args.dpid, args.mode or MODES)
+    finally:
+        client.close()
+    print(format_report(report))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] Report written to {os.path.abspath(args.out)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,754 @@
+"""
+Device broker - one process owns the device sessions; GUI and CLI clients attach over a local socket
+
+    python fpk_broker.py serve                       # own the default device
+    python cmd_gui.py --broker 8770                  # GUI attaches instead of polling itself
+    python fpk_broker.py press up --count 2          # one-shot CLI client
+    python fpk_broker.py preset adas
+
+Without a broker every tool instance runs its own 3-second connection
+check, its own deploys and its own command queue, so a GUI and a script
+driving the same device interleave adb traffic unpredictably. The broker
+keeps one FpkClient per device: one health poller (which deploys
+mfl_total.sh when the shell comes back and pushes state changes to
+subscribers), one command queue and one adb server watcher.
+
+Clients speak JSON lines over 127.0.0.1. A request is an object with an
+"id" and an "op"; the reply carries the same id. Presets also stream
+"step", "wait" and "state" events under their id, and subscribers receive
+{"event": "status", ...} messages without an id.
+
+Each attached client has its own FIFO. The scheduler takes one command per
+client in turn and hands the device queue the next one only after the
+previous one finished, so a client streaming keypresses cannot starve
+another client's writes. Repeated presses of one button from one client
+still merge into a single invocation. Preset batches take turns with the
+scheduled commands on the device queue.
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from adb_exec import resolve_adb_binary
+from adb_server import AdbServerManager
+from command_queue import QueuedCommand
+from fpk_client import (
+    DEFAULT_DEVICE_ID,
+    MFL_BUTTONS,
+    PRESETS,
+    ConnectionStatus,
+    FpkClient,
+    OperationResult,
+    PresetRun,
+    validate_signal,
+)
+from fpk_metrics import REGISTRY
+
+DEFAULT_BROKER_PORT = 8770
+BROKER_PORT_ENV = "FPK_BROKER_PORT"
+
+# Seconds between health checks of each device (one poller per device for all clients)
+POLL_SECONDS = 3.0
+
+# Presses of one button merged into one scheduled invocation at most
+MAX_MERGED_PRESSES = 20
+
+# Seconds a client waits for the broker to accept the connection / answer a plain request
+CONNECT_TIMEOUT = 5.0
+REQUEST_TIMEOUT = 120.0
+
+PROTOCOL_VERSION = 1
+
+
+class BrokerError(Exception):
+    """The broker rejected a request."""
+
+
+# ----- broker side -----
+
+
+class ClientConnection:
+    """One attached client; send() may be called from any thread."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, sock, wfile, address):
+        self.id = next(self._ids)
+        self.name = ""
+        self.address = address
+        self.attached_at = time.time()
+        self.requests = 0
+        self.presets = {}  # request id -> PresetRun in flight
+        self.closed = False
+        self._sock = sock
+        self._wfile = wfile
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        payload = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                self._wfile.write(payload)
+                self._wfile.flush()
+            except (OSError, ValueError):
+                self.closed = True
+
+    def close(self):
+        """Hang up (the handler thread then detaches the client)."""
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def describe(self):
+        return {"id": self.id, "name": self.name, "attached_at": self.attached_at, "requests": self.requests}
+
+
+class _Job:
+    """One scheduled press/signal/batch and the connection waiting for its reply."""
+
+    __slots__ = ("op", "args", "connection", "request_ids", "queued_at")
+
+    def __init__(self, op, args, connection, request_id):
+        self.op = op
+        self.args = args
+        self.connection = connection
+        self.request_ids = [request_id]
+        self.queued_at = time.perf_counter()
+
+    def merge(self, job):
+        """Fold a repeat press of the same button into this job; False if it cannot merge."""
+        if self.op != "press" or job.op != "press" or self.args[0] != job.args[0]:
+            return False
+        if self.args[1] + job.args[1] > MAX_MERGED_PRESSES:
+            return False
+        self.args = (self.args[0], self.args[1] + job.args[1])
+        self.request_ids.extend(job.request_ids)
+        return True
+
+
+class FairScheduler:
+    """Round-robin over per-client FIFOs; run(job) is called for one job at a time."""
+
+    def __init__(self, run, name="broker-scheduler"):
+        self._run_job = run
+        self._queues = collections.OrderedDict()  # owner -> deque of jobs, next turn first
+        self._last_owner = None  # owner of the job handed out last
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    @property
+    def depth(self):
+        with self._cond:
+            return sum(len(pending) for pending in self._queues.values())
+
+    def submit(self, owner, job):
+        with self._cond:
+            pending = self._queues.get(owner)
+            if pending is None:
+                pending = self._queues[owner] = collections.deque()
+                # A new client queues behind the waiting ones but ahead of the one that just had its turn
+                if self._last_owner in self._queues:
+                    self._queues.move_to_end(self._last_owner)
+            elif pending and pending[-1].merge(job):
+                return
+            pending.append(job)
+            self._cond.notify()
+
+    def drop(self, owner):
+        """Forget a detached client's pending jobs."""
+        with self._cond:
+            return list(self._queues.pop(owner, ()))
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _next(self):
+        with self._cond:
+            while not self._stopped:
+                for owner, pending in self._queues.items():
+                    if pending:
+                        job = pending.popleft()
+                        # The next turn goes to the other clients first
+                        self._queues.move_to_end(owner)
+                        self._last_owner = owner
+                        return job
+                self._cond.wait()
+            return None
+
+    def _run(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            try:
+                self._run_job(job)
+            except Exception as e:
+                for request_id in job.request_ids:
+                    job.connection.send({"id": request_id, "error": str(e)})
+
+
+class DeviceSession:
+    """The broker's connection to one device: client, health poller, scheduler and subscribers."""
+
+    def __init__(self, device_id, adb_folder="", server=None, poll_seconds=POLL_SECONDS, log=None):
+        self.device_id = device_id
+        self.log = log or (lambda message: None)
+        self.client = FpkClient(device_id=device_id, adb_folder=adb_folder, log=self.log, hold_offline=True)
+        self.client.server = server
+        self.poll_seconds = poll_seconds
+        self.scheduler = FairScheduler(self._dispatch, name=f"broker-{device_id}")
+        self.subscribers = set()
+        self.status = None  # last decided ConnectionStatus
+        self._stop = threading.Event()
+        self._poller = threading.Thread(target=self._poll, name=f"health-{device_id}", daemon=True)
+        self._poller.start()
+
+    def close(self):
+        self._stop.set()
+        self.scheduler.stop()
+        self.client.close()
+
+    # ----- health -----
+
+    def _poll(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                self.log(f"[BROKER] {self.device_id}: health check failed: {e}")
+            self._stop.wait(self.poll_seconds)
+
+    def check(self):
+        """Run the status chain once; deploys on reconnect and notifies subscribers of changes."""
+        status = self.client.status()
+        if status.shell_working is None:
+            return  # Undecided; keep the previous state
+        previous = self.status
+        if status.ready and (previous is None or not previous.ready):
+            self.log(f"[BROKER] {self.device_id} ready")
+            # Deploy before clients see "ready": a press sent on that status needs the script
+            self.client.ensure_script(self.log)
+        elif previous is not None and previous.ready and not status.ready:
+            self.log(f"[BROKER] {self.device_id} lost")
+        self.status = status
+        if previous is None or _state(previous) != _state(status):
+            self.publish()
+
+    def status_dict(self):
+        status = self.status.to_dict() if self.status is not None else {"ready": None}
+        status.update({
+            "device_id": self.device_id,
+            "queue_depth": self.client.queue.depth,
+            "scheduled": self.scheduler.depth,
+            "offline_held": self.client.offline.depth,
+            "capabilities": self.client.capabilities.describe() if self.client.capabilities else None,
+        })
+        return status
+
+    def publish(self):
+        message = {"event": "status", "device": self.device_id, "status": self.status_dict()}
+        for connection in list(self.subscribers):
+            connection.send(message)
+
+    # ----- commands -----
+
+    def submit(self, connection, op, args, request_id):
+        self.scheduler.submit(connection, _Job(op, args, connection, request_id))
+
+    def _dispatch(self, job):
+        """Scheduler worker: hand one job to the device queue and wait until it ran."""
+        started = time.perf_counter()
+
+        def on_done(result):
+            reply = {"queue_ms": round((started - job.queued_at) * 1000.0, 1),
+                     "exec_ms": round((time.perf_counter() - started) * 1000.0, 1)}
+            if result is None:
+                reply["error"] = "Command was dropped by the device queue"
+            elif isinstance(result, list):
+                reply["results"] = [item.to_dict() for item in result]
+            else:
+                reply["result"] = result.to_dict()
+            for request_id in job.request_ids:
+                job.connection.send(dict(reply, id=request_id))
+
+        if job.op == "press":
+            entry = self.client.submit_press(job.args[0], job.args[1], on_done=on_done)
+        elif job.op == "signal":
+            entry = self.client.submit_signal(job.args[0], job.args[1], on_done=on_done)
+        else:
+            entry = self.client.submit_many(job.args, on_done=on_done)
+        # A command held for an offline device finishes on reconnect; do not block the other clients on it
+        if self.client.online:
+            entry.wait()
+
+    def run_preset(self, connection, request_id, name):
+        def send_event(event, **fields):
+            connection.send(dict(fields, id=request_id, event=event))
+
+        def on_state(run):
+            send_event("state", run=_run_dict(run))
+
+        run = self.client.start_preset(
+            name, on_result=lambda result: send_event("step", result=result.to_dict()),
+            on_wait=lambda wait_ms: send_event("wait", ms=wait_ms), on_state=on_state)
+        connection.presets[request_id] = run
+
+        def finish():
+            run.wait()
+            connection.presets.pop(request_id, None)
+            connection.send({"id": request_id, "run": _run_dict(run)})
+
+        threading.Thread(target=finish, name=f"broker-preset-{request_id}", daemon=True).start()
+
+
+def _state(status):
+    return bool(status.adb_installed), bool(status.device_connected), bool(status.shell_working)
+
+
+def _run_dict(run):
+    return {
+        "name": run.name,
+        "state": run.state,
+        "total_steps": run.total_steps,
+        "checkpoint": run.checkpoint,
+        "steps_sent": run.steps_sent,
+        "failures": run.failures,
+        "suspensions": run.suspensions,
+        "redeploys": run.redeploys,
+        "reapplied": run.reapplied,
+        "downtime": round(run.downtime, 3),
+        "elapsed": round(run.elapsed, 3),
+    }
+
+
+class Broker:
+    """Owns the device sessions and serves clients on 127.0.0.1:port."""
+
+    def __init__(self, port=DEFAULT_BROKER_PORT, adb_folder="", device_ids=(DEFAULT_DEVICE_ID,),
+                 poll_seconds=POLL_SECONDS, log=None, host="127.0.0.1"):
+        self.adb_folder = adb_folder
+        self.poll_seconds = poll_seconds
+        self.log = log or (lambda message: None)
+        self.default_device = device_ids[0] if device_ids else DEFAULT_DEVICE_ID
+        self.connections = set()
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self.adb_server = AdbServerManager(lambda: resolve_adb_binary(self.adb_folder)[0], log=self.log)
+        handler = type("BrokerHandler", (_BrokerHandler,), {"broker": self})
+        self.server = _BrokerServer((host, port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name="broker", daemon=True)
+        for device_id in device_ids:
+            self.session(device_id)
+        REGISTRY.gauge_callback("broker_clients", lambda: len(self.connections), "Clients attached to the broker")
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.adb_server.start()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for connection in list(self.connections):
+            connection.close()
+        self.adb_server.stop()
+        for session in list(self.sessions.values()):
+            session.close()
+
+    def session(self, device_id=None):
+        device_id = device_id or self.default_device
+        with self._lock:
+            session = self.sessions.get(device_id)
+            if session is None:
+                session = self.sessions[device_id] = DeviceSession(
+                    device_id, self.adb_folder, self.adb_server, self.poll_seconds, self.log)
+            return session
+
+    def attach(self, connection):
+        with self._lock:
+            self.connections.add(connection)
+
+    def detach(self, connection):
+        with self._lock:
+            self.connections.discard(connection)
+            sessions = list(self.sessions.values())
+        connection.closed = True
+        for session in sessions:
+            session.subscribers.discard(connection)
+            session.scheduler.drop(connection)
+        for run in list(connection.presets.values()):
+            run.cancel()
+        if connection.name:
+            self.log(f"[BROKER] {connection.name} (#{connection.id}) detached")
+
+    def handle(self, connection, message):
+        """Answer one request (commands are answered later, when they ran)."""
+        request_id = message.get("id")
+        op = message.get("op")
+        connection.requests += 1
+        REGISTRY.inc("broker_requests_total", op=str(op))
+        try:
+            session = self.session(message.get("device")) if op != "hello" else None
+            if op == "hello":
+                connection.name = str(message.get("name", ""))[:64]
+                self.log(f"[BROKER] {connection.name or 'client'} (#{connection.id}) attached")
+                connection.send({"id": request_id, "client": connection.id, "protocol": PROTOCOL_VERSION,
+                                 "devices": list(self.sessions), "default_device": self.default_device})
+            elif op == "status":
+                connection.send({"id": request_id, "status": session.status_dict(),
+                                 "clients": [other.describe() for other in list(self.connections)]})
+            elif op == "subscribe":
+                session.subscribers.add(connection)
+                connection.send({"id": request_id, "status": session.status_dict()})
+            elif op == "press":
+                button, count = str(message.get("button", "")), int(message.get("count", 1))
+                if button not in MFL_BUTTONS:
+                    raise ValueError(f"Unknown button: {button} (valid: {', '.join(MFL_BUTTONS)})")
+                session.submit(connection, "press", (button, max(1, count)), request_id)
+            elif op == "signal":
+                dpid, value = str(message.get("dpid", "")), str(message.get("value", ""))
+                validate_signal(dpid, value)
+                session.submit(connection, "signal", (dpid, value), request_id)
+            elif op == "batch":
+                pairs = [(str(dpid), str(value)) for dpid, value in message.get("pairs", [])]
+                for dpid, value in pairs:
+                    validate_signal(dpid, value)
+                session.submit(connection, "batch", pairs, request_id)
+            elif op == "preset":
+                name = str(message.get("name", ""))
+                if name not in PRESETS:
+                    raise ValueError(f"Unknown preset: {name} (valid: {', '.join(PRESETS)})")
+                session.run_preset(connection, request_id, name)
+            else:
+                raise ValueError(f"Unknown op: {op!r}")
+        except (ValueError, TypeError) as e:
+            connection.send({"id": request_id, "error": str(e)})
+
+
+class _BrokerServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    broker = None
+
+    def handle(self):
+        connection = ClientConnection(self.connection, self.wfile, self.client_address)
+        self.broker.attach(connection)
+        try:
+            for raw in self.rfile:
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line.decode("utf-8"))
+                except ValueError as e:
+                    connection.send({"error": f"Invalid JSON: {e}"})
+                    continue
+                if not isinstance(message, dict):
+                    connection.send({"error": "Request must be a JSON object"})
+                    continue
+                self.broker.handle(connection, message)
+        except OSError:
+            pass
+        finally:
+            self.broker.detach(connection)
+
+
+REGISTRY.describe("broker_requests_total", "counter", "Requests received by the device broker, by op")
+
+
+# ----- client side -----
+
+
+class BrokerClient:
+    """Connection to a running broker with the submit/press/preset calls of FpkClient.
+
+    submit_* return waitable queue entries whose result is an
+    OperationResult (a list for submit_many); on_done(result) runs on the
+    reader thread (trace_id is accepted for FpkClient compatibility; the
+    device spans are recorded by the broker). subscribe(on_status) delivers
+    the status dicts the broker pushes when the device state changes.
+    """
+
+    def __init__(self, port=DEFAULT_BROKER_PORT, host="127.0.0.1", name="", device_id=None,
+                 timeout=CONNECT_TIMEOUT):
+        self.port = port
+        self.device_id = device_id
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connected = True
+        self._file = self.sock.makefile("rb")
+        self._send_lock = threading.Lock()
+        self._pending = {}  # request id -> (entry, convert, on_event)
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._status_listeners = []
+        self._reader = threading.Thread(target=self._read, name="broker-client", daemon=True)
+        self._reader.start()
+        hello = self.request("hello", name=name)
+        self.client_id = hello["client"]
+        self.device_id = device_id or hello["default_device"]
+
+    def close(self):
+        self.connected = False
+        self._status_listeners = []  # A deliberate close is not reported as a lost broker
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def _submit(self, op, fields, convert=None, on_done=None, on_event=None, label="", count=1):
+        entry = QueuedCommand(None, (lambda entry, result, error: on_done(result)) if on_done else None,
+                              label=label, count=count)
+        entry.started_at = entry.queued_at
+        request_id = next(self._ids)
+        with self._pending_lock:
+            self._pending[request_id] = (entry, convert, on_event)
+        message = dict(fields, id=request_id, op=op)
+        if self.device_id and "device" not in message:
+            message["device"] = self.device_id
+        payload = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+        try:
+            with self._send_lock:
+                self.sock.sendall(payload)
+        except OSError as e:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            entry.finish(None, ConnectionError(f"Broker connection lost: {e}"))
+        return entry
+
+    def request(self, op, timeout=REQUEST_TIMEOUT, **fields):
+        """Send a request and wait for its reply dict."""
+        entry = self._submit(op, fields)
+        if not entry.wait(timeout):
+            raise TimeoutError(f"No reply from the broker to {op}")
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    def _read(self):
+        try:
+            for raw in self._file:
+                message = json.loads(raw.decode("utf-8"))
+                request_id, event = message.get("id"), message.get("event")
+                if request_id is None:
+                    if event == "status":
+                        for listener in list(self._status_listeners):
+                            listener(message["status"])
+                    continue
+                with self._pending_lock:
+                    pending = self._pending.get(request_id) if event else self._pending.pop(request_id, None)
+                if pending is None:
+                    continue
+                entry, convert, on_event = pending
+                if event:
+                    if on_event:
+                        on_event(message)
+                elif "error" in message:
+                    entry.finish(None, BrokerError(message["error"]))
+                else:
+                    entry.finish(convert(message) if convert else message)
+        except (OSError, ValueError):
+            pass
+        self.connected = False
+        with self._pending_lock:
+            pending, self._pending = list(self._pending.values()), {}
+        for entry, _, _ in pending:
+            entry.finish(None, ConnectionError("Broker connection closed"))
+        for listener in list(self._status_listeners):
+            listener(None)
+
+    # ----- FpkClient-style calls -----
+
+    def status(self):
+        """The broker's last health check as a ConnectionStatus (nothing is sent to the device)."""
+        status = self.request("status")["status"]
+        if status.get("ready") is None:
+            return ConnectionStatus(None, None, None)
+        return ConnectionStatus(status["adb_installed"], status["device_connected"], status["shell_working"],
+                                status["checked_at"])
+
+    def subscribe(self, on_status):
+        """Call on_status(dict) now and on every change (None when the broker goes away)."""
+        self._status_listeners.append(on_status)
+        on_status(self.request("subscribe")["status"])
+
+    def submit_press(self, button_name, count=1, on_done=None, trace_id=None):
+        return self._submit("press", {"button": button_name, "count": count}, _operation_result, on_done,
+                            label=button_name, count=count)
+
+    def submit_signal(self, signal_name, signal_value, on_done=None, trace_id=None):
+        return self._submit("signal", {"dpid": str(signal_name), "value": str(signal_value)}, _operation_result,
+                            on_done, label=str(signal_name))
+
+    def submit_many(self, pairs, on_done=None):
+        pairs = [(str(name), str(value)) for name, value in pairs]
+        return self._submit("batch", {"pairs": pairs},
+                            lambda message: [OperationResult.from_dict(item) for item in message["results"]],
+                            on_done, label=f"batch[{len(pairs)}]")
+
+    def press(self, button_name, count=1):
+        return _wait_reply(self.submit_press(button_name, count))
+
+    def send_signal(self, signal_name, signal_value):
+        return _wait_reply(self.submit_signal(signal_name, signal_value))
+
+    def send_many(self, pairs):
+        return _wait_reply(self.submit_many(pairs))
+
+    def start_preset(self, name, on_result=None, on_wait=None, on_state=None):
+        """Run a preset in the broker; returns a PresetRun mirrored from its events."""
+        run = PresetRun(name, len(PRESETS[name][1]) if name in PRESETS else 0)
+
+        def update(fields):
+            for key in ("state", "checkpoint", "suspensions", "redeploys", "reapplied", "downtime"):
+                setattr(run, key, fields[key])
+
+        def on_event(message):
+            if message["event"] == "step":
+                result = OperationResult.from_dict(message["result"])
+                run.steps_sent += 1
+                run.results.append(result)
+                run.failures += int(not result.ok)
+                if on_result:
+                    on_result(result)
+            elif message["event"] == "wait" and on_wait:
+                on_wait(message["ms"])
+            elif message["event"] == "state":
+                update(message["run"])
+                if on_state:
+                    on_state(run)
+
+        def on_done(message):
+            if message is not None:
+                update(message["run"])
+                run.steps_sent, run.failures = message["run"]["steps_sent"], message["run"]["failures"]
+            else:
+                run.state = "abandoned"
+            run.finish()
+
+        self._submit("preset", {"name": name}, on_done=on_done, on_event=on_event, label=name)
+        return run
+
+    def run_preset(self, name, on_result=None, on_wait=None):
+        run = self.start_preset(name, on_result, on_wait)
+        run.wait()
+        return run
+
+
+def _operation_result(message):
+    return OperationResult.from_dict(message["result"])
+
+
+def _wait_reply(entry):
+    entry.wait()
+    if entry.error is not None:
+        raise entry.error
+    return entry.result
+
+
+def broker_port():
+    import os
+    try:
+        return int(os.environ.get(BROKER_PORT_ENV, DEFAULT_BROKER_PORT))
+    except ValueError:
+        return DEFAULT_BROKER_PORT
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="FPK device broker")
+    parser.add_argument("--port", type=int, default=broker_port(),
+                        help=f"Broker port on 127.0.0.1 (default {DEFAULT_BROKER_PORT}; env {BROKER_PORT_ENV})")
+    parser.add_argument("--device-id", default=None, help="adb serial of the target (default: the broker's)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run the broker")
+    serve.add_argument("--adb-folder", default="", help="Folder containing adb1.exe (default: adb on PATH)")
+    serve.add_argument("--poll", type=float, default=POLL_SECONDS, help="Seconds between health checks")
+    serve.add_argument("--device", action="append", default=[], metavar="SERIAL",
+                       help="Device to own from the start (repeatable; default: the tool's device)")
+
+    commands.add_parser("status", help="Show the device state and the attached clients")
+    press = commands.add_parser("press", help="Press an MFL button")
+    press.add_argument("button", choices=MFL_BUTTONS)
+    press.add_argument("--count", type=int, default=1)
+    signal = commands.add_parser("signal", help="Write one DPID value")
+    signal.add_argument("dpid")
+    signal.add_argument("value")
+    preset = commands.add_parser("preset", help="Run a preset")
+    preset.add_argument("name", choices=list(PRESETS))
+    return parser.parse_args(argv)
+
+
+def serve(args):
+    devices = args.device or [args.device_id or DEFAULT_DEVICE_ID]
+    try:
+        broker = Broker(args.port, args.adb_folder, devices, args.poll, log=print).start()
+    except OSError as e:
+        print(f"[BROKER] Could not listen on 127.0.0.1:{args.port}: {e}", file=sys.stderr)
+        return 1
+    print(f"[BROKER] Serving {', '.join(devices)} on 127.0.0.1:{broker.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    broker.stop()
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "serve":
+        return serve(args)
+    try:
+        client = BrokerClient(args.port, name="fpk_broker cli", device_id=args.device_id)
+    except OSError as e:
+        print(f"[BROKER] No broker on 127.0.0.1:{args.port}: {e}", file=sys.stderr)
+        return 1
+    try:
+        if args.command == "status":
+            reply = client.request("status")
+            print(json.dumps(reply, indent=1))
+            return 0 if reply["status"].get("ready") else 1
+        if args.command == "press":
+            result = client.press(args.button, args.count)
+        elif args.command == "signal":
+            result = client.send_signal(args.dpid, args.value)
+        else:
+            run = client.run_preset(args.name, on_result=print)
+            print(f"[PRESET] {run.name}: {run.state}, {run.steps_sent} steps, {run.failures} failed")
+            return 0 if run.ok else 1
+        print(result)
+        return 0 if result.ok else 1
+    except (BrokerError, ConnectionError) as e:
+        print(f"[BROKER] {e}", file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Device capability probe - what the target shell offers, learned in one adb shell call
+
+    caps = probe(client._run, client.templates)
+    caps.ipc_sender      # "/usr/bin/IpcSender" or None
+    caps.deploy_dir      # first writable candidate directory
+    caps.script_version  # version of an installed mfl_total.sh (or None)
+
+FpkClient probes once per connection and keeps the result until the device
+drops, so deploy, send and script invocation choose their mechanism without
+trying commands one by one.
+"""
+
+import re
+import time
+
+from adb_exec import REMOTE_SCRIPT_NAME
+
+# Remote directories the script may live in, in order of preference
+CANDIDATE_DIRS = ("/tmp/", "/data/local/tmp/")
+
+# Shell commands the tool can make use of (IpcSender for writes, a hash to verify deploys)
+PROBED_COMMANDS = ("IpcSender", "md5sum", "sha1sum")
+
+# Section marker in the probe output
+CAP_MARKER = "@@FPK_CAP"
+
+PROBE_TIMEOUT = 10
+
+_VERSION_PATTERN = re.compile(r"[0-9a-f]{12}")
+
+
+def build_probe_command(candidate_dirs=CANDIDATE_DIRS, script_name=REMOTE_SCRIPT_NAME):
+    """One shell line that reports commands, writable directories and installed scripts."""
+    parts = []
+    for name in PROBED_COMMANDS:
+        parts.append(f"echo {CAP_MARKER} cmd {name}")
+        parts.append(f"command -v {name}")
+    for directory in candidate_dirs:
+        probe_file = f"{directory}.fpk_probe"
+        script = directory + script_name
+        parts.append(f"echo {CAP_MARKER} dir {directory}")
+        parts.append(f"echo ok > {probe_file} 2>/dev/null && echo writable")
+        parts.append(f"rm -f {probe_file}")
+        # Executable script first; through sh when chmod is not permitted there
+        parts.append(f"echo {CAP_MARKER} exec {script}")
+        parts.append(f"{script} version 2>/dev/null")
+        parts.append(f"echo {CAP_MARKER} sh {script}")
+        parts.append(f"sh {script} version 2>/dev/null")
+    parts.append(f"echo {CAP_MARKER} end")
+    return "; ".join(parts)
+
+
+class DeviceCapabilities:
+    """Parsed probe result.
+
+    commands: {name: path} of the PROBED_COMMANDS found on PATH.
+    writable_dirs: candidate directories a file could be created in.
+    script_dir / script_version / script_via_sh: the installed mfl_total.sh
+        with a version stamp (preferring the current one when several exist).
+    """
+
+    __slots__ = ("commands", "writable_dirs", "scripts", "script_dir", "script_version", "script_via_sh",
+                 "probed_at", "elapsed", "stdin_batch")
+
+    def __init__(self, commands=None, writable_dirs=(), scripts=None, elapsed=0.0):
+        self.commands = dict(commands or {})
+        self.writable_dirs = list(writable_dirs)
+        self.scripts = dict(scripts or {})  # dir -> (version, via_sh)
+        self.script_dir = None
+        self.script_version = None
+        self.script_via_sh = False
+        self.probed_at = time.time()
+        self.elapsed = elapsed
+        self.stdin_batch = None  # None = not probed on this connection yet
+
+    def select_script(self, wanted_version=None):
+        """Pick the installed script (the wanted version if present, else the first found)."""
+        chosen = None
+        for directory, (version, via_sh) in self.scripts.items():
+            if chosen is None or version == wanted_version:
+                chosen = directory, version, via_sh
+            if version == wanted_version:
+                break
+        if chosen is not None:
+            self.script_dir, self.script_version, self.script_via_sh = chosen
+        return chosen
+
+    @property
+    def ipc_sender(self):
+        return self.commands.get("IpcSender")
+
+    @property
+    def deploy_dir(self):
+        """Where to push the script: the first writable candidate (None if none is writable)."""
+        return self.writable_dirs[0] if self.writable_dirs else None
+
+    @property
+    def hash_command(self):
+        """Fastest available content hash for verifying pushed files."""
+        for name in ("md5sum", "sha1sum"):
+            if name in self.commands:
+                return name
+        return None
+
+    def to_dict(self):
+        return {
+            "commands": dict(self.commands),
+            "writable_dirs": list(self.writable_dirs),
+            "script_dir": self.script_dir,
+            "script_version": self.script_version,
+            "script_via_sh": self.script_via_sh,
+            "stdin_batch": self.stdin_batch,
+            "hash_command": self.hash_command,
+            "probed_at": self.probed_at,
+            "elapsed_ms": round(self.elapsed * 1000.0, 1),
+        }
+
+    def describe(self):
+        """One-line summary for logs and the status UI."""
+        parts = ["IpcSender " + ("ok" if self.ipc_sender else "MISSING")]
+        parts.append("writable " + (", ".join(self.writable_dirs) if self.writable_dirs else "none"))
+        if self.script_version:
+            via = " via sh" if self.script_via_sh else ""
+            parts.append(f"script {self.script_version} in {self.script_dir}{via}")
+        else:
+            parts.append("script not installed")
+        return "; ".join(parts)
+
+
+def parse_probe_output(stdout, elapsed=0.0):
+    """DeviceCapabilities from the probe output, or None if the probe did not run to the end."""
+    commands, writable, scripts = {}, [], {}
+    section, lines, complete = None, [], False
+
+    def close_section():
+        if section is None:
+            return
+        kind, _, subject = section.partition(" ")
+        text = [line for line in lines if line]
+        if kind == "cmd" and text and text[0].startswith("/"):
+            commands[subject] = text[0]
+        elif kind == "dir" and "writable" in text:
+            writable.append(subject)
+        elif kind in ("exec", "sh") and text and _VERSION_PATTERN.fullmatch(text[0]):
+            directory = subject[:subject.rindex("/") + 1]
+            if directory not in scripts:
+                scripts[directory] = (text[0], kind == "sh")
+
+    for raw in stdout.splitlines():
+        line = raw.strip()
+        if line.startswith(CAP_MARKER):
+            close_section()
+            section, lines = line[len(CAP_MARKER):].strip(), []
+            if section == "end":
+                complete = True
+                section = None
+            continue
+        lines.append(line)
+    close_section()
+    if not complete:
+        return None
+    return DeviceCapabilities(commands, writable, scripts, elapsed)
+
+
+def probe(run, templates, timeout=PROBE_TIMEOUT):
+    """Run the probe through run(argv, timeout) (an adb runner); None if the shell did not answer."""
+    started = time.perf_counter()
+    try:
+        process = run(templates.shell_command(build_probe_command()), timeout)
+    except Exception:
+        return None
+    if process.returncode != 0 and CAP_MARKER not in process.stdout:
+        return None
+    return parse_probe_output(process.stdout, time.perf_counter() - started)
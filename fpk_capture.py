@@ -0,0 +1,378 @@
+"""
+Frame capture - low-fps screen recording in a bounded in-memory ring, frozen into clips around actions
+
+    python fpk_capture.py --fps 2 --pre 5 --post 5 --out captures --preset custom_12
+
+    capture = FrameCapture(client, fps=2, seconds=30)
+    capture.start()               # every finished write/press of client now triggers a clip
+    capture.trigger("manual")     # or trigger one by hand
+
+Transient HMI states (a popup that is gone half a second after the
+signal) cannot be grabbed by hand. The capture thread takes a screenshot
+every 1/fps seconds (`adb exec-out screencap`, see fpk_screen) and keeps
+the frames as PNG bytes in a ring bounded by frame count and by total
+bytes, so hours of capture use the memory of the first minute. A frame
+identical to the previous one is not stored again; the stored frame just
+records how long the screen stayed that way.
+
+Every operation the client finishes (signal write, button press, failed
+call) is a trigger: the frames from pre seconds before the operation
+started are frozen at once, the frames of the next post seconds are added
+as they arrive, and the clip is written to <out>/<timestamp>_<label>/ as
+PNGs named by their offset from the trigger, plus clip.json. Triggers that
+fall inside an open clip's window extend that clip instead of opening
+another one.
+"""
+
+import argparse
+import collections
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+from fpk_client import DEFAULT_DEVICE_ID, MFL_BUTTONS, PRESETS, FpkClient
+from fpk_metrics import REGISTRY
+from fpk_screen import decode_screencap, encode_png
+
+DEFAULT_FPS = 2.0
+DEFAULT_SECONDS = 30.0  # history kept in the ring
+DEFAULT_PRE = 5.0
+DEFAULT_POST = 5.0
+DEFAULT_OUT_DIR = "captures"
+
+# Compressed frames kept at most, whatever the frame count allows
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# A clip stops growing this long after its first trigger, however many triggers follow
+MAX_CLIP_SECONDS = 60.0
+
+# zlib level of the stored frames (1 = fastest; HMI screens are mostly flat colour)
+FRAME_COMPRESSION = 1
+
+# Seconds to wait after a failed capture before the next attempt
+CAPTURE_BACKOFF = 2.0
+
+# Saved clip directories remembered for the status view
+CLIP_HISTORY = 50
+
+
+class Frame:
+    """One distinct screen: first seen at t, unchanged until until (repeats further captures)."""
+
+    __slots__ = ("t", "until", "repeats", "checksum", "png")
+
+    def __init__(self, t, checksum, png):
+        self.t = t
+        self.until = t
+        self.repeats = 0
+        self.checksum = checksum
+        self.png = png
+
+
+class FrameRing:
+    """The most recent distinct frames, bounded by count and by compressed bytes."""
+
+    def __init__(self, max_frames, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_frames = max(1, int(max_frames))
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evicted = 0
+        self._frames = collections.deque()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def add(self, t, image):
+        """Store image captured at t; returns its Frame (the previous one if the screen did not change)."""
+        checksum = (image.width, image.height, zlib.crc32(image.pixels))
+        with self._lock:
+            last = self._frames[-1] if self._frames else None
+            if last is not None and last.checksum == checksum:
+                last.until = t
+                last.repeats += 1
+                return last
+        frame = Frame(t, checksum, encode_png(image, FRAME_COMPRESSION))
+        with self._lock:
+            self._frames.append(frame)
+            self.bytes += len(frame.png)
+            while len(self._frames) > 1 and (len(self._frames) > self.max_frames or self.bytes > self.max_bytes):
+                self.bytes -= len(self._frames.popleft().png)
+                self.evicted += 1
+        return frame
+
+    def window(self, start, end):
+        """Frames on screen at any time between start and end, oldest first."""
+        with self._lock:
+            return [frame for frame in self._frames if frame.until >= start and frame.t <= end]
+
+
+class Clip:
+    """Frames around one or more triggers; open until its post window has passed."""
+
+    __slots__ = ("start", "until", "events", "frames", "path")
+
+    def __init__(self, start, until):
+        self.start = start
+        self.until = until
+        self.events = []  # (t, label, error)
+        self.frames = []
+        self.path = None
+
+    @property
+    def trigger_at(self):
+        return self.events[0][0]
+
+    @property
+    def label(self):
+        return self.events[0][1]
+
+    def add_frames(self, frames):
+        for frame in frames:
+            if not any(frame is kept for kept in self.frames):
+                self.frames.append(frame)
+
+
+def _safe_name(text):
+    return re.sub(r"[^A-Za-z0-9_.=-]+", "_", text)[:60].strip("_") or "trigger"
+
+
+class FrameCapture:
+    """Captures the device screen in a background thread and saves clips around triggers.
+
+    errors_only: only failed operations trigger clips.
+    on_clip(clip) is called from the capture thread after a clip was saved.
+    """
+
+    def __init__(self, client, fps=DEFAULT_FPS, seconds=DEFAULT_SECONDS, pre=DEFAULT_PRE, post=DEFAULT_POST,
+                 out_dir=DEFAULT_OUT_DIR, max_bytes=DEFAULT_MAX_BYTES, errors_only=False, on_clip=None):
+        self.client = client
+        self.interval = 1.0 / max(0.1, float(fps))
+        self.pre = pre
+        self.post = post
+        self.out_dir = out_dir
+        self.errors_only = errors_only
+        self.on_clip = on_clip
+        # The ring must cover a clip's pre window plus the frames captured while it is still open
+        self.ring = FrameRing(max(seconds, pre + post) / self.interval, max_bytes)
+        self.captures = 0
+        self.capture_errors = 0
+        self.last_error = ""
+        self.triggers = 0
+        self.saved = collections.deque(maxlen=CLIP_HISTORY)  # paths of saved clips
+        self.started_at = None
+        self._open = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return self
+        self._stop.clear()
+        self.started_at = time.time()
+        self.client.result_listeners.append(self.on_result)
+        self._thread = threading.Thread(target=self._run, name="frame-capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Stop capturing and save the clips still open with the frames they have."""
+        if self.on_result in self.client.result_listeners:
+            self.client.result_listeners.remove(self.on_result)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._collect(float("inf"))
+
+    # ----- triggers -----
+
+    def on_result(self, result):
+        """Client result listener: the operation's start time is the trigger."""
+        if result.ok and self.errors_only:
+            return
+        label = f"{result.kind} {result.name}={result.value}"
+        if not result.ok:
+            label += f" {result.error_class}"
+        self.trigger(label, result.timestamp - result.elapsed, error=not result.ok)
+
+    def trigger(self, label, at=None, error=False):
+        """Freeze the frames around at (default now); returns the Clip that covers it."""
+        at = time.time() if at is None else at
+        with self._lock:
+            self.triggers += 1
+            for clip in self._open:
+                if clip.start <= at <= clip.until:
+                    clip.events.append((at, label, error))
+                    clip.until = min(max(clip.until, at + self.post), clip.trigger_at + MAX_CLIP_SECONDS)
+                    return clip
+            clip = Clip(at - self.pre, at + self.post)
+            clip.events.append((at, label, error))
+            # Pre-trigger frames are taken now, before the ring can evict them
+            clip.add_frames(self.ring.window(clip.start, clip.until))
+            self._open.append(clip)
+        REGISTRY.inc("capture_triggers_total", result="error" if error else "ok")
+        return clip
+
+    # ----- capture thread -----
+
+    def _run(self):
+        next_at = time.monotonic()
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                image = decode_screencap(self.client.screencap())
+                self.ring.add((started + time.time()) / 2.0, image)
+                self.captures += 1
+            except (OSError, RuntimeError, ValueError, subprocess.TimeoutExpired) as e:
+                self.capture_errors += 1
+                self.last_error = str(e)
+                REGISTRY.inc("capture_errors_total")
+                next_at = time.monotonic() + CAPTURE_BACKOFF
+            self._collect(time.time())
+            next_at += self.interval
+            delay = next_at - time.monotonic()
+            if delay < 0:
+                next_at = time.monotonic()  # Capturing is slower than fps; do not try to catch up
+            self._stop.wait(max(0.0, delay))
+
+    def _collect(self, now):
+        """Add new frames to the open clips and save the clips whose window has passed."""
+        closed = []
+        with self._lock:
+            for clip in list(self._open):
+                clip.add_frames(self.ring.window(clip.start, clip.until))
+                if now >= clip.until:
+                    self._open.remove(clip)
+                    closed.append(clip)
+        for clip in closed:
+            try:
+                self._save(clip)
+            except OSError as e:
+                self.last_error = f"Could not save clip: {e}"
+                continue
+            self.saved.append(clip.path)
+            REGISTRY.inc("capture_clips_total")
+            if self.on_clip:
+                self.on_clip(clip)
+
+    def _save(self, clip):
+        at = clip.trigger_at
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(at)) + f".{int(at * 1000) % 1000:03d}"
+        directory = os.path.join(self.out_dir, f"{stamp}_{_safe_name(clip.label)}")
+        os.makedirs(directory, exist_ok=True)
+        frames = []
+        for index, frame in enumerate(sorted(clip.frames, key=lambda frame: frame.t)):
+            offset_ms = round((frame.t - at) * 1000.0)
+            name = f"frame_{index:03d}_{offset_ms:+07d}ms.png"
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(frame.png)
+            frames.append({"file": name, "t": round(frame.t, 3), "offset_ms": offset_ms,
+                           "unchanged_ms": round((frame.until - frame.t) * 1000.0), "repeats": frame.repeats})
+        info = {
+            "trigger_at": at,
+            "label": clip.label,
+            "pre": self.pre,
+            "post": self.post,
+            "events": [{"t": round(t, 3), "offset_ms": round((t - at) * 1000.0), "label": label, "error": error}
+                       for t, label, error in clip.events],
+            "frames": frames,
+        }
+        with open(os.path.join(directory, "clip.json"), "w", encoding="utf-8") as f:
+            json.dump(info, f, indent=1)
+        clip.path = directory
+
+    def to_dict(self):
+        """Capture state for /status."""
+        with self._lock:
+            open_clips = len(self._open)
+        return {
+            "running": self.running,
+            "fps": round(1.0 / self.interval, 2),
+            "frames": len(self.ring),
+            "ring_bytes": self.ring.bytes,
+            "max_bytes": self.ring.max_bytes,
+            "evicted": self.ring.evicted,
+            "captures": self.captures,
+            "capture_errors": self.capture_errors,
+            "last_error": self.last_error,
+            "triggers": self.triggers,
+            "open_clips": open_clips,
+            "saved": list(self.saved)[-5:],
+        }
+
+
+REGISTRY.describe("capture_triggers_total", "counter", "Frame capture triggers, by operation result")
+REGISTRY.describe("capture_clips_total", "counter", "Frame capture clips saved")
+REGISTRY.describe("capture_errors_total", "counter", "Screenshots the frame capture could not take")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="FPK frame capture around actions")
+    parser.add_argument("--device-id", default=DEFAULT_DEVICE_ID, help="adb serial of the target")
+    parser.add_argument("--adb-folder", default="", help="Folder containing adb1.exe (default: adb on PATH)")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS, help="Screenshots per second")
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SECONDS, help="History kept in memory")
+    parser.add_argument("--max-mb", type=float, default=DEFAULT_MAX_BYTES / 1048576.0,
+                        help="Memory cap of the frame ring (MB)")
+    parser.add_argument("--pre", type=float, default=DEFAULT_PRE, help="Seconds kept before a trigger")
+    parser.add_argument("--post", type=float, default=DEFAULT_POST, help="Seconds kept after a trigger")
+    parser.add_argument("--out", default=DEFAULT_OUT_DIR, help="Directory for saved clips")
+    parser.add_argument("--errors-only", action="store_true", help="Only failed operations trigger clips")
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument("--preset", choices=list(PRESETS), help="Run this preset after --pre seconds, then exit")
+    action.add_argument("--press", choices=MFL_BUTTONS, help="Press this button after --pre seconds, then exit")
+    action.add_argument("--signal", nargs=2, metavar=("DPID", "VALUE"),
+                        help="Send one value after --pre seconds, then exit")
+    parser.add_argument("--duration", type=float, default=0.0,
+                        help="Without an action: stop after this many seconds (0 = until Ctrl+C)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    client = FpkClient(device_id=args.device_id, adb_folder=args.adb_folder, log=print)
+    capture = FrameCapture(client, args.fps, args.seconds, args.pre, args.post, args.out,
+                           int(args.max_mb * 1048576), args.errors_only,
+                           on_clip=lambda clip: print(f"[CAPTURE] {len(clip.frames)} frames around "
+                                                      f"{clip.label} saved to {clip.path}"))
+    print(f"[CAPTURE] {args.fps:g} fps, {args.pre:g}s before / {args.post:g}s after each action -> {args.out}")
+    capture.start()
+    try:
+        if args.preset or args.press or args.signal:
+            time.sleep(args.pre)
+            if args.preset:
+                client.run_preset(args.preset)
+            elif args.press:
+                client.ensure_script()
+                print(client.press(args.press))
+            else:
+                print(client.send_signal(*args.signal))
+            time.sleep(args.post + capture.interval)
+        elif args.duration:
+            time.sleep(args.duration)
+        else:
+            while True:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.stop()
+        client.close()
+    status = capture.to_dict()
+    print(f"[CAPTURE] {status['captures']} screenshots, {status['frames']} distinct frames in memory "
+          f"({status['ring_bytes'] / 1024:.0f} KB), {len(capture.saved)} clip(s) saved")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1569 @@
+"""
+FPK client - device logic (checks, deployment, signals, buttons, presets) without tkinter
+
+    from fpk_client import FpkClient
+
+    client = FpkClient()
+    print(client.status().ready)
+    client.deploy()
+    result = client.send_signal("DP_ID_B_ACC_STATUSICON", 5)
+    results = client.send_many([("DP_ID_A", 1), ("DP_ID_B", 2)])   # one adb process
+    client.press("up", count=3)
+    run = client.run_preset("adas")
+
+send_*/press/run_preset block until the device answered; the submit_*/
+start_preset variants return at once with a waitable. Those writes and
+presses (preset steps included) go through one CommandQueue, so library
+calls, GUI actions and API requests never interleave their IpcSender
+writes. The other calls run adb directly on the calling thread, next to
+whatever the queue is doing: status() and the other checks, deploy() /
+ensure_script(), the capability probe, screencap() and execute_many()
+(the queue worker's batch path, which fpk_stress also calls directly).
+"""
+
+import hashlib
+import os
+import re
+import stat
+import subprocess
+import threading
+import time
+
+from adaptive_timeout import TimeoutPolicy
+from adb_exec import (
+    REMOTE_SCRIPT_DIR,
+    AdbCommandTemplates,
+    format_argv,
+    is_device_parse_error,
+    resolve_adb_binary,
+    run_adb,
+)
+from command_queue import CommandQueue
+from fpk_caps import probe as probe_device
+from fpk_ledger import BUTTON_PREFIX, SignalLedger
+from fpk_metrics import REGISTRY
+from fpk_trace import TRACER
+from offline_queue import OFFLINE_MAX_AGE, OFFLINE_MAX_SIZE, OfflineQueue
+
+DEFAULT_DEVICE_ID = "ABC-0123456789"
+
+# Timeouts (seconds)
+SIGNAL_TIMEOUT = 10
+BUTTON_TIMEOUT = 10
+PUSH_TIMEOUT = 30
+CHMOD_TIMEOUT = 15
+SCREENCAP_TIMEOUT = 15
+
+# Cached connection checks older than this are refreshed when shown (seconds)
+STATUS_STALE_SECONDS = 30
+
+# Fixed part of a batch timeout per write (until the per-write latency is known)
+BATCH_SECONDS_PER_WRITE = 0.2
+
+# Device writes fail without spawning adb while a failed device/shell check is this recent (seconds)
+FAIL_FAST_SECONDS = 10.0
+
+# Signals sent per adb invocation by send_many (keeps the shell command line short)
+BATCH_CHUNK_SIZE = 50
+
+# Signals per invocation when they are streamed to `mfl_total.sh batch` on stdin
+STDIN_BATCH_CHUNK_SIZE = 1000
+
+# Marker printed after every step of a batched shell command
+BATCH_RC_MARKER = "@@FPK_RC"
+
+# Error of a batched write whose marker never came back (the shell died)
+NO_RESULT_ERROR = "No result from device"
+
+# Error classes that mean the device or its link went away, not that a write was rejected
+CONNECTION_ERROR_CLASSES = ("timeout", "no_device", "unauthorized", "offline")
+
+# Seconds between connection checks while waiting for the device to come back
+READY_POLL_SECONDS = 2.0
+
+# Seconds a suspended preset waits for the device before it is abandoned (None = until cancelled)
+PRESET_RESUME_TIMEOUT = 300.0
+
+SIGNAL_NAME_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+SIGNAL_VALUE_PATTERN = re.compile(r"-?\d+")
+
+# MFL buttons: verb -> (echo text, press DPID, release DPID). mfl_total.sh
+# writes 1 then 0 to the press DPID, then 1 then 0 to the release DPID.
+MFL_BUTTON_TABLE = {
+    "up": ("up.", "DP_ID_HMI_UP_SHORT_PRESS", "DP_ID_HMI_UP_SHORT_RELEASE"),
+    "down": ("down", "DP_ID_HMI_DOWN_SHORT_PRESS", "DP_ID_HMI_DOWN_SHORT_RELEASE"),
+    "menuup": ("menuup", "DP_ID_HMI_MENU_UP_SHORT_PRESS", "DP_ID_HMI_MENU_UP_SHORT_RELEASE"),
+    "menudown": ("menudown", "DP_ID_HMI_MENU_DOWN_SHORT_PRESS", "DP_ID_HMI_MENU_DOWN_SHORT_RELEASE"),
+    "ok": ("ok", "DP_ID_HMI_OK_SHORT_PRESS", "DP_ID_HMI_OK_SHORT_RELEASE"),
+    "view": ("view", "DP_ID_HMI_VIEW_SHORT_PRESS", "DP_ID_HMI_VIEW_SHORT_PRESS_RELEASE"),
+    "fas": ("fas", "DP_ID_HMI_FAS_TASTER_SHORT_PRESS", "DP_ID_HMI_FAS_TASTER_SHORT_RELEASE"),
+}
+
+# MFL script verbs (mfl_total.sh <verb>)
+MFL_BUTTONS = tuple(MFL_BUTTON_TABLE)
+
+# Custom 12 scenario: one ZPM popup cycle, repeated (waits are in ms)
+_CUSTOM_12_CYCLE = [
+    ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
+    ("WAIT", "1000"),
+    ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),
+    ("DP_ID_HMI_ZPM_ANZEIGEID", "42493"),
+
+    ("WAIT", "300"),
+]
+
+# Presets: name -> (log title, [(DPID, value) or ("WAIT", ms), ...])
+PRESETS = {
+    "adas": ("[PRESET] ADAS batch send", [
+        ("DP_ID_S_FOD_STATE_ACC", "1"),
+        ("DP_ID_B_TA_FOD_STATUS", "1"),
+        ("DP_ID_DP_LDW_VERBAUT", "1"),
+        ("DP_ID_B_LDW_LERNMODUS_SEITENABHAENGIG", "15"),
+        ("DP_ID_B_ACC_STATUSICON", "5"),
+        ("DP_ID_B_TA_AKTIV_HMI", "1"),
+        ("DP_ID_B_TA_HMI_EGO_LI_TYP", "3"),
+        ("DP_ID_B_TA_HMI_EGO_RE_TYP", "3"),
+        ("DP_ID_B_TA_HMI_NACHB_LI_TYP", "2"),
+        ("DP_ID_B_TA_HMI_NACHB_RE_TYP", "2"),
+        ("DP_ID_B_TA_HMI_TAZOOMSTUFEAKTIV", "1"),
+        ("DP_ID_B_TA_HMI_SEG1_KRUEMMUNG", "2048"),
+        ("DP_ID_B_TA_HMI_SEG2_KRUEMMUNG", "2048"),
+        ("DP_ID_B_TA_HMI_SEG1_GIERWINKEL", "2048"),
+        ("DP_ID_B_TA_HMI_SEG2_BEGINN", "0"),
+        ("DP_ID_B_TA_HMI_EGOOBJ_DY", "64"),
+    ]),
+    "navigation": ("[PRESET] Navigation batch send", [
+        ("DP_ID_BAP_NAVI_VIDEOSTREAMS_AVAILABLE", "1"),
+        ("DP_ID_BAP_NAVI_ACTIVERGTYPE_RGTYPE", "3"),
+        ("DP_ID_HMI_NAVI_VIDEOSTREAM_VIDEODATA_READY", "1"),
+        ("DP_ID_BAP_NAVIGATION_AVAILABLE", "1"),
+        ("DP_ID_BAP_NAVI_FSG_OPERATIONSTATE_OP_STATE", "0"),
+    ]),
+    "long_view": ("[KEY] LONG VIEW (11) sequence send", [
+        ("DP_ID_HMI_VIEW_LONG_PRESS", "1"),
+        ("DP_ID_HMI_VIEW_LONG_PRESS", "0"),
+        ("DP_ID_HMI_VIEW_LONG_PRESS_RELEASE", "1"),
+        ("DP_ID_HMI_VIEW_LONG_PRESS_RELEASE", "0"),
+    ]),
+    "custom_12": ("[PRESET] CUSTOM (12) batch send", _CUSTOM_12_CYCLE * 12),
+}
+
+def _mfl_button_block(keyword, name, echo_text, press_dpid, release_dpid):
+    lines = [f'{keyword} [ "$1" = "{name}" ]; then', f'    echo "{echo_text}"']
+    for dpid in (press_dpid, release_dpid):
+        lines.append(f"    IpcSender --dpid {dpid} 0 1 > /dev/null 2>&1")
+        lines.append(f"    IpcSender --dpid {dpid} 0 0 > /dev/null 2>&1")
+    return lines
+
+
+def build_mfl_script(buttons=MFL_BUTTON_TABLE):
+    """Generate mfl_total.sh from the button table.
+
+    Verbs: <button> [count], signal <DPID> <VALUE>, batch (reads "DPID VALUE"
+    lines from stdin and prints "@@FPK_RC <rc>" after each write) and version.
+    The version stamp is a hash of the generated body, so any table change
+    yields a new version.
+    """
+    body = [
+        "",
+        "# Repeat a button N times in one invocation: mfl_total.sh <button> <count>",
+        'if [ "$1" != "signal" ] && [ -n "$2" ] && [ "$2" -gt 1 ] 2>/dev/null; then',
+        '    n="$2"',
+        "    rc=0",
+        '    while [ "$n" -gt 0 ]; do',
+        "        # Through sh: the script may be deployed without exec permission (run as `sh <path>`)",
+        '        sh "$0" "$1"',
+        "        r=$?",
+        '        [ "$rc" -eq 0 ] && rc=$r',
+        "        n=$((n - 1))",
+        "    done",
+        "    # A press that failed mid-burst fails the whole invocation",
+        '    exit "$rc"',
+        "fi",
+        "",
+    ]
+    keyword = "if"
+    for name, (echo_text, press_dpid, release_dpid) in buttons.items():
+        body.extend(_mfl_button_block(keyword, name, echo_text, press_dpid, release_dpid))
+        keyword = "elif"
+    body.extend([
+        'elif [ "$1" = "signal" ]; then',
+        '    dpid="$2"',
+        '    value="$3"',
+        '    if [ -z "$dpid" ] || [ -z "$value" ]; then',
+        '        echo "Usage: $0 signal <DPID_NAME> <VALUE>"',
+        "        exit 1",
+        "    fi",
+        '    echo "signal: $dpid = $value"',
+        '    IpcSender --dpid "$dpid" 0 "$value" > /dev/null 2>&1',
+        'elif [ "$1" = "batch" ]; then',
+        "    # One shell process for many writes: stdin lines are <DPID> <VALUE>",
+        "    while read -r dpid value; do",
+        '        [ -z "$dpid" ] && continue',
+        '        IpcSender --dpid "$dpid" 0 "$value" 2>&1',
+        f'        echo "{BATCH_RC_MARKER} $?"',
+        "    done",
+        'elif [ "$1" = "version" ]; then',
+        '    echo "$MFL_SCRIPT_VERSION"',
+        "else",
+        '    echo "Unknown Command."',
+        "fi",
+        "",
+    ])
+    body_text = "\n".join(body)
+    version = hashlib.sha1(body_text.encode("utf-8")).hexdigest()[:12]
+    header = "\n".join([
+        "#!/bin/bash",
+        f"# Generated by FPK ADB CMD Sender - do not edit (version {version})",
+        f'MFL_SCRIPT_VERSION="{version}"',
+    ])
+    return header + "\n" + body_text, version
+
+
+MFL_SCRIPT, MFL_SCRIPT_VERSION = build_mfl_script()
+
+
+def _silent(message):
+    pass
+
+
+def validate_signal(signal_name, signal_value):
+    """Raise ValueError unless the DPID name/value are safe IpcSender arguments."""
+    if not SIGNAL_NAME_PATTERN.fullmatch(str(signal_name)):
+        raise ValueError("Signal name may only contain letters, numbers, and underscores. (e.g., DP_ID_SOMETHING)")
+    if not SIGNAL_VALUE_PATTERN.fullmatch(str(signal_value)):
+        raise ValueError("Signal value must be an integer. (e.g., 0, 1, -1)")
+
+
+def is_connection_failure(result):
+    """True if an OperationResult failed because the device/shell went away."""
+    return result.error_class in CONNECTION_ERROR_CLASSES or result.error == NO_RESULT_ERROR
+
+
+def classify_failure(stdout, stderr, returncode):
+    """Error class for a finished adb call (None if it succeeded)."""
+    if is_device_parse_error(stdout, stderr):
+        return "parse_error"
+    if returncode == 0:
+        return None
+    stderr_lc = (stderr or "").lower()
+    if "no devices" in stderr_lc or "not found" in stderr_lc:
+        return "no_device"
+    if "unauthorized" in stderr_lc:
+        return "unauthorized"
+    if "offline" in stderr_lc:
+        return "offline"
+    return "failed"
+
+
+class OperationResult:
+    """Structured outcome of one signal write or button press.
+
+    error_class is None on success, otherwise one of: timeout, parse_error,
+    no_device, unauthorized, offline, failed, error.
+    """
+
+    __slots__ = ("kind", "name", "value", "ok", "returncode", "stdout", "stderr",
+                 "error", "error_class", "elapsed", "timestamp")
+
+    def __init__(self, kind, name, value, returncode=None, stdout="", stderr="",
+                 error=None, error_class=None, elapsed=0.0, timestamp=None):
+        self.kind = kind
+        self.name = name
+        self.value = value
+        self.returncode = returncode
+        self.stdout = stdout or ""
+        self.stderr = stderr or ""
+        self.error = error
+        self.error_class = error_class
+        self.ok = error_class is None
+        self.elapsed = elapsed
+        self.timestamp = timestamp if timestamp is not None else time.time()
+
+    @classmethod
+    def from_process(cls, kind, name, value, process):
+        return cls(kind, name, value, process.returncode, process.stdout, process.stderr,
+                   error_class=classify_failure(process.stdout, process.stderr, process.returncode),
+                   elapsed=process.elapsed)
+
+    @classmethod
+    def from_exception(cls, kind, name, value, error, elapsed=0.0):
+        if isinstance(error, subprocess.TimeoutExpired):
+            return cls(kind, name, value, error="Command execution timed out", error_class="timeout", elapsed=elapsed)
+        return cls(kind, name, value, error=str(error), error_class="error", elapsed=elapsed)
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Inverse of to_dict (results relayed by the broker)."""
+        return cls(data["kind"], data["name"], data["value"], data.get("returncode"), data.get("stdout", ""),
+                   data.get("stderr", ""), data.get("error"), data.get("error_class"), data.get("elapsed", 0.0),
+                   data.get("timestamp"))
+
+    def __repr__(self):
+        state = "ok" if self.ok else self.error_class
+        return f"<OperationResult {self.kind} {self.name}={self.value} {state} {self.elapsed * 1000:.1f}ms>"
+
+
+class ConnectionStatus:
+    """Result of the quiet install/device/shell check chain."""
+
+    __slots__ = ("adb_installed", "device_connected", "shell_working", "checked_at")
+
+    def __init__(self, adb_installed, device_connected, shell_working, checked_at=None):
+        self.adb_installed = adb_installed
+        self.device_connected = device_connected
+        self.shell_working = shell_working
+        self.checked_at = checked_at if checked_at is not None else time.time()
+
+    @property
+    def ready(self):
+        return bool(self.adb_installed and self.device_connected and self.shell_working)
+
+    def to_dict(self):
+        return {
+            "adb_installed": bool(self.adb_installed),
+            "device_connected": bool(self.device_connected),
+            "shell_working": bool(self.shell_working),
+            "ready": self.ready,
+            "checked_at": self.checked_at,
+        }
+
+
+class StatusCache:
+    """Latest result of each connection check ("adb", "device", "shell"), shared by all callers.
+
+    Both the quiet periodic checks and the verbose settings checks write
+    here, so readers (settings window, API) can show a status without
+    touching the device.
+    """
+
+    CHECKS = ("adb", "device", "shell")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def update(self, check, ok, message, checked_at=None):
+        with self._lock:
+            self._entries[check] = (bool(ok), message, checked_at if checked_at is not None else time.time())
+
+    def get(self, check):
+        """(ok, message, checked_at) or None if the check never ran."""
+        with self._lock:
+            return self._entries.get(check)
+
+    def age(self, check, now=None):
+        """Seconds since the check last ran (None if never)."""
+        entry = self.get(check)
+        if entry is None:
+            return None
+        return (now or time.time()) - entry[2]
+
+    def is_stale(self, max_age=STATUS_STALE_SECONDS):
+        """True if any check is missing or older than max_age seconds."""
+        now = time.time()
+        for check in self.CHECKS:
+            age = self.age(check, now)
+            if age is None or age > max_age:
+                return True
+        return False
+
+    def to_dict(self):
+        now = time.time()
+        with self._lock:
+            entries = dict(self._entries)
+        return {
+            check: {"ok": ok, "message": message, "checked_at": checked_at, "age": round(now - checked_at, 1)}
+            for check, (ok, message, checked_at) in entries.items()
+        }
+
+
+def format_age(seconds):
+    """Short human-readable age ("just now", "42s ago", "3m ago")."""
+    if seconds is None:
+        return "never"
+    if seconds < 2:
+        return "just now"
+    if seconds < 120:
+        return f"{int(seconds)}s ago"
+    if seconds < 7200:
+        return f"{int(seconds // 60)}m ago"
+    return f"{int(seconds // 3600)}h ago"
+
+
+class DeployResult:
+    """Outcome of pushing mfl_total.sh and marking it executable."""
+
+    __slots__ = ("pushed", "chmod_ok", "message", "elapsed", "via_sh")
+
+    def __init__(self, pushed, chmod_ok, message="", elapsed=0.0, via_sh=False):
+        self.pushed = pushed
+        self.chmod_ok = chmod_ok
+        self.message = message
+        self.elapsed = elapsed
+        self.via_sh = via_sh  # chmod was refused; the script runs as `sh <path>`
+
+    @property
+    def ok(self):
+        return self.pushed and (self.chmod_ok or self.via_sh)
+
+
+class PresetRun:
+    """Progress of one preset run (waitable from other threads).
+
+    checkpoint is the index of the first step not yet confirmed by the
+    device; a suspended run continues from there. state is running,
+    suspended, abandoned (the device never came back) or done.
+    """
+
+    def __init__(self, name, total_steps=0):
+        self.name = name
+        self.total_steps = total_steps
+        self.checkpoint = 0
+        self.state = "running"
+        self.suspensions = 0
+        self.redeploys = 0
+        self.reapplied = 0  # state-prefix writes sent on resume
+        self.downtime = 0.0
+        self.steps_sent = 0
+        self.failures = 0
+        self.results = []
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self._done = threading.Event()
+        self._cancel = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """Stop before the next batch or WAIT step (the batch in flight still completes)."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def finish(self):
+        if self.state != "abandoned":
+            self.state = "done"
+        self.finished_at = time.perf_counter()
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                pass
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def add_done_callback(self, callback):
+        """Call callback(run) once the run has finished (right away if it already has)."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        try:
+            callback(self)
+        except Exception:
+            pass
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def ok(self):
+        return self.failures == 0
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+
+def parse_devices(stdout):
+    """Parse `adb devices` output into [(serial, state), ...]."""
+    devices = []
+    lines = stdout.strip().split('\n')
+    for line in lines[1:]:  # First line is "List of devices attached"
+        if line.strip() and '\t' in line:
+            device_info = line.strip().split('\t')
+            if len(device_info) >= 2:
+                devices.append((device_info[0], device_info[1]))
+    return devices
+
+
+class FpkClient:
+    """Device operations for one FPK target, usable from scripts, tests, the GUI and the API.
+
+    log: optional callable(message) used by the verbose checks and deploy;
+    it is called from whatever thread runs the operation.
+
+    hold_offline: when status() finds the device disconnected, single writes
+    and presses are held in an OfflineQueue instead of spawning adb
+    processes that time out; they are sent as one batch when status() sees
+    the shell working again.
+
+    rate_limiter: optional rate_limit.RateLimiter; every write and press
+    waits for its tokens before the adb call, and batches and multi-presses
+    are split so one invocation never carries more writes than a burst.
+    """
+
+    def __init__(self, device_id=DEFAULT_DEVICE_ID, adb_folder="", cwd=None, log=None,
+                 coalesce_window=0.0, max_rate=None, max_burst=50, hold_offline=False,
+                 offline_max_age=OFFLINE_MAX_AGE, offline_max_size=OFFLINE_MAX_SIZE, rate_limiter=None):
+        self.device_id = device_id
+        self.adb_folder = adb_folder
+        self.cwd = cwd  # None = the process working directory at call time
+        self.log = log or _silent
+        self.queue = CommandQueue(coalesce_window=coalesce_window, max_rate=max_rate, max_burst=max_burst)
+        self.status_cache = StatusCache()
+        # Every finished write/press in columnar form (stats view, exports)
+        self.ledger = SignalLedger()
+        # Called with every finished OperationResult (frame capture triggers); must not block
+        self.result_listeners = []
+        # True once the deployed script's batch verb answered over stdin
+        self.stdin_batch = False
+        self.hold_offline = hold_offline
+        self.offline = OfflineQueue(self._drop_held, offline_max_age, offline_max_size, max_burst)
+        self.online = True  # False from a failed status() until the held commands are flushed
+        self.limiter = rate_limiter
+        # Per-operation timeouts learnt from the latency of this client's adb calls
+        self.timeouts = TimeoutPolicy()
+        # Optional AdbServerManager; while it tracks the server, status() skips the version/devices spawns
+        self.server = None
+        # Where mfl_total.sh lives and how it is started (chosen from the capability probe)
+        self.script_dir = REMOTE_SCRIPT_DIR
+        self.script_via_sh = False
+        # fpk_caps.DeviceCapabilities of the current connection (None until probed / after a drop)
+        self.capabilities = None
+        self._offline_lock = threading.Lock()
+        # Serializes push/chmod/verify: GUI threads and the queue worker both deploy
+        self._deploy_lock = threading.RLock()
+        self._templates = None
+        self._templates_key = None
+
+    # ----- configuration -----
+
+    @property
+    def templates(self):
+        """argv templates for the current ADB folder/device id (resolved once, then reused)."""
+        key = (self.adb_folder, self.device_id, self.script_dir, self.script_via_sh)
+        if self._templates is None or self._templates_key != key:
+            binary, warning = resolve_adb_binary(self.adb_folder)
+            if warning:
+                # Fall back to default command if adb1.exe isn't found
+                self.log(f"[Warning] {warning}")
+            self._templates = AdbCommandTemplates(binary, self.device_id, self.script_dir, self.script_via_sh)
+            self._templates_key = key
+        return self._templates
+
+    def close(self):
+        """Stop the command queue (pending and held operations fail)."""
+        self.offline.discard()
+        self.queue.stop()
+
+    def _run(self, argv, timeout):
+        return run_adb(argv, timeout=timeout, cwd=self.cwd)
+
+    def _call(self, operation, argv, default_timeout, input_text=None, binary=False):
+        """run_adb with the adaptive timeout of operation on this device; the latency is fed back."""
+        timeout = self.timeouts.timeout(operation, self.device_id, default_timeout)
+        try:
+            process = run_adb(argv, timeout=timeout, cwd=self.cwd, input_text=input_text, binary=binary)
+        except subprocess.TimeoutExpired:
+            self.timeouts.timed_out(operation, self.device_id)
+            raise
+        stdout = "" if binary else process.stdout
+        if classify_failure(stdout, process.stderr, process.returncode) not in CONNECTION_ERROR_CLASSES:
+            # "no devices"/"offline" answers come back at once and say nothing about the device's latency
+            self.timeouts.observe(operation, self.device_id, process.elapsed)
+        return process
+
+    def _call_many(self, operation, per_item, argv, count, default_timeout, item_timeout, input_text=None):
+        """_call for an invocation carrying count items (writes, presses); the timeout grows with count."""
+        timeout = self.timeouts.batch_timeout(self.device_id, count, default_timeout, item_timeout,
+                                              operation, per_item)
+        try:
+            process = run_adb(argv, timeout=timeout, cwd=self.cwd, input_text=input_text)
+        except subprocess.TimeoutExpired:
+            self.timeouts.timed_out(operation, self.device_id)
+            raise
+        if process.returncode == 0:
+            self.timeouts.observe_batch(self.device_id, count, process.elapsed, operation, per_item)
+        return process
+
+    # ----- verbose checks (used by the settings window) -----
+
+    def check_installation(self, log=None):
+        """Check whether ADB is installed/available. Returns (ok, message) and records it in the status cache."""
+        ok, message = self._check_installation(log)
+        self.status_cache.update("adb", ok, message)
+        return ok, message
+
+    def _check_installation(self, log):
+        log = log or _silent
+        try:
+            # Run adb command to verify installation
+            adb_cmd = self.templates.device
+            if self.adb_folder:
+                log(f"[ADB Check] Selected ADB folder: {self.adb_folder}")
+            else:
+                log("[ADB Check] Using default ADB command (searching PATH)")
+            log(f"[ADB Check] Command: {format_argv(adb_cmd)}")
+
+            process = self._call("version", adb_cmd, 10)
+            stdout, stderr = process.stdout, process.stderr
+
+            # Log outputs
+            log(f"[ADB Check] Return code: {process.returncode}")
+            if stdout.strip():
+                log(f"[ADB Check] STDOUT:\n{stdout}")
+            if stderr.strip():
+                log(f"[ADB Check] STDERR:\n{stderr}")
+
+            # Determine ADB availability
+            # 1) Return code 9009 = command not found (Windows)
+            if process.returncode == 9009:
+                log("[ADB Check] ❌ Command not found (return code: 9009)")
+                return False, "Cannot find the ADB command. It may not be installed or not on PATH."
+
+            # 2) Specific error message in stderr
+            if "'adb' is not recognized" in stderr:
+                log("[ADB Check] ❌ Command not recognized")
+                return False, "ADB command is not recognized. It may not be installed or not on PATH."
+
+            # 3) If it prints "Android Debug Bridge", it's installed
+            if "Android Debug Bridge" in stdout or "Android Debug Bridge" in stderr:
+                log("[ADB Check] ✅ ADB detected (" + "Android Debug Bridge" + " found)")
+                return True, "ADB is installed and available."
+
+            # 4) If return code is 1 and help/usage is shown, treat as installed
+            if process.returncode == 1 and ("usage:" in stdout.lower() or "usage:" in stderr.lower()):
+                log("[ADB Check] ✅ ADB detected (usage/help shown)")
+                return True, "ADB is installed and available."
+
+            # 5) Extra verification: run `adb version`
+            log("[ADB Check] Extra verification: running `adb version`...")
+            try:
+                version_process = self._call("version", self.templates.version, 5)
+                version_stdout, version_stderr = version_process.stdout, version_process.stderr
+
+                log(f"[ADB Check] adb version return code: {version_process.returncode}")
+                if version_stdout.strip():
+                    log(f"[ADB Check] adb version STDOUT:\n{version_stdout}")
+                if version_stderr.strip():
+                    log(f"[ADB Check] adb version STDERR:\n{version_stderr}")
+
+                if version_process.returncode == 0 and ("Android Debug Bridge" in version_stdout or "version" in version_stdout.lower()):
+                    log("[ADB Check] ✅ ADB detected (`adb version` succeeded)")
+                    return True, "ADB is installed and available."
+
+            except Exception as ve:
+                log(f"[ADB Check] adb version failed: {str(ve)}")
+
+            # 6) Otherwise assume not installed/available
+            log(f"[ADB Check] ❌ ADB check failed (return code: {process.returncode})")
+            return False, f"Cannot determine ADB installation status. (return code: {process.returncode})"
+
+        except subprocess.TimeoutExpired:
+            log("[ADB Check] ❌ Timeout")
+            return False, "ADB command timed out"
+        except FileNotFoundError:
+            log("[ADB Check] ❌ File not found (FileNotFoundError)")
+            return False, "ADB may not be installed or not on PATH."
+        except OSError as e:
+            if e.errno == 2:  # No such file or directory
+                log("[ADB Check] ❌ File not found (OSError)")
+                return False, "Cannot find the ADB executable."
+            else:
+                log(f"[ADB Check] ❌ OS error: {str(e)}")
+                return False, f"System error: {str(e)}"
+        except Exception as e:
+            log(f"[ADB Check] ❌ Exception: {str(e)}")
+            return False, f"Error while checking ADB: {str(e)}"
+
+    def check_devices(self, log=None):
+        """Check ADB device connection status. Returns (ok, message) and records it in the status cache."""
+        ok, message = self._check_devices(log)
+        self.status_cache.update("device", ok, message)
+        return ok, message
+
+    def _check_devices(self, log):
+        log = log or _silent
+        try:
+            # Check connected devices via `adb devices`
+            log("[Device Check] Running `adb devices`...")
+
+            process = self._call("devices", self.templates.devices, 15)
+            stdout, stderr = process.stdout, process.stderr
+
+            # Log outputs
+            log(f"[Device Check] Return code: {process.returncode}")
+            if stdout.strip():
+                log(f"[Device Check] STDOUT:\n{stdout}")
+            if stderr.strip():
+                log(f"[Device Check] STDERR:\n{stderr}")
+
+            if process.returncode == 0:
+                devices = parse_devices(stdout)
+                if devices:
+                    device_list = []
+                    for device_id, status in devices:
+                        device_list.append(f"{device_id} ({status})")
+                    log(f"[Device Check] ✅ Devices found: {len(devices)}")
+                    return True, f"Connected devices: {', '.join(device_list)}"
+                else:
+                    log("[Device Check] ❌ No connected devices")
+                    return False, "No devices are connected."
+            else:
+                log("[Device Check] ❌ Failed to run `adb devices`")
+                return False, f"Failed to run `adb devices`: {stderr}"
+
+        except subprocess.TimeoutExpired:
+            log("[Device Check] ❌ Timeout")
+            return False, "`adb devices` timed out"
+        except Exception as e:
+            log(f"[Device Check] ❌ Exception: {str(e)}")
+            return False, f"Error while checking devices: {str(e)}"
+
+    def check_shell(self, log=None):
+        """Test ADB shell connectivity. Returns (ok, message) and records it in the status cache."""
+        ok, message = self._check_shell(log)
+        self.status_cache.update("shell", ok, message)
+        return ok, message
+
+    def _check_shell(self, log):
+        log = log or _silent
+        try:
+            # Test shell connectivity using `adb shell echo`
+            log('[Shell Test] Running `adb shell echo "ADB Shell Test"`...')
+
+            process = self._call("shell", self.templates.shell_echo, 15)
+            stdout, stderr = process.stdout, process.stderr
+
+            # Log outputs
+            log(f"[Shell Test] Return code: {process.returncode}")
+            if stdout.strip():
+                log(f"[Shell Test] STDOUT:\n{stdout}")
+            if stderr.strip():
+                log(f"[Shell Test] STDERR:\n{stderr}")
+
+            if process.returncode == 0 and "ADB Shell Test" in stdout:
+                log("[Shell Test] ✅ Shell connected")
+                return True, "ADB Shell connectivity is working."
+            elif "no devices/emulators found" in stderr:
+                log("[Shell Test] ❌ No device")
+                return False, "No connected device; cannot run the shell test."
+            elif "device unauthorized" in stderr:
+                log("[Shell Test] ❌ Device unauthorized")
+                return False, "Device is unauthorized. Confirm USB debugging authorization."
+            elif "device offline" in stderr:
+                log("[Shell Test] ❌ Device offline")
+                return False, "Device is offline."
+            else:
+                log("[Shell Test] ❌ Shell connection failed")
+                return False, f"ADB Shell connection failed: {stderr}"
+
+        except subprocess.TimeoutExpired:
+            log("[Shell Test] ❌ Timeout")
+            return False, "ADB Shell command timed out"
+        except Exception as e:
+            log(f"[Shell Test] ❌ Exception: {str(e)}")
+            return False, f"Error while testing ADB Shell: {str(e)}"
+
+    # ----- quiet checks (periodic connection monitor) -----
+
+    def is_adb_installed(self):
+        """Check ADB installation status (silent)."""
+        if self.server is not None and self.server.binary_ok(self.templates.binary):
+            return True
+        try:
+            process = self._call("version", self.templates.version, 5)
+            return process.returncode == 0 and ("Android Debug Bridge" in process.stdout or "version" in process.stdout.lower())
+        except Exception:
+            return False
+
+    def is_device_connected(self):
+        """True if the configured device id is listed in the `device` state (silent)."""
+        if self.server is not None:
+            try:
+                return self.server.device_state(self.device_id) == "device"
+            except LookupError:
+                pass  # Not tracking: ask adb
+        try:
+            # List all devices (the devices template carries no -s option)
+            process = self._call("devices", self.templates.devices, 5)
+            if process.returncode == 0:
+                for device_id, device_status in parse_devices(process.stdout):
+                    # Check the configured device id and its status
+                    if device_id == self.device_id:
+                        return device_status == 'device'
+            return False
+        except Exception:
+            return False
+
+    def probe_shell(self):
+        """Test ADB shell connectivity (silent). Returns (True/False/None, message); None = unknown."""
+        try:
+            process = self._call("shell", self.templates.shell_echo, 5)
+            if process.returncode == 0 and "ADB Shell Test" in process.stdout:
+                return True, "Connected"
+            else:
+                return False, "Not connected"
+
+        except subprocess.TimeoutExpired:
+            # Treat timeout as a connection failure
+            return False, "Timeout"
+        except Exception as e:
+            # For other exceptions, keep the previous state (return None)
+            return None, str(e)
+
+    def status(self):
+        """Run the quiet install -> device -> shell chain and return a ConnectionStatus.
+
+        shell_working is None when the shell probe could not decide. Decided
+        results are recorded in the status cache.
+        """
+        cache = self.status_cache
+        adb_installed = self.is_adb_installed()
+        cache.update("adb", adb_installed,
+                     "ADB is installed and available." if adb_installed else "ADB is not available.")
+        if not adb_installed:
+            cache.update("device", False, "ADB is not installed, so device status cannot be checked.")
+            cache.update("shell", False, "ADB is not installed, so the shell test cannot be run.")
+            self.capabilities = None
+            self._set_online(False)
+            return ConnectionStatus(False, False, False)
+
+        device_connected = self.is_device_connected()
+        if device_connected:
+            cache.update("device", True, f"Connected device: {self.device_id} (device)")
+        else:
+            cache.update("device", False, f"Device {self.device_id} is not connected.")
+            cache.update("shell", False, "No connected device; cannot run the shell test.")
+            self.capabilities = None
+            self._set_online(False)
+            return ConnectionStatus(True, False, False)
+
+        shell_working, shell_message = self.probe_shell()
+        if shell_working is not None:
+            cache.update("shell", shell_working, "ADB Shell connectivity is working." if shell_working
+                         else f"ADB Shell connection failed: {shell_message}")
+        status = ConnectionStatus(True, True, shell_working)
+        if shell_working is not None:
+            if not shell_working:
+                self.capabilities = None
+            self._set_online(status.ready)
+        return status
+
+    # ----- deployment -----
+
+    def default_script_path(self):
+        return os.path.join(self.cwd or os.getcwd(), "mfl_total.sh")
+
+    def write_script(self, script_path=None):
+        """Write mfl_total.sh locally (LF line endings) and return its path."""
+        script_path = script_path or self.default_script_path()
+        with open(script_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(MFL_SCRIPT)
+
+        # Grant execute permission (primarily on Unix-like systems)
+        try:
+            os.chmod(script_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IROTH)
+        except OSError:
+            pass  # chmod behavior may be limited on Windows
+        return script_path
+
+    def deploy(self, script_path=None, log=None):
+        """Push mfl_total.sh to the script directory on the device and make it executable."""
+        with self._deploy_lock, TRACER.span("deploy", cat="deploy"):
+            return self._deploy(script_path, log or _silent)
+
+    def _use_script(self, script_dir, via_sh):
+        """Point the script templates at script_dir (run through sh when via_sh)."""
+        self.script_dir = script_dir
+        self.script_via_sh = via_sh
+
+    def _deploy(self, script_path, log):
+        started = time.perf_counter()
+        script_path = script_path or self.default_script_path()
+        if not os.path.exists(script_path):
+            self.write_script(script_path)
+        caps = self.capabilities
+        script_dir = self.script_dir
+        if caps is not None and caps.deploy_dir and script_dir not in caps.writable_dirs:
+            log(f"[Script Upload] {script_dir} is not writable on the device; using {caps.deploy_dir}")
+            script_dir = caps.deploy_dir
+        self._use_script(script_dir, False)
+        remote_path = self.templates.script_path
+
+        try:
+            # 1. Upload the script via adb push
+            log("[Script Upload] Uploading mfl_total.sh to the device...")
+            with TRACER.span("deploy push", cat="deploy"):
+                push_process = self._call("push", self.templates.push(script_path), PUSH_TIMEOUT)
+            push_stdout, push_stderr = push_process.stdout, push_process.stderr
+
+            log(f"[Script Upload] Return code: {push_process.returncode}")
+            if push_stdout.strip():
+                log(f"[Script Upload] STDOUT:\n{push_stdout}")
+            if push_stderr.strip():
+                log(f"[Script Upload] STDERR:\n{push_stderr}")
+
+            pushed = push_process.returncode == 0
+            if pushed and self._verify_pushed(caps, script_path, remote_path, log) is False:
+                pushed = False
+            if pushed:
+                log("[Script Upload] ✅ Upload succeeded")
+                REGISTRY.inc("deploy_total", result="pushed")
+            elif push_process.returncode == 0:
+                REGISTRY.inc("deploy_total", result="failed")
+            else:
+                log("[Script Upload] ❌ Upload failed")
+                REGISTRY.inc("deploy_total", result="failed")
+                if "no devices/emulators found" in push_stderr:
+                    log("[Script Upload] No device is connected.")
+                elif "device unauthorized" in push_stderr:
+                    log("[Script Upload] Device authorization is required.")
+                # Even if upload fails, still try chmod (file may already exist)
+
+            # 2. Grant execute permission via chmod +x (attempt regardless of upload result)
+            log(f"[Chmod] Granting execute permission to {remote_path}...")
+            with TRACER.span("deploy chmod", cat="deploy"):
+                chmod_process = self._call("chmod", self.templates.chmod_script, CHMOD_TIMEOUT)
+
+            log(f"[Chmod] Return code: {chmod_process.returncode}")
+            if chmod_process.stdout.strip():
+                log(f"[Chmod] STDOUT:\n{chmod_process.stdout}")
+            if chmod_process.stderr.strip():
+                log(f"[Chmod] STDERR:\n{chmod_process.stderr}")
+
+            chmod_ok = chmod_process.returncode == 0
+            via_sh = pushed and not chmod_ok
+            if chmod_ok:
+                log("[Chmod] ✅ Execute permission granted")
+            elif via_sh:
+                # Permission changes can be refused (noexec/restricted mounts); sh still runs the file
+                log("[Chmod] ❌ Failed to grant execute permission; the script will be run through sh")
+                self._use_script(script_dir, True)
+            else:
+                log("[Chmod] ❌ Failed to grant execute permission")
+            if chmod_ok or via_sh:
+                self.stdin_batch = self._probe_stdin_batch()
+                if caps is not None:
+                    caps.scripts[script_dir] = (MFL_SCRIPT_VERSION, via_sh)
+                    caps.select_script(MFL_SCRIPT_VERSION)
+                    caps.stdin_batch = self.stdin_batch
+                log("[Deploy] ✅ mfl_total.sh deployed to device")
+                log(f"[Usage] On the device: {'sh ' if via_sh else ''}{remote_path} "
+                    "[up|down|menuup|menudown|ok|view|fas] [count]")
+            result = DeployResult(pushed, chmod_ok, "", time.perf_counter() - started, via_sh)
+            result.message = "Deployed" if result.ok else "Deploy incomplete"
+            return result
+
+        except subprocess.TimeoutExpired:
+            log("[Script Upload] ❌ Upload timed out")
+            REGISTRY.inc("deploy_total", result="failed")
+            return DeployResult(False, False, "Upload timed out", time.perf_counter() - started)
+        except Exception as e:
+            log(f"[Script Upload Error] {str(e)}")
+            REGISTRY.inc("deploy_total", result="failed")
+            return DeployResult(False, False, str(e), time.perf_counter() - started)
+
+    def _verify_pushed(self, caps, script_path, remote_path, log):
+        """Compare the pushed script's hash with the local file; None if the device has no hash command."""
+        name = caps.hash_command if caps is not None else None
+        if name is None:
+            return None
+        with open(script_path, "rb") as f:
+            expected = hashlib.new(name[:-len("sum")], f.read()).hexdigest()
+        try:
+            process = self._call("shell", self.templates.shell_command(name, remote_path), BUTTON_TIMEOUT)
+        except Exception as e:
+            log(f"[Script Upload] Could not verify the upload: {e}")
+            return None
+        fields = process.stdout.split()
+        if process.returncode == 0 and fields and fields[0].lower() == expected:
+            return True
+        log(f"[Script Upload] ❌ {remote_path} does not match the local script ({name} mismatch)")
+        return False
+
+    def script_version(self):
+        """Version printed by the deployed mfl_total.sh, or None if it is missing or predates versions."""
+        try:
+            process = self._call("shell", self.templates.mfl_script + ("version",), BUTTON_TIMEOUT)
+        except Exception:
+            return None
+        version = process.stdout.strip()
+        return version if process.returncode == 0 and re.fullmatch(r"[0-9a-f]{12}", version) else None
+
+    def probe_capabilities(self, refresh=False):
+        """What the device shell offers (fpk_caps.DeviceCapabilities), probed once per connection.
+
+        Returns None if the shell did not answer. An installed script of the
+        current version becomes the one the templates use.
+        """
+        if self.capabilities is not None and not refresh:
+            return self.capabilities
+        with TRACER.span("capability probe", cat="deploy"):
+            caps = probe_device(self._run, self.templates)
+        if caps is None:
+            return None
+        if caps.select_script(MFL_SCRIPT_VERSION):
+            self._use_script(caps.script_dir, caps.script_via_sh)
+        if caps.ipc_sender is None:
+            self.log("[Device] ⚠️ IpcSender is not on the device PATH; signal writes will fail")
+        self.capabilities = caps
+        return caps
+
+    def _script_current(self, caps):
+        """True if the probe found the current mfl_total.sh (probing the stdin batch verb once)."""
+        if caps is None or caps.script_version != MFL_SCRIPT_VERSION:
+            return False
+        if caps.stdin_batch is None:
+            caps.stdin_batch = self.stdin_batch = self._probe_stdin_batch()
+        return True
+
+    def ensure_script(self, log=None):
+        """Deploy mfl_total.sh unless the device already has the current version; True if it is usable."""
+        with self._deploy_lock:
+            caps = self.probe_capabilities()
+            if self._script_current(caps):
+                if log:
+                    log(f"[Deploy] mfl_total.sh is up to date at {self.templates.script_path}; upload skipped")
+                REGISTRY.inc("deploy_total", result="skipped")
+                return True
+            if caps is None and self.script_version() == MFL_SCRIPT_VERSION:
+                return True
+            # A device reboot empties /tmp; always push the generated script
+            return self.deploy(self.write_script(), log).ok
+
+    def wait_until_ready(self, timeout=None, poll=READY_POLL_SECONDS, cancel=None):
+        """Poll the quiet status checks until the shell works; False on timeout or when cancel is set."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.status().ready:
+                return True
+            remaining = poll if deadline is None else min(poll, deadline - time.monotonic())
+            if remaining <= 0:
+                return False
+            if cancel is not None:
+                if cancel.wait(remaining):
+                    return False
+            else:
+                time.sleep(remaining)
+
+    def recover(self, timeout=None, cancel=None, log=None):
+        """Wait for the device after a drop and redeploy the script if it lost it.
+
+        Returns (ready, redeployed).
+        """
+        if not self.wait_until_ready(timeout, cancel=cancel):
+            return False, False
+        if self._script_current(self.probe_capabilities(refresh=True)):
+            return True, False
+        # The device rebooted (empty /tmp) or runs an older script
+        if log:
+            log("[RECOVER] Redeploying mfl_total.sh")
+        return self.ensure_script(log), True
+
+    # ----- device operations (queued) -----
+
+    def _throttle(self, names):
+        """Wait until the rate limits admit one write to each DPID in names."""
+        if self.limiter is None:
+            return
+        started = time.perf_counter()
+        if self.limiter.acquire(self.device_id, names) and TRACER.enabled:
+            TRACER.complete("rate limit", started, time.perf_counter(), "queue", writes=len(names))
+
+    def screencap(self, png=False):
+        """One screenshot read as bytes straight from `adb exec-out screencap` (no temp files).
+
+        Returns the raw frame (header + RGBA pixels, see fpk_screen), or a
+        PNG with png=True. Raises RuntimeError if the device is known
+        offline or the capture failed.
+        """
+        reason = self.known_offline()
+        if reason is not None:
+            REGISTRY.inc("fail_fast_total", kind="screencap")
+            raise RuntimeError(f"{reason} (not captured)")
+        argv = self.templates.screencap + (("-p",) if png else ())
+        process = self._call("screencap", argv, SCREENCAP_TIMEOUT, binary=True)
+        if process.returncode != 0 or not process.stdout:
+            raise RuntimeError(process.stderr.strip() or f"screencap failed (code {process.returncode})")
+        return process.stdout
+
+    def known_offline(self):
+        """Why the device cannot be reached right now (None = not known to be offline).
+
+        Uses the adb server's live device list when it is tracked, else a
+        failed device/shell check younger than FAIL_FAST_SECONDS.
+        """
+        if self.server is not None:
+            try:
+                state = self.server.device_state(self.device_id)
+            except LookupError:
+                state = "device"  # Not tracking: fall back to the checks
+            if state != "device":
+                return f"Device {self.device_id} is {state or 'not connected'}"
+        now = time.time()
+        for check in ("device", "shell"):
+            entry = self.status_cache.get(check)
+            if entry is not None and not entry[0] and now - entry[2] < FAIL_FAST_SECONDS:
+                return entry[1]
+        return None
+
+    def _unavailable(self, kind, name, value):
+        """Failed result without a device round trip (device known offline, no IpcSender), else None."""
+        reason = self.known_offline()
+        if reason is not None:
+            REGISTRY.inc("fail_fast_total", kind=kind)
+            return OperationResult(kind, name, value, error=f"{reason} (not sent)", error_class="offline")
+        caps = self.capabilities
+        if kind == "signal" and caps is not None and caps.ipc_sender is None:
+            return OperationResult(kind, name, value, 127, "", "",
+                                   error="IpcSender is not installed on the device", error_class="failed")
+        return None
+
+    def _signal_now(self, signal_name, signal_value):
+        """Send one DPID value right now (runs on the queue worker)."""
+        result = self._unavailable("signal", signal_name, signal_value)
+        if result is not None:
+            self._record(result)
+            return result
+        self._throttle([signal_name])
+        started = time.perf_counter()
+        try:
+            # adb shell IpcSender --dpid <name> 0 <value>
+            # NOTE: Do not use host-side redirection like `> /dev/null` on Windows.
+            process = self._call("signal", self.templates.signal(signal_name, signal_value), SIGNAL_TIMEOUT)
+            result = OperationResult.from_process("signal", signal_name, signal_value, process)
+        except Exception as e:
+            result = OperationResult.from_exception("signal", signal_name, signal_value, e, time.perf_counter() - started)
+        self._record(result)
+        return result
+
+    def _probe_stdin_batch(self):
+        """True if `mfl_total.sh batch` sees EOF on stdin (adb forwards stdin on this host/device)."""
+        try:
+            process = self._call("shell", self.templates.mfl_batch, 5, input_text="")
+        except Exception:
+            return False
+        # An older script without the verb answers "Unknown Command."
+        return process.returncode == 0 and not process.stdout.strip()
+
+    def execute_many(self, pairs):
+        """Send several DPID values now, one adb shell invocation per chunk.
+
+        With the deployed script's batch verb the writes are streamed on stdin
+        to one device shell; otherwise they are joined into one command line.
+        Bypasses the command queue, so several threads can drive the device in
+        parallel (stress runs); everything else should use send_many.
+        """
+        if pairs and self._unavailable("signal", *pairs[0]) is not None:
+            results = [self._unavailable("signal", name, value) for name, value in pairs]
+            for result in results:
+                self._record(result)
+            return results
+        results = []
+        chunk_size = STDIN_BATCH_CHUNK_SIZE if self.stdin_batch else BATCH_CHUNK_SIZE
+        if self.limiter is not None:
+            # No invocation carries more writes than a bucket can admit at once
+            runs = self.limiter.split([name for name, _ in pairs], chunk_size)
+        else:
+            runs = [(offset, offset + chunk_size) for offset in range(0, len(pairs), chunk_size)]
+        for start, end in runs:
+            chunk = pairs[start:end]
+            self._throttle([name for name, _ in chunk])
+            results.extend(self._batch_chunk(chunk))
+        for result in results:
+            self._record(result)
+        return results
+
+    def _batch_chunk(self, pairs):
+        started = time.perf_counter()
+        try:
+            if self.stdin_batch:
+                # mfl_total.sh batch: one "<DPID> <VALUE>" line per write
+                argv = self.templates.mfl_batch
+                lines = "".join(f"{name} {value}\n" for name, value in pairs)
+            else:
+                # One shell command line: every IpcSender call is followed by a marker with its exit code
+                script = "; ".join(
+                    f'IpcSender --dpid {name} 0 {value} 2>&1; echo "{BATCH_RC_MARKER} $?"'
+                    for name, value in pairs
+                )
+                argv, lines = self.templates.shell + (script,), None
+            process = self._call_many("signal", "batch_write", argv, len(pairs), SIGNAL_TIMEOUT,
+                                      BATCH_SECONDS_PER_WRITE, input_text=lines)
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            return [OperationResult.from_exception("signal", name, value, e, elapsed) for name, value in pairs]
+
+        per_step = process.elapsed / max(1, len(pairs))
+        results = []
+        output_lines = []
+        for line in process.stdout.splitlines():
+            if line.startswith(BATCH_RC_MARKER) and len(results) < len(pairs):
+                name, value = pairs[len(results)]
+                try:
+                    returncode = int(line[len(BATCH_RC_MARKER):].strip())
+                except ValueError:
+                    returncode = -1
+                stdout = "\n".join(output_lines)
+                results.append(OperationResult(
+                    "signal", name, value, returncode, stdout, "",
+                    error_class=classify_failure(stdout, "", returncode), elapsed=per_step))
+                output_lines = []
+            else:
+                output_lines.append(line)
+
+        # Steps without a marker never ran (shell died, device dropped, ...)
+        for name, value in pairs[len(results):]:
+            returncode = process.returncode if process.returncode != 0 else -1
+            results.append(OperationResult(
+                "signal", name, value, returncode, "\n".join(output_lines), process.stderr,
+                error=NO_RESULT_ERROR,
+                error_class=classify_failure("", process.stderr, returncode), elapsed=per_step))
+        return results
+
+    def _press_now(self, button_name, count):
+        result = self._unavailable("button", button_name, count)
+        if result is not None:
+            self._record(result)
+            return result
+        started = time.perf_counter()
+        _, press_dpid, release_dpid = MFL_BUTTON_TABLE[button_name]
+        # One press is four IPC writes: press 1/0, release 1/0
+        writes = [press_dpid, press_dpid, release_dpid, release_dpid]
+        per_call = (self.limiter.max_repeats(writes) if self.limiter is not None else None) or count
+        done = 0
+        while True:
+            presses = min(per_call, count - done)
+            self._throttle(writes * presses)
+            try:
+                # adb shell <script dir>/mfl_total.sh [button_name] [count]
+                process = self._call_many("button", "press", self.templates.mfl_button(button_name, presses),
+                                          presses, BUTTON_TIMEOUT, 0.0)
+                result = OperationResult.from_process("button", button_name, presses, process)
+            except Exception as e:
+                result = OperationResult.from_exception("button", button_name, presses, e,
+                                                        time.perf_counter() - started)
+            done += presses
+            if not result.ok or done >= count:
+                break
+        # Report the presses that ran as one operation
+        result.value = done
+        result.elapsed = time.perf_counter() - started
+        self._record(result)
+        return result
+
+    def _record(self, result):
+        """Count a finished operation and append it to the ledger."""
+        outcome = "ok" if result.ok else result.error_class
+        if result.kind == "button":
+            REGISTRY.inc("buttons_total", result.value, button=result.name, result=outcome)
+        else:
+            REGISTRY.inc("signals_total", result=outcome)
+        self.ledger.record(result)
+        for listener in list(self.result_listeners):
+            try:
+                listener(result)
+            except Exception:
+                pass
+
+    def timeline_since(self, since=None):
+        """Ledger events recorded at or after since (epoch seconds) as dicts."""
+        entries = []
+        for t, name, value, result, latency_ms in self.ledger.events(since):
+            button = name.startswith(BUTTON_PREFIX)
+            entries.append({
+                "t": round(t, 3),
+                "kind": "button" if button else "signal",
+                "name": name[len(BUTTON_PREFIX):] if button else name,
+                "value": value,
+                "result": result,
+                "elapsed_ms": round(latency_ms, 1),
+            })
+        return entries
+
+    # ----- offline holding -----
+
+    def _set_online(self, online):
+        """Track the connection from status(): start holding when it drops, flush when it is back."""
+        if not self.hold_offline:
+            self.online = True
+            return
+        if not online:
+            self.online = False
+        elif not self.online:
+            self.flush_offline()
+
+    def flush_offline(self):
+        """Send the held commands in order as one queue entry; returns the entry (None if nothing was held)."""
+        with self._offline_lock:
+            held = self.offline.take()
+            entry = None
+            if held:
+                self.log(f"[Offline] Sending {len(held)} held command(s)")
+                entry = self.queue.submit(lambda count: self._send_held(held), label=f"offline[{len(held)}]")
+            # Set under the lock so nothing new is held behind the flush
+            self.online = True
+        return entry
+
+    def _send_held(self, held):
+        """Run on the queue worker: consecutive writes go out as one batch, presses in between."""
+        current = [command for command in held if command.device_id == self.device_id]
+        for command in held:
+            if command.device_id != self.device_id:
+                self._drop_held(command, "device_changed")
+        # The device may have rebooted while it was away
+        self.ensure_script()
+        index = 0
+        while index < len(current):
+            command = current[index]
+            if command.kind == "button":
+                self._finish_held(command, self._press_now(command.name, command.value))
+                index += 1
+                continue
+            end = index
+            while end < len(current) and current[end].kind == "signal":
+                end += 1
+            group = current[index:end]
+            results = self.execute_many([(command.name, command.value) for command in group])
+            for command, result in zip(group, results):
+                self._finish_held(command, result)
+            index = end
+        return len(current)
+
+    @staticmethod
+    def _finish_held(command, result):
+        REGISTRY.inc("offline_commands_total", outcome="flushed")
+        for entry in command.entries:
+            entry.started_at = entry.started_at or time.perf_counter()
+            entry.finish(result)
+
+    def _drop_held(self, command, reason):
+        if reason == "expired":
+            message = f"Held for more than {self.offline.max_age:g}s while the device was offline"
+        elif reason == "overflow":
+            message = f"Offline queue full ({self.offline.max_size} commands)"
+        elif reason == "device_changed":
+            message = f"Device changed while offline (held for {command.device_id})"
+        else:
+            message = "Discarded from the offline queue"
+        result = OperationResult(command.kind, command.name, command.value, error=message, error_class="offline")
+        for entry in command.entries:
+            entry.finish(result)
+
+    def _hold(self):
+        """True if new single writes/presses should be held instead of queued (call under _offline_lock)."""
+        return self.hold_offline and not self.online
+
+    # ----- queue submission -----
+
+    def submit_signal(self, signal_name, signal_value, on_done=None, trace_id=None):
+        """Queue one DPID write; returns the queue entry (entry.result is an OperationResult)."""
+        validate_signal(signal_name, signal_value)
+        with self._offline_lock:
+            if self._hold():
+                return self.offline.hold_signal(self.device_id, str(signal_name), str(signal_value),
+                                                _result_callback(on_done), trace_id)
+            return self.queue.submit(lambda count: self._signal_now(signal_name, signal_value),
+                                     _result_callback(on_done), label=signal_name, trace_id=trace_id)
+
+    def submit_many(self, pairs, on_done=None, trace_id=None):
+        """Queue a batch of DPID writes; entry.result is a list of OperationResult."""
+        pairs = [(str(name), str(value)) for name, value in pairs]
+        for name, value in pairs:
+            validate_signal(name, value)
+        return self.queue.submit(lambda count: self.execute_many(pairs),
+                                 _result_callback(on_done), label=f"batch[{len(pairs)}]", trace_id=trace_id)
+
+    def submit_press(self, button_name, count=1, on_done=None, trace_id=None):
+        """Queue an MFL button press (merged with an identical pending press)."""
+        if button_name not in MFL_BUTTONS:
+            raise ValueError(f"Unknown button: {button_name} (valid: {', '.join(MFL_BUTTONS)})")
+        with self._offline_lock:
+            if self._hold():
+                return self.offline.hold_press(self.device_id, button_name, count, _result_callback(on_done),
+                                               trace_id)
+            return self.queue.submit(lambda merged_count: self._press_now(button_name, merged_count),
+                                     _result_callback(on_done), coalesce_key=("mfl", button_name),
+                                     count=count, label=button_name, trace_id=trace_id)
+
+    def send_signal(self, signal_name, signal_value):
+        """Send one DPID value and wait for the result."""
+        return _wait_result(self.submit_signal(signal_name, signal_value))
+
+    def send_many(self, pairs):
+        """Send several DPID values (batched into few adb processes) and wait for all results."""
+        return _wait_result(self.submit_many(pairs))
+
+    def press(self, button_name, count=1):
+        """Press an MFL button count times and wait for the result."""
+        return _wait_result(self.submit_press(button_name, count))
+
+    # ----- presets -----
+
+    def _send_batch(self, batch):
+        """Send (DPID, value) pairs through the queue and wait; returns one result per pair."""
+        with TRACER.span("preset batch", cat="preset", steps=len(batch)):
+            entry = self.submit_many(batch)
+            entry.wait()
+        if entry.error is None:
+            return entry.result
+        return [OperationResult.from_exception("signal", signal_name, signal_value, entry.error)
+                for signal_name, signal_value in batch]
+
+    def start_preset(self, preset, on_result=None, on_wait=None, resume=True, reapply=True,
+                     resume_timeout=PRESET_RESUME_TIMEOUT, on_state=None):
+        """Run a preset (name from PRESETS, or a step list) in a background thread.
+
+        Consecutive signal steps are sent as one batch through the queue;
+        WAIT steps sleep in the preset thread without holding the queue.
+        on_result(OperationResult) is called per step, on_wait(ms) per WAIT.
+
+        With resume, a step that fails because the device went away
+        suspends the run instead of failing every remaining step: it waits
+        up to resume_timeout for the device (redeploying the script if
+        needed), re-sends the last value of every DPID written before the
+        checkpoint when reapply is set, and continues from the checkpoint.
+        on_state(run) is called when the run is suspended, resumed or
+        abandoned.
+        """
+        if isinstance(preset, str):
+            if preset not in PRESETS:
+                raise ValueError(f"Unknown preset: {preset} (valid: {', '.join(PRESETS)})")
+            name, steps = preset, PRESETS[preset][1]
+        else:
+            name, steps = "custom", list(preset)
+        run = PresetRun(name, len(steps))
+        applied = {}  # DPID -> last confirmed value, in write order (the state prefix)
+
+        def set_state(state):
+            run.state = state
+            if on_state:
+                on_state(run)
+
+        def report(result):
+            run.steps_sent += 1
+            run.results.append(result)
+            if not result.ok:
+                run.failures += 1
+            if on_result:
+                on_result(result)
+
+        def flush(batch):
+            """Send indexed steps; returns the connection failure that stopped the batch, or None."""
+            if not batch:
+                return None
+            results = self._send_batch([(signal_name, signal_value) for _, signal_name, signal_value in batch])
+            for (index, signal_name, signal_value), result in zip(batch, results):
+                if resume and is_connection_failure(result):
+                    return result
+                report(result)
+                if result.ok:
+                    applied.pop(signal_name, None)
+                    applied[signal_name] = signal_value
+                run.checkpoint = index + 1
+            return None
+
+        def suspend(failure):
+            """Wait for the device and restore the state prefix; False if the run has to stop."""
+            run.suspensions += 1
+            REGISTRY.inc("preset_suspensions_total", preset=name)
+            set_state("suspended")
+            paused_at = time.monotonic()
+            while not run.cancelled:
+                ready, redeployed = self.recover(resume_timeout, cancel=run._cancel)
+                run.redeploys += int(redeployed)
+                if not ready:
+                    break
+                if not (reapply and applied):
+                    run.downtime += time.monotonic() - paused_at
+                    set_state("running")
+                    return True
+                prefix = list(applied.items())
+                results = self._send_batch(prefix)
+                run.reapplied += len(prefix)
+                if not any(is_connection_failure(result) for result in results):
+                    run.downtime += time.monotonic() - paused_at
+                    set_state("running")
+                    return True
+            run.downtime += time.monotonic() - paused_at
+            if not run.cancelled:
+                # The step that hit the drop is the only one reported as failed
+                report(failure)
+                set_state("abandoned")
+            return False
+
+        def send_steps():
+            batch = []
+            index = 0
+            while not run.cancelled:
+                if index < len(steps) and steps[index][0] != "WAIT":
+                    batch.append((index,) + tuple(steps[index]))
+                    index += 1
+                    continue
+
+                failure = flush(batch)
+                batch = []
+                if failure is not None:
+                    if not suspend(failure):
+                        return
+                    index = run.checkpoint
+                    continue
+                if index == len(steps):
+                    return
+                try:
+                    wait_ms = int(str(steps[index][1]).strip())
+                except Exception:
+                    wait_ms = 0
+                if on_wait:
+                    on_wait(wait_ms)
+                if wait_ms > 0:
+                    with TRACER.span(f"WAIT {wait_ms}ms", cat="preset"):
+                        run._cancel.wait(wait_ms / 1000.0)
+                index += 1
+                run.checkpoint = index
+
+        def execute_thread():
+            try:
+                with TRACER.span(f"preset {name}", cat="preset"):
+                    send_steps()
+            finally:
+                REGISTRY.inc("presets_total", preset=name, result="ok" if run.failures == 0 else "failed")
+                run.finish()
+
+        thread = threading.Thread(target=execute_thread, name=f"preset-{name}")
+        thread.daemon = True
+        thread.start()
+        return run
+
+    def run_preset(self, preset, on_result=None, on_wait=None, **options):
+        """Run a preset and wait until it has finished; returns its PresetRun (options as start_preset)."""
+        run = self.start_preset(preset, on_result, on_wait, **options)
+        run.wait()
+        return run
+
+
+def _result_callback(on_done):
+    """Adapt on_done(result) to the queue's on_done(entry, result, error)."""
+    if on_done is None:
+        return None
+    return lambda entry, result, error: on_done(result)
+
+
+def _wait_result(entry):
+    entry.wait()
+    if entry.error is not None:
+        raise entry.error
+    return entry.result
@@ -0,0 +1,316 @@
+"""
+Fuzzing mode - seeded random DPID values sent through the batched path until the device fails
+
+    python fpk_fuzz.py --seed 42 --duration 28800 \\
+        --signal DP_ID_B_ACC_STATUSICON=0:15 --signal DP_ID_HMI_ZPM_ANZEIGEID=0,42490:42499
+    python fpk_fuzz.py --replay fuzz_42_1.json
+
+Each --signal gives a DPID and its values: single numbers and lo:hi ranges.
+The same seed and signal list always produce the same value sequence. Writes
+go out in batches (FpkClient.execute_many); a batch fails when a write times
+out, is rejected (parse error), the device drops, or the shell dies before
+answering every write.
+
+After a failure the device is given time to come back, then the steps sent
+before it are replayed in shrinking subsets (delta debugging) until the
+smallest sequence that still fails the same way is found. It is written to a
+reproducer file that --replay sends again.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from fpk_client import DEFAULT_DEVICE_ID, NO_RESULT_ERROR, FpkClient, validate_signal
+from fpk_metrics import REGISTRY
+
+# Writes per adb invocation
+DEFAULT_BATCH_SIZE = 20
+
+# Share of values taken from the range edges (lo, lo+1, hi-1, hi, 0)
+EDGE_PROBABILITY = 0.2
+
+# Steps before a failure that are candidates for the reproducer
+HISTORY_STEPS = 2000
+
+# Replays spent on minimizing one failure
+MAX_MINIMIZE_TRIALS = 64
+
+# Seconds to wait for the device to come back after a failure
+RECOVERY_TIMEOUT = 120.0
+
+
+def parse_range_spec(spec):
+    """"DPID=1,5,10:20" -> (DPID, [(1, 1), (5, 5), (10, 20)])."""
+    name, sep, values = spec.partition("=")
+    name = name.strip()
+    if not sep or not values.strip():
+        raise ValueError(f"Expected DPID=values, got {spec!r}")
+    ranges = []
+    for part in values.split(","):
+        low, _, high = part.strip().partition(":")
+        high = high or low
+        validate_signal(name, low)
+        validate_signal(name, high)
+        low, high = int(low), int(high)
+        ranges.append((min(low, high), max(low, high)))
+    return name, ranges
+
+
+def fuzz_steps(signals, seed):
+    """Endless, reproducible (DPID, value) sequence for the signal ranges."""
+    rng = random.Random(seed)
+    while True:
+        name, ranges = signals[rng.randrange(len(signals))]
+        low, high = ranges[rng.randrange(len(ranges))]
+        if rng.random() < EDGE_PROBABILITY:
+            edges = [value for value in (low, low + 1, high - 1, high, 0) if low <= value <= high]
+            value = edges[rng.randrange(len(edges))]
+        else:
+            value = rng.randint(low, high)
+        yield name, str(value)
+
+
+def batch_failure(results):
+    """(index, error_class, detail) of the first failed write in a batch, or None."""
+    for index, result in enumerate(results):
+        if result.ok:
+            continue
+        if result.error == NO_RESULT_ERROR and result.error_class == "failed":
+            return index, "shell_died", result.stderr.strip() or result.error
+        return index, result.error_class, (result.error or result.stderr or result.stdout).strip()
+    return None
+
+
+def send_steps(client, steps, batch_size=DEFAULT_BATCH_SIZE):
+    """Send steps in batches until one fails; returns (error_class, detail) of the failure or None."""
+    for offset in range(0, len(steps), batch_size):
+        failure = batch_failure(client.execute_many(steps[offset:offset + batch_size]))
+        if failure is not None:
+            return failure[1:]
+    return None
+
+
+def minimize(steps, reproduces, max_trials=MAX_MINIMIZE_TRIALS):
+    """Smallest subsequence of steps for which reproduces(steps) stays True (ddmin).
+
+    Returns (steps, trials). Stops early when the trial budget is used up.
+    """
+    trials = 0
+    granularity = 2
+    while len(steps) >= 2 and trials < max_trials:
+        size = -(-len(steps) // granularity)
+        chunks = [steps[offset:offset + size] for offset in range(0, len(steps), size)]
+        reduced = False
+        # Complements first: they keep the last (failing) step in most candidates
+        for index in range(len(chunks)):
+            candidate = [step for other, chunk in enumerate(chunks) if other != index for step in chunk]
+            if not candidate or trials >= max_trials:
+                continue
+            trials += 1
+            if reproduces(candidate):
+                steps = candidate
+                granularity = max(granularity - 1, 2)
+                reduced = True
+                break
+        if reduced:
+            continue
+        for chunk in chunks:
+            if trials >= max_trials or len(chunk) == len(steps):
+                continue
+            trials += 1
+            if reproduces(chunk):
+                steps = chunk
+                granularity = 2
+                reduced = True
+                break
+        if reduced:
+            continue
+        if granularity >= len(steps):
+            break
+        granularity = min(len(steps), granularity * 2)
+    return steps, trials
+
+
+class FuzzRun:
+    """One fuzzing session: generate, send, detect failures, minimize, write reproducers."""
+
+    def __init__(self, client, signals, seed, batch_size=DEFAULT_BATCH_SIZE, duration=None, max_steps=None,
+                 max_failures=1, out_dir=".", log=None):
+        if not signals:
+            raise ValueError("At least one --signal is required")
+        self.client = client
+        self.signals = signals
+        self.seed = seed
+        self.batch_size = max(1, int(batch_size))
+        self.duration = duration
+        self.max_steps = max_steps
+        self.max_failures = max(1, int(max_failures))
+        self.out_dir = out_dir
+        self.log = log or (lambda message: None)
+        self.sent = 0
+        self.batches = 0
+        self.failures = []  # reproducer dicts
+        self.started_at = None
+        self.finished_at = None
+
+    def wait_until_healthy(self, timeout=RECOVERY_TIMEOUT):
+        return self.client.wait_until_ready(timeout)
+
+    def reproduces(self, steps, error_class):
+        """Replay steps on a healthy device; True if they fail with error_class again."""
+        if not self.wait_until_healthy():
+            raise RuntimeError("Device did not recover for a minimization replay")
+        failure = send_steps(self.client, steps, self.batch_size)
+        return failure is not None and failure[0] == error_class
+
+    def run(self):
+        """Fuzz until the duration/step limit or max_failures; returns the report dict."""
+        self.started_at = time.time()
+        deadline = time.monotonic() + self.duration if self.duration else None
+        steps = fuzz_steps(self.signals, self.seed)
+        history = []
+        while len(self.failures) < self.max_failures:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if self.max_steps is not None and self.sent >= self.max_steps:
+                break
+            count = self.batch_size
+            if self.max_steps is not None:
+                count = min(count, self.max_steps - self.sent)
+            batch = [next(steps) for _ in range(count)]
+            results = self.client.execute_many(batch)
+            self.batches += 1
+            failure = batch_failure(results)
+            sent_steps = batch if failure is None else batch[:failure[0] + 1]
+            self.sent += len(sent_steps)
+            history.extend(sent_steps)
+            del history[:-HISTORY_STEPS]
+            if failure is None:
+                if self.batches % 50 == 0:
+                    self.log(f"[FUZZ] {self.sent} writes, {len(self.failures)} failures")
+                continue
+
+            _, error_class, detail = failure
+            REGISTRY.inc("fuzz_failures_total", error_class=error_class)
+            self.log(f"[FUZZ] Failure after {self.sent} writes: {error_class} ({detail[:120]})")
+            self.failures.append(self._reproducer(history, error_class, detail))
+            history = []
+            if len(self.failures) < self.max_failures and not self.wait_until_healthy():
+                self.log("[FUZZ] Device did not come back; stopping")
+                break
+        self.finished_at = time.time()
+        return self.report()
+
+    def _reproducer(self, history, error_class, detail):
+        """Minimize the failing history and write the reproducer file."""
+        failing_index = self.sent - 1
+        if error_class == "parse_error":
+            # A rejected DPID/value fails on its own
+            candidate, trials = [history[-1]], 0
+        else:
+            try:
+                candidate, trials = minimize(list(history), lambda steps: self.reproduces(steps, error_class))
+            except RuntimeError as e:
+                self.log(f"[FUZZ] Minimization stopped: {e}")
+                candidate, trials = list(history), 0
+        reproducer = {
+            "seed": self.seed,
+            "signals": [{"dpid": name, "ranges": [list(r) for r in ranges]} for name, ranges in self.signals],
+            "device_id": self.client.device_id,
+            "failure": {"error_class": error_class, "detail": detail, "step_index": failing_index},
+            "history_steps": len(history),
+            "minimize_trials": trials,
+            "steps": [[name, value] for name, value in candidate],
+        }
+        path = os.path.join(self.out_dir, f"fuzz_{self.seed}_{len(self.failures) + 1}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(reproducer, f, indent=1)
+        reproducer["path"] = path
+        self.log(f"[FUZZ] Reproducer: {len(candidate)} of {len(history)} steps -> {os.path.abspath(path)}")
+        return reproducer
+
+    def report(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "seed": self.seed,
+            "device_id": self.client.device_id,
+            "elapsed": round(elapsed, 3),
+            "sent": self.sent,
+            "batches": self.batches,
+            "rate": round(self.sent / elapsed, 2) if elapsed > 0 else 0.0,
+            "failures": [{"error_class": failure["failure"]["error_class"], "steps": len(failure["steps"]),
+                          "path": failure["path"]} for failure in self.failures],
+        }
+
+
+def replay(client, path, batch_size=DEFAULT_BATCH_SIZE):
+    """Send a reproducer's steps; returns (reproduced, failure or None)."""
+    with open(path, "r", encoding="utf-8") as f:
+        reproducer = json.load(f)
+    failure = send_steps(client, [(name, value) for name, value in reproducer["steps"]], batch_size)
+    expected = reproducer["failure"]["error_class"]
+    return failure is not None and failure[0] == expected, failure
+
+
+REGISTRY.describe("fuzz_failures_total", "counter", "Device failures found by the fuzzer")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="FPK seeded DPID fuzzer")
+    parser.add_argument("--signal", action="append", default=[], metavar="DPID=LO:HI,V",
+                        help="DPID with values and lo:hi ranges to draw from (repeatable)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed (default: time-based, printed)")
+    parser.add_argument("--duration", type=float, default=None, help="Run time in seconds")
+    parser.add_argument("--steps", type=int, default=None, help="Stop after this many writes")
+    parser.add_argument("--max-failures", type=int, default=1, help="Stop after this many failures")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Writes per adb invocation")
+    parser.add_argument("--replay", default="", help="Send the steps of a reproducer file and check the failure")
+    parser.add_argument("--device-id", default=DEFAULT_DEVICE_ID, help="adb serial of the target")
+    parser.add_argument("--adb-folder", default="", help="Folder containing adb1.exe (default: adb on PATH)")
+    parser.add_argument("--out-dir", default=".", help="Directory for reproducer files")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    client = FpkClient(device_id=args.device_id, adb_folder=args.adb_folder)
+
+    if args.replay:
+        reproduced, failure = replay(client, args.replay, args.batch_size)
+        client.close()
+        print(f"[FUZZ] {'Reproduced' if reproduced else 'Not reproduced'}: {failure or 'no failure'}")
+        return 1 if reproduced else 0
+
+    try:
+        signals = [parse_range_spec(spec) for spec in args.signal]
+        if not signals:
+            raise ValueError("At least one --signal is required")
+    except ValueError as e:
+        print(f"[FUZZ] {e}", file=sys.stderr)
+        return 2
+    if args.duration is None and args.steps is None:
+        print("[FUZZ] Give --duration and/or --steps", file=sys.stderr)
+        return 2
+
+    seed = args.seed if args.seed is not None else int(time.time())
+    print(f"[FUZZ] Seed {seed}")
+    status = client.status()
+    if not status.ready:
+        print(f"[FUZZ] Warning: device not ready ({status.to_dict()})", file=sys.stderr)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    run = FuzzRun(client, signals, seed, args.batch_size, args.duration, args.steps, args.max_failures,
+                  args.out_dir, log=print)
+    report = run.run()
+    client.close()
+    print(f"[FUZZ] {report['sent']} writes in {report['elapsed']:g}s ({report['rate']:g}/s), "
+          f"{len(report['failures'])} failures")
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+Signal ledger - columnar, array-backed record of every device write for long soak runs
+
+Each event is five fixed-width columns in array.array chunks: time (ms since
+the ledger started), interned DPID index, value, result code and latency,
+about 21 bytes per event instead of a Python object. Chunks hold CHUNK_SIZE
+events; when max_events is reached the oldest chunk is dropped, so memory
+stays bounded however long the run is.
+
+Every chunk also keeps per-DPID totals and error counts, so counts and error
+rates over a time window only scan the (at most two) chunks that are cut by
+the window edges.
+
+    ledger = SignalLedger()
+    ledger.record(result)                       # OperationResult
+    ledger.summary(since=time.time() - 600)     # per-DPID count/errors/p50/p99
+"""
+
+import array
+import bisect
+import collections
+import csv
+import threading
+import time
+
+from fpk_metrics import quantile
+
+# Events per chunk (about 1.3 MB of columns)
+CHUNK_SIZE = 65536
+
+# Events kept before the oldest chunk is dropped (about 88 MB)
+MAX_EVENTS = 64 * CHUNK_SIZE
+
+# Result codes; index 0 is success. Unknown error classes map to "error".
+RESULT_CODES = ("ok", "timeout", "parse_error", "no_device", "unauthorized", "offline", "failed", "error",
+                "shell_died")
+_RESULT_INDEX = {name: index for index, name in enumerate(RESULT_CODES)}
+
+# Interned names of MFL button presses (value = press count)
+BUTTON_PREFIX = "mfl:"
+
+LATENCY_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class _Chunk:
+    __slots__ = ("t_ms", "dpid", "value", "result", "latency_ms", "totals", "errors")
+
+    def __init__(self):
+        self.t_ms = array.array("I")  # ms since the ledger epoch
+        self.dpid = array.array("I")  # index into SignalLedger.names
+        self.value = array.array("q")
+        self.result = array.array("B")  # index into RESULT_CODES
+        self.latency_ms = array.array("f")
+        self.totals = collections.Counter()  # dpid index -> events
+        self.errors = collections.Counter()  # dpid index -> failed events
+
+    def __len__(self):
+        return len(self.t_ms)
+
+    def span(self, since_ms, until_ms):
+        """Index range of the events inside [since_ms, until_ms)."""
+        start = 0 if since_ms is None else bisect.bisect_left(self.t_ms, since_ms)
+        stop = len(self.t_ms) if until_ms is None else bisect.bisect_left(self.t_ms, until_ms)
+        return start, stop
+
+
+class SignalLedger:
+    """Thread-safe append-only event store with windowed queries.
+
+    Events are stored in completion order; times are expected to be (almost)
+    non-decreasing, which holds for one command queue.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, max_events=MAX_EVENTS):
+        self.chunk_size = chunk_size
+        self.max_chunks = max(1, max_events // chunk_size)
+        self.epoch = time.time()
+        self.names = []  # dpid index -> name
+        self._index = {}  # name -> dpid index
+        self._chunks = [_Chunk()]
+        self._lock = threading.Lock()
+        self.dropped = 0  # events discarded with old chunks
+
+    # ----- recording -----
+
+    def intern(self, name):
+        index = self._index.get(name)
+        if index is None:
+            with self._lock:
+                index = self._index.get(name)
+                if index is None:
+                    index = self._index[name] = len(self.names)
+                    self.names.append(name)
+        return index
+
+    def append(self, t, name, value, result, latency):
+        """Add one event: epoch seconds, DPID name, integer value, result code name, latency in seconds."""
+        dpid = self.intern(name)
+        code = _RESULT_INDEX.get(result, _RESULT_INDEX["error"])
+        t_ms = max(0, int((t - self.epoch) * 1000.0))
+        with self._lock:
+            chunk = self._chunks[-1]
+            if len(chunk) >= self.chunk_size:
+                chunk = _Chunk()
+                self._chunks.append(chunk)
+                if len(self._chunks) > self.max_chunks:
+                    self.dropped += len(self._chunks.pop(0))
+            if chunk.t_ms and t_ms < chunk.t_ms[-1]:
+                t_ms = chunk.t_ms[-1]  # keep the column sorted for bisect
+            chunk.t_ms.append(t_ms)
+            chunk.dpid.append(dpid)
+            chunk.value.append(value)
+            chunk.result.append(code)
+            chunk.latency_ms.append(latency * 1000.0)
+            chunk.totals[dpid] += 1
+            if code:
+                chunk.errors[dpid] += 1
+
+    def record(self, result):
+        """Append an OperationResult (signal write or button press)."""
+        name = BUTTON_PREFIX + result.name if result.kind == "button" else result.name
+        try:
+            value = int(result.value)
+        except (TypeError, ValueError):
+            value = 0
+        self.append(result.timestamp, name, value, "ok" if result.ok else result.error_class, result.elapsed)
+
+    # ----- queries -----
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(chunk) for chunk in self._chunks)
+
+    def memory_bytes(self):
+        """Bytes held by the column arrays."""
+        with self._lock:
+            return sum(column.buffer_info()[1] * column.itemsize
+                       for chunk in self._chunks
+                       for column in (chunk.t_ms, chunk.dpid, chunk.value, chunk.result, chunk.latency_ms))
+
+    def _window(self, since, until):
+        """[(chunk, start, stop, whole)] covering the window; whole = a full, sealed chunk."""
+        since_ms = None if since is None else int((since - self.epoch) * 1000.0)
+        until_ms = None if until is None else int((until - self.epoch) * 1000.0)
+        with self._lock:
+            chunks = list(self._chunks)
+            # The last chunk is still growing: fix its length now
+            sizes = [len(chunk) for chunk in chunks]
+        spans = []
+        last = len(chunks) - 1
+        for position, (chunk, size) in enumerate(zip(chunks, sizes)):
+            if not size:
+                continue
+            if since_ms is not None and chunk.t_ms[size - 1] < since_ms:
+                continue
+            if until_ms is not None and chunk.t_ms[0] >= until_ms:
+                break
+            start, stop = chunk.span(since_ms, until_ms)
+            stop = min(stop, size)
+            spans.append((chunk, start, stop, position != last and start == 0 and stop == size))
+        return spans
+
+    def counts(self, since=None, until=None):
+        """{name: (events, failed events)} in the window."""
+        totals = collections.Counter()
+        errors = collections.Counter()
+        for chunk, start, stop, whole in self._window(since, until):
+            if whole:
+                totals.update(chunk.totals)
+                errors.update(chunk.errors)
+                continue
+            dpids, results = chunk.dpid, chunk.result
+            for index in range(start, stop):
+                totals[dpids[index]] += 1
+                if results[index]:
+                    errors[dpids[index]] += 1
+        return {self.names[dpid]: (total, errors[dpid]) for dpid, total in totals.items()}
+
+    def error_rates(self, since=None, until=None):
+        """{name: failed / total} in the window."""
+        return {name: failed / total for name, (total, failed) in self.counts(since, until).items()}
+
+    def result_counts(self, since=None, until=None, name=None):
+        """{result code name: events} in the window (optionally for one DPID)."""
+        dpid = self._index.get(name) if name is not None else None
+        codes = collections.Counter()
+        for chunk, start, stop, _ in self._window(since, until):
+            if dpid is None:
+                codes.update(chunk.result[start:stop])
+            else:
+                dpids, results = chunk.dpid, chunk.result
+                codes.update(results[index] for index in range(start, stop) if dpids[index] == dpid)
+        return {RESULT_CODES[code]: count for code, count in codes.items()}
+
+    def latencies(self, since=None, until=None, name=None, ok_only=True):
+        """Sorted latencies (ms) in the window, optionally for one DPID."""
+        dpid = self._index.get(name) if name is not None else None
+        if name is not None and dpid is None:
+            return []
+        values = []
+        for chunk, start, stop, _ in self._window(since, until):
+            latency, dpids, results = chunk.latency_ms, chunk.dpid, chunk.result
+            if dpid is None and not ok_only:
+                values.extend(latency[start:stop])
+                continue
+            values.extend(latency[index] for index in range(start, stop)
+                          if (dpid is None or dpids[index] == dpid) and not (ok_only and results[index]))
+        values.sort()
+        return values
+
+    def latency_percentiles(self, since=None, until=None, name=None, quantiles=LATENCY_QUANTILES):
+        values = self.latencies(since, until, name)
+        if not values:
+            return {}
+        result = {f"p{int(q * 100)}": round(quantile(values, q), 3) for q in quantiles}
+        result["max"] = round(values[-1], 3)
+        return result
+
+    def summary(self, since=None, until=None):
+        """Per-DPID rows sorted by name: name, count, errors, error_rate, p50_ms, p99_ms (one scan)."""
+        per_dpid = collections.defaultdict(list)
+        totals = collections.Counter()
+        errors = collections.Counter()
+        for chunk, start, stop, _ in self._window(since, until):
+            latency, dpids, results = chunk.latency_ms, chunk.dpid, chunk.result
+            for index in range(start, stop):
+                dpid = dpids[index]
+                totals[dpid] += 1
+                if results[index]:
+                    errors[dpid] += 1
+                else:
+                    per_dpid[dpid].append(latency[index])
+        rows = []
+        for dpid, total in totals.items():
+            values = sorted(per_dpid.get(dpid, ()))
+            rows.append({
+                "name": self.names[dpid],
+                "count": total,
+                "errors": errors[dpid],
+                "error_rate": errors[dpid] / total,
+                "p50_ms": round(quantile(values, 0.5), 3) if values else None,
+                "p99_ms": round(quantile(values, 0.99), 3) if values else None,
+            })
+        rows.sort(key=lambda row: row["name"])
+        return rows
+
+    def events(self, since=None, until=None):
+        """Yield (t, name, value, result, latency_ms) tuples in the window, oldest first."""
+        names = self.names
+        for chunk, start, stop, _ in self._window(since, until):
+            for index in range(start, stop):
+                yield (self.epoch + chunk.t_ms[index] / 1000.0, names[chunk.dpid[index]], chunk.value[index],
+                       RESULT_CODES[chunk.result[index]], chunk.latency_ms[index])
+
+    def export_csv(self, path, since=None, until=None):
+        """Write the window as CSV (t, name, value, result, latency_ms); returns the row count."""
+        rows = 0
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("t", "name", "value", "result", "latency_ms"))
+            for t, name, value, result, latency_ms in self.events(since, until):
+                writer.writerow((f"{t:.3f}", name, value, result, f"{latency_ms:.3f}"))
+                rows += 1
+        return rows
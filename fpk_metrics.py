@@ -0,0 +1,214 @@
+"""
+Metrics - in-process counters/gauges/latency summaries and an optional Prometheus text endpoint
+"""
+
+import collections
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Samples kept per latency summary (quantiles are computed over this window)
+SUMMARY_WINDOW = 1024
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=None):
+    items = list(label_key)
+    if extra:
+        items.extend(extra)
+    if not items:
+        return ""
+    parts = []
+    for name, value in items:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def quantile(sorted_values, q):
+    """Nearest-rank quantile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class _Summary:
+    __slots__ = ("count", "total", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = collections.deque(maxlen=SUMMARY_WINDOW)
+
+
+class MetricsRegistry:
+    """Thread-safe metric store.
+
+    Recording is a dict update under a short lock, so it is safe to call from
+    the Tk loop and from command threads. Rendering copies the data and
+    formats it outside the lock.
+    """
+
+    def __init__(self, prefix="fpk_"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._counters = collections.defaultdict(float)
+        self._gauges = {}
+        self._summaries = {}
+        self._gauge_callbacks = {}
+        self.started_at = time.time()
+
+    def describe(self, name, metric_type, help_text):
+        """Register HELP/TYPE text for a metric."""
+        with self._lock:
+            self._types[name] = metric_type
+            self._help[name] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        """Increase a counter."""
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += amount
+
+    def set(self, name, value, **labels):
+        """Set a gauge."""
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        """Add a sample (seconds) to a latency summary."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = _Summary()
+            summary.count += 1
+            summary.total += value
+            summary.samples.append(value)
+
+    def gauge_callback(self, name, func, help_text=""):
+        """Register a gauge evaluated at scrape time (func() -> number)."""
+        with self._lock:
+            self._gauge_callbacks[name] = func
+            self._types[name] = "gauge"
+            if help_text:
+                self._help[name] = help_text
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def snapshot(self):
+        """Copy of all metric values: (counters, gauges, summaries)."""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            summaries = {
+                key: (summary.count, summary.total, list(summary.samples))
+                for key, summary in self._summaries.items()
+            }
+            callbacks = dict(self._gauge_callbacks)
+        for name, func in callbacks.items():
+            try:
+                gauges[(name, ())] = float(func())
+            except Exception:
+                pass
+        return counters, gauges, summaries
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        counters, gauges, summaries = self.snapshot()
+        gauges[("uptime_seconds", ())] = time.time() - self.started_at
+
+        by_name = collections.defaultdict(list)
+        for (name, label_key), value in counters.items():
+            by_name[name].append(("counter", label_key, value))
+        for (name, label_key), value in gauges.items():
+            by_name[name].append(("gauge", label_key, value))
+        for (name, label_key), value in summaries.items():
+            by_name[name].append(("summary", label_key, value))
+
+        with self._lock:
+            help_texts = dict(self._help)
+
+        lines = []
+        for name in sorted(by_name):
+            full_name = self.prefix + name
+            entries = by_name[name]
+            if name in help_texts:
+                lines.append(f"# HELP {full_name} {help_texts[name]}")
+            lines.append(f"# TYPE {full_name} {entries[0][0]}")
+            for metric_type, label_key, value in sorted(entries, key=lambda entry: entry[1]):
+                if metric_type != "summary":
+                    lines.append(f"{full_name}{_format_labels(label_key)} {value:g}")
+                    continue
+                count, total, samples = value
+                samples.sort()
+                for q in SUMMARY_QUANTILES:
+                    labels = _format_labels(label_key, [("quantile", q)])
+                    lines.append(f"{full_name}{labels} {quantile(samples, q):.6f}")
+                lines.append(f"{full_name}_sum{_format_labels(label_key)} {total:.6f}")
+                lines.append(f"{full_name}_count{_format_labels(label_key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry used by the GUI and the adb execution layer
+REGISTRY = MetricsRegistry()
+
+REGISTRY.describe("adb_spawns_total", "counter", "adb processes started, by subcommand")
+REGISTRY.describe("adb_command_seconds", "summary", "adb process wall time, by subcommand")
+REGISTRY.describe("signals_total", "counter", "DPID signal sends, by result")
+REGISTRY.describe("buttons_total", "counter", "MFL button presses, by button and result")
+REGISTRY.describe("presets_total", "counter", "Preset runs, by preset and result")
+REGISTRY.describe("preset_suspensions_total", "counter", "Preset runs suspended by a device drop, by preset")
+REGISTRY.describe("fail_fast_total", "counter", "Device operations failed without adb because the device is known offline")
+REGISTRY.describe("deploy_total", "counter", "mfl_total.sh deployments, by result (pushed/skipped/failed)")
+REGISTRY.describe("connection_ready", "gauge", "1 when ADB, device and shell checks all pass")
+REGISTRY.describe("disconnects_total", "counter", "Transitions from connected to disconnected")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep scrapes out of the console
+        pass
+
+
+class MetricsServer:
+    """Serves a registry at http://<host>:<port>/metrics from a daemon thread."""
+
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9464):
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-http", daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,398 @@
+"""
+Device resource monitor - CPU/memory load of the target sampled over one persistent adb shell
+
+    python fpk_monitor.py --interval 0.5 --process hmi_app --duration 120 --out load.json
+
+One `adb shell` stays open for the whole run; every sample is a single
+command line written to its stdin (`cat /proc/stat /proc/meminfo
+/proc/<pid>/stat ...; echo <marker>`), so sampling costs no process spawn
+on the host or on the device. If the shell dies (device dropped), it is
+reopened on the next tick.
+
+Samples are kept in a bounded series. export() writes them together with
+the client's timeline of sent signals/buttons, so load spikes can be lined
+up with the DPID writes that caused them.
+"""
+
+import argparse
+import collections
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+from adb_exec import open_adb_session
+from fpk_client import DEFAULT_DEVICE_ID, FpkClient
+from fpk_metrics import REGISTRY
+from process_manager import PROCESSES
+
+DEFAULT_INTERVAL = 1.0
+
+# Samples kept in memory (1 hour at the default interval)
+DEFAULT_MAX_SAMPLES = 3600
+
+# Seconds to wait for one sample's output before the shell is considered hung
+SAMPLE_TIMEOUT = 5.0
+
+# Seconds between attempts to reopen a dead shell
+REOPEN_BACKOFF = 2.0
+
+# /proc/<pid>/stat reports RSS in pages
+PAGE_SIZE_KB = 4
+
+SAMPLE_MARKER = "@@FPK_SAMPLE"
+PIDOF_MARKER = "@@FPK_PIDOF"
+
+
+def _cpu_times(line):
+    """ "cpu  user nice system idle iowait irq softirq steal ..." -> (busy, total) jiffies."""
+    values = [int(field) for field in line.split()[1:9]]
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    total = sum(values)
+    return total - idle, total
+
+
+def _process_times(line):
+    """/proc/<pid>/stat line -> (pid, utime + stime, rss pages), or None."""
+    head, sep, rest = line.rpartition(")")
+    if not sep or "(" not in head:
+        return None
+    try:
+        pid = int(head.split("(", 1)[0])
+        fields = rest.split()
+        return pid, int(fields[11]) + int(fields[12]), int(fields[21])
+    except (ValueError, IndexError):
+        return None
+
+
+class ResourceSample:
+    """One monitor sample. processes maps a process name to (cpu_percent, rss_kb)."""
+
+    __slots__ = ("t", "cpu_percent", "mem_used_kb", "mem_total_kb", "processes")
+
+    def __init__(self, t, cpu_percent, mem_used_kb, mem_total_kb, processes):
+        self.t = t
+        self.cpu_percent = cpu_percent
+        self.mem_used_kb = mem_used_kb
+        self.mem_total_kb = mem_total_kb
+        self.processes = processes
+
+    @property
+    def mem_percent(self):
+        return 100.0 * self.mem_used_kb / self.mem_total_kb if self.mem_total_kb else None
+
+    def to_dict(self):
+        return {
+            "t": round(self.t, 3),
+            "cpu_percent": None if self.cpu_percent is None else round(self.cpu_percent, 1),
+            "mem_used_kb": self.mem_used_kb,
+            "mem_total_kb": self.mem_total_kb,
+            "processes": {name: {"cpu_percent": None if cpu is None else round(cpu, 1), "rss_kb": rss}
+                          for name, (cpu, rss) in self.processes.items()},
+        }
+
+
+class DeviceMonitor:
+    """Samples /proc on the device at a fixed rate in a background thread.
+
+    processes: process names to follow (resolved with pidof, re-resolved
+    when they restart). Per-process CPU is a share of the whole device,
+    like cpu_percent. on_sample(ResourceSample) is called from the
+    sampling thread.
+    """
+
+    def __init__(self, client, interval=DEFAULT_INTERVAL, processes=(), max_samples=DEFAULT_MAX_SAMPLES,
+                 on_sample=None):
+        self.client = client
+        self.interval = max(0.05, float(interval))
+        self.process_names = [name for name in processes if name]
+        self.series = collections.deque(maxlen=max_samples)
+        self.on_sample = on_sample
+        self.started_at = None
+        self.shell_restarts = 0
+        self.sample_errors = 0
+        self.last_error = ""
+        self._pids = {}  # name -> [pid, ...]
+        self._sampled_pids = set()  # pids whose stat the current command reads
+        self._previous = None  # (cpu busy, cpu total, {pid: jiffies})
+        self._shell = None
+        self._lines = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._sequence = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="device-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=SAMPLE_TIMEOUT):
+        self._stop.set()
+        self._close_shell()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def samples(self, since=None):
+        """Samples taken at or after since (epoch seconds), oldest first."""
+        return [sample for sample in list(self.series) if since is None or sample.t >= since]
+
+    def latest(self):
+        return self.series[-1] if self.series else None
+
+    # ----- persistent shell -----
+
+    def _open_shell(self):
+        process = open_adb_session(self.client.templates.shell, cwd=self.client.cwd)
+        lines = queue.Queue()
+
+        def read_lines():
+            for line in process.stdout:
+                lines.put(line.rstrip("\r\n"))
+            lines.put(None)  # EOF: the shell is gone
+
+        threading.Thread(target=read_lines, name="device-monitor-reader", daemon=True).start()
+        self._shell, self._lines = process, lines
+        self._previous = None
+        self._pids = {}
+
+    def _close_shell(self):
+        process, self._shell = self._shell, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except (OSError, ValueError):
+            pass
+        PROCESSES.close(process)
+
+    def _command(self):
+        self._sequence += 1
+        parts = []
+        for name in self.process_names:
+            if not self._pids.get(name):
+                parts.append(f"echo {PIDOF_MARKER} {name}; pidof {name}")
+        self._sampled_pids = {pid for pids in self._pids.values() for pid in pids}
+        paths = ["/proc/stat", "/proc/meminfo"]
+        paths.extend(f"/proc/{pid}/stat" for pid in sorted(self._sampled_pids))
+        parts.append("cat " + " ".join(paths) + " 2>/dev/null")
+        parts.append(f"echo {SAMPLE_MARKER} {self._sequence}")
+        return "; ".join(parts) + "\n"
+
+    def _read_sample_output(self):
+        """Lines up to this sample's marker; raises RuntimeError if the shell dies or hangs."""
+        end = f"{SAMPLE_MARKER} {self._sequence}"
+        deadline = time.monotonic() + SAMPLE_TIMEOUT
+        output = []
+        while True:
+            try:
+                line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise RuntimeError("No sample output (shell hung)")
+            if line is None:
+                raise RuntimeError("Device shell closed")
+            if line.strip() == end:
+                return output
+            output.append(line)
+
+    # ----- sampling -----
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if self._shell is None or self._shell.poll() is not None:
+                    if self._shell is not None:
+                        self._close_shell()
+                        self.shell_restarts += 1
+                    self._open_shell()
+                self._shell.stdin.write(self._command())
+                self._shell.stdin.flush()
+                sample = self._parse(self._read_sample_output())
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.sample_errors += 1
+                self.last_error = str(e)
+                REGISTRY.inc("device_monitor_errors_total")
+                self._close_shell()
+                self.shell_restarts += 1
+                self._stop.wait(REOPEN_BACKOFF)
+                next_tick = time.monotonic()
+                continue
+
+            if sample is not None:
+                self.series.append(sample)
+                self._publish(sample)
+                if self.on_sample:
+                    self.on_sample(sample)
+
+            # Fixed schedule: a slow sample does not shift the following ones
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+        self._close_shell()
+
+    def _parse(self, lines):
+        """Turn one sample's output into a ResourceSample (None for the first, baseline read)."""
+        cpu = None
+        meminfo = {}
+        process_times = {}
+        pidof_name = None
+        for line in lines:
+            if line.startswith(PIDOF_MARKER):
+                pidof_name = line[len(PIDOF_MARKER):].strip()
+                self._pids[pidof_name] = []
+                continue
+            if pidof_name is not None and line.split() and all(token.isdigit() for token in line.split()):
+                self._pids[pidof_name] = [int(token) for token in line.split()]
+                pidof_name = None
+                continue
+            pidof_name = None
+            if line.startswith("cpu "):
+                cpu = _cpu_times(line)
+            elif line[:1].isupper() and ":" in line:
+                key, _, value = line.partition(":")
+                fields = value.split()
+                if fields and fields[0].isdigit():
+                    meminfo[key] = int(fields[0])
+            elif line[:1].isdigit():
+                parsed = _process_times(line)
+                if parsed:
+                    pid, jiffies, rss_pages = parsed
+                    process_times[pid] = (jiffies, rss_pages)
+        if cpu is None:
+            raise RuntimeError("No /proc/stat in sample output")
+
+        # Processes that exited (or restarted) are looked up again next time
+        gone = self._sampled_pids - set(process_times)
+        if gone:
+            for name, pids in self._pids.items():
+                self._pids[name] = [pid for pid in pids if pid not in gone]
+
+        previous, self._previous = self._previous, (cpu[0], cpu[1], {pid: t for pid, (t, _) in process_times.items()})
+        if previous is None:
+            return None
+
+        total_delta = cpu[1] - previous[1]
+        cpu_percent = 100.0 * (cpu[0] - previous[0]) / total_delta if total_delta > 0 else None
+        processes = {}
+        for name in self.process_names:
+            pids = [pid for pid in self._pids.get(name, ()) if pid in process_times]
+            if not pids:
+                processes[name] = (None, None)
+                continue
+            jiffies = sum(process_times[pid][0] - previous[2].get(pid, process_times[pid][0]) for pid in pids)
+            rss_kb = sum(process_times[pid][1] for pid in pids) * PAGE_SIZE_KB
+            processes[name] = (100.0 * jiffies / total_delta if total_delta > 0 else None, rss_kb)
+
+        mem_total = meminfo.get("MemTotal", 0)
+        available = meminfo.get("MemAvailable")
+        if available is None:
+            available = meminfo.get("MemFree", 0) + meminfo.get("Buffers", 0) + meminfo.get("Cached", 0)
+        return ResourceSample(time.time(), cpu_percent, mem_total - available, mem_total, processes)
+
+    def _publish(self, sample):
+        if sample.cpu_percent is not None:
+            REGISTRY.set("device_cpu_percent", round(sample.cpu_percent, 1))
+        REGISTRY.set("device_mem_used_kb", sample.mem_used_kb)
+        for name, (cpu_percent, rss_kb) in sample.processes.items():
+            if cpu_percent is not None:
+                REGISTRY.set("device_process_cpu_percent", round(cpu_percent, 1), process=name)
+                REGISTRY.set("device_process_rss_kb", rss_kb, process=name)
+
+    # ----- export -----
+
+    def report(self):
+        """Samples plus the signals/buttons sent while they were taken."""
+        samples = self.samples()
+        since = samples[0].t - self.interval if samples else self.started_at
+        return {
+            "device_id": self.client.device_id,
+            "interval": self.interval,
+            "processes": list(self.process_names),
+            "started_at": self.started_at,
+            "shell_restarts": self.shell_restarts,
+            "sample_errors": self.sample_errors,
+            "samples": [sample.to_dict() for sample in samples],
+            "signals": self.client.timeline_since(since),
+        }
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=1)
+        return path
+
+
+REGISTRY.describe("device_monitor_errors_total", "counter", "Device monitor samples that failed")
+REGISTRY.describe("device_cpu_percent", "gauge", "Device CPU load of the last monitor sample")
+REGISTRY.describe("device_mem_used_kb", "gauge", "Device memory in use (MemTotal - MemAvailable)")
+REGISTRY.describe("device_process_cpu_percent", "gauge", "Device CPU share of a monitored process")
+REGISTRY.describe("device_process_rss_kb", "gauge", "Resident memory of a monitored process")
+
+
+def format_summary(report):
+    samples = report["samples"]
+    if not samples:
+        return "[MONITOR] No samples"
+    cpu = [s["cpu_percent"] for s in samples if s["cpu_percent"] is not None]
+    mem = [s["mem_used_kb"] for s in samples]
+    lines = [
+        f"[MONITOR] {len(samples)} samples, {len(report['signals'])} operations sent, "
+        f"{report['shell_restarts']} shell restarts",
+        f"[MONITOR] CPU avg {sum(cpu) / max(1, len(cpu)):.1f}% max {max(cpu, default=0):.1f}%",
+        f"[MONITOR] Memory used max {max(mem) // 1024} MB of {samples[-1]['mem_total_kb'] // 1024} MB",
+    ]
+    for name in report["processes"]:
+        values = [s["processes"][name]["cpu_percent"] for s in samples
+                  if s["processes"].get(name, {}).get("cpu_percent") is not None]
+        lines.append(f"[MONITOR] {name}: CPU max {max(values, default=0):.1f}%")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sample FPK target CPU/memory load over one adb shell")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between samples")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to sample")
+    parser.add_argument("--process", action="append", default=[], help="Device process name to follow (repeatable)")
+    parser.add_argument("--device-id", default=DEFAULT_DEVICE_ID)
+    parser.add_argument("--adb-folder", default="", help="Folder containing adb1.exe (empty = adb on PATH)")
+    parser.add_argument("--out", default="", help="Result JSON path (default: monitor_<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    client = FpkClient(device_id=args.device_id, adb_folder=args.adb_folder, log=print)
+    monitor = DeviceMonitor(client, args.interval, args.process,
+                            max_samples=int(args.duration / max(0.05, args.interval)) + 2)
+    monitor.start()
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    monitor.stop()
+    client.close()
+
+    out_path = args.out or f"monitor_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    report = monitor.report()
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(format_summary(report))
+    print(f"[MONITOR] Results written to {os.path.abspath(out_path)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,550 @@
+"""
+Screenshot verification - compare the HMI after an action with stored reference images
+
+    python fpk_screen.py record adas --preset adas    # run the preset, save the screen as screen_refs/adas.png
+    python fpk_screen.py verify adas --preset adas    # run it again and compare (exit code 1 on a mismatch)
+
+    verifier = ScreenVerifier(client)
+    check = verifier.verify("adas")                   # ScreenCheck: passed, score, changed pixels
+
+Screenshots come from `adb exec-out screencap` as raw RGBA frames, read as
+bytes straight from the pipe: the device does not spend time encoding a
+PNG, nothing goes through a temp file and nothing passes through the cp949
+text decoding of the other adb calls.
+
+References are PNG files in the reference directory. An optional
+<name>.json next to one sets how it is compared:
+
+    {"regions": [[x, y, w, h], ...],  compare only these (default: the whole screen)
+     "ignore": [[x, y, w, h], ...],   never compare these (clock, animations)
+     "tolerance": 24,                 per-channel difference still counted as equal
+     "threshold": 0.002}              fraction of compared pixels allowed to differ
+
+Decoded references and their compiled masks are cached in memory and
+reloaded only when one of the files changes. The diff walks the mask row
+by row and skips byte-identical rows with one comparison, so the
+per-pixel loop only runs where the two screens differ.
+"""
+
+import argparse
+import collections
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from fpk_client import DEFAULT_DEVICE_ID, MFL_BUTTONS, PRESETS, FpkClient
+from fpk_metrics import REGISTRY
+
+DEFAULT_REFERENCE_DIR = "screen_refs"
+
+# Seconds the HMI gets to settle (animations, popups) between the action and the capture
+SETTLE_SECONDS = 0.5
+
+# Comparison defaults for references without a .json
+DEFAULT_TOLERANCE = 24
+DEFAULT_THRESHOLD = 0.002
+
+# Decoded references kept in memory (a 1920x720 screen is about 4 MB)
+REFERENCE_CACHE_SIZE = 16
+
+# Checks kept for the result log / status
+HISTORY_SIZE = 100
+
+# screencap raw pixel formats with 4 bytes per pixel (RGBA_8888, RGBX_8888)
+RAW_FORMATS = (1, 2)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG color type -> bytes per pixel at bit depth 8
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+class Image:
+    """An RGB image: 3 bytes per pixel, rows top to bottom."""
+
+    __slots__ = ("width", "height", "pixels")
+
+    def __init__(self, width, height, pixels):
+        if len(pixels) != width * height * 3:
+            raise ValueError(f"{len(pixels)} bytes do not make a {width}x{height} RGB image")
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+
+    @classmethod
+    def from_rgba(cls, width, height, rgba):
+        rgba = bytes(rgba)
+        rgb = bytearray(width * height * 3)
+        for channel in range(3):
+            rgb[channel::3] = rgba[channel::4]
+        return cls(width, height, bytes(rgb))
+
+    @classmethod
+    def from_gray(cls, width, height, gray):
+        gray = bytes(gray)
+        rgb = bytearray(width * height * 3)
+        for channel in range(3):
+            rgb[channel::3] = gray
+        return cls(width, height, bytes(rgb))
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def __repr__(self):
+        return f"<Image {self.width}x{self.height}>"
+
+
+# ----- decoding / encoding -----
+
+
+def decode_screencap(data):
+    """`screencap` output -> Image (raw frames with a 12- or 16-byte header, or PNG)."""
+    if data[:8] == PNG_SIGNATURE:
+        return decode_png(data)
+    if len(data) < 12:
+        raise ValueError(f"Short screencap output ({len(data)} bytes)")
+    width, height, pixel_format = struct.unpack_from("<III", data)
+    header = len(data) - width * height * 4
+    if header not in (12, 16):
+        raise ValueError(f"Unexpected screencap output: {len(data)} bytes for {width}x{height}")
+    if pixel_format not in RAW_FORMATS:
+        raise ValueError(f"Unsupported screencap pixel format {pixel_format}")
+    return Image.from_rgba(width, height, data[header:])
+
+
+def decode_png(data):
+    """8-bit, non-interlaced PNG (gray, RGB, palette, with or without alpha) -> Image."""
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+    header, palette, idat = None, b"", []
+    offset = 8
+    while offset + 8 <= len(data):
+        length, kind = struct.unpack_from(">I4s", data, offset)
+        body = data[offset + 8:offset + 8 + length]
+        offset += 12 + length
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif kind == b"PLTE":
+            palette = body
+        elif kind == b"IDAT":
+            idat.append(body)
+        elif kind == b"IEND":
+            break
+    if header is None:
+        raise ValueError("PNG without IHDR")
+    width, height, depth, color_type, _, _, interlace = header
+    if depth != 8 or interlace or color_type not in _PNG_CHANNELS:
+        raise ValueError(f"Unsupported PNG: bit depth {depth}, color type {color_type}, interlace {interlace}")
+    raw = _unfilter(zlib.decompress(b"".join(idat)), width, height, _PNG_CHANNELS[color_type])
+    if color_type == 2:
+        return Image(width, height, raw)
+    if color_type == 6:
+        return Image.from_rgba(width, height, raw)
+    if color_type == 0:
+        return Image.from_gray(width, height, raw)
+    if color_type == 4:
+        return Image.from_gray(width, height, raw[0::2])
+    colors = [palette[index * 3:index * 3 + 3].ljust(3, b"\0") for index in range(256)]
+    return Image(width, height, b"".join(map(colors.__getitem__, raw)))
+
+
+def _unfilter(data, width, height, bpp):
+    """Undo the per-row PNG filters."""
+    stride = width * bpp
+    if len(data) < (stride + 1) * height:
+        raise ValueError("Truncated PNG image data")
+    out = bytearray()
+    previous = bytes(stride)
+    for y in range(height):
+        start = y * (stride + 1)
+        kind = data[start]
+        line = bytearray(data[start + 1:start + 1 + stride])
+        if kind == 1:
+            for i in range(bpp, stride):
+                line[i] = (line[i] + line[i - bpp]) & 0xFF
+        elif kind == 2:
+            for i in range(stride):
+                line[i] = (line[i] + previous[i]) & 0xFF
+        elif kind == 3:
+            for i in range(stride):
+                left = line[i - bpp] if i >= bpp else 0
+                line[i] = (line[i] + ((left + previous[i]) >> 1)) & 0xFF
+        elif kind == 4:
+            for i in range(stride):
+                left = line[i - bpp] if i >= bpp else 0
+                up = previous[i]
+                upper_left = previous[i - bpp] if i >= bpp else 0
+                estimate = left + up - upper_left
+                distance_left, distance_up = abs(estimate - left), abs(estimate - up)
+                distance_upper_left = abs(estimate - upper_left)
+                if distance_left <= distance_up and distance_left <= distance_upper_left:
+                    predictor = left
+                elif distance_up <= distance_upper_left:
+                    predictor = up
+                else:
+                    predictor = upper_left
+                line[i] = (line[i] + predictor) & 0xFF
+        elif kind != 0:
+            raise ValueError(f"Bad PNG filter type {kind}")
+        out += line
+        previous = line
+    return bytes(out)
+
+
+def _png_chunk(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF)
+
+
+def encode_png(image, level=6):
+    """Image -> RGB PNG bytes (unfiltered rows, so decoding it back is a plain copy)."""
+    stride = image.width * 3
+    rows = b"".join(b"\0" + image.pixels[y * stride:(y + 1) * stride] for y in range(image.height))
+    return (PNG_SIGNATURE
+            + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", image.width, image.height, 8, 2, 0, 0, 0))
+            + _png_chunk(b"IDAT", zlib.compress(rows, level))
+            + _png_chunk(b"IEND", b""))
+
+
+# ----- masked diff -----
+
+
+def _clip(rect, width, height):
+    x, y, w, h = (int(value) for value in rect)
+    x0, y0, x1, y1 = max(0, x), max(0, y), min(width, x + w), min(height, y + h)
+    return (x0, y0, x1, y1) if x0 < x1 and y0 < y1 else None
+
+
+def _merge(spans):
+    merged = []
+    for x0, x1 in sorted(spans):
+        if merged and x0 <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], x1))
+        else:
+            merged.append((x0, x1))
+    return merged
+
+
+def _subtract(spans, cuts):
+    for cut0, cut1 in _merge(cuts):
+        remaining = []
+        for x0, x1 in spans:
+            if cut1 <= x0 or x1 <= cut0:
+                remaining.append((x0, x1))
+                continue
+            if x0 < cut0:
+                remaining.append((x0, cut0))
+            if cut1 < x1:
+                remaining.append((cut1, x1))
+        spans = remaining
+    return spans
+
+
+class Mask:
+    """Pixels to compare, compiled into bands of rows that share the same x spans."""
+
+    __slots__ = ("width", "height", "bands", "pixels")
+
+    def __init__(self, width, height, regions=None, ignore=()):
+        self.width = width
+        self.height = height
+        regions = [_clip(rect, width, height) for rect in (regions or [(0, 0, width, height)])]
+        regions = [rect for rect in regions if rect]
+        ignore = [rect for rect in (_clip(rect, width, height) for rect in ignore) if rect]
+        edges = sorted({0, height}.union(y for rect in regions + ignore for y in (rect[1], rect[3])))
+        self.bands = []  # (top, bottom, [(x0, x1), ...])
+        for top, bottom in zip(edges, edges[1:]):
+            spans = _merge([(x0, x1) for x0, y0, x1, y1 in regions if y0 <= top and bottom <= y1])
+            spans = _subtract(spans, [(x0, x1) for x0, y0, x1, y1 in ignore if y0 <= top and bottom <= y1])
+            if spans:
+                self.bands.append((top, bottom, spans))
+        self.pixels = sum((bottom - top) * sum(x1 - x0 for x0, x1 in spans) for top, bottom, spans in self.bands)
+
+
+def _changed_pixels(a, b, start, end, tolerance):
+    changed = 0
+    for i in range(start, end, 3):
+        if (abs(a[i] - b[i]) > tolerance or abs(a[i + 1] - b[i + 1]) > tolerance
+                or abs(a[i + 2] - b[i + 2]) > tolerance):
+            changed += 1
+    return changed
+
+
+def compare(image, reference, mask, tolerance=DEFAULT_TOLERANCE):
+    """Pixels of image that differ from reference inside mask -> (changed, compared)."""
+    if image.size != reference.size:
+        raise ValueError(f"Screen is {image.width}x{image.height}, "
+                         f"reference is {reference.width}x{reference.height}")
+    a, b = image.pixels, reference.pixels
+    stride = image.width * 3
+    changed = 0
+    for top, bottom, spans in mask.bands:
+        for y in range(top, bottom):
+            base = y * stride
+            for x0, x1 in spans:
+                start, end = base + x0 * 3, base + x1 * 3
+                if a[start:end] != b[start:end]:
+                    changed += _changed_pixels(a, b, start, end, tolerance)
+    return changed, mask.pixels
+
+
+# ----- references -----
+
+
+class Reference:
+    """A decoded reference image with its comparison settings."""
+
+    __slots__ = ("name", "image", "mask", "tolerance", "threshold", "stamp")
+
+    def __init__(self, name, image, options, stamp):
+        self.name = name
+        self.image = image
+        self.mask = Mask(image.width, image.height, options.get("regions"), options.get("ignore", ()))
+        self.tolerance = int(options.get("tolerance", DEFAULT_TOLERANCE))
+        self.threshold = float(options.get("threshold", DEFAULT_THRESHOLD))
+        self.stamp = stamp
+
+
+class ReferenceCache:
+    """Reference images of one directory, decoded once and kept while their files are unchanged."""
+
+    def __init__(self, directory=DEFAULT_REFERENCE_DIR, max_entries=REFERENCE_CACHE_SIZE):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.loads = 0
+        self._entries = collections.OrderedDict()  # name -> Reference, least recently used first
+        self._lock = threading.Lock()
+
+    def paths(self, name):
+        base = os.path.join(self.directory, name)
+        return base + ".png", base + ".json"
+
+    def exists(self, name):
+        return os.path.isfile(self.paths(name)[0])
+
+    def names(self):
+        try:
+            return sorted(entry[:-4] for entry in os.listdir(self.directory) if entry.endswith(".png"))
+        except OSError:
+            return []
+
+    def _stamp(self, name):
+        stamp = []
+        for path in self.paths(name):
+            try:
+                stat = os.stat(path)
+                stamp.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        if stamp[0] is None:
+            raise FileNotFoundError(f"No reference image {self.paths(name)[0]}")
+        return tuple(stamp)
+
+    def get(self, name):
+        """The Reference called name; raises FileNotFoundError / ValueError."""
+        stamp = self._stamp(name)
+        with self._lock:
+            reference = self._entries.get(name)
+            if reference is not None and reference.stamp == stamp:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                REGISTRY.inc("screen_reference_cache_total", result="hit")
+                return reference
+        png_path, json_path = self.paths(name)
+        with open(png_path, "rb") as f:
+            image = decode_png(f.read())
+        options = {}
+        if stamp[1] is not None:
+            with open(json_path, "r", encoding="utf-8") as f:
+                options = json.load(f)
+        reference = Reference(name, image, options, stamp)
+        with self._lock:
+            self._entries[name] = reference
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.loads += 1
+        REGISTRY.inc("screen_reference_cache_total", result="miss")
+        return reference
+
+    def save(self, name, image):
+        """Write image as the reference called name (its .json, if any, is kept)."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.paths(name)[0]
+        with open(path, "wb") as f:
+            f.write(encode_png(image))
+        with self._lock:
+            self._entries.pop(name, None)
+        return path
+
+
+# ----- verification -----
+
+
+class ScreenCheck:
+    """Outcome of comparing one screenshot with a reference; passed is None if it could not be compared."""
+
+    __slots__ = ("name", "passed", "score", "changed", "compared", "threshold", "capture_ms", "diff_ms",
+                 "error", "saved_path", "timestamp")
+
+    def __init__(self, name, passed=None, score=None, changed=0, compared=0, threshold=None,
+                 capture_ms=0.0, diff_ms=0.0, error=None, saved_path=None):
+        self.name = name
+        self.passed = passed
+        self.score = score
+        self.changed = changed
+        self.compared = compared
+        self.threshold = threshold
+        self.capture_ms = capture_ms
+        self.diff_ms = diff_ms
+        self.error = error
+        self.saved_path = saved_path
+        self.timestamp = time.time()
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def describe(self):
+        """One line for the result log."""
+        if self.error is not None:
+            return f"[SCREEN] {self.name}: ⚠️ not compared - {self.error}"
+        verdict = "✅ PASS" if self.passed else "❌ FAIL"
+        text = (f"[SCREEN] {self.name}: {verdict} score {self.score:.4f} "
+                f"({self.changed}/{self.compared} px differ, threshold {self.threshold:g}; "
+                f"capture {self.capture_ms:.0f} ms, diff {self.diff_ms:.0f} ms)")
+        if self.saved_path:
+            text += f" - screen saved to {self.saved_path}"
+        return text
+
+    def __repr__(self):
+        state = "error" if self.error is not None else ("pass" if self.passed else "fail")
+        return f"<ScreenCheck {self.name} {state} score={self.score}>"
+
+
+class ScreenVerifier:
+    """Captures the device screen and compares it with the references of one directory.
+
+    save_failures: failing screenshots are written to <dir>/failures/ for inspection.
+    history keeps the last HISTORY_SIZE checks.
+    """
+
+    def __init__(self, client, reference_dir=DEFAULT_REFERENCE_DIR, settle=SETTLE_SECONDS, save_failures=True):
+        self.client = client
+        self.references = ReferenceCache(reference_dir)
+        self.settle = settle
+        self.save_failures = save_failures
+        self.history = collections.deque(maxlen=HISTORY_SIZE)
+
+    def capture(self):
+        """The current screen as an Image."""
+        return decode_screencap(self.client.screencap())
+
+    def record(self, name, settle=None):
+        """Save the current screen (after settling) as the reference called name; returns its path."""
+        time.sleep(self.settle if settle is None else settle)
+        return self.references.save(name, self.capture())
+
+    def verify(self, name, settle=None):
+        """Compare the current screen (after settling) with reference name; returns a ScreenCheck."""
+        time.sleep(self.settle if settle is None else settle)
+        try:
+            reference = self.references.get(name)
+            started = time.perf_counter()
+            image = self.capture()
+            captured = time.perf_counter()
+            changed, compared = compare(image, reference.image, reference.mask, reference.tolerance)
+            finished = time.perf_counter()
+        except (OSError, ValueError, RuntimeError) as e:
+            check = ScreenCheck(name, error=str(e))
+        else:
+            score = changed / compared if compared else 0.0
+            check = ScreenCheck(name, score <= reference.threshold, round(score, 6), changed, compared,
+                                reference.threshold, (captured - started) * 1000.0, (finished - captured) * 1000.0)
+            if not check.passed and self.save_failures:
+                check.saved_path = self._save_failure(name, image)
+        REGISTRY.inc("screen_checks_total", result="error" if check.error else ("pass" if check.passed else "fail"))
+        self.history.append(check)
+        return check
+
+    def _save_failure(self, name, image):
+        directory = os.path.join(self.references.directory, "failures")
+        path = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.png")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(encode_png(image))
+        except OSError:
+            return None
+        return path
+
+
+REGISTRY.describe("screen_checks_total", "counter", "Screenshot comparisons, by result (pass/fail/error)")
+REGISTRY.describe("screen_reference_cache_total", "counter", "Reference image lookups, by result (hit/miss)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="FPK screenshot verification")
+    parser.add_argument("--device-id", default=DEFAULT_DEVICE_ID, help="adb serial of the target")
+    parser.add_argument("--adb-folder", default="", help="Folder containing adb1.exe (default: adb on PATH)")
+    parser.add_argument("--refs", default=DEFAULT_REFERENCE_DIR, help="Reference image directory")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="Seconds between the action and the capture")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    capture = commands.add_parser("capture", help="Save one screenshot as PNG")
+    capture.add_argument("out")
+    commands.add_parser("list", help="List the references")
+    for name, text in (("record", "Run an action and save the screen as a reference"),
+                       ("verify", "Run an action and compare the screen with a reference")):
+        command = commands.add_parser(name, help=text)
+        command.add_argument("name", help="Reference name (<refs>/<name>.png)")
+        action = command.add_mutually_exclusive_group()
+        action.add_argument("--preset", choices=list(PRESETS), help="Run this preset first")
+        action.add_argument("--press", choices=MFL_BUTTONS, help="Press this MFL button first")
+        command.add_argument("--count", type=int, default=1, help="Presses for --press")
+        command.add_argument("--json", action="store_true", help="Print the check as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    verifier = ScreenVerifier(None, args.refs, args.settle)
+    if args.command == "list":
+        for name in verifier.references.names():
+            print(name)
+        return 0
+
+    client = FpkClient(device_id=args.device_id, adb_folder=args.adb_folder, log=print)
+    verifier.client = client
+    try:
+        if args.command == "capture":
+            with open(args.out, "wb") as f:
+                f.write(encode_png(verifier.capture()))
+            print(f"[SCREEN] Saved {args.out}")
+            return 0
+        if args.preset:
+            run = client.run_preset(args.preset)
+            print(f"[PRESET] {run.name}: {run.state}, {run.steps_sent} steps, {run.failures} failed")
+        elif args.press:
+            client.ensure_script()
+            print(client.press(args.press, args.count))
+        if args.command == "record":
+            print(f"[SCREEN] Reference saved to {verifier.record(args.name)}")
+            return 0
+        check = verifier.verify(args.name)
+        print(json.dumps(check.to_dict()) if args.json else check.describe())
+        return 0 if check.passed else 1
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"[SCREEN] {e}", file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+FPK device simulator - a fake adb and device shell for running the tool without hardware
+
+    python -m fpk_sim install /tmp/fpk-sim-bin      # writes an `adb` launcher
+    PATH=/tmp/fpk-sim-bin:$PATH python cmd_gui.py   # or fpk_stress.py, FpkClient, ...
+
+    python -m fpk_sim config latency_ms=40 disconnect_rate=0.01
+    python -m fpk_sim connection unauthorized
+    python -m fpk_sim status
+
+All fake adb processes share one JSON state file (FPK_SIM_STATE, default
+<tempdir>/fpk_sim_state.json) holding the configuration, the pushed files,
+the last value of every DPID and call counters. Unknown DPIDs produce the
+same can_dpid_msg_lut parse error output as the target.
+"""
+
+import os
+import stat
+import sys
+
+from fpk_sim.state import CONNECTION_STATES, DEFAULT_CONFIG, StateStore, new_state
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Simulator:
+    """Programmatic control of the simulator state (tests, benchmarks)."""
+
+    def __init__(self, state_path=None):
+        self.store = StateStore(state_path)
+
+    @property
+    def env(self):
+        """Environment entries a fake adb process needs to find this state file."""
+        return {"FPK_SIM_STATE": self.store.path}
+
+    def reset(self, **config):
+        """Start from a fresh device (no files, no DPID values) with optional config overrides."""
+        state = new_state()
+        state["config"].update(self._checked(config))
+        with self.store.locked() as current:
+            current.clear()
+            current.update(state)
+
+    def configure(self, **config):
+        with self.store.locked() as state:
+            state["config"].update(self._checked(config))
+
+    def set_connection(self, connection):
+        if connection not in CONNECTION_STATES:
+            raise ValueError(f"connection must be one of {', '.join(CONNECTION_STATES)}")
+        self.configure(connection=connection)
+
+    def register_dpids(self, *names):
+        with self.store.locked() as state:
+            extra = state["config"]["extra_dpids"]
+            extra.extend(name for name in names if name not in extra)
+
+    def snapshot(self):
+        return self.store.load()
+
+    def dpid_values(self):
+        return dict(self.store.load()["dpids"])
+
+    @staticmethod
+    def _checked(config):
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown simulator setting(s): {', '.join(sorted(unknown))}")
+        if "connection" in config and config["connection"] not in CONNECTION_STATES:
+            raise ValueError(f"connection must be one of {', '.join(CONNECTION_STATES)}")
+        return config
+
+
+def install_launchers(directory):
+    """Write `adb` (POSIX) and `adb.cmd` (Windows) launchers for the fake adb into directory."""
+    os.makedirs(directory, exist_ok=True)
+    python = sys.executable
+    posix_path = os.path.join(directory, "adb")
+    with open(posix_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("#!/bin/sh\n")
+        f.write(f'PYTHONPATH="{PACKAGE_ROOT}${{PYTHONPATH:+:$PYTHONPATH}}" exec "{python}" -m fpk_sim.adb "$@"\n')
+    os.chmod(posix_path, os.stat(posix_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    windows_path = os.path.join(directory, "adb.cmd")
+    with open(windows_path, "w", encoding="utf-8", newline="\r\n") as f:
+        f.write("@echo off\n")
+        f.write(f'set "PYTHONPATH={PACKAGE_ROOT};%PYTHONPATH%"\n')
+        f.write(f'"{python}" -m fpk_sim.adb %*\n')
+    return [posix_path, windows_path]
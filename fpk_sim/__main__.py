@@ -0,0 +1,72 @@
+"""
+Simulator control - `python -m fpk_sim <install|reset|config|connection|register|status>`
+"""
+
+import argparse
+import json
+import sys
+
+from fpk_sim import Simulator, install_launchers
+from fpk_sim.state import CONNECTION_STATES
+
+
+def _parse_setting(text):
+    key, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected key=value, got {text!r}")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fpk_sim", description="FPK device simulator control")
+    parser.add_argument("--state", default=None, help="State file (default: FPK_SIM_STATE or <tempdir>/fpk_sim_state.json)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    install = commands.add_parser("install", help="Write adb launchers into a directory")
+    install.add_argument("directory")
+
+    reset = commands.add_parser("reset", help="Fresh device state (optional key=value settings)")
+    reset.add_argument("settings", nargs="*", type=_parse_setting)
+
+    config = commands.add_parser("config", help="Change settings, e.g. latency_ms=40 disconnect_rate=0.01")
+    config.add_argument("settings", nargs="+", type=_parse_setting)
+
+    connection = commands.add_parser("connection", help="Set the device connection state")
+    connection.add_argument("connection", choices=CONNECTION_STATES)
+
+    register = commands.add_parser("register", help="Add DPIDs to the simulated can_dpid_msg_lut")
+    register.add_argument("dpids", nargs="+")
+
+    commands.add_parser("status", help="Print the simulator state as JSON")
+
+    args = parser.parse_args(argv)
+    simulator = Simulator(args.state)
+    try:
+        if args.command == "install":
+            for path in install_launchers(args.directory):
+                print(path)
+        elif args.command == "reset":
+            simulator.reset(**dict(args.settings))
+        elif args.command == "config":
+            simulator.configure(**dict(args.settings))
+        elif args.command == "connection":
+            simulator.set_connection(args.connection)
+        elif args.command == "register":
+            simulator.register_dpids(*args.dpids)
+        elif args.command == "status":
+            state = simulator.snapshot()
+            state["files"] = {path: {"mode": entry["mode"], "bytes": len(entry["content"])}
+                              for path, entry in state["files"].items()}
+            state.pop("lut", None)
+            print(json.dumps(state, indent=2))
+    except ValueError as e:
+        print(f"fpk_sim: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
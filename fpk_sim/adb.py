@@ -0,0 +1,194 @@
+"""
+Fake adb executable - `python -m fpk_sim.adb [-s SERIAL] <command> ...`
+
+Implements the adb commands the tool uses (version, devices, push, shell,
+exec-out, get-state, start-server/kill-server) against the simulator state.
+"""
+
+import os
+import random
+import sys
+import time
+
+from fpk_sim.screen import raw_frame, render
+from fpk_sim.shell import FakeShell
+from fpk_sim.state import StateStore
+
+ADB_VERSION_TEXT = (
+    "Android Debug Bridge version 1.0.41\n"
+    "Version 34.0.5-fpk-sim\n"
+    "Installed as {path}\n"
+)
+
+UNAUTHORIZED_TEXT = (
+    "error: device unauthorized.\n"
+    "This adb server's $ADB_VENDOR_KEYS is not set\n"
+    "Try 'adb kill-server' if that seems wrong.\n"
+    "Otherwise check for a confirmation dialog on your device.\n"
+)
+
+
+def _connection(state, now):
+    """Effective connection state, applying injected drops."""
+    config = state["config"]
+    if now < state.get("disconnected_until", 0.0):
+        return "disconnected"
+    if config["disconnect_rate"] and random.random() < config["disconnect_rate"]:
+        state["disconnected_until"] = now + config["disconnect_seconds"]
+        state["counters"]["disconnects"] += 1
+        return "disconnected"
+    return config["connection"]
+
+
+def _simulate_latency(config):
+    latency = config["latency_ms"] + random.uniform(-1.0, 1.0) * config["jitter_ms"]
+    if latency > 0:
+        time.sleep(latency / 1000.0)
+
+
+def _parse_global_options(argv):
+    serial = None
+    index = 0
+    while index < len(argv):
+        arg = argv[index]
+        if arg == "-s" and index + 1 < len(argv):
+            serial = argv[index + 1]
+            index += 2
+        elif arg in ("-d", "-e", "-a"):
+            index += 1
+        elif arg in ("-P", "-H", "-L") and index + 1 < len(argv):
+            index += 2
+        else:
+            break
+    return serial, argv[index:]
+
+
+def _device_error(state, serial, connection):
+    """Error text for device-bound commands, or None if the device is usable."""
+    config = state["config"]
+    if connection == "disconnected":
+        if serial:
+            return f"error: device '{serial}' not found\n"
+        return "error: no devices/emulators found\n"
+    if serial and serial != config["serial"]:
+        return f"error: device '{serial}' not found\n"
+    if connection == "unauthorized":
+        return UNAUTHORIZED_TEXT
+    if connection == "offline":
+        return "error: device offline\n"
+    return None
+
+
+def _push(store, local_path, remote):
+    try:
+        with open(local_path, "r", encoding="utf-8", newline="") as f:
+            content = f.read()
+    except OSError as e:
+        sys.stderr.write(f"adb: error: cannot stat '{local_path}': {e.strerror}\n")
+        return 1
+    if remote.endswith("/"):
+        remote += os.path.basename(local_path)
+    with store.locked() as state:
+        if any(remote.startswith(directory) for directory in state["config"].get("readonly_dirs", ())):
+            sys.stderr.write(f"adb: error: failed to copy '{local_path}' to '{remote}': "
+                             f"remote couldn't create file: Read-only file system\n")
+            return 1
+        state["files"][remote] = {"content": content, "mode": "644"}
+    sys.stdout.write(f"{local_path}: 1 file pushed, 0 skipped. 1.2 MB/s ({len(content)} bytes in 0.001s)\n")
+    return 0
+
+
+def _shell(store, args, stdin):
+    def write_out(text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    def write_err(text):
+        sys.stderr.write(text)
+        sys.stderr.flush()
+
+    shell = FakeShell(store, write_out, write_err, stdin)
+    if args:
+        # adb joins the arguments with spaces and hands them to the device shell
+        return shell.run(" ".join(args))
+
+    # Interactive shell: one command line per input line until EOF/exit
+    rc = 0
+    for line in stdin:
+        line = line.rstrip("\r\n")
+        if line.strip() == "exit":
+            break
+        if line.strip():
+            rc = shell.run(line)
+    return rc
+
+
+def _screencap(store, args):
+    """screencap [-p]: the rendered screen as a raw frame or PNG, written as bytes."""
+    with store.locked() as state:
+        if "-p" in args:
+            from fpk_screen import Image, encode_png
+
+            width, height, pixels = render(state)
+            data = encode_png(Image.from_rgba(width, height, pixels))
+        else:
+            data = raw_frame(state)
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
+    return 0
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    serial, args = _parse_global_options(argv)
+    command = args[0] if args else "help"
+    store = StateStore()
+
+    if command == "version":
+        sys.stdout.write(ADB_VERSION_TEXT.format(path=os.path.abspath(sys.argv[0])))
+        return 0
+    if command in ("start-server", "kill-server", "reconnect"):
+        return 0
+    if command == "help":
+        sys.stderr.write("Android Debug Bridge version 1.0.41\nusage: adb [-s SERIAL] COMMAND ...\n")
+        return 1
+
+    with store.locked() as state:
+        state["counters"]["adb_calls"] += 1
+        config = dict(state["config"])
+        connection = _connection(state, time.time())
+    _simulate_latency(config)
+
+    if command == "devices":
+        lines = ["List of devices attached"]
+        if connection != "disconnected":
+            lines.append(f"{config['serial']}\t{connection}")
+        sys.stdout.write("\n".join(lines) + "\n\n")
+        return 0
+
+    error = _device_error(state, serial, connection)
+    if command == "get-state":
+        if error:
+            sys.stderr.write(error)
+            return 1
+        sys.stdout.write("device\n")
+        return 0
+    if command == "wait-for-device":
+        return 0 if error is None else 1
+    if error:
+        sys.stderr.write(error)
+        return 1
+
+    if command == "push" and len(args) >= 3:
+        return _push(store, args[1], args[2])
+    if command == "exec-out" and args[1:2] == ["screencap"]:
+        return _screencap(store, args[2:])
+    if command in ("shell", "exec-out"):
+        return _shell(store, args[1:], sys.stdin)
+
+    sys.stderr.write(f"adb: unknown command {command}\n")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
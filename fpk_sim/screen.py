@@ -0,0 +1,73 @@
+"""
+Simulated HMI screen - a frame rendered from the device state for `adb exec-out screencap`
+
+The picture is a function of the DPID values, so an action that changes
+them changes the screen the same way on every run:
+
+- a status strip along the bottom whose color is a checksum of all values
+- a popup box while DP_ID_HMI_ZPM_ANZEIGEID is non-zero, colored by its
+  value (only for popup_seconds after the write when that is set)
+- a clock block in the top right corner that changes every second (what a
+  reference's "ignore" regions are for)
+"""
+
+import struct
+import time
+import zlib
+
+DEFAULT_SCREEN_SIZE = (480, 180)
+
+BACKGROUND = (16, 20, 28)
+CLOCK_SIZE = (72, 16)
+STATUS_HEIGHT = 12
+POPUP_DPID = "DP_ID_HMI_ZPM_ANZEIGEID"
+
+# screencap raw header: width, height, pixel format (1 = RGBA_8888), color space
+RAW_FORMAT_RGBA = 1
+
+
+def _color(number):
+    return (64 + number % 192, 64 + (number >> 8) % 192, 64 + (number >> 16) % 192)
+
+
+def clock_region(width, height):
+    """(x, y, w, h) of the block that changes every second."""
+    return width - CLOCK_SIZE[0] - 4, 4, CLOCK_SIZE[0], CLOCK_SIZE[1]
+
+
+def popup_region(width, height):
+    return width * 3 // 10, height * 3 // 10, width * 4 // 10, height * 4 // 10
+
+
+def render(state, now=None):
+    """The current screen as (width, height, RGBA bytes)."""
+    width, height = state["config"].get("screen_size") or DEFAULT_SCREEN_SIZE
+    now = time.time() if now is None else now
+    frame = bytearray(bytes(BACKGROUND + (255,)) * (width * height))
+
+    def fill(x, y, w, h, color):
+        x0, y0, x1, y1 = max(0, x), max(0, y), min(width, x + w), min(height, y + h)
+        if x0 >= x1:
+            return
+        span = bytes(color + (255,)) * (x1 - x0)
+        for row in range(y0, y1):
+            start = (row * width + x0) * 4
+            frame[start:start + len(span)] = span
+
+    dpids = state["dpids"]
+    checksum = zlib.crc32(repr(sorted(dpids.items())).encode("utf-8"))
+    fill(0, height - STATUS_HEIGHT, width, STATUS_HEIGHT, _color(checksum))
+    popup = dpids.get(POPUP_DPID, "0")
+    lifetime = state["config"].get("popup_seconds") or 0.0
+    if lifetime and now - state.get("written_at", {}).get(POPUP_DPID, 0.0) > lifetime:
+        popup = "0"
+    if popup not in ("", "0"):
+        fill(*popup_region(width, height), _color(zlib.crc32(popup.encode("utf-8"))))
+    fill(*clock_region(width, height), _color(int(now) * 2654435761))
+    return width, height, bytes(frame)
+
+
+def raw_frame(state, now=None):
+    """`screencap` output without -p: 16-byte header + RGBA pixels."""
+    width, height, pixels = render(state, now)
+    return struct.pack("<IIII", width, height, RAW_FORMAT_RGBA, 0) + pixels
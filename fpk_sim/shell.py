@@ -0,0 +1,415 @@
+"""
+Fake device shell - the subset of /bin/sh the tool uses on the target
+"""
+
+import hashlib
+import re
+import shlex
+import time
+
+IPC_SENDER_PATH = "/usr/bin/IpcSender"
+
+# Builtins reported by `which` / `command -v`
+KNOWN_BINARIES = {
+    "IpcSender": IPC_SENDER_PATH,
+    "echo": "/bin/echo",
+    "cat": "/bin/cat",
+    "chmod": "/bin/chmod",
+    "sleep": "/bin/sleep",
+    "usleep": "/bin/usleep",
+    "md5sum": "/usr/bin/md5sum",
+    "sha1sum": "/usr/bin/sha1sum",
+    "sh": "/bin/sh",
+    "pidof": "/bin/pidof",
+}
+
+# Simulated device processes: name -> pid
+SIM_PROCESSES = {"hmi_app": 812, "ipc_router": 640, "surfaceflinger": 403}
+
+SIM_CPUS = 4
+SIM_HZ = 100
+SIM_MEM_TOTAL_KB = 2048000
+
+# Idle load and CPU time (jiffies, 10 ms each) burnt per IpcSender write
+SIM_BASE_LOAD = 0.12
+SIM_JIFFIES_PER_WRITE = 0.1
+
+_CONNECTORS = (";", "&&", "||", "\n")
+# Lines of the generated mfl_total.sh the script runner recognises instead of interpreting
+# if/while itself; tests/test_sim.py checks them against fpk_client.build_mfl_script()
+_MFL_BLOCK = re.compile(r'(?:if|elif) \[ "\$1" = "(\w+)" \]; then\n(.*?)(?=\n(?:elif|else|fi)\b)', re.S)
+_MFL_REPEAT = re.compile(r'\[ "\$2" -gt 1 \]')
+_MFL_REPEAT_RC = re.compile(r'exit "\$rc"')
+_MFL_REEXEC = re.compile(r'^\s*(sh )?"\$0" "\$1"$', re.M)
+_MFL_VERSION = re.compile(r'^MFL_SCRIPT_VERSION="([^"]*)"', re.M)
+
+
+def _read_only(state, path):
+    return any(path.startswith(directory) for directory in state["config"].get("readonly_dirs", ()))
+
+
+def parse_dpid_error(name):
+    """Output of IpcSender for a DPID that is not in can_dpid_msg_lut."""
+    return (f"[CMessage][ParsingDPID] DPID '{name}' not found in can_dpid_msg_lut\n"
+            f"[IpcSender] failed to send {name}\n")
+
+
+def _split_commands(line):
+    """Tokenise a command line into [(connector, words, redirects), ...]."""
+    lexer = shlex.shlex(line, posix=True, punctuation_chars=";&|<>")
+    lexer.whitespace_split = True
+    lexer.commenters = ""
+    commands = []
+    connector = ";"
+    words, redirects = [], []
+    tokens = list(lexer)
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token in _CONNECTORS:
+            if words:
+                commands.append((connector, words, redirects))
+            connector, words, redirects = token, [], []
+        elif token in (">", ">>", ">&", "<"):
+            fd = "0" if token == "<" else "1"
+            if words and words[-1] in ("1", "2") and f"{words[-1]}{token}" in line:
+                fd = words.pop()
+            target = tokens[index + 1] if index + 1 < len(tokens) else ""
+            redirects.append((fd, token, target))
+            index += 1
+        else:
+            words.append(token)
+        index += 1
+    if words:
+        commands.append((connector, words, redirects))
+    return commands
+
+
+class FakeShell:
+    """Executes command lines against the simulator state.
+
+    store: fpk_sim.state.StateStore; every command line runs under its lock,
+    so concurrent fake adb processes see a consistent device.
+    """
+
+    def __init__(self, store, write_out, write_err, stdin=None):
+        self.store = store
+        self.write_out = write_out
+        self.write_err = write_err
+        self.stdin = stdin
+        self.last_rc = 0
+        self.state = None
+        self._exit_code = 0
+
+    def run(self, line):
+        """Run one command line; returns its exit code."""
+        with self.store.locked() as state:
+            self.state = state
+            try:
+                return self._run_line(line)
+            finally:
+                self.state = None
+
+    def _run_line(self, line, positional=()):
+        rc = self.last_rc
+        for connector, words, redirects in _split_commands(line):
+            if connector == "&&" and rc != 0:
+                continue
+            if connector == "||" and rc == 0:
+                continue
+            words = [self._expand(word, positional) for word in words]
+            rc, out, err = self._execute(words)
+            rc = self._emit(out, err, redirects) or rc
+            if rc is None:  # exit
+                self.last_rc = self._exit_code
+                return self._exit_code
+            self.last_rc = rc
+        return rc
+
+    def _expand(self, word, positional):
+        word = word.replace("$?", str(self.last_rc))
+        for index, value in enumerate(positional):
+            word = word.replace(f"${index}", value)
+        return word
+
+    def _emit(self, out, err, redirects):
+        """Route output through the redirects; returns 1 if a redirect target could not be created."""
+        out_target, err_target = "stdout", "stderr"
+        for fd, operator, target in redirects:
+            if operator == "<":
+                continue
+            if operator == ">&":
+                if fd == "2" and target == "1":
+                    err_target = out_target
+                elif fd == "1" and target == "2":
+                    out_target = err_target
+                continue
+            if target != "/dev/null" and _read_only(self.state, target):
+                self.write_err(f"/bin/sh: can't create {target}: Read-only file system\n")
+                return 1
+            sink = "null" if target == "/dev/null" else "file:" + target
+            if fd == "2":
+                err_target = sink
+            else:
+                out_target = sink
+        for text, target in ((out, out_target), (err, err_target)):
+            if not text:
+                continue
+            if target == "stdout":
+                self.write_out(text)
+            elif target == "stderr":
+                self.write_err(text)
+            elif target.startswith("file:"):
+                path = target[5:]
+                entry = self.state["files"].setdefault(path, {"content": "", "mode": "644"})
+                entry["content"] += text
+
+    # ----- commands -----
+
+    def _execute(self, words):
+        name, args = words[0], words[1:]
+        handler = getattr(self, "_cmd_" + name.replace("-", "_"), None) if not name.startswith("/") else None
+        if handler is not None:
+            return handler(args)
+        if name in self.state["files"]:
+            return self._run_script(name, args)
+        if name in KNOWN_BINARIES.values():
+            return self._execute([name.rsplit("/", 1)[1]] + args)
+        return 127, "", f"/bin/sh: {name}: not found\n"
+
+    def _installed(self, name):
+        return name != "IpcSender" or self.state["config"].get("ipc_sender", True)
+
+    def _cmd_echo(self, args):
+        if args and args[0] == "-n":
+            return 0, " ".join(args[1:]), ""
+        return 0, " ".join(args) + "\n", ""
+
+    def _cmd_true(self, args):
+        return 0, "", ""
+
+    def _cmd_false(self, args):
+        return 1, "", ""
+
+    def _cmd_exit(self, args):
+        self._exit_code = int(args[0]) if args and args[0].lstrip("-").isdigit() else self.last_rc
+        return None, "", ""
+
+    def _cmd_sleep(self, args):
+        try:
+            time.sleep(float(args[0]))
+        except (IndexError, ValueError):
+            return 1, "", "sleep: invalid time interval\n"
+        return 0, "", ""
+
+    def _cmd_usleep(self, args):
+        try:
+            time.sleep(int(args[0]) / 1000000.0)
+        except (IndexError, ValueError):
+            return 1, "", "usleep: invalid time interval\n"
+        return 0, "", ""
+
+    def _cmd_which(self, args):
+        found = [KNOWN_BINARIES[arg] for arg in args if arg in KNOWN_BINARIES and self._installed(arg)]
+        if len(found) != len(args):
+            return 1, "".join(path + "\n" for path in found), ""
+        return 0, "".join(path + "\n" for path in found), ""
+
+    def _cmd_command(self, args):
+        if args[:1] == ["-v"]:
+            return self._cmd_which(args[1:])
+        return self._execute(args) if args else (0, "", "")
+
+    def _cmd_cat(self, args):
+        out, err, rc = [], [], 0
+        for path in args:
+            entry = self.state["files"].get(path)
+            if entry is None and path.startswith("/proc/"):
+                content = self._proc_file(path)
+                if content is not None:
+                    entry = {"content": content}
+            if entry is None:
+                err.append(f"cat: {path}: No such file or directory\n")
+                rc = 1
+            else:
+                out.append(entry["content"])
+        if not args and self.stdin is not None:
+            out.append(self.stdin.read())
+        return rc, "".join(out), "".join(err)
+
+    def _proc_file(self, path):
+        """Synthetic /proc/stat, /proc/meminfo and /proc/<pid>/stat; load follows the IPC write count."""
+        state = self.state
+        uptime = time.time() - state.setdefault("booted_at", time.time())
+        writes = state["counters"]["ipc_writes"]
+        total = int(uptime * SIM_HZ * SIM_CPUS)
+        busy = min(total, int(total * SIM_BASE_LOAD + writes * SIM_JIFFIES_PER_WRITE))
+        if path == "/proc/stat":
+            user, system = busy * 2 // 3, busy - busy * 2 // 3
+            lines = [f"cpu  {user} 0 {system} {total - busy} 0 0 0 0 0 0"]
+            lines.extend(f"cpu{index} 0 0 0 0 0 0 0 0 0 0" for index in range(SIM_CPUS))
+            lines.append(f"ctxt {writes * 10}")
+            return "\n".join(lines) + "\n"
+        if path == "/proc/meminfo":
+            available = SIM_MEM_TOTAL_KB // 2 - len(state["dpids"]) * 64
+            return (f"MemTotal:       {SIM_MEM_TOTAL_KB} kB\n"
+                    f"MemFree:        {available // 2} kB\n"
+                    f"MemAvailable:   {available} kB\n"
+                    f"Buffers:        2048 kB\n"
+                    f"Cached:         {available // 3} kB\n")
+        for index, (name, pid) in enumerate(sorted(SIM_PROCESSES.items())):
+            if path == f"/proc/{pid}/stat":
+                # The first process (the HMI) does the work for every write
+                jiffies = int(uptime * SIM_HZ * 0.02 + (writes * SIM_JIFFIES_PER_WRITE if index == 0 else 0))
+                fields = ["S", "1"] + ["0"] * 9 + [str(jiffies), "0"] + ["0"] * 8 + [str(20000 + 1000 * index)]
+                return f"{pid} ({name}) {' '.join(fields)}\n"
+        return None
+
+    def _cmd_pidof(self, args):
+        pids = [str(SIM_PROCESSES[name]) for name in args if name in SIM_PROCESSES]
+        return (0 if pids else 1), (" ".join(pids) + "\n") if pids else "", ""
+
+    def _cmd_chmod(self, args):
+        if len(args) < 2:
+            return 1, "", "chmod: missing operand\n"
+        mode, paths = args[0], args[1:]
+        if self.state["config"].get("chmod_denied"):
+            return 1, "", f"chmod: {paths[0]}: Operation not permitted\n"
+        for path in paths:
+            entry = self.state["files"].get(path)
+            if entry is None:
+                return 1, "", f"chmod: {path}: No such file or directory\n"
+            entry["mode"] = "755" if "x" in mode or mode.endswith(("5", "7")) else mode
+        return 0, "", ""
+
+    def _cmd_rm(self, args):
+        for path in args:
+            if not path.startswith("-"):
+                self.state["files"].pop(path, None)
+        return 0, "", ""
+
+    def _cmd_ls(self, args):
+        paths = [arg for arg in args if not arg.startswith("-")]
+        out, rc = [], 0
+        for path in paths:
+            if path in self.state["files"]:
+                out.append(path + "\n")
+            else:
+                matches = sorted(p for p in self.state["files"] if p.startswith(path.rstrip("/") + "/"))
+                if matches:
+                    out.extend(p.rsplit("/", 1)[1] + "\n" for p in matches)
+                else:
+                    rc = 1
+        return rc, "".join(out), "" if rc == 0 else "ls: No such file or directory\n"
+
+    def _hash(self, algorithm, args):
+        out = []
+        for path in args:
+            entry = self.state["files"].get(path)
+            if entry is None:
+                return 1, "", f"{algorithm}: {path}: No such file or directory\n"
+            digest = hashlib.new(algorithm, entry["content"].encode("utf-8")).hexdigest()
+            out.append(f"{digest}  {path}\n")
+        return 0, "".join(out), ""
+
+    def _cmd_md5sum(self, args):
+        return self._hash("md5", args)
+
+    def _cmd_sha1sum(self, args):
+        return self._hash("sha1", args)
+
+    def _cmd_sh(self, args):
+        if len(args) >= 2 and args[0] == "-c":
+            rc = self._run_line(args[1])
+            return rc, "", ""
+        if args and args[0] in self.state["files"]:
+            return self._run_script(args[0], args[1:], check_mode=False)
+        return 0, "", ""
+
+    def _cmd_IpcSender(self, args):
+        # IpcSender --dpid <name> <instance> <value>
+        if not self._installed("IpcSender"):
+            return 127, "", "/bin/sh: IpcSender: not found\n"
+        if len(args) < 4 or args[0] != "--dpid":
+            return 1, "", "Usage: IpcSender --dpid <DPID> <instance> <value>\n"
+        name, value = args[1], args[3]
+        config = self.state["config"]
+        self.state["counters"]["ipc_writes"] += 1
+        if config["ipc_latency_ms"]:
+            time.sleep(config["ipc_latency_ms"] / 1000.0)
+        if not config["accept_all_dpids"] and name not in self.state["lut"] and name not in config["extra_dpids"]:
+            self.state["counters"]["parse_errors"] += 1
+            return 0, parse_dpid_error(name), ""
+        self.state["dpids"][name] = value
+        self.state.setdefault("written_at", {})[name] = time.time()
+        return 0, "", ""
+
+    # ----- mfl_total.sh -----
+
+    def _run_script(self, path, args, check_mode=True):
+        entry = self.state["files"][path]
+        if check_mode and entry.get("mode") != "755":
+            return 126, "", f"/bin/sh: {path}: Permission denied\n"
+        content = entry["content"]
+        verb = args[0] if args else ""
+
+        if verb != "signal" and len(args) > 1 and _MFL_REPEAT.search(content) and args[1].isdigit() \
+                and int(args[1]) > 1:
+            # Each press re-runs the script: directly needs exec permission, `sh "$0"` does not
+            reexec = _MFL_REEXEC.search(content)
+            direct = reexec is None or not reexec.group(1)
+            out, err, first_rc = [], [], 0
+            for _ in range(int(args[1])):
+                rc, text, error = self._run_script(path, [verb], check_mode=direct)
+                out.append(text)
+                err.append(error)
+                first_rc = first_rc or rc
+            # Older scripts end the loop with `exit 0` whatever the presses returned
+            return (first_rc if _MFL_REPEAT_RC.search(content) else 0), "".join(out), "".join(err)
+
+        if verb == "batch" and 'elif [ "$1" = "batch" ]' in content:
+            return self._run_batch()
+
+        if verb == "version":
+            match = _MFL_VERSION.search(content)
+            if match:
+                return 0, match.group(1) + "\n", ""
+
+        if verb == "signal":
+            if len(args) < 3:
+                return 1, f"Usage: {path} signal <DPID_NAME> <VALUE>\n", ""
+            rc, _, _ = self._cmd_IpcSender(["--dpid", args[1], "0", args[2]])
+            return 0, f"signal: {args[1]} = {args[2]}\n", ""
+
+        for block_verb, body in _MFL_BLOCK.findall(content):
+            if block_verb == verb and verb != "signal":
+                return self._run_block(body, [path] + list(args))
+        return 0, "Unknown Command.\n", ""
+
+    def _run_batch(self):
+        """mfl_total.sh batch: apply "<DPID> <VALUE>" stdin lines, one marker line per write."""
+        out = []
+        if self.stdin is not None:
+            for line in self.stdin:
+                parts = line.split()
+                if not parts:
+                    continue
+                rc, text, _ = self._cmd_IpcSender(["--dpid", parts[0], "0", parts[1] if len(parts) > 1 else ""])
+                out.append(text)
+                out.append(f"@@FPK_RC {rc}\n")
+        return 0, "".join(out), ""
+
+    def _run_block(self, body, positional):
+        out = []
+        rc = 0
+        saved = self.write_out, self.write_err
+        self.write_out = out.append
+        self.write_err = lambda text: None
+        try:
+            for line in body.splitlines():
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    rc = self._run_line(line, positional)
+        finally:
+            self.write_out, self.write_err = saved
+        return rc, "".join(out), ""
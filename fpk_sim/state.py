@@ -0,0 +1,147 @@
+"""
+Simulator state - one JSON file shared by every fake adb process
+"""
+
+import contextlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+STATE_ENV = "FPK_SIM_STATE"
+DEFAULT_STATE_PATH = os.path.join(tempfile.gettempdir(), "fpk_sim_state.json")
+
+# Seconds to wait for the state lock before giving up
+LOCK_TIMEOUT = 10.0
+
+# A lock file older than this is considered abandoned by a killed process
+STALE_LOCK_SECONDS = 30.0
+
+DEFAULT_SERIAL = "ABC-0123456789"
+
+# Device connection states reported by `adb devices`
+CONNECTION_STATES = ("device", "unauthorized", "offline", "disconnected")
+
+DEFAULT_CONFIG = {
+    "serial": DEFAULT_SERIAL,
+    "connection": "device",  # device / unauthorized / offline / disconnected
+    "latency_ms": 15.0,  # per adb invocation
+    "jitter_ms": 5.0,
+    "ipc_latency_ms": 0.5,  # per IpcSender write
+    "disconnect_rate": 0.0,  # probability per adb invocation that the device drops
+    "disconnect_seconds": 5.0,  # how long an injected drop lasts
+    "accept_all_dpids": False,  # True = no can_dpid_msg_lut parse errors
+    "extra_dpids": [],  # registered in addition to the tool's own DPIDs
+    "readonly_dirs": [],  # remote directories that refuse pushes and file writes, e.g. ["/tmp/"]
+    "chmod_denied": False,  # True = chmod fails with "Operation not permitted"
+    "ipc_sender": True,  # False = IpcSender is not installed
+    "screen_size": [480, 180],  # width, height of the frame `screencap` returns
+    "popup_seconds": 0.0,  # > 0: the ANZEIGEID popup disappears this long after the write (transient glitch)
+}
+
+
+def default_lut():
+    """DPIDs the tool itself sends (presets and MFL buttons) - the simulated can_dpid_msg_lut."""
+    from fpk_client import MFL_SCRIPT, PRESETS
+
+    names = set(re.findall(r"DP_ID_[A-Za-z0-9_]+", MFL_SCRIPT))
+    for _, steps in PRESETS.values():
+        names.update(name for name, _ in steps if name != "WAIT")
+    return sorted(names)
+
+
+def new_state():
+    return {
+        "config": dict(DEFAULT_CONFIG),
+        "lut": default_lut(),
+        "dpids": {},  # name -> last value
+        "written_at": {},  # name -> epoch seconds of the last write
+        "files": {},  # remote path -> {"content": str, "mode": "644"/"755"}
+        "counters": {"adb_calls": 0, "ipc_writes": 0, "parse_errors": 0, "disconnects": 0},
+        "disconnected_until": 0.0,
+    }
+
+
+def state_path():
+    return os.environ.get(STATE_ENV) or DEFAULT_STATE_PATH
+
+
+class StateStore:
+    """Read-modify-write access to the state file under a cross-process lock file."""
+
+    def __init__(self, path=None):
+        self.path = path or state_path()
+        self.lock_path = self.path + ".lock"
+
+    def _acquire(self):
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode("ascii"))
+                os.close(fd)
+                return
+            except FileExistsError:
+                try:
+                    if self._lock_abandoned():
+                        os.remove(self.lock_path)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Simulator state is locked: {self.lock_path}")
+                time.sleep(0.001)
+
+    def _lock_abandoned(self):
+        """True if the lock holder was killed (a stopped adb shell) or the lock is very old."""
+        if time.time() - os.path.getmtime(self.lock_path) > STALE_LOCK_SECONDS:
+            return True
+        with open(self.lock_path, "r", encoding="ascii") as f:
+            holder = f.read().strip()
+        if not holder.isdigit() or sys.platform == "win32":
+            return False
+        try:
+            os.kill(int(holder), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    def _release(self):
+        try:
+            os.remove(self.lock_path)
+        except OSError:
+            pass
+
+    def load(self):
+        """Current state (a fresh default state if the file does not exist yet)."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return new_state()
+        if "lut" not in state:
+            state = dict(new_state(), **state)
+        for key, value in DEFAULT_CONFIG.items():
+            state["config"].setdefault(key, value)
+        return state
+
+    def save(self, state):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=1)
+        os.replace(temp_path, self.path)
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Yield the state dict; it is written back when the block exits normally."""
+        self._acquire()
+        try:
+            state = self.load()
+            yield state
+            self.save(state)
+        finally:
+            self._release()
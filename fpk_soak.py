@@ -0,0 +1,320 @@
+"""
+Soak mode - loop a preset for hours, riding out device disconnects
+
+    python fpk_soak.py --preset custom_12 --duration 28800 --out soak.json
+
+Each iteration runs the preset through FpkClient.start_preset. When a step
+fails because the device or its shell went away (timeout, no device,
+offline, shell died), the preset suspends instead of letting every
+remaining step time out: the run pauses until the device is back,
+redeploys mfl_total.sh if the device lost it, re-applies the signal state
+and resumes the iteration from its last confirmed step.
+
+Progress, failures, disconnects and a bounded series of host memory /
+process counts are kept. Nothing grows with the number of iterations:
+per-step results live in the client's bounded ledger, the run only keeps
+counters and the last few failure messages.
+"""
+
+import argparse
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+from fpk_client import DEFAULT_DEVICE_ID, PRESETS, FpkClient
+from fpk_metrics import REGISTRY
+from process_manager import PROCESSES
+from rate_limit import RateLimiter, parse_dpid_limit, parse_limit
+
+# Give up waiting for the device after this long (seconds, None = until the run ends)
+RECONNECT_TIMEOUT = None
+
+# Resource samples kept (one per iteration, at most every SAMPLE_SECONDS)
+MAX_SAMPLES = 2000
+SAMPLE_SECONDS = 30.0
+
+# Failure messages kept for the report
+MAX_FAILURE_DETAILS = 50
+
+
+def process_rss_kb():
+    """Resident memory of this process in kB (None if the platform offers no cheap way)."""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class _Counters(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+            counters = _Counters()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize // 1024
+        except (AttributeError, OSError):
+            pass
+        return None
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SoakRun:
+    """Loops a preset (name from PRESETS or a step list) for a duration and/or iteration count.
+
+    on_progress(dict) is called from the soak thread after every iteration.
+    """
+
+    def __init__(self, client, preset, duration=None, iterations=None, reconnect_timeout=RECONNECT_TIMEOUT,
+                 log=None, on_progress=None):
+        if duration is None and iterations is None:
+            raise ValueError("Give a duration and/or an iteration count")
+        if isinstance(preset, str) and preset not in PRESETS:
+            raise ValueError(f"Unknown preset: {preset} (valid: {', '.join(PRESETS)})")
+        self.client = client
+        self.preset = preset
+        self.preset_name = preset if isinstance(preset, str) else "custom"
+        self.duration = duration
+        self.iterations = iterations
+        self.reconnect_timeout = reconnect_timeout
+        self.log = log or (lambda message: None)
+        self.on_progress = on_progress
+        self.state = "idle"  # idle / running / paused / done / stopped / gave_up
+        self.completed = 0
+        self.clean = 0  # iterations without any failed step
+        self.steps_ok = 0
+        self.steps_failed = 0
+        self.errors = collections.Counter()
+        self.failure_details = collections.deque(maxlen=MAX_FAILURE_DETAILS)
+        self.disconnects = 0
+        self.redeploys = 0
+        self.downtime = 0.0
+        self.samples = collections.deque(maxlen=MAX_SAMPLES)
+        self.started_at = None
+        self.finished_at = None
+        self._stop = threading.Event()
+        self._run = None  # PresetRun in flight
+        self._thread = None
+        self._last_sample = 0.0
+
+    def start(self):
+        """Run in a background thread."""
+        self._thread = threading.Thread(target=self.run, name="soak", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Finish after cancelling the iteration in flight."""
+        self._stop.set()
+        run = self._run
+        if run is not None:
+            run.cancel()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return self.state in ("running", "paused")
+
+    def _time_left(self):
+        if self.duration is None:
+            return True
+        return time.time() - self.started_at < self.duration
+
+    def run(self):
+        """Loop until the duration/iteration limit or stop(); returns the report dict."""
+        self.started_at = time.time()
+        self.state = "running"
+        self._sample(force=True)
+        self.log(f"[SOAK] Started: {self.preset_name}"
+                 + (f" for {self.duration:g}s" if self.duration else "")
+                 + (f", {self.iterations} iterations" if self.iterations else ""))
+        while not self._stop.is_set() and self._time_left():
+            if self.iterations is not None and self.completed >= self.iterations:
+                break
+            if not self._iteration() and not self._stop.is_set():
+                self.log("[SOAK] Device did not come back; stopping")
+                self.state = "gave_up"
+                break
+            self._sample()
+            if self.on_progress:
+                self.on_progress(self.progress())
+        if self.state != "gave_up":
+            self.state = "stopped" if self._stop.is_set() else "done"
+        self.finished_at = time.time()
+        self._sample(force=True)
+        self.log(f"[SOAK] {self.state}: {self.completed} iterations, {self.steps_failed} failed steps, "
+                 f"{self.disconnects} disconnects")
+        return self.report()
+
+    def _resume_timeout(self):
+        timeout = self.reconnect_timeout
+        if self.duration is not None:
+            remaining = max(0.0, self.duration - (time.time() - self.started_at))
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def _iteration(self):
+        """Run the preset once; False if it was abandoned because the device never came back."""
+
+        def on_result(result):
+            if result.ok:
+                self.steps_ok += 1
+                return
+            self.steps_failed += 1
+            self.errors[result.error_class] += 1
+            self.failure_details.append(
+                f"{time.strftime('%H:%M:%S')} #{self.completed + 1} {result.name}={result.value} "
+                f"{result.error_class}: {(result.error or result.stderr or result.stdout).strip()[:120]}")
+
+        def on_state(run):
+            if run.state == "suspended":
+                self.disconnects += 1
+                self.state = "paused"
+                self.log(f"[SOAK] Device lost in iteration {self.completed + 1} at step "
+                         f"{run.checkpoint}/{run.total_steps}; waiting for it to come back...")
+            elif run.state == "running":
+                self.state = "running"
+                self.log(f"[SOAK] Device back; resuming from step {run.checkpoint} "
+                         f"(re-applied {run.reapplied} signals so far)")
+
+        run = self._run = self.client.start_preset(self.preset, on_result=on_result,
+                                                   resume_timeout=self._resume_timeout(), on_state=on_state)
+        if self._stop.is_set():
+            run.cancel()
+        run.wait()
+        self._run = None
+        self.redeploys += run.redeploys
+        self.downtime += run.downtime
+        if not run.cancelled and run.state != "abandoned":
+            self.completed += 1
+            if run.failures == 0:
+                self.clean += 1
+        REGISTRY.inc("soak_iterations_total", result="ok" if run.failures == 0 else "failed")
+        return run.state != "abandoned"
+
+    def _sample(self, force=False):
+        now = time.time()
+        if not force and now - self._last_sample < SAMPLE_SECONDS:
+            return
+        self._last_sample = now
+        self.samples.append({
+            "t": round(now, 3),
+            "iterations": self.completed,
+            "rss_kb": process_rss_kb(),
+            "threads": threading.active_count(),
+            "adb_live": PROCESSES.counts()["live"],
+            "adb_leaked": PROCESSES.counts()["leaked"],
+            "ledger_events": len(self.client.ledger),
+        })
+
+    def progress(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        latest = self.samples[-1] if self.samples else {}
+        return {
+            "state": self.state,
+            "preset": self.preset_name,
+            "elapsed": round(elapsed, 1),
+            "iterations": self.completed,
+            "clean_iterations": self.clean,
+            "steps_ok": self.steps_ok,
+            "steps_failed": self.steps_failed,
+            "errors": dict(self.errors),
+            "disconnects": self.disconnects,
+            "redeploys": self.redeploys,
+            "downtime": round(self.downtime, 1),
+            "rss_kb": latest.get("rss_kb"),
+            "threads": latest.get("threads"),
+        }
+
+    def report(self):
+        report = self.progress()
+        report.update({
+            "device_id": self.client.device_id,
+            "duration": self.duration,
+            "target_iterations": self.iterations,
+            "failure_details": list(self.failure_details),
+            "samples": list(self.samples),
+        })
+        return report
+
+
+REGISTRY.describe("soak_iterations_total", "counter", "Soak loop iterations by outcome")
+
+
+def format_progress(progress):
+    text = (f"[SOAK] {progress['state']} {progress['elapsed']:.0f}s: {progress['iterations']} iterations "
+            f"({progress['clean_iterations']} clean), {progress['steps_failed']} failed steps, "
+            f"{progress['disconnects']} disconnects")
+    if progress.get("rss_kb"):
+        text += f", {progress['rss_kb'] // 1024} MB RSS"
+    return text
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="FPK unattended soak test")
+    parser.add_argument("--preset", default="custom_12", choices=list(PRESETS), help="Preset to loop")
+    parser.add_argument("--duration", type=float, default=None, help="Run time in seconds")
+    parser.add_argument("--iterations", type=int, default=None, help="Stop after this many iterations")
+    parser.add_argument("--reconnect-timeout", type=float, default=RECONNECT_TIMEOUT,
+                        help="Seconds to wait for a lost device (default: until the run ends)")
+    parser.add_argument("--rate-limit", type=parse_limit, default=None, metavar="RATE[/BURST]",
+                        help="Device write limit in writes per second (default: unlimited)")
+    parser.add_argument("--dpid-limit", type=parse_dpid_limit, action="append", default=[],
+                        metavar="PATTERN=RATE[/BURST]", help="Write limit for a DPID or fnmatch group (repeatable)")
+    parser.add_argument("--device-id", default=DEFAULT_DEVICE_ID, help="adb serial of the target")
+    parser.add_argument("--adb-folder", default="", help="Folder containing adb1.exe (default: adb on PATH)")
+    parser.add_argument("--out", default="", help="Result file (default: soak_<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.duration is None and args.iterations is None:
+        print("[SOAK] Give --duration and/or --iterations", file=sys.stderr)
+        return 2
+    limiter = RateLimiter(args.rate_limit, dict(args.dpid_limit)) if args.rate_limit or args.dpid_limit else None
+    client = FpkClient(device_id=args.device_id, adb_folder=args.adb_folder, rate_limiter=limiter)
+    if not client.ensure_script(log=print):
+        print("[SOAK] Warning: could not deploy mfl_total.sh; the first iteration will wait for the device",
+              file=sys.stderr)
+
+    soak = SoakRun(client, args.preset, args.duration, args.iterations, args.reconnect_timeout, log=print)
+    last_print = [0.0]
+
+    def on_progress(progress):
+        if time.monotonic() - last_print[0] >= SAMPLE_SECONDS:
+            last_print[0] = time.monotonic()
+            print(format_progress(progress))
+
+    soak.on_progress = on_progress
+    try:
+        soak.start().wait()
+    except KeyboardInterrupt:
+        soak.stop()
+        soak.wait()
+    client.close()
+
+    out_path = args.out or f"soak_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(soak.report(), f, indent=1)
+    print(format_progress(soak.progress()))
+    print(f"[SOAK] Results written to {os.path.abspath(out_path)}")
+    return 0 if soak.state == "done" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
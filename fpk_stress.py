@@ -0,0 +1,311 @@
+"""
+Stress mode - sustained DPID write load against the device IPC path
+
+    python fpk_stress.py --rate 200 --duration 60 --concurrency 4 \\
+        --signal DP_ID_HMI_ZPM_ANZEIGEID=0,42490 --out stress.json
+
+A pacer thread releases batches of writes on a fixed schedule; worker
+threads send each batch with one adb shell invocation (FpkClient.execute_many,
+the fastest send path). When every worker is busy and the backlog is full,
+further writes are counted as skipped instead of queuing without bound, so
+"achieved" vs "target" shows where the device starts to lag.
+
+The result file holds the configuration, totals, latency percentiles, error
+classes and a per-second time series.
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from fpk_client import DEFAULT_DEVICE_ID, FpkClient, validate_signal
+from fpk_metrics import quantile
+
+# Writes per adb invocation
+DEFAULT_BATCH_SIZE = 10
+
+# Batches waiting per worker before the pacer starts skipping
+BACKLOG_PER_WORKER = 2
+
+# Width of one time-series bucket (seconds)
+BUCKET_SECONDS = 1.0
+
+LATENCY_QUANTILES = (0.5, 0.9, 0.99)
+
+# Samples kept for the run-wide and per-bucket percentiles (uniform reservoir beyond that)
+RESERVOIR_SIZE = 10000
+BUCKET_RESERVOIR_SIZE = 1000
+
+# Seconds to wait for the device before giving up (the run itself would record every write as offline)
+DEFAULT_READY_TIMEOUT = 30.0
+
+
+def parse_signal_spec(spec):
+    """"DPID=v1,v2,..." -> (DPID, [v1, v2, ...]); the values are written round-robin."""
+    name, sep, values = spec.partition("=")
+    name = name.strip()
+    values = [value.strip() for value in values.split(",") if value.strip()] if sep else ["0"]
+    for value in values:
+        validate_signal(name, value)
+    return name, values
+
+
+def signal_cycle(signals):
+    """Endless (DPID, value) sequence interleaving all DPIDs and their values."""
+    steps = []
+    longest = max(len(values) for _, values in signals)
+    for index in range(longest):
+        for name, values in signals:
+            steps.append((name, values[index % len(values)]))
+    return itertools.cycle(steps)
+
+
+class Reservoir:
+    """Uniform random sample of at most size values (Algorithm R), for percentiles of long runs."""
+
+    __slots__ = ("size", "seen", "values", "maximum", "_rng")
+
+    def __init__(self, size=RESERVOIR_SIZE, seed=0):
+        self.size = size
+        self.seen = 0
+        self.values = []
+        self.maximum = None
+        self._rng = random.Random(seed)
+
+    def add(self, value):
+        self.seen += 1
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            index = self._rng.randrange(self.seen)
+            if index < self.size:
+                self.values[index] = value
+
+    def sorted(self):
+        """The sample sorted, with the true maximum last."""
+        values = sorted(self.values)
+        if values:
+            values[-1] = self.maximum
+        return values
+
+
+class _Bucket:
+    __slots__ = ("sent", "ok", "errors", "skipped", "latencies")
+
+    def __init__(self):
+        self.sent = 0
+        self.ok = 0
+        self.errors = collections.Counter()
+        self.skipped = 0
+        self.latencies = Reservoir(BUCKET_RESERVOIR_SIZE)
+
+
+class StressRun:
+    """One stress run: pacing, workers and result collection."""
+
+    def __init__(self, client, signals, rate, duration, concurrency=1, batch_size=DEFAULT_BATCH_SIZE):
+        if rate <= 0 or duration <= 0 or concurrency < 1:
+            raise ValueError("rate, duration and concurrency must be positive")
+        self.client = client
+        self.signals = signals
+        self.rate = float(rate)
+        self.duration = float(duration)
+        self.concurrency = int(concurrency)
+        # Never batch more than one second of load at once
+        self.batch_size = max(1, min(int(batch_size), int(self.rate)))
+        self._batches = queue.Queue(maxsize=self.concurrency * BACKLOG_PER_WORKER)
+        self._lock = threading.Lock()
+        self._buckets = collections.defaultdict(_Bucket)
+        self._latencies = Reservoir()
+        self._lags = Reservoir()
+        self._errors = collections.Counter()
+        self._sent = 0
+        self._ok = 0
+        self._skipped = 0
+        self.started_at = None
+        self.finished_at = None
+
+    def _bucket(self, now):
+        return self._buckets[int((now - self.started_at) / BUCKET_SECONDS)]
+
+    def _pace(self):
+        """Release one batch every batch_size / rate seconds until the duration is over."""
+        steps = signal_cycle(self.signals)
+        interval = self.batch_size / self.rate
+        deadline = self.started_at + self.duration
+        due = self.started_at
+        while due < deadline:
+            now = time.perf_counter()
+            if now < due:
+                time.sleep(due - now)
+            batch = [next(steps) for _ in range(self.batch_size)]
+            try:
+                self._batches.put_nowait((due, batch))
+            except queue.Full:
+                with self._lock:
+                    self._skipped += len(batch)
+                    self._bucket(due).skipped += len(batch)
+            due += interval
+        for _ in range(self.concurrency):
+            self._batches.put(None)
+
+    def _work(self):
+        while True:
+            item = self._batches.get()
+            if item is None:
+                return
+            due, batch = item
+            started = time.perf_counter()
+            results = self.client.execute_many(batch)
+            finished = time.perf_counter()
+            latency = finished - started
+            with self._lock:
+                bucket = self._bucket(finished)
+                self._lags.add(started - due)
+                for result in results:
+                    self._sent += 1
+                    bucket.sent += 1
+                    if result.ok:
+                        self._ok += 1
+                        bucket.ok += 1
+                        self._latencies.add(latency)
+                        bucket.latencies.add(latency)
+                    else:
+                        self._errors[result.error_class] += 1
+                        bucket.errors[result.error_class] += 1
+
+    def run(self):
+        """Run the load and return the report dict."""
+        self.started_at = time.perf_counter()
+        workers = [
+            threading.Thread(target=self._work, name=f"stress-worker-{index}", daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        self._pace()
+        for worker in workers:
+            worker.join()
+        self.finished_at = time.perf_counter()
+        return self.report()
+
+    def report(self):
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        with self._lock:
+            latencies = self._latencies.sorted()
+            lags = self._lags.sorted()
+            series = []
+            for index in sorted(self._buckets):
+                bucket = self._buckets[index]
+                bucket_latencies = bucket.latencies.sorted()
+                series.append({
+                    "t": round(index * BUCKET_SECONDS, 3),
+                    "sent": bucket.sent,
+                    "ok": bucket.ok,
+                    "skipped": bucket.skipped,
+                    "errors": dict(bucket.errors),
+                    "latency_ms": _percentiles_ms(bucket_latencies),
+                })
+            return {
+                "config": {
+                    "device_id": self.client.device_id,
+                    "signals": [{"dpid": name, "values": values} for name, values in self.signals],
+                    "target_rate": self.rate,
+                    "duration": self.duration,
+                    "concurrency": self.concurrency,
+                    "batch_size": self.batch_size,
+                },
+                "elapsed": round(elapsed, 3),
+                "sent": self._sent,
+                "ok": self._ok,
+                "skipped": self._skipped,
+                "errors": dict(self._errors),
+                "achieved_rate": round(self._sent / elapsed, 2) if elapsed > 0 else 0.0,
+                "ok_rate": round(self._ok / elapsed, 2) if elapsed > 0 else 0.0,
+                "latency_ms": _percentiles_ms(latencies),
+                "schedule_lag_ms": _percentiles_ms(lags),
+                "series": series,
+            }
+
+
+def _percentiles_ms(sorted_seconds):
+    if not sorted_seconds:
+        return {}
+    values = {f"p{int(q * 100)}": round(quantile(sorted_seconds, q) * 1000.0, 3) for q in LATENCY_QUANTILES}
+    values["max"] = round(sorted_seconds[-1] * 1000.0, 3)
+    return values
+
+
+def format_summary(report):
+    lines = [
+        f"[STRESS] target {report['config']['target_rate']:g}/s, achieved {report['achieved_rate']:g}/s "
+        f"(ok {report['ok_rate']:g}/s) over {report['elapsed']:g}s",
+        f"[STRESS] sent {report['sent']}, ok {report['ok']}, skipped {report['skipped']}, errors {report['errors'] or 0}",
+    ]
+    if report["latency_ms"]:
+        latency = report["latency_ms"]
+        lines.append(f"[STRESS] latency ms p50 {latency['p50']} p90 {latency['p90']} p99 {latency['p99']} max {latency['max']}")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="FPK DPID stress test")
+    parser.add_argument("--signal", action="append", required=True, metavar="DPID=V1,V2",
+                        help="DPID and values to write round-robin (repeatable)")
+    parser.add_argument("--rate", type=float, default=50.0, help="Target writes per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Run time in seconds")
+    parser.add_argument("--concurrency", type=int, default=1, help="Parallel adb invocations")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Writes per adb invocation")
+    parser.add_argument("--device-id", default=DEFAULT_DEVICE_ID, help="adb serial of the target")
+    parser.add_argument("--adb-folder", default="", help="Folder containing adb1.exe (default: adb on PATH)")
+    parser.add_argument("--ready-timeout", type=float, default=DEFAULT_READY_TIMEOUT,
+                        help="Seconds to wait for the device before aborting")
+    parser.add_argument("--out", default="", help="Result file (default: stress_<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        signals = [parse_signal_spec(spec) for spec in args.signal]
+    except ValueError as e:
+        print(f"[STRESS] {e}", file=sys.stderr)
+        return 2
+
+    client = FpkClient(device_id=args.device_id, adb_folder=args.adb_folder, log=print)
+    status = client.status()
+    if not status.ready:
+        print(f"[STRESS] Device not ready ({status.to_dict()}); waiting up to {args.ready_timeout:g}s",
+              file=sys.stderr)
+        if not client.wait_until_ready(args.ready_timeout):
+            print("[STRESS] Device still not ready; aborting", file=sys.stderr)
+            client.close()
+            return 1
+    if not client.ensure_script():
+        # Probes the shell too: without it execute_many never uses the stdin batch path
+        print("[STRESS] Warning: mfl_total.sh could not be deployed; batches use the slower fallback",
+              file=sys.stderr)
+
+    run = StressRun(client, signals, args.rate, args.duration, args.concurrency, args.batch_size)
+    report = run.run()
+    client.close()
+
+    out_path = args.out or f"stress_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(format_summary(report))
+    print(f"[STRESS] Results written to {os.path.abspath(out_path)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
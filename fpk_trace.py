@@ -0,0 +1,149 @@
+"""
+Tracing - opt-in span recording exported as Chrome trace event JSON
+
+    from fpk_trace import TRACER
+
+    TRACER.enable()
+    with TRACER.span("deploy", cat="deploy"):
+        ...
+    TRACER.save("fpk_trace.json")   # open in chrome://tracing or ui.perfetto.dev
+
+Synchronous work on one thread is recorded as complete ("X") events.
+Operations that hop threads (keypress -> queue -> adb -> Tk render) are
+recorded as async ("b"/"e") events sharing an operation id, so a viewer
+shows them as one track per operation.
+
+While disabled, span() returns a shared no-op context manager and the
+other recording calls return after one attribute check.
+"""
+
+import collections
+import itertools
+import json
+import os
+import threading
+import time
+
+# Events kept in memory (oldest are dropped beyond this)
+MAX_EVENTS = 500000
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.complete(self.name, self.start, time.perf_counter(), self.cat, **self.args)
+        return False
+
+
+class Tracer:
+    """Collects trace events in memory until save() writes them out."""
+
+    def __init__(self):
+        self.enabled = False
+        self._events = collections.deque(maxlen=MAX_EVENTS)
+        self._thread_names = {}
+        self._ids = itertools.count(1)
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def enable(self):
+        self._origin = time.perf_counter()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._events.clear()
+        self._thread_names.clear()
+
+    def _us(self, perf_time):
+        return round((perf_time - self._origin) * 1000000.0, 3)
+
+    def _tid(self):
+        thread = threading.current_thread()
+        tid = thread.ident
+        if tid not in self._thread_names:
+            self._thread_names[tid] = thread.name
+        return tid
+
+    def span(self, name, cat="fpk", **args):
+        """Context manager recording a complete event on the current thread."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def complete(self, name, start, end, cat="fpk", **args):
+        """Record a complete event from perf_counter() timestamps on the current thread."""
+        if not self.enabled:
+            return
+        self._events.append({
+            "name": name, "cat": cat, "ph": "X", "pid": self._pid, "tid": self._tid(),
+            "ts": self._us(start), "dur": round((end - start) * 1000000.0, 3), "args": args,
+        })
+
+    def instant(self, name, cat="fpk", **args):
+        if not self.enabled:
+            return
+        self._events.append({
+            "name": name, "cat": cat, "ph": "i", "s": "t", "pid": self._pid, "tid": self._tid(),
+            "ts": self._us(time.perf_counter()), "args": args,
+        })
+
+    def new_operation(self):
+        """Id for an operation that spans several threads (None while disabled)."""
+        if not self.enabled:
+            return None
+        return next(self._ids)
+
+    def async_span(self, name, start, end, op_id, cat="operation", **args):
+        """Record an async interval belonging to operation op_id."""
+        if not self.enabled or op_id is None:
+            return
+        common = {"name": name, "cat": cat, "id": op_id, "pid": self._pid, "tid": self._tid()}
+        self._events.append(dict(common, ph="b", ts=self._us(start), args=args))
+        self._events.append(dict(common, ph="e", ts=self._us(end)))
+
+    def to_json(self):
+        events = list(self._events)
+        for tid, thread_name in list(self._thread_names.items()):
+            events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid,
+                           "args": {"name": thread_name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path):
+        """Write the collected events as Chrome trace JSON; returns the number of events."""
+        data = self.to_json()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        return len(data["traceEvents"])
+
+
+# Shared tracer (disabled unless --trace / FPK_TRACE is given)
+TRACER = Tracer()
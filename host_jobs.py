@@ -0,0 +1,297 @@
+"""
+Host command jobs - streaming output, timeout and cancel/kill for arbitrary host commands
+"""
+
+import codecs
+import itertools
+import locale
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# Bytes read from a pipe per chunk
+READ_CHUNK_SIZE = 4096
+
+# Seconds to wait after a polite terminate before killing the process tree
+CANCEL_GRACE_SECONDS = 2.0
+
+
+def default_output_encoding():
+    """Encoding used by host console programs (cp949 on Korean Windows, utf-8 on most Linux)."""
+    return locale.getpreferredencoding(False) or 'utf-8'
+
+
+def _taskkill_tree(process):
+    # taskkill /T also takes down children started by cmd.exe; it finds them
+    # through the live parent, so it has to run before the wrapper is gone
+    subprocess.run(
+        ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+    )
+
+
+def _signal_group(process, sig):
+    # The child was started in its own session, so its pid is the group id.
+    # Until the leader is reaped (returncode set) its pid - and with it the
+    # group id - cannot be reused, even if it already exited; members that
+    # outlive the leader are still reached. After the reap it could name an
+    # unrelated group, so nothing is sent.
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, sig)
+    except (OSError, ProcessLookupError):
+        pass
+
+
+def kill_process_tree(process):
+    """Kill a process and all of its children (nothing once the process has been reaped)."""
+    if sys.platform != "win32":
+        _signal_group(process, signal.SIGKILL)
+        return
+    try:
+        if process.poll() is None:
+            _taskkill_tree(process)
+    except OSError:
+        pass
+    if process.poll() is None:
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+
+def terminate_process_tree(process):
+    """Ask a process and its children to stop (on Windows console trees can only be killed)."""
+    if sys.platform != "win32":
+        _signal_group(process, signal.SIGTERM)
+        return
+    try:
+        # terminate() would only end the cmd.exe wrapper and orphan its children
+        if process.poll() is None:
+            _taskkill_tree(process)
+    except OSError:
+        pass
+
+
+class HostJob:
+    """One running (or finished) host command."""
+
+    def __init__(self, job_id, command, cwd, timeout):
+        self.job_id = job_id
+        self.command = command
+        self.cwd = cwd
+        self.timeout = timeout
+        self.process = None
+        self.state = "starting"  # starting, running, done, cancelled, killed, timeout, error
+        self.returncode = None
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.output_chars = 0
+        self._finished = threading.Event()
+        # Held while signalling the process group and while reaping the leader,
+        # so a signal never goes to a group id that was freed by the reap
+        self._reap_lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.state in ("starting", "running")
+
+    @property
+    def elapsed(self):
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return end - self.started_at
+
+    def wait(self, timeout=None):
+        """Block until the job has finished (True) or the wait times out (False)."""
+        return self._finished.wait(timeout)
+
+    def describe(self):
+        """One-line summary for job lists."""
+        return f"#{self.job_id} [{self.state}] {self.elapsed:.1f}s  {self.command}"
+
+
+class HostJobManager:
+    """Runs host commands as cancellable jobs and streams their output incrementally.
+
+    on_output(job, stream_name, text) is called from reader threads for every
+    decoded chunk; on_exit(job) is called once when the job ends. Callbacks
+    must not block (the GUI hands them to the Tk loop).
+    """
+
+    def __init__(self, encoding=None, default_timeout=None, on_output=None, on_exit=None):
+        self.encoding = encoding or default_output_encoding()
+        self.default_timeout = default_timeout
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, command, cwd=None, timeout=None):
+        """Start a host command (shell syntax, as typed by the user) and return its HostJob."""
+        if timeout is None:
+            timeout = self.default_timeout
+        job = HostJob(next(self._ids), command, cwd, timeout)
+        with self._lock:
+            self._jobs[job.job_id] = job
+
+        popen_kwargs = {}
+        if sys.platform == "win32":
+            popen_kwargs["creationflags"] = getattr(subprocess, "CREATE_NEW_PROCESS_GROUP", 0)
+        else:
+            popen_kwargs["start_new_session"] = True
+
+        try:
+            job.process = subprocess.Popen(
+                command,
+                shell=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                **popen_kwargs
+            )
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, "error")
+            return job
+
+        job.state = "running"
+        readers = [
+            threading.Thread(target=self._read_stream, args=(job, job.process.stdout, "stdout"), daemon=True),
+            threading.Thread(target=self._read_stream, args=(job, job.process.stderr, "stderr"), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        threading.Thread(target=self._watch, args=(job, readers), daemon=True).start()
+        return job
+
+    def _read_stream(self, job, stream, stream_name):
+        """Decode a pipe chunk by chunk (multi-byte characters may span chunks)."""
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        try:
+            while True:
+                chunk = stream.read1(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self._emit(job, stream_name, decoder.decode(chunk))
+            self._emit(job, stream_name, decoder.decode(b"", final=True))
+        except (OSError, ValueError):
+            pass
+        finally:
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def _emit(self, job, stream_name, text):
+        if not text:
+            return
+        job.output_chars += len(text)
+        if self.on_output:
+            try:
+                self.on_output(job, stream_name, text)
+            except Exception:
+                pass
+
+    def _watch(self, job, readers):
+        """Enforce the timeout, then reap the process and report its exit."""
+        if sys.platform == "win32":
+            try:
+                job.process.wait(timeout=job.timeout)
+            except subprocess.TimeoutExpired:
+                self._time_out(job)
+                job.process.wait()
+        else:
+            timer = None
+            if job.timeout is not None:
+                timer = threading.Timer(job.timeout, self._time_out, (job,))
+                timer.daemon = True
+                timer.start()
+            try:
+                # Wait for the leader to exit without reaping it: its zombie keeps the group id reserved
+                os.waitid(os.P_PID, job.process.pid, os.WEXITED | os.WNOWAIT)
+            except ChildProcessError:
+                pass
+            if timer is not None:
+                timer.cancel()
+            with job._reap_lock:
+                if job.state != "running":
+                    # Cancelled, killed or timed out: members that outlived the leader go too
+                    kill_process_tree(job.process)
+                job.process.wait()
+
+        for reader in readers:
+            reader.join(timeout=1.0)
+
+        job.returncode = job.process.returncode
+        self._finish(job, "done" if job.state == "running" else job.state)
+
+    def _time_out(self, job):
+        with job._reap_lock:
+            if job.state == "running":
+                job.state = "timeout"
+            kill_process_tree(job.process)
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished_at = time.time()
+        with self._lock:
+            self._jobs.pop(job.job_id, None)
+        job._finished.set()
+        if self.on_exit:
+            try:
+                self.on_exit(job)
+            except Exception:
+                pass
+
+    def cancel(self, job_id):
+        """Terminate a job politely; kill its process tree if it does not stop in time."""
+        job = self.get(job_id)
+        if job is None or not job.running or job.process is None:
+            return False
+        job.state = "cancelled"
+        with job._reap_lock:
+            terminate_process_tree(job.process)
+
+        def escalate():
+            # Once the leader exits, _watch kills the rest of the group before reaping it
+            if job.wait(CANCEL_GRACE_SECONDS):
+                return
+            job.state = "killed"
+            with job._reap_lock:
+                kill_process_tree(job.process)
+
+        threading.Thread(target=escalate, daemon=True).start()
+        return True
+
+    def kill(self, job_id):
+        """Kill a job's process tree immediately."""
+        job = self.get(job_id)
+        if job is None or not job.running or job.process is None:
+            return False
+        job.state = "killed"
+        with job._reap_lock:
+            kill_process_tree(job.process)
+        return True
+
+    def kill_all(self):
+        """Kill every running job (used on application exit)."""
+        for job in self.running_jobs():
+            self.kill(job.job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def running_jobs(self):
+        """Jobs that have not finished yet, oldest first."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.job_id)
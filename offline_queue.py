@@ -0,0 +1,181 @@
+"""
+Offline command queue - holds operator input while the device is disconnected
+
+Writes to the same DPID collapse to the latest value (the collapsed entry
+moves to the position of the newest write); repeated presses of the same
+button merge into one press with a count. Held commands expire after
+max_age seconds (a timer drops them even if nothing else touches the
+queue, so waiters are not blocked past max_age), and the oldest is
+dropped once max_size commands are held.
+take() hands the survivors over in order so the client can send them as one
+batch after the shell works again.
+"""
+
+import collections
+import threading
+import time
+
+from command_queue import QueuedCommand
+from fpk_metrics import REGISTRY
+
+# Held commands older than this are dropped (seconds)
+OFFLINE_MAX_AGE = 60.0
+
+# Commands held at most; the oldest is dropped beyond this
+OFFLINE_MAX_SIZE = 200
+
+
+class HeldCommand:
+    """One held write or press and the queue entries it answers.
+
+    superseded holds the entries of earlier writes to the same DPID; they
+    finish with the result of this (latest) write.
+    """
+
+    __slots__ = ("kind", "name", "value", "device_id", "entry", "superseded", "held_at")
+
+    def __init__(self, kind, name, value, device_id, entry):
+        self.kind = kind  # "signal" or "button"
+        self.name = name
+        self.value = value  # DPID value or press count
+        self.device_id = device_id
+        self.entry = entry
+        self.superseded = []
+        self.held_at = time.monotonic()
+
+    @property
+    def entries(self):
+        return [self.entry] + self.superseded
+
+
+class OfflineQueue:
+    """Per-device holding area used while the device is disconnected.
+
+    on_drop(held, reason) is called for every held command that is dropped
+    (expired, overflow, discarded); it must finish the entries.
+    """
+
+    def __init__(self, on_drop, max_age=OFFLINE_MAX_AGE, max_size=OFFLINE_MAX_SIZE, max_burst=50):
+        self.on_drop = on_drop
+        self.max_age = max_age
+        self.max_size = max(1, int(max_size))
+        self.max_burst = max_burst
+        self._held = collections.OrderedDict()  # key -> HeldCommand, oldest first
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._timer = None
+
+    @property
+    def depth(self):
+        with self._lock:
+            return len(self._held)
+
+    def hold_signal(self, device_id, signal_name, signal_value, on_done=None, trace_id=None):
+        """Hold a DPID write; returns its queue entry (finished when flushed or dropped)."""
+        entry = QueuedCommand(None, on_done, label=signal_name, trace_id=trace_id)
+        key = ("signal", device_id, signal_name)
+        dropped = []
+        with self._lock:
+            previous = self._held.pop(key, None)
+            held = HeldCommand("signal", signal_name, signal_value, device_id, entry)
+            if previous is not None:
+                held.superseded = previous.entries
+                REGISTRY.inc("offline_commands_total", outcome="superseded")
+            self._held[key] = held
+            dropped.extend(self._trim())
+            self._schedule_expiry()
+        REGISTRY.inc("offline_commands_total", outcome="held")
+        self._drop(dropped)
+        return entry
+
+    def hold_press(self, device_id, button_name, count=1, on_done=None, trace_id=None):
+        """Hold an MFL press; merges into the newest held command if it is the same button.
+
+        A merged press returns the held entry; its on_done is still called when that entry finishes.
+        """
+        dropped = []
+        with self._lock:
+            if self._held:
+                tail = next(reversed(self._held.values()))
+                if (tail.kind == "button" and tail.name == button_name and tail.device_id == device_id
+                        and tail.value + count <= self.max_burst):
+                    tail.value += count
+                    tail.entry.count = tail.value
+                    if on_done is not None:
+                        tail.entry.add_done_callback(lambda entry: on_done(entry, entry.result, entry.error))
+                    REGISTRY.inc("offline_commands_total", outcome="held")
+                    return tail.entry
+            entry = QueuedCommand(None, on_done, coalesce_key=("mfl", button_name), count=count,
+                                  label=button_name, trace_id=trace_id)
+            self._seq += 1
+            self._held[("button", device_id, self._seq)] = HeldCommand("button", button_name, count, device_id, entry)
+            dropped.extend(self._trim())
+            self._schedule_expiry()
+        REGISTRY.inc("offline_commands_total", outcome="held")
+        self._drop(dropped)
+        return entry
+
+    def take(self):
+        """Remove and return the held commands (oldest first), dropping expired ones."""
+        with self._lock:
+            dropped = self._expired()
+            held = list(self._held.values())
+            self._held.clear()
+        self._drop(dropped)
+        return held
+
+    def discard(self, reason="discarded"):
+        """Drop every held command."""
+        with self._lock:
+            dropped = [(held, reason) for held in self._held.values()]
+            self._held.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self._drop(dropped)
+
+    def expire(self):
+        """Drop the commands held longer than max_age; returns how many were dropped."""
+        with self._lock:
+            dropped = self._expired()
+            self._timer = None
+            self._schedule_expiry()
+        self._drop(dropped)
+        return len(dropped)
+
+    def _schedule_expiry(self):
+        # One timer at a time, due when the oldest held command expires (call under _lock)
+        if self.max_age is None or self._timer is not None or not self._held:
+            return
+        oldest = next(iter(self._held.values()))
+        delay = max(0.0, oldest.held_at + self.max_age - time.monotonic())
+        self._timer = threading.Timer(delay + 0.01, self.expire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _expired(self):
+        if self.max_age is None:
+            return []
+        cutoff = time.monotonic() - self.max_age
+        dropped = []
+        for key, held in list(self._held.items()):
+            if held.held_at >= cutoff:
+                break  # Ordered by hold time
+            dropped.append((self._held.pop(key), "expired"))
+        return dropped
+
+    def _trim(self):
+        dropped = self._expired()
+        while len(self._held) > self.max_size:
+            dropped.append((self._held.popitem(last=False)[1], "overflow"))
+        return dropped
+
+    def _drop(self, dropped):
+        # Outside the lock: on_drop runs the entries' callbacks
+        for held, reason in dropped:
+            REGISTRY.inc("offline_commands_total", outcome=reason)
+            self.on_drop(held, reason)
+
+
+REGISTRY.describe("offline_commands_total", "counter",
+                  "Commands held while disconnected, by outcome (held/superseded/flushed/expired/overflow/...)")
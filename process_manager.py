@@ -0,0 +1,166 @@
+"""
+Process lifecycle manager - bounded, tracked adb child processes that are killed and reaped on timeout
+"""
+
+import subprocess
+import sys
+import threading
+import time
+
+from fpk_metrics import REGISTRY
+from fpk_trace import TRACER
+from host_jobs import kill_process_tree
+
+# Upper bound for adb processes running at the same time
+MAX_CHILDREN = 8
+
+# Seconds to wait for a killed process to exit and release its pipes
+REAP_GRACE_SECONDS = 2.0
+
+# How often processes that survived a kill are polled again
+LEAK_POLL_SECONDS = 5.0
+
+# Own process group/session, so a timeout can take down the whole tree
+if sys.platform == "win32":
+    GROUP_FLAGS = getattr(subprocess, "CREATE_NEW_PROCESS_GROUP", 0)
+    SESSION_KWARGS = {}
+else:
+    GROUP_FLAGS = 0
+    SESSION_KWARGS = {"start_new_session": True}
+
+
+class ProcessManager:
+    """Starts child processes under a concurrency cap and guarantees they are reaped.
+
+    run() behaves like Popen + communicate(timeout=...), except that on
+    timeout the child's process tree is killed and waited for before
+    TimeoutExpired is raised. Children that still do not exit are kept on a
+    leak list and polled in the background until they go away.
+    """
+
+    def __init__(self, max_children=MAX_CHILDREN, reap_grace=REAP_GRACE_SECONDS):
+        self.max_children = max_children
+        self.reap_grace = reap_grace
+        self._slots = threading.BoundedSemaphore(max_children)
+        self._lock = threading.Lock()
+        self._live = set()
+        self._leaked = set()
+        self._reaper = None
+        self.spawned = 0
+        self.killed = 0
+        self.reaped_late = 0
+
+    def counts(self):
+        """Snapshot of process counts: live, leaked, spawned, killed, reaped_late."""
+        with self._lock:
+            return {
+                "live": len(self._live),
+                "leaked": len(self._leaked),
+                "spawned": self.spawned,
+                "killed": self.killed,
+                "reaped_late": self.reaped_late,
+            }
+
+    def run(self, argv, timeout=None, input=None, creationflags=0, **popen_kwargs):
+        """Run argv to completion and return (process, stdout, stderr).
+
+        Blocks while max_children processes are already running.
+        """
+        with self._slots:
+            with TRACER.span("spawn", cat="adb"):
+                process = subprocess.Popen(
+                    list(argv),
+                    creationflags=creationflags | GROUP_FLAGS,
+                    **SESSION_KWARGS,
+                    **popen_kwargs,
+                )
+            with self._lock:
+                self._live.add(process)
+                self.spawned += 1
+            try:
+                stdout, stderr = process.communicate(input=input, timeout=timeout)
+            except BaseException:
+                # TimeoutExpired, KeyboardInterrupt, ...: never leave the child running
+                self._kill(process)
+                raise
+            finally:
+                with self._lock:
+                    self._live.discard(process)
+            return process, stdout, stderr
+
+    def spawn(self, argv, creationflags=0, **popen_kwargs):
+        """Start a long-lived child (persistent shell) and return the Popen.
+
+        It does not take one of the max_children slots, but is counted as live
+        until close() kills and reaps it.
+        """
+        with TRACER.span("spawn", cat="adb"):
+            process = subprocess.Popen(
+                list(argv),
+                creationflags=creationflags | GROUP_FLAGS,
+                **SESSION_KWARGS,
+                **popen_kwargs,
+            )
+        with self._lock:
+            self._live.add(process)
+            self.spawned += 1
+        return process
+
+    def close(self, process):
+        """Stop a child started with spawn(): kill it if still running, then reap it."""
+        with self._lock:
+            self._live.discard(process)
+        if process.poll() is None:
+            kill_process_tree(process)
+        try:
+            # The owner may still be reading stdout, so only wait here
+            process.wait(timeout=self.reap_grace)
+        except subprocess.TimeoutExpired:
+            if process.poll() is None:
+                self._add_leak(process)
+
+    def _kill(self, process):
+        """Kill the process tree and reap it (or hand it to the leak reaper)."""
+        kill_process_tree(process)
+        with self._lock:
+            self.killed += 1
+        REGISTRY.inc("adb_children_killed_total")
+        try:
+            # communicate() drains the pipes and waits, so the child is reaped
+            process.communicate(timeout=self.reap_grace)
+        except (subprocess.TimeoutExpired, OSError, ValueError):
+            if process.poll() is None:
+                self._add_leak(process)
+
+    def _add_leak(self, process):
+        with self._lock:
+            self._leaked.add(process)
+            if self._reaper is None or not self._reaper.is_alive():
+                self._reaper = threading.Thread(target=self._reap_leaks, name="adb-reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap_leaks(self):
+        while True:
+            time.sleep(LEAK_POLL_SECONDS)
+            with self._lock:
+                leaked = list(self._leaked)
+            for process in leaked:
+                kill_process_tree(process)
+                if process.poll() is not None:
+                    with self._lock:
+                        self._leaked.discard(process)
+                        self.reaped_late += 1
+            with self._lock:
+                if not self._leaked:
+                    self._reaper = None
+                    return
+
+
+# Shared manager for every adb invocation
+PROCESSES = ProcessManager()
+
+REGISTRY.describe("adb_children_killed_total", "counter", "adb processes killed after a timeout")
+REGISTRY.gauge_callback("adb_children_live", lambda: PROCESSES.counts()["live"],
+                        "adb processes currently running")
+REGISTRY.gauge_callback("adb_children_leaked", lambda: PROCESSES.counts()["leaked"],
+                        "adb processes that survived a kill and are not reaped yet")
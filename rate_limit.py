@@ -0,0 +1,209 @@
+"""
+Token-bucket rate limits for device writes - per device and per DPID or DPID group
+
+    limiter = RateLimiter(device=(250, 100), dpids={"DP_ID_HMI_ZPM_*": (20, 5)})
+    limiter.acquire(device_id, ["DP_ID_HMI_ZPM_ANZEIGEID"] * 3)  # blocks until the writes fit
+
+A bucket holds up to burst tokens and refills at rate tokens per second.
+Every IPC write takes one token from its device's bucket and one from the
+bucket of the first DPID limit it matches (an exact name or an fnmatch
+pattern; all DPIDs matching a pattern share its bucket). Writes that do not
+fit wait instead of being dropped. The wait is reserved up front (the
+bucket goes into debt), so concurrent senders are served in arrival order
+and a waiting batch is not starved by single writes.
+"""
+
+import fnmatch
+import threading
+import time
+
+from fpk_metrics import REGISTRY
+
+
+def parse_limit(text):
+    """"RATE" or "RATE/BURST" (writes per second, bucket size) -> (rate, burst)."""
+    rate_text, _, burst_text = text.partition("/")
+    rate = float(rate_text)
+    burst = float(burst_text) if burst_text else max(1.0, rate)
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"Invalid rate limit: {text}")
+    return rate, burst
+
+
+def parse_dpid_limit(text):
+    """"PATTERN=RATE[/BURST]" -> (pattern, (rate, burst))."""
+    pattern, sep, limit = text.partition("=")
+    if not sep or not pattern:
+        raise ValueError(f"Expected PATTERN=RATE[/BURST], got {text}")
+    return pattern, parse_limit(limit)
+
+
+class TokenBucket:
+    """burst tokens at most, refilled at rate per second; tokens go negative while writes are owed."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "writes", "waits", "waited")
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.writes = 0
+        self.waits = 0  # reservations that had to wait
+        self.waited = 0.0  # seconds waited in total
+
+    def level(self, now):
+        """Tokens available at now (negative = owed to writes already admitted)."""
+        # now can predate updated when the bucket was created after the caller read the clock
+        return min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+
+    def reserve(self, count, now):
+        """Take count tokens, going into debt if short; returns the seconds until they are covered."""
+        self.tokens = self.level(now) - count
+        self.updated = now
+        self.writes += count
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    """Write limits shared by everything that sends to the devices.
+
+    device: (rate, burst) applied to each device separately, None = unlimited.
+    dpids: {DPID name or pattern: (rate, burst)}; patterns are tried in
+        order and a DPID counts against the first one it matches.
+    """
+
+    def __init__(self, device=None, dpids=None):
+        self.device_limit = device
+        self.dpid_limits = list((dpids or {}).items())
+        self.waiting = 0  # senders blocked right now
+        self._device_buckets = {}  # device id -> TokenBucket
+        self._group_buckets = {}  # pattern -> TokenBucket
+        self._groups = {}  # DPID -> pattern (None = not limited), memoised
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.device_limit is not None or bool(self.dpid_limits)
+
+    def split(self, names, size):
+        """Cut writes to names into (start, end) runs of at most size writes that fit every burst."""
+        bursts = dict(self.dpid_limits)
+        if self.device_limit is not None:
+            size = min(size, max(1, int(self.device_limit[1])))
+        runs, start, counts = [], 0, {}
+        for index, name in enumerate(names):
+            pattern = self.group_of(name)
+            if index - start >= size or (pattern is not None and counts.get(pattern, 0) >= bursts[pattern][1]):
+                runs.append((start, index))
+                start, counts = index, {}
+            if pattern is not None:
+                counts[pattern] = counts.get(pattern, 0) + 1
+        if start < len(names):
+            runs.append((start, len(names)))
+        return runs
+
+    def max_repeats(self, names):
+        """How often the writes to names fit into one burst (at least 1); None if unlimited."""
+        fits = []
+        if self.device_limit is not None:
+            fits.append(int(self.device_limit[1]) // max(1, len(names)))
+        bursts = dict(self.dpid_limits)
+        counts = {}
+        for name in names:
+            pattern = self.group_of(name)
+            if pattern is not None:
+                counts[pattern] = counts.get(pattern, 0) + 1
+        fits.extend(int(bursts[pattern][1]) // count for pattern, count in counts.items())
+        return max(1, min(fits)) if fits else None
+
+    def group_of(self, name):
+        """The DPID limit pattern name counts against (None if it is not limited)."""
+        if name not in self._groups:
+            self._groups[name] = next((pattern for pattern, _ in self.dpid_limits
+                                       if pattern == name or fnmatch.fnmatchcase(name, pattern)), None)
+        return self._groups[name]
+
+    def _buckets(self, device_id, names):
+        """(bucket, writes) pairs for writes to names (call under the lock)."""
+        wanted = []
+        if self.device_limit is not None:
+            bucket = self._device_buckets.get(device_id)
+            if bucket is None:
+                bucket = self._device_buckets[device_id] = TokenBucket(*self.device_limit)
+            wanted.append((bucket, len(names)))
+        counts = {}
+        for name in names:
+            pattern = self.group_of(name)
+            if pattern is not None:
+                counts[pattern] = counts.get(pattern, 0) + 1
+        for pattern, count in counts.items():
+            bucket = self._group_buckets.get(pattern)
+            if bucket is None:
+                limit = dict(self.dpid_limits)[pattern]
+                bucket = self._group_buckets[pattern] = TokenBucket(*limit)
+            wanted.append((bucket, count))
+        return wanted
+
+    def acquire(self, device_id, names):
+        """Block until writes to names (one entry per write) fit every limit; returns the seconds waited."""
+        if not self.enabled or not names:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            reserved = [(bucket, bucket.reserve(count, now)) for bucket, count in self._buckets(device_id, names)]
+            wait = max([delay for _, delay in reserved] or [0.0])
+            if wait > 0:
+                for bucket, delay in reserved:
+                    if delay > 0:
+                        bucket.waits += 1
+                        bucket.waited += delay
+                self.waiting += 1
+        if wait <= 0:
+            return 0.0
+        REGISTRY.inc("rate_limited_writes_total", len(names))
+        REGISTRY.inc("rate_limit_wait_seconds_total", wait)
+        try:
+            time.sleep(wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        return wait
+
+    def snapshot(self):
+        """Bucket states (device buckets first) as dicts for the stats view and /status."""
+        now = time.monotonic()
+        rows = []
+        with self._lock:
+            for scope, buckets in (("device", self._device_buckets), ("dpid", self._group_buckets)):
+                for key, bucket in buckets.items():
+                    level = bucket.level(now)
+                    rows.append({
+                        "scope": scope,
+                        "key": key,
+                        "rate": bucket.rate,
+                        "burst": bucket.burst,
+                        "tokens": round(max(0.0, level), 1),
+                        "owed": round(max(0.0, -level), 1),  # writes admitted but not yet covered
+                        "writes": bucket.writes,
+                        "waits": bucket.waits,
+                        "waited": round(bucket.waited, 3),
+                    })
+        return rows
+
+    def describe(self):
+        """One-line configuration summary."""
+        if not self.enabled:
+            return "No write rate limits"
+        parts = []
+        if self.device_limit is not None:
+            parts.append(f"device {self.device_limit[0]:g}/s (burst {self.device_limit[1]:g})")
+        parts.extend(f"{pattern} {rate:g}/s (burst {burst:g})" for pattern, (rate, burst) in self.dpid_limits)
+        text = "Limits: " + ", ".join(parts)
+        if self.waiting:
+            text += f"; {self.waiting} sender(s) waiting"
+        return text
+
+
+REGISTRY.describe("rate_limited_writes_total", "counter", "Device writes that waited for a rate-limit token")
+REGISTRY.describe("rate_limit_wait_seconds_total", "counter", "Seconds device writes waited for rate-limit tokens")
@@ -0,0 +1,38 @@
+"""
+Shared fixtures: a fresh fpk_sim device per test, reached through the fake adb on PATH
+"""
+
+import os
+import sys
+
+import pytest
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PACKAGE_ROOT not in sys.path:
+    sys.path.insert(0, PACKAGE_ROOT)
+
+from fpk_sim import Simulator, install_launchers  # noqa: E402
+
+
+@pytest.fixture
+def sim(tmp_path, monkeypatch):
+    """A connected simulated device with no latency; every adb call of the test goes to it."""
+    bin_dir = tmp_path / "bin"
+    install_launchers(str(bin_dir))
+    simulator = Simulator(str(tmp_path / "sim_state.json"))
+    simulator.reset(latency_ms=0.0, jitter_ms=0.0, ipc_latency_ms=0.0)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ.get("PATH", ""))
+    for key, value in simulator.env.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.chdir(tmp_path)
+    return simulator
+
+
+@pytest.fixture
+def client(sim, tmp_path):
+    """An FpkClient on the simulated device (closed after the test)."""
+    from fpk_client import FpkClient
+
+    fpk = FpkClient(cwd=str(tmp_path))
+    yield fpk
+    fpk.close()
@@ -0,0 +1,54 @@
+import pytest
+
+from adaptive_timeout import K, MIN_SAMPLES, TimeoutPolicy
+
+
+def test_default_until_enough_samples_then_estimate():
+    policy = TimeoutPolicy()
+    for _ in range(MIN_SAMPLES - 1):
+        policy.observe("signal", "dev", 0.1)
+    assert policy.timeout("signal", "dev", 10) == 10
+    policy.observe("signal", "dev", 0.1)
+    # Constant latency: the deviation decays from its initial half-sample towards zero
+    assert policy.timeout("signal", "dev", 10) == 1.0  # clamped to the signal floor
+    assert policy.mean("signal", "dev") == pytest.approx(0.1)
+
+
+def test_estimate_is_clamped_and_per_device():
+    policy = TimeoutPolicy(limits={"slow": (0.5, 3.0)})
+    for seconds in (1.0, 2.0, 1.0, 2.0, 1.5):
+        policy.observe("slow", "dev", seconds)
+    estimator = policy._estimator("slow", "dev")
+    expected = min(3.0, estimator.smoothed + K * estimator.deviation)
+    assert policy.timeout("slow", "dev", 10) == pytest.approx(expected)
+    assert policy.timeout("slow", "other", 10) == 3.0  # no samples there: default, clamped
+
+
+def test_timeouts_back_off_until_a_call_completes():
+    policy = TimeoutPolicy(limits={"op": (0.1, 8.0)})
+    assert policy.timeout("op", "dev", 1.0) == 1.0
+    policy.timed_out("op", "dev")
+    assert policy.timeout("op", "dev", 1.0) == 2.0
+    policy.timed_out("op", "dev")
+    assert policy.timeout("op", "dev", 1.0) == 4.0
+    policy.observe("op", "dev", 0.5)
+    assert policy.timeout("op", "dev", 1.0) == 1.0
+    assert policy.snapshot()[0]["timeouts"] == 2
+
+
+def test_batches_split_into_invocation_and_per_item_cost():
+    policy = TimeoutPolicy()
+    policy.observe_batch("dev", 1, 0.2)  # first call: all of it is invocation cost
+    for _ in range(20):
+        policy.observe_batch("dev", 10, 0.2 + 10 * 0.01)
+    assert policy.mean("batch_write", "dev") == pytest.approx(0.01, rel=0.2)
+    assert policy.batch_timeout("dev", 100, 10, 0.5) > policy.batch_timeout("dev", 10, 10, 0.5)
+
+
+def test_client_feeds_observed_latency(client):
+    client.ensure_script()
+    for value in range(MIN_SAMPLES + 1):
+        assert client.send_signal("DP_ID_HMI_ZPM_ANZEIGEID", str(value)).ok
+    rows = {row["operation"]: row for row in client.timeouts.snapshot() if row["device_id"] == client.device_id}
+    assert rows["signal"]["samples"] >= MIN_SAMPLES
+    assert rows["signal"]["timeout_s"] is not None
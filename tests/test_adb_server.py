@@ -0,0 +1,122 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import adb_server
+from adb_server import AdbServerManager, parse_device_list
+
+
+class FakeAdbServer:
+    """Answers host:version and host:track-devices like an adb server on a local port."""
+
+    def __init__(self, devices="ABC-0123456789\tdevice\n"):
+        self.devices = devices
+        self.trackers = []
+        self._listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            length = int(conn.recv(4), 16)
+            service = conn.recv(length).decode("ascii")
+            if service == "host:version":
+                conn.sendall(b"OKAY" + self._payload("0029"))
+                conn.close()
+            elif service == "host:track-devices":
+                conn.sendall(b"OKAY" + self._payload(self.devices))
+                self.trackers.append(conn)
+            else:
+                conn.sendall(b"FAIL" + self._payload("unknown host service"))
+                conn.close()
+
+    @staticmethod
+    def _payload(text):
+        data = text.encode("utf-8")
+        return b"%04x" % len(data) + data
+
+    def push(self, devices):
+        self.trackers[-1].sendall(self._payload(devices))
+
+    def drop_trackers(self):
+        """What the client sees when the server is killed and started again."""
+        for conn in self.trackers:
+            conn.close()
+
+    def close(self):
+        self._listener.close()
+        self.drop_trackers()
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
+
+
+@pytest.fixture
+def fake_server(sim):
+    server = FakeAdbServer()
+    yield server
+    server.close()
+
+
+def test_parse_device_list():
+    assert parse_device_list("A\tdevice\nB\toffline\n\n") == {"A": "device", "B": "offline"}
+
+
+def test_watcher_tracks_devices_and_rewarms_after_a_restart(fake_server):
+    warmed = []
+    manager = AdbServerManager(lambda: "adb", on_ready=warmed.append, port=fake_server.port).start()
+    try:
+        assert _wait_for(lambda: manager.tracking and warmed == [False])
+        assert manager.state == "running" and manager.version == 0x29
+        assert manager.device_state("ABC-0123456789") == "device"
+
+        fake_server.push("ABC-0123456789\toffline\n")
+        assert _wait_for(lambda: manager.device_state("ABC-0123456789") == "offline")
+
+        fake_server.drop_trackers()
+        assert _wait_for(lambda: warmed == [False, True] and manager.tracking)
+        assert manager.restarts == 1 and manager.to_dict()["restarts"] == 1
+        assert "1 restart" in manager.describe()
+    finally:
+        manager.stop()
+
+
+def test_without_a_server_the_watcher_falls_back(sim, monkeypatch):
+    monkeypatch.setattr(adb_server, "RETRY_SECONDS", 0.1)
+    with socket.create_server(("127.0.0.1", 0)) as unused:
+        port = unused.getsockname()[1]
+    manager = AdbServerManager(lambda: "adb", port=port).start()
+    try:
+        assert _wait_for(lambda: manager.state == "unavailable")
+        assert not manager.tracking
+        with pytest.raises(LookupError):
+            manager.device_state("ABC-0123456789")
+        assert manager.describe().startswith("No adb server")
+    finally:
+        manager.stop()
+
+
+def test_client_checks_read_the_tracked_device_list(fake_server, client, sim):
+    manager = AdbServerManager(lambda: client.templates.binary, port=fake_server.port).start()
+    client.server = manager
+    try:
+        assert _wait_for(lambda: manager.tracking)
+        calls = sim.snapshot()["counters"]["adb_calls"]
+        assert client.is_adb_installed() and client.is_device_connected()
+        fake_server.push("ABC-0123456789\toffline\n")
+        assert _wait_for(lambda: not client.is_device_connected())
+        assert "offline" in client.known_offline()
+        # Answered from the tracking connection, no adb spawned
+        assert sim.snapshot()["counters"]["adb_calls"] == calls
+    finally:
+        manager.stop()
@@ -0,0 +1,177 @@
+import http.client
+import json
+import queue
+import threading
+
+import pytest
+
+from fpk_api import AutomationApiServer
+from fpk_client import MFL_BUTTONS, PRESETS, validate_signal
+
+
+class ClientBackend:
+    """The AutomationApi backend contract on top of an FpkClient (what cmd_gui provides with a window)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def api_validate(self, op, args):
+        if op == "press" and args[0] not in MFL_BUTTONS:
+            raise ValueError(f"Unknown button: {args[0]}")
+        if op == "signal":
+            validate_signal(*args)
+        if op == "preset" and args[0] not in PRESETS:
+            raise ValueError(f"Unknown preset: {args[0]}")
+
+    def api_press(self, button, count):
+        self.api_validate("press", (button, count))
+        return self.client.submit_press(button, count)
+
+    def api_signal(self, dpid, value):
+        self.api_validate("signal", (dpid, value))
+        return self.client.submit_signal(dpid, value)
+
+    def api_preset(self, name):
+        self.api_validate("preset", (name,))
+        return self.client.start_preset(name)
+
+    def api_status(self):
+        return {"device_id": self.client.device_id, "queue_depth": self.client.queue.depth}
+
+    def api_log_tail(self, lines):
+        return ["line"] * min(lines, 3)
+
+    def api_catalog(self):
+        return {"presets": sorted(PRESETS), "buttons": sorted(MFL_BUTTONS)}
+
+
+@pytest.fixture
+def server(client):
+    client.ensure_script()
+    api_server = AutomationApiServer(ClientBackend(client), port=0).start()
+    yield api_server
+    api_server.stop()
+
+
+def _request(server, method, path, body=None):
+    connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=30)
+    try:
+        payload = None if body is None else json.dumps(body)
+        connection.request(method, path, payload, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def _subscribe(server):
+    """Open /events and return a queue receiving each event's JSON."""
+    events = queue.Queue()
+    connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=30)
+    connection.request("GET", "/events")
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "text/event-stream"
+
+    def read():
+        try:
+            for raw in response.fp:
+                line = raw.decode("utf-8").strip()
+                if line.startswith("data:"):
+                    events.put(json.loads(line[len("data:"):]))
+        except (OSError, ValueError):
+            pass
+
+    threading.Thread(target=read, daemon=True).start()
+    return events, connection
+
+
+def test_press_and_signal_wait_for_the_device(server, sim):
+    status, body = _request(server, "POST", "/signal", {"dpid": "DP_ID_HMI_ZPM_ANZEIGEID", "value": "42490"})
+    assert status == 200 and body["ok"] and body["op"] == "signal"
+    assert set(body["latency_ms"]) >= {"queue", "exec", "total"}
+    assert sim.dpid_values()["DP_ID_HMI_ZPM_ANZEIGEID"] == "42490"
+
+    status, body = _request(server, "POST", "/press", {"button": "up", "count": 2})
+    assert status == 200 and body["ok"] and body["count"] == 2
+
+
+def test_errors_are_reported_as_json(server):
+    assert _request(server, "POST", "/press", {"button": "sideways"})[0] == 400
+    status, body = _request(server, "POST", "/signal", {"dpid": "DP_ID_NOT_IN_LUT", "value": "1"})
+    assert status == 200 and not body["ok"] and body["error_class"] == "parse_error"
+    assert _request(server, "GET", "/nowhere")[0] == 404
+    assert _request(server, "POST", "/batch", {"requests": "press"})[0] == 400
+
+
+def test_an_invalid_batch_queues_nothing(server, sim):
+    requests = [{"op": "signal", "dpid": "DP_ID_HMI_ZPM_ANZEIGEID", "value": "5"}, {"op": "press", "button": "no"}]
+    status, body = _request(server, "POST", "/batch", {"requests": requests})
+    assert status == 400 and body["error"].startswith("requests[1]:")
+    status, body = _request(server, "POST", "/batch", {"requests": [requests[0], "press"]})
+    assert status == 400
+    assert "DP_ID_HMI_ZPM_ANZEIGEID" not in sim.dpid_values()
+    assert sim.snapshot()["counters"]["ipc_writes"] == 0
+
+
+def test_wait_must_be_a_json_boolean(server, sim):
+    for wait in ("false", 0, None):
+        status, body = _request(server, "POST", "/signal",
+                                {"dpid": "DP_ID_HMI_ZPM_ANZEIGEID", "value": "1", "wait": wait})
+        assert status == 400 and "wait" in body["error"]
+    assert "DP_ID_HMI_ZPM_ANZEIGEID" not in sim.dpid_values()
+
+
+def test_bad_content_length_is_a_client_error(server):
+    connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=10)
+    try:
+        connection.putrequest("POST", "/press")
+        connection.putheader("Content-Length", "twelve")
+        connection.endheaders()
+        response = connection.getresponse()
+        assert response.status == 400
+        assert json.loads(response.read())["error"] == "Invalid Content-Length"
+    finally:
+        connection.close()
+
+
+def test_read_only_endpoints(server, client):
+    assert _request(server, "GET", "/status") == (200, {"device_id": client.device_id, "queue_depth": 0})
+    assert _request(server, "GET", "/log?lines=2")[1] == {"lines": ["line", "line"]}
+    assert "up" in _request(server, "GET", "/presets")[1]["buttons"]
+
+
+def test_batch_keeps_request_order(server, sim):
+    requests = [{"op": "signal", "dpid": "DP_ID_HMI_ZPM_ANZEIGEID", "value": str(value)} for value in range(3)]
+    requests.append({"op": "press", "button": "down"})
+    status, body = _request(server, "POST", "/batch", {"requests": requests})
+    assert status == 200 and body["ok"]
+    assert [result["op"] for result in body["results"]] == ["signal"] * 3 + ["press"]
+    assert sim.dpid_values()["DP_ID_HMI_ZPM_ANZEIGEID"] == "2"
+
+
+def test_queued_requests_are_published_on_events(server):
+    events, connection = _subscribe(server)
+    try:
+        status, body = _request(server, "POST", "/signal",
+                                {"dpid": "DP_ID_HMI_ZPM_ANZEIGEID", "value": "7", "wait": False})
+        assert status == 202 and body["queued"]
+        event = events.get(timeout=15)
+        assert event["id"] == body["id"] and event["ok"] and event["label"] == "DP_ID_HMI_ZPM_ANZEIGEID"
+
+        status, body = _request(server, "POST", "/batch", {"wait": False, "requests": [
+            {"op": "press", "button": "up"}, {"op": "press", "button": "up"}, {"op": "preset", "name": "adas"}]})
+        assert status == 202
+        published = {}
+        while len(published) < 3:
+            event = events.get(timeout=30)
+            published[event["id"]] = event
+        assert sorted(published) == sorted(body["ids"])
+        assert all(event["ok"] for event in published.values())
+        assert {event["op"] for event in published.values()} == {"press", "preset"}
+
+        # Waited requests are published too
+        _request(server, "POST", "/press", {"button": "ok"})
+        assert events.get(timeout=15)["op"] == "press"
+    finally:
+        connection.close()
@@ -0,0 +1,23 @@
+import fpk_bench
+
+
+def test_every_mode_writes_through_the_simulator(client, sim):
+    report = fpk_bench.run_benchmark(client, signals=4)
+    modes = report["modes"]
+    assert list(modes) == list(fpk_bench.MODES)
+    for result in modes.values():
+        assert result["signals"] == 4 and result["ok"] == 4
+    assert modes["shell"]["speedup_vs_shell"] == 1.0
+    # No process per write: the persistent session beats any spawn-per-call mode
+    assert modes["session"]["per_signal_ms"]["mean"] < modes["argv"]["per_signal_ms"]["mean"]
+    assert sim.snapshot()["counters"]["ipc_writes"] == 12
+
+
+def test_main_writes_the_report(sim, tmp_path, capsys):
+    out = tmp_path / "bench.json"
+    assert fpk_bench.main(["--signals", "2", "--mode", "argv", "--out", str(out)]) == 0
+    assert "argv" in capsys.readouterr().out
+    assert out.exists()
+
+    sim.set_connection("disconnected")
+    assert fpk_bench.main(["--signals", "2"]) == 1
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from fpk_broker import Broker, BrokerClient, BrokerError, FairScheduler, _Job
+
+
+def _scheduler():
+    gate, ran = threading.Event(), []
+
+    def run(job):
+        gate.wait(10)
+        ran.append((job.connection, job.args))
+
+    return FairScheduler(run), gate, ran
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_scheduler_takes_turns_between_clients():
+    scheduler, gate, ran = _scheduler()
+    try:
+        scheduler.submit("a", _Job("signal", ("DP_A", "0"), "a", 0))
+        assert _wait_for(lambda: scheduler.depth == 0)  # the worker holds a0
+        for index in range(1, 4):
+            scheduler.submit("a", _Job("signal", ("DP_A", str(index)), "a", index))
+        scheduler.submit("b", _Job("signal", ("DP_B", "0"), "b", 0))
+        scheduler.submit("b", _Job("signal", ("DP_B", "1"), "b", 1))
+        gate.set()
+        assert _wait_for(lambda: len(ran) == 6)
+        # Client b does not wait behind the rest of a's backlog
+        assert [f"{owner}{args[1]}" for owner, args in ran] == ["a0", "b0", "a1", "b1", "a2", "a3"]
+    finally:
+        gate.set()
+        scheduler.stop()
+
+
+def test_scheduler_merges_repeated_presses_and_drops_detached_clients():
+    scheduler, gate, ran = _scheduler()
+    try:
+        scheduler.submit("a", _Job("signal", ("DP_A", "0"), "a", 0))
+        assert _wait_for(lambda: scheduler.depth == 0)
+        scheduler.submit("a", _Job("press", ("up", 2), "a", 1))
+        scheduler.submit("a", _Job("press", ("up", 3), "a", 2))
+        scheduler.submit("a", _Job("press", ("down", 1), "a", 3))
+        assert scheduler.depth == 2
+        scheduler.submit("b", _Job("press", ("ok", 1), "b", 1))
+        assert [job.request_ids for job in scheduler.drop("b")] == [[1]]
+        gate.set()
+        assert _wait_for(lambda: len(ran) == 3)
+        assert [args for _, args in ran] == [("DP_A", "0"), ("up", 5), ("down", 1)]
+    finally:
+        gate.set()
+        scheduler.stop()
+
+
+@pytest.fixture
+def broker(sim):
+    broker = Broker(port=0, poll_seconds=0.2).start()
+    yield broker
+    broker.stop()
+
+
+def test_two_clients_share_one_device_session(broker, sim):
+    gui = BrokerClient(broker.port, name="gui")
+    script = BrokerClient(broker.port, name="script")
+    try:
+        statuses = []
+        gui.subscribe(statuses.append)
+        assert _wait_for(lambda: gui.status().ready)
+        presses = [gui.submit_press("up") for _ in range(3)]
+        results = script.send_many([("DP_ID_HMI_ZPM_ANZEIGEID", "42490"), ("DP_ID_B_ACC_STATUSICON", "5")])
+        assert [result.ok for result in results] == [True, True]
+        for entry in presses:
+            assert entry.wait(10) and entry.result.ok
+        assert script.send_signal("DP_ID_HMI_ZPM_ANZEIGEID", "0").ok
+        assert sim.dpid_values()["DP_ID_HMI_ZPM_ANZEIGEID"] == "0"
+
+        run = script.run_preset("navigation")
+        assert run.state == "done" and run.steps_sent == 5 and run.failures == 0
+
+        names = {client["name"] for client in gui.request("status")["clients"]}
+        assert {"gui", "script"} <= names
+        assert statuses and statuses[-1]["ready"]
+        with pytest.raises(BrokerError):
+            gui.press("no_such_button")
+    finally:
+        gui.close()
+        script.close()
+    assert _wait_for(lambda: not broker.connections)
+
+
+def test_subscribers_hear_about_a_lost_device(broker, sim):
+    client = BrokerClient(broker.port, name="watcher")
+    try:
+        statuses = []
+        client.subscribe(statuses.append)
+        assert _wait_for(lambda: statuses[-1]["ready"])
+        sim.set_connection("disconnected")
+        assert _wait_for(lambda: statuses[-1]["ready"] is False)
+        assert not client.status().ready
+    finally:
+        client.close()
@@ -0,0 +1,75 @@
+from fpk_caps import CAP_MARKER, build_probe_command, parse_probe_output
+
+
+def _probe_output(*sections):
+    lines = []
+    for header, body in sections:
+        lines.append(f"{CAP_MARKER} {header}")
+        lines.extend(body)
+    lines.append(f"{CAP_MARKER} end")
+    return "\n".join(lines) + "\n"
+
+
+def test_parse_commands_dirs_and_scripts():
+    output = _probe_output(
+        ("cmd IpcSender", ["/usr/bin/IpcSender"]),
+        ("cmd md5sum", []),
+        ("cmd sha1sum", ["/usr/bin/sha1sum"]),
+        ("dir /tmp/", []),
+        ("exec /tmp/mfl_total.sh", []),
+        ("sh /tmp/mfl_total.sh", []),
+        ("dir /data/local/tmp/", ["writable"]),
+        ("exec /data/local/tmp/mfl_total.sh", ["/bin/sh: permission denied"]),
+        ("sh /data/local/tmp/mfl_total.sh", ["0123456789ab"]),
+    )
+    caps = parse_probe_output(output)
+    assert caps.ipc_sender == "/usr/bin/IpcSender"
+    assert caps.hash_command == "sha1sum"
+    assert caps.writable_dirs == ["/data/local/tmp/"] and caps.deploy_dir == "/data/local/tmp/"
+    assert caps.scripts == {"/data/local/tmp/": ("0123456789ab", True)}
+    assert caps.select_script("0123456789ab") == ("/data/local/tmp/", "0123456789ab", True)
+
+
+def test_select_prefers_the_wanted_version():
+    output = _probe_output(
+        ("exec /tmp/mfl_total.sh", ["aaaaaaaaaaaa"]),
+        ("exec /data/local/tmp/mfl_total.sh", ["bbbbbbbbbbbb"]),
+    )
+    caps = parse_probe_output(output)
+    assert caps.select_script("bbbbbbbbbbbb")[0] == "/data/local/tmp/"
+    assert caps.select_script("cccccccccccc")[0] == "/tmp/"
+    assert caps.ipc_sender is None and caps.deploy_dir is None
+
+
+def test_truncated_output_is_no_result():
+    assert parse_probe_output(f"{CAP_MARKER} cmd IpcSender\n/usr/bin/IpcSender\n") is None
+    assert parse_probe_output("") is None
+
+
+def test_probe_command_covers_every_candidate():
+    command = build_probe_command(("/a/", "/b/"), "x.sh")
+    for fragment in ("command -v IpcSender", "/a/.fpk_probe", "/b/x.sh version", "sh /b/x.sh version"):
+        assert fragment in command
+    assert command.endswith(f"echo {CAP_MARKER} end")
+
+
+def test_probe_against_the_simulator(sim, client):
+    assert client.status().ready
+    caps = client.probe_capabilities()
+    assert caps.ipc_sender and caps.hash_command == "md5sum"
+    assert caps.script_version is None
+    assert client.ensure_script()
+
+    caps = client.probe_capabilities(refresh=True)
+    from fpk_client import MFL_SCRIPT_VERSION
+    assert caps.script_version == MFL_SCRIPT_VERSION and not caps.script_via_sh
+
+
+def test_probe_finds_a_script_run_through_sh(sim, client):
+    sim.configure(chmod_denied=True, readonly_dirs=["/tmp/"])
+    client.status()
+    assert client.ensure_script()
+    caps = client.probe_capabilities(refresh=True)
+    assert caps.script_dir == "/data/local/tmp/" and caps.script_via_sh
+    assert client.press("up", 2).ok
+    assert sim.snapshot()["counters"]["ipc_writes"] > 0
@@ -0,0 +1,56 @@
+import json
+import os
+import threading
+import time
+
+from fpk_capture import FrameCapture, FrameRing
+from fpk_screen import Image, decode_png
+
+
+def _image(value):
+    return Image(4, 2, bytes([value]) * 24)
+
+
+def test_ring_stores_distinct_frames_within_its_bounds():
+    ring = FrameRing(max_frames=3)
+    first = ring.add(1.0, _image(0))
+    assert ring.add(1.5, _image(0)) is first and first.repeats == 1 and first.until == 1.5
+    for index in range(1, 5):
+        ring.add(2.0 + index, _image(index))
+    assert len(ring) == 3 and ring.evicted == 2
+    assert [frame.t for frame in ring.window(4.0, 5.5)] == [4.0, 5.0]
+    assert decode_png(ring.window(6.0, 6.0)[0].png).pixels == _image(4).pixels
+
+
+def test_triggers_inside_an_open_clip_extend_it(tmp_path):
+    capture = FrameCapture(None, pre=1.0, post=2.0, out_dir=str(tmp_path))
+    clip = capture.trigger("first", at=100.0)
+    assert capture.trigger("second", at=101.5) is clip
+    assert clip.until == 103.5 and [label for _, label, _ in clip.events] == ["first", "second"]
+    assert capture.trigger("later", at=110.0) is not clip
+
+
+def test_clip_frames_around_a_transient_popup(client, sim, tmp_path):
+    sim.configure(popup_seconds=0.3)
+    clips = []
+    saved = threading.Event()
+    capture = FrameCapture(client, fps=20, pre=0.5, post=0.8, out_dir=str(tmp_path),
+                           on_clip=lambda clip: (clips.append(clip), saved.set()))
+    capture.start()
+    try:
+        time.sleep(0.6)
+        assert client.send_signal("DP_ID_HMI_ZPM_ANZEIGEID", "42490").ok
+        assert saved.wait(10)
+    finally:
+        capture.stop()
+    assert capture.captures > 5 and capture.capture_errors == 0
+
+    with open(os.path.join(clips[0].path, "clip.json"), "r", encoding="utf-8") as f:
+        info = json.load(f)
+    assert info["label"] == "signal DP_ID_HMI_ZPM_ANZEIGEID=42490"
+    offsets = [frame["offset_ms"] for frame in info["frames"]]
+    assert offsets == sorted(offsets) and offsets[0] < 0 < offsets[-1]
+    # The popup came and went inside the clip: at least before/popup/after distinct frames
+    assert len(info["frames"]) >= 3
+    for frame in info["frames"]:
+        assert os.path.exists(os.path.join(clips[0].path, frame["file"]))
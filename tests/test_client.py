@@ -0,0 +1,17 @@
+import threading
+
+from fpk_metrics import REGISTRY
+
+
+def test_concurrent_ensure_script_pushes_once(client, sim):
+    pushed = REGISTRY.counter_value("deploy_total", result="pushed")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.ensure_script())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert results == [True] * 4
+    # The first deploy holds the lock; everyone after it finds the script current
+    assert REGISTRY.counter_value("deploy_total", result="pushed") == pushed + 1
+    assert client.send_signal("DP_ID_HMI_ZPM_ANZEIGEID", "1").ok
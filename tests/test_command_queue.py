@@ -0,0 +1,103 @@
+import threading
+import time
+
+from command_queue import CommandQueue
+
+
+def _blocked_queue(**kwargs):
+    """A queue whose worker is busy until the returned event is set (so submissions stay pending)."""
+    queue = CommandQueue(**kwargs)
+    release = threading.Event()
+    queue.submit(lambda count: release.wait(5))
+    time.sleep(0.05)
+    return queue, release
+
+
+def test_repeats_of_one_key_merge_into_one_invocation():
+    queue, release = _blocked_queue()
+    calls = []
+    try:
+        first = queue.submit(lambda count: calls.append(("up", count)) or count, coalesce_key="up")
+        assert queue.submit(lambda count: None, coalesce_key="up", count=2) is first
+        other = queue.submit(lambda count: calls.append(("down", count)) or count, coalesce_key="down")
+        last = queue.submit(lambda count: calls.append(("up", count)) or count, coalesce_key="up")
+        assert last is not first  # order between keys is kept
+        release.set()
+        assert last.wait(5)
+        assert calls == [("up", 3), ("down", 1), ("up", 1)]
+        assert first.result == 3 and other.result == 1
+    finally:
+        queue.stop()
+
+
+def test_every_merged_submitter_is_called_back():
+    queue, release = _blocked_queue()
+    seen = []
+    try:
+        first = queue.submit(lambda count: count, lambda entry, result, error: seen.append(("a", result)),
+                             coalesce_key="up")
+        queue.submit(lambda count: count, lambda entry, result, error: seen.append(("b", result)), coalesce_key="up")
+        queue.submit(lambda count: count, coalesce_key="up")
+        release.set()
+        assert first.wait(5)
+        deadline = time.monotonic() + 2
+        while len(seen) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sorted(seen) == [("a", 3), ("b", 3)]
+    finally:
+        queue.stop()
+
+
+def test_merge_stops_at_max_burst():
+    queue, release = _blocked_queue(max_burst=3)
+    try:
+        first = queue.submit(lambda count: count, coalesce_key="up", count=2)
+        second = queue.submit(lambda count: count, coalesce_key="up", count=2)
+        assert second is not first
+        release.set()
+        assert second.wait(5) and (first.result, second.result) == (2, 2)
+    finally:
+        queue.stop()
+
+
+def test_coalesce_window_collects_later_repeats():
+    queue = CommandQueue(coalesce_window=0.2)
+    try:
+        entry = queue.submit(lambda count: count, coalesce_key="up")
+        time.sleep(0.05)
+        assert queue.submit(lambda count: count, coalesce_key="up") is entry
+        assert entry.wait(5) and entry.result == 2
+        assert entry.queue_seconds >= 0.15
+    finally:
+        queue.stop()
+
+
+def test_errors_callbacks_and_stop():
+    queue, release = _blocked_queue()
+    seen = []
+    failing = queue.submit(lambda count: 1 / 0, on_done=lambda entry, result, error: seen.append(type(error)))
+    done = []
+    failing.add_done_callback(done.append)
+    pending = queue.submit(lambda count: count)
+    release.set()
+    assert failing.wait(5)
+    assert isinstance(failing.error, ZeroDivisionError) and seen == [ZeroDivisionError] and done == [failing]
+    assert pending.wait(5)
+
+    queue, release = _blocked_queue()
+    dropped = queue.submit(lambda count: count)
+    late = []
+    queue.stop()
+    release.set()
+    dropped.add_done_callback(late.append)
+    assert dropped.wait(1) and dropped.error is not None and late == [dropped]
+
+
+def test_client_presses_coalesce_on_the_device(client, sim):
+    client.ensure_script()
+    entries = [client.submit_press("down") for _ in range(5)]
+    for entry in entries:
+        assert entry.wait(10) and entry.result.ok
+    invocations = {id(entry) for entry in entries}
+    assert len(invocations) < 5  # repeats queued behind the first press merged
+    assert sum(entry.count for entry in {id(entry): entry for entry in entries}.values()) == 5
@@ -0,0 +1,47 @@
+import itertools
+import json
+
+import fpk_fuzz
+from fpk_fuzz import FuzzRun, fuzz_steps, minimize, parse_range_spec
+
+KNOWN = "DP_ID_HMI_ZPM_ANZEIGEID"
+UNKNOWN = "DP_ID_FUZZ_NOT_IN_LUT"
+
+
+def test_same_seed_gives_the_same_values_in_range():
+    signals = [parse_range_spec(f"{KNOWN}=0,42490:42499"), parse_range_spec("DP_ID_B_ACC_STATUSICON=15:0")]
+    assert signals[1] == ("DP_ID_B_ACC_STATUSICON", [(0, 15)])
+    first = list(itertools.islice(fuzz_steps(signals, 7), 200))
+    assert first == list(itertools.islice(fuzz_steps(signals, 7), 200))
+    assert first != list(itertools.islice(fuzz_steps(signals, 8), 200))
+    for name, value in first:
+        ranges = dict(signals)[name]
+        assert any(low <= int(value) <= high for low, high in ranges)
+
+
+def test_minimize_keeps_only_the_steps_that_matter():
+    steps = list(range(40))
+    steps_found, trials = minimize(steps, lambda candidate: 3 in candidate and 31 in candidate)
+    assert steps_found == [3, 31]
+    assert 0 < trials <= fpk_fuzz.MAX_MINIMIZE_TRIALS
+
+
+def test_clean_run_sends_every_step(client, sim):
+    run = FuzzRun(client, [parse_range_spec(f"{KNOWN}=0:100")], seed=1, batch_size=10, max_steps=35)
+    report = run.run()
+    assert report["sent"] == 35 and report["batches"] == 4 and report["failures"] == []
+    assert sim.snapshot()["counters"]["ipc_writes"] == 35
+
+
+def test_parse_error_is_written_as_a_one_step_reproducer(client, sim, tmp_path):
+    signals = [parse_range_spec(f"{KNOWN}=0:100"), parse_range_spec(f"{UNKNOWN}=1")]
+    run = FuzzRun(client, signals, seed=3, batch_size=10, max_steps=500, out_dir=str(tmp_path))
+    report = run.run()
+    assert [failure["error_class"] for failure in report["failures"]] == ["parse_error"]
+    with open(report["failures"][0]["path"], "r", encoding="utf-8") as f:
+        reproducer = json.load(f)
+    assert reproducer["seed"] == 3 and reproducer["steps"] == [[UNKNOWN, "1"]]
+
+    assert fpk_fuzz.replay(client, report["failures"][0]["path"])[0]
+    sim.register_dpids(UNKNOWN)
+    assert fpk_fuzz.main(["--replay", report["failures"][0]["path"]]) == 0
@@ -0,0 +1,110 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import host_jobs
+from host_jobs import HostJobManager, kill_process_tree
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="POSIX process groups")
+
+
+def _alive(pid):
+    """True while pid runs (a zombie nobody reaps counts as gone)."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            return "\tZ" not in next(line for line in f if line.startswith("State:"))
+    except FileNotFoundError:
+        return False
+    except OSError:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+
+def _wait_gone(pid, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while _alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return not _alive(pid)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(host_jobs, "CANCEL_GRACE_SECONDS", 0.3)
+    output = []
+    jobs = HostJobManager(encoding="utf-8", on_output=lambda job, stream, text: output.append((stream, text)))
+    jobs.output = output
+    yield jobs
+    jobs.kill_all()
+
+
+def _child_pid(manager, job):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        text = "".join(text for stream, text in manager.output if stream == "stdout").strip()
+        if text:
+            return int(text.split()[0])
+        time.sleep(0.02)
+    raise AssertionError("the job did not report its child")
+
+
+def test_output_is_streamed_and_exit_reported(manager):
+    job = manager.start("echo out; echo err >&2; exit 3")
+    assert job.wait(5)
+    assert job.state == "done" and job.returncode == 3
+    assert ("stdout", "out\n") in manager.output and ("stderr", "err\n") in manager.output
+    assert manager.running_jobs() == []
+
+
+def test_cancel_stops_a_job_politely(manager):
+    job = manager.start("sleep 30")
+    time.sleep(0.1)
+    assert manager.cancel(job.job_id)
+    assert job.wait(2) and job.state == "cancelled"
+    assert not manager.cancel(job.job_id)
+
+
+def test_cancel_escalates_to_kill(manager):
+    job = manager.start("trap '' TERM; while :; do sleep 0.05; done")
+    time.sleep(0.2)
+    manager.cancel(job.job_id)
+    assert not job.wait(0.2)  # still inside the grace period
+    assert job.wait(3) and job.state == "killed"
+
+
+def test_cancel_kills_children_that_outlive_the_leader(manager):
+    job = manager.start("(trap '' TERM; sleep 30) & echo $!; sleep 30")
+    child = _child_pid(manager, job)
+    manager.cancel(job.job_id)
+    assert job.wait(3) and job.state == "cancelled"
+    assert _wait_gone(child)
+
+
+def test_timeout_kills_the_process_group(manager):
+    job = manager.start("sleep 30 & echo $!; sleep 30", timeout=0.3)
+    child = _child_pid(manager, job)
+    assert job.wait(3) and job.state == "timeout"
+    assert _wait_gone(child)
+
+
+def test_a_reaped_process_is_never_signalled(monkeypatch):
+    sent = []
+    monkeypatch.setattr(host_jobs.os, "killpg", lambda pgid, sig: sent.append((pgid, sig)))
+    process = subprocess.Popen(["true"], start_new_session=True)
+    process.wait()
+    kill_process_tree(process)
+    host_jobs.terminate_process_tree(process)
+    assert sent == []
+
+    process = subprocess.Popen(["sleep", "30"], start_new_session=True)
+    try:
+        kill_process_tree(process)
+        assert sent and sent[0][0] == process.pid
+    finally:
+        process.kill()
+        process.wait()
@@ -0,0 +1,56 @@
+import time
+
+from fpk_client import OperationResult
+from fpk_ledger import BUTTON_PREFIX, SignalLedger
+
+
+def test_counts_and_error_rates_over_sealed_and_growing_chunks():
+    ledger = SignalLedger(chunk_size=4, max_events=100)
+    start = ledger.epoch
+    for index in range(10):
+        result = "ok" if index % 5 else "timeout"
+        ledger.append(start + index, "DP_A" if index % 2 else "DP_B", index, result, 0.010)
+
+    assert len(ledger) == 10
+    assert ledger.counts() == {"DP_A": (5, 1), "DP_B": (5, 1)}
+    assert ledger.error_rates()["DP_A"] == 0.2
+    # Window cutting through the first and last chunk
+    assert ledger.counts(since=start + 2, until=start + 7) == {"DP_A": (2, 1), "DP_B": (3, 0)}
+    assert ledger.result_counts(name="DP_B") == {"ok": 4, "timeout": 1}
+
+
+def test_oldest_chunk_is_dropped_at_max_events():
+    ledger = SignalLedger(chunk_size=4, max_events=8)
+    for index in range(13):
+        ledger.append(ledger.epoch + index, "DP_A", index, "ok", 0.001)
+
+    assert len(ledger) == 5  # max_events // chunk_size chunks, counting the growing one
+    assert ledger.dropped == 8
+    assert [event[2] for event in ledger.events()][0] == 8
+
+
+def test_record_operation_results_and_percentiles():
+    ledger = SignalLedger()
+    now = time.time()
+    for ms in (10, 20, 30, 40):
+        ledger.record(OperationResult("signal", "DP_A", "7", 0, elapsed=ms / 1000.0, timestamp=now))
+    ledger.record(OperationResult("button", "up", 3, 0, elapsed=0.05, timestamp=now))
+    ledger.record(OperationResult("signal", "DP_A", "x", error="gone", error_class="no_device", timestamp=now))
+
+    latency = ledger.latency_percentiles(name="DP_A")
+    assert round(latency["p50"]) == 30 and round(latency["max"]) == 40
+    rows = {row["name"]: row for row in ledger.summary()}
+    assert rows["DP_A"]["count"] == 5 and rows["DP_A"]["errors"] == 1
+    assert rows[BUTTON_PREFIX + "up"]["count"] == 1
+    assert [event[2] for event in ledger.events() if event[1] == "DP_A"][-1] == 0  # non-numeric value
+
+
+def test_ledger_records_client_results(client):
+    ledger = SignalLedger()
+    client.ensure_script()
+    for value in ("1", "2"):
+        ledger.record(client.send_signal("DP_ID_HMI_ZPM_ANZEIGEID", value))
+    ledger.record(client.send_signal("DP_ID_NOT_IN_LUT", "1"))
+
+    assert ledger.counts() == {"DP_ID_HMI_ZPM_ANZEIGEID": (2, 0), "DP_ID_NOT_IN_LUT": (1, 1)}
+    assert ledger.result_counts(name="DP_ID_NOT_IN_LUT") == {"parse_error": 1}
@@ -0,0 +1,86 @@
+import http.client
+
+import pytest
+
+from fpk_metrics import REGISTRY, MetricsRegistry, MetricsServer
+
+
+def _scrape(server, path="/metrics"):
+    connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=10)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        return response.status, response.getheader("Content-Type"), response.read().decode("utf-8")
+    finally:
+        connection.close()
+
+
+def _samples(text):
+    """{metric line name with labels: value} of the non-comment lines."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            samples[name] = float(value)
+    return samples
+
+
+@pytest.fixture
+def registry_server():
+    registry = MetricsRegistry(prefix="test_")
+    server = MetricsServer(registry, port=0).start()
+    yield registry, server
+    server.stop()
+
+
+def test_metrics_endpoint_serves_counters_gauges_and_summaries(registry_server):
+    registry, server = registry_server
+    registry.describe("writes_total", "counter", "Writes, by result")
+    registry.inc("writes_total", result="ok")
+    registry.inc("writes_total", 2, result="ok")
+    registry.inc("writes_total", result="timeout")
+    registry.set("ready", 1)
+    registry.gauge_callback("queue_depth", lambda: 4, "Pending commands")
+    for seconds in (0.1, 0.2, 0.3):
+        registry.observe("call_seconds", seconds, op="signal")
+
+    status, content_type, text = _scrape(server)
+    assert status == 200 and content_type.startswith("text/plain; version=0.0.4")
+    lines = text.splitlines()
+    assert "# HELP test_writes_total Writes, by result" in lines
+    assert "# TYPE test_writes_total counter" in lines
+    assert "# TYPE test_ready gauge" in lines
+    assert "# TYPE test_queue_depth gauge" in lines
+    assert "# TYPE test_call_seconds summary" in lines
+
+    samples = _samples(text)
+    assert samples['test_writes_total{result="ok"}'] == 3
+    assert samples['test_writes_total{result="timeout"}'] == 1
+    assert samples["test_ready"] == 1 and samples["test_queue_depth"] == 4
+    assert samples['test_call_seconds{op="signal",quantile="0.5"}'] == pytest.approx(0.2)
+    assert samples['test_call_seconds_count{op="signal"}'] == 3
+    assert samples['test_call_seconds_sum{op="signal"}'] == pytest.approx(0.6)
+    assert samples["test_uptime_seconds"] >= 0
+
+    assert _scrape(server, "/")[0] == 200
+    assert _scrape(server, "/other")[0] == 404
+
+
+def test_label_values_are_escaped(registry_server):
+    registry, server = registry_server
+    registry.inc("errors_total", kind='say "hi"\n')
+    assert 'test_errors_total{kind="say \\"hi\\"\\n"} 1' in _scrape(server)[2].splitlines()
+
+
+def test_client_operations_are_counted(client):
+    server = MetricsServer(port=0).start()
+    try:
+        before = REGISTRY.counter_value("adb_spawns_total", subcommand="shell")
+        client.ensure_script()
+        assert client.send_signal("DP_ID_HMI_ZPM_ANZEIGEID", "1").ok
+        samples = _samples(_scrape(server)[2])
+    finally:
+        server.stop()
+    assert samples['fpk_adb_spawns_total{subcommand="shell"}'] > before
+    assert samples['fpk_deploy_total{result="pushed"}'] >= 1
+    assert samples['fpk_signals_total{result="ok"}'] >= 1
@@ -0,0 +1,35 @@
+from fpk_client import BATCH_RC_MARKER, MFL_BUTTON_TABLE, MFL_SCRIPT_VERSION, build_mfl_script
+
+
+def test_script_has_one_block_per_button_and_a_body_hash_version():
+    script, version = build_mfl_script()
+    assert version == MFL_SCRIPT_VERSION
+    assert f'MFL_SCRIPT_VERSION="{version}"' in script
+    for name, (_, press_dpid, release_dpid) in MFL_BUTTON_TABLE.items():
+        assert f'[ "$1" = "{name}" ]; then' in script
+        assert f"IpcSender --dpid {press_dpid} 0 1" in script
+        assert f"IpcSender --dpid {release_dpid} 0 0" in script
+    assert 'elif [ "$1" = "batch" ]; then' in script and BATCH_RC_MARKER in script
+
+    table = dict(MFL_BUTTON_TABLE, extra=("extra", "DP_ID_EXTRA_PRESS", "DP_ID_EXTRA_RELEASE"))
+    assert build_mfl_script(table)[1] != version
+    assert build_mfl_script(dict(MFL_BUTTON_TABLE))[1] == version
+
+
+def test_deployed_script_answers_version_and_presses(client, sim):
+    assert client.ensure_script()
+    assert client.script_version() == MFL_SCRIPT_VERSION
+    assert client.press("ok").ok
+    values = sim.dpid_values()
+    assert values["DP_ID_HMI_OK_SHORT_PRESS"] == "0" and values["DP_ID_HMI_OK_SHORT_RELEASE"] == "0"
+
+
+def test_batch_verb_streams_writes_on_stdin(client, sim):
+    assert client.ensure_script() and client.stdin_batch
+    before = sim.snapshot()["counters"]["adb_calls"]
+    pairs = [("DP_ID_HMI_ZPM_ANZEIGEID", str(value)) for value in range(5)] + [("DP_ID_NOT_IN_LUT", "1")]
+    results = client.execute_many(pairs)
+    assert [result.ok for result in results] == [True] * 5 + [False]
+    assert sim.dpid_values()["DP_ID_HMI_ZPM_ANZEIGEID"] == "4"
+    # All six writes went through one adb invocation
+    assert sim.snapshot()["counters"]["adb_calls"] == before + 1
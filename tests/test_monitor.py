@@ -0,0 +1,37 @@
+import time
+
+from fpk_monitor import DeviceMonitor, format_summary
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_monitor_samples_over_one_persistent_shell(client, sim, tmp_path):
+    calls = sim.snapshot()["counters"]["adb_calls"]
+    monitor = DeviceMonitor(client, interval=0.1, processes=["hmi_app", "not_running"])
+    monitor.start()
+    try:
+        assert _wait_for(lambda: len(monitor.samples()) >= 3)
+        assert client.send_signal("DP_ID_HMI_ZPM_ANZEIGEID", "1").ok
+    finally:
+        monitor.stop()
+    assert not monitor.running
+    assert monitor.shell_restarts == 0 and monitor.sample_errors == 0
+
+    sample = monitor.latest()
+    assert 0 <= sample.cpu_percent <= 100
+    assert 0 < sample.mem_used_kb < sample.mem_total_kb
+    assert sample.processes["hmi_app"][1] > 0
+    assert sample.processes["not_running"] == (None, None)
+    # The monitor shell plus the one signal: sampling spawns nothing per tick
+    assert sim.snapshot()["counters"]["adb_calls"] == calls + 2
+
+    report = monitor.report()
+    assert [entry["name"] for entry in report["signals"]] == ["DP_ID_HMI_ZPM_ANZEIGEID"]
+    assert "hmi_app" in format_summary(report)
+    monitor.export(str(tmp_path / "load.json"))
+    assert (tmp_path / "load.json").exists()
@@ -0,0 +1,100 @@
+import time
+
+from offline_queue import OfflineQueue
+
+
+def _collecting_queue(**kwargs):
+    dropped = []
+
+    def on_drop(held, reason):
+        dropped.append((held.name, reason))
+        for entry in held.entries:
+            entry.finish(reason)
+
+    return OfflineQueue(on_drop, **kwargs), dropped
+
+
+def test_writes_to_one_dpid_collapse_to_the_latest_value():
+    queue, dropped = _collecting_queue()
+    first = queue.hold_signal("dev", "DP_A", "1")
+    queue.hold_signal("dev", "DP_B", "1")
+    latest = queue.hold_signal("dev", "DP_A", "2")
+
+    held = queue.take()
+    assert [(command.name, command.value) for command in held] == [("DP_B", "1"), ("DP_A", "2")]
+    assert held[1].entries == [latest, first]
+    assert queue.depth == 0 and not dropped
+
+
+def test_repeated_presses_merge_up_to_max_burst():
+    queue, _ = _collecting_queue(max_burst=5)
+    entry = queue.hold_press("dev", "up", 2)
+    assert queue.hold_press("dev", "up", 3) is entry
+    assert entry.count == 5
+    queue.hold_press("dev", "up", 1)  # over max_burst: a new command
+    queue.hold_press("dev", "down", 1)
+    assert [(command.name, command.value) for command in queue.take()] == [("up", 5), ("up", 1), ("down", 1)]
+
+
+def test_every_merged_press_is_called_back():
+    queue, _ = _collecting_queue()
+    done = []
+    entry = queue.hold_press("dev", "up", 1, on_done=lambda entry, result, error: done.append("first"))
+    queue.hold_press("dev", "up", 1, on_done=lambda entry, result, error: done.append(("second", result)))
+    queue.discard()
+    assert entry.result == "discarded"
+    assert done == ["first", ("second", "discarded")]
+
+
+def test_overflow_drops_the_oldest():
+    queue, dropped = _collecting_queue(max_size=2)
+    queue.hold_signal("dev", "DP_A", "1")
+    queue.hold_signal("dev", "DP_B", "1")
+    queue.hold_signal("dev", "DP_C", "1")
+    assert dropped == [("DP_A", "overflow")]
+    assert [command.name for command in queue.take()] == ["DP_B", "DP_C"]
+
+
+def test_expiry_finishes_waiters_without_further_calls():
+    queue, dropped = _collecting_queue(max_age=0.2)
+    entry = queue.hold_signal("dev", "DP_A", "1")
+    started = time.monotonic()
+    assert entry.wait(2.0)
+    assert time.monotonic() - started < 1.0
+    assert entry.result == "expired"
+    assert dropped == [("DP_A", "expired")] and queue.depth == 0
+
+
+def test_client_holds_while_offline_and_flushes_on_reconnect(sim, tmp_path):
+    from fpk_client import FpkClient
+
+    client = FpkClient(cwd=str(tmp_path), hold_offline=True)
+    try:
+        sim.set_connection("disconnected")
+        assert not client.status().ready
+        first = client.submit_signal("DP_ID_HMI_ZPM_ANZEIGEID", "1")
+        latest = client.submit_signal("DP_ID_HMI_ZPM_ANZEIGEID", "2")
+        press = client.submit_press("up", 2)
+        assert client.offline.depth == 2 and not first.wait(0.1)
+
+        sim.set_connection("device")
+        assert client.status().ready
+        for entry in (first, latest, press):
+            assert entry.wait(10) and entry.result.ok
+        assert first.result is latest.result
+        assert sim.dpid_values()["DP_ID_HMI_ZPM_ANZEIGEID"] == "2"
+    finally:
+        client.close()
+
+
+def test_client_expired_commands_finish_as_offline(sim, tmp_path):
+    from fpk_client import FpkClient
+
+    client = FpkClient(cwd=str(tmp_path), hold_offline=True, offline_max_age=0.2)
+    try:
+        sim.set_connection("disconnected")
+        client.status()
+        result = client.send_signal("DP_ID_HMI_ZPM_ANZEIGEID", "1")
+        assert not result.ok and result.error_class == "offline"
+    finally:
+        client.close()
@@ -0,0 +1,61 @@
+import threading
+import time
+
+STEPS = [
+    ("DP_ID_HMI_ZPM_ANZEIGEID", "42490"),
+    ("DP_ID_B_ACC_STATUSICON", "5"),
+    ("WAIT", "300"),
+    ("DP_ID_HMI_ZPM_ANZEIGEID", "0"),
+    ("DP_ID_B_TA_AKTIV_HMI", "1"),
+]
+
+
+def _drop(sim, seconds, reboot=False):
+    """Make the simulated device disappear for seconds; a reboot also empties its files."""
+    with sim.store.locked() as state:
+        state["disconnected_until"] = time.time() + seconds
+        if reboot:
+            state["files"] = {}
+
+
+def test_preset_suspends_and_resumes_from_its_checkpoint(client, sim):
+    assert client.ensure_script()
+    states = []
+    threading.Timer(0.1, _drop, (sim, 1.0, True)).start()  # inside the WAIT step
+    run = client.run_preset(STEPS, on_state=lambda run: states.append((run.state, run.checkpoint)),
+                            resume_timeout=30)
+    assert run.state == "done" and run.failures == 0
+    assert states == [("suspended", 3), ("running", 3)]
+    assert run.suspensions == 1 and run.redeploys == 1
+    # Both DPIDs written before the checkpoint were re-sent after the drop
+    assert run.reapplied == 2 and run.downtime > 0
+    assert [result.ok for result in run.results] == [True] * 4
+    assert sim.dpid_values() == {"DP_ID_HMI_ZPM_ANZEIGEID": "0", "DP_ID_B_ACC_STATUSICON": "5",
+                                 "DP_ID_B_TA_AKTIV_HMI": "1"}
+
+
+def test_preset_is_abandoned_when_the_device_does_not_return(client, sim):
+    sim.set_connection("disconnected")
+    states = []
+    run = client.run_preset(STEPS, on_state=lambda run: states.append(run.state), resume_timeout=0.3)
+    assert run.state == "abandoned" and states == ["suspended", "abandoned"]
+    # Only the step that hit the drop is reported
+    assert run.checkpoint == 0 and run.failures == 1 and len(run.results) == 1
+
+
+def test_without_resume_every_step_fails_on_its_own(client, sim):
+    sim.set_connection("disconnected")
+    run = client.run_preset(STEPS, resume=False)
+    assert run.state == "done" and run.suspensions == 0
+    assert run.failures == 4 and run.checkpoint == len(STEPS)
+
+
+def test_cancel_ends_a_suspended_preset(client, sim):
+    sim.set_connection("disconnected")
+    suspended = threading.Event()
+    run = client.start_preset(STEPS, resume_timeout=30,
+                              on_state=lambda run: run.state == "suspended" and suspended.set())
+    assert suspended.wait(10)
+    run.cancel()
+    assert run.wait(10)
+    assert run.cancelled and run.state == "done"
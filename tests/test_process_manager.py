@@ -0,0 +1,59 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import process_manager
+from process_manager import ProcessManager
+
+from test_host_jobs import _wait_gone
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="POSIX commands")
+
+
+def test_max_children_serializes_runs():
+    manager = ProcessManager(max_children=1)
+    spans = []
+
+    def run():
+        started = time.monotonic()
+        process, _, _ = manager.run(["sleep", "0.3"])
+        spans.append((started, time.monotonic(), process.returncode))
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert [returncode for _, _, returncode in spans] == [0, 0]
+    # The second child only starts once the first has finished
+    assert time.monotonic() - started >= 0.6
+    assert manager.counts() == {"live": 0, "leaked": 0, "spawned": 2, "killed": 0, "reaped_late": 0}
+
+
+def test_timeout_kills_and_reaps_the_process_tree():
+    manager = ProcessManager()
+    with pytest.raises(subprocess.TimeoutExpired) as excinfo:
+        manager.run(["sh", "-c", "sleep 30 & echo $!; sleep 30"], timeout=0.5, stdout=subprocess.PIPE)
+    child = int(excinfo.value.output.split()[0])
+    assert _wait_gone(child)
+    assert manager.counts() == {"live": 0, "leaked": 0, "spawned": 1, "killed": 1, "reaped_late": 0}
+    # The slot was given back
+    assert manager.run(["true"], timeout=5)[0].returncode == 0
+
+
+def test_leaked_processes_are_reaped_in_the_background(monkeypatch):
+    monkeypatch.setattr(process_manager, "LEAK_POLL_SECONDS", 0.05)
+    manager = ProcessManager()
+    process = manager.spawn(["sleep", "30"])
+    manager._add_leak(process)
+    assert manager.counts()["leaked"] == 1
+    deadline = time.monotonic() + 5
+    while manager.counts()["leaked"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert process.poll() is not None
+    counts = manager.counts()
+    assert counts["leaked"] == 0 and counts["reaped_late"] == 1
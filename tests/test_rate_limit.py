@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from rate_limit import RateLimiter, TokenBucket, parse_dpid_limit, parse_limit
+
+
+def test_parse_limits():
+    assert parse_limit("20") == (20.0, 20.0)
+    assert parse_limit("0.5") == (0.5, 1.0)
+    assert parse_limit("20/5") == (20.0, 5.0)
+    assert parse_dpid_limit("DP_ID_HMI_*=10/2") == ("DP_ID_HMI_*", (10.0, 2.0))
+    for text in ("0", "5/0", "-1"):
+        with pytest.raises(ValueError):
+            parse_limit(text)
+    with pytest.raises(ValueError):
+        parse_dpid_limit("10/2")
+
+
+def test_token_bucket_goes_into_debt_and_refills():
+    bucket = TokenBucket(rate=10, burst=5)
+    now = bucket.updated
+    assert bucket.reserve(5, now) == 0.0
+    assert bucket.reserve(2, now) == pytest.approx(0.2)  # two tokens owed at 10/s
+    assert bucket.level(now + 0.2) == pytest.approx(0.0, abs=1e-9)
+    assert bucket.level(now + 10) == 5.0  # capped at burst
+    assert bucket.writes == 7
+
+
+def test_limiter_groups_dpids_by_first_matching_pattern():
+    limiter = RateLimiter(dpids={"DP_ID_HMI_ZPM_ANZEIGEID": (5, 1), "DP_ID_HMI_*": (50, 10)})
+    assert limiter.group_of("DP_ID_HMI_ZPM_ANZEIGEID") == "DP_ID_HMI_ZPM_ANZEIGEID"
+    assert limiter.group_of("DP_ID_HMI_OTHER") == "DP_ID_HMI_*"
+    assert limiter.group_of("DP_ID_CAN_SPEED") is None
+    assert not RateLimiter().enabled
+
+
+def test_split_and_max_repeats_respect_bursts():
+    limiter = RateLimiter(device=(100, 4), dpids={"DP_A": (10, 2)})
+    names = ["DP_A", "DP_B", "DP_A", "DP_A", "DP_B", "DP_B", "DP_B"]
+    runs = limiter.split(names, size=50)
+    assert runs == [(0, 3), (3, 7)]
+    for start, end in runs:
+        assert end - start <= 4 and names[start:end].count("DP_A") <= 2
+    assert limiter.max_repeats(["DP_A", "DP_B"]) == 2
+    assert RateLimiter().max_repeats(["DP_A"]) is None
+
+
+def test_acquire_waits_once_the_burst_is_spent():
+    limiter = RateLimiter(device=(20, 2))
+    assert limiter.acquire("dev", ["DP_A", "DP_A"]) == 0.0
+    started = time.monotonic()
+    waited = limiter.acquire("dev", ["DP_A"])
+    assert waited == pytest.approx(0.05, abs=0.01)
+    assert time.monotonic() - started >= 0.04
+    # Devices have separate buckets
+    assert limiter.acquire("other", ["DP_A", "DP_A"]) == 0.0
+    rows = {row["key"]: row for row in limiter.snapshot()}
+    assert rows["dev"]["writes"] == 3 and rows["dev"]["waits"] == 1
+
+
+def test_client_writes_are_paced_by_the_limiter(sim):
+    from fpk_client import FpkClient
+
+    client = FpkClient(rate_limiter=RateLimiter(dpids={"DP_ID_HMI_ZPM_ANZEIGEID": (20, 1)}))
+    try:
+        client.ensure_script()
+        started = time.monotonic()
+        results = client.send_many([("DP_ID_HMI_ZPM_ANZEIGEID", str(value)) for value in range(4)])
+        elapsed = time.monotonic() - started
+    finally:
+        client.close()
+    assert all(result.ok for result in results)
+    assert elapsed >= 0.14  # three writes beyond the burst at 20/s
+    assert sim.dpid_values()["DP_ID_HMI_ZPM_ANZEIGEID"] == "3"
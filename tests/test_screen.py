@@ -0,0 +1,62 @@
+import json
+import os
+
+import fpk_screen
+from fpk_screen import Image, Mask, ScreenVerifier, compare, decode_png, decode_screencap, encode_png
+from fpk_sim.screen import STATUS_HEIGHT, clock_region, popup_region, raw_frame
+from fpk_sim.state import new_state
+
+
+def test_raw_screencap_and_png_round_trip():
+    state = new_state()
+    state["dpids"]["DP_ID_HMI_ZPM_ANZEIGEID"] = "42490"
+    image = decode_screencap(raw_frame(state, now=0))
+    assert image.size == (480, 180)
+    assert decode_png(encode_png(image)).pixels == image.pixels
+    assert decode_screencap(encode_png(image)).pixels == image.pixels
+
+
+def test_mask_regions_and_ignored_areas():
+    mask = Mask(100, 50, regions=[(0, 0, 60, 50), (40, 0, 60, 50)], ignore=[(10, 10, 20, 5), (-5, -5, 10, 10)])
+    assert mask.pixels == 100 * 50 - 20 * 5 - 5 * 5
+
+    plain = Image(4, 2, bytes(24))
+    changed = Image(4, 2, bytes(3) + b"\x10\x00\x00" + b"\xff\x00\x00" + bytes(15))
+    assert compare(changed, plain, Mask(4, 2), tolerance=24) == (1, 8)
+    assert compare(changed, plain, Mask(4, 2, ignore=[(2, 0, 1, 1)]), tolerance=24) == (0, 7)
+
+
+def test_verify_against_a_recorded_reference(client, sim, tmp_path):
+    refs = tmp_path / "refs"
+    verifier = ScreenVerifier(client, str(refs), settle=0)
+    assert client.send_signal("DP_ID_HMI_ZPM_ANZEIGEID", "42490").ok
+    path = verifier.record("popup")
+    with open(os.path.join(refs, "popup.json"), "w", encoding="utf-8") as f:
+        json.dump({"ignore": [list(clock_region(480, 180))]}, f)
+
+    check = verifier.verify("popup")
+    assert check.passed and check.changed == 0 and check.error is None
+    assert verifier.verify("popup").passed and verifier.references.hits == 1
+
+    # A different popup value recolors the popup box and the status strip: a failure, saved for inspection
+    assert client.send_signal("DP_ID_HMI_ZPM_ANZEIGEID", "42493").ok
+    check = verifier.verify("popup")
+    _, _, width, height = popup_region(480, 180)
+    assert not check.passed and check.changed == width * height + 480 * STATUS_HEIGHT
+    assert check.saved_path and os.path.exists(check.saved_path)
+    assert os.path.exists(path)
+
+    missing = verifier.verify("no_such_reference")
+    assert missing.passed is None and "No reference image" in missing.error
+
+
+def test_cli_records_and_verifies(sim, tmp_path, capsys):
+    refs = str(tmp_path / "refs")
+    common = ["--refs", refs, "--settle", "0"]
+    assert fpk_screen.main(common + ["record", "adas", "--preset", "adas"]) == 0
+    with open(os.path.join(refs, "adas.json"), "w", encoding="utf-8") as f:
+        json.dump({"ignore": [list(clock_region(480, 180))]}, f)
+    assert fpk_screen.main(common + ["verify", "adas"]) == 0
+    assert fpk_screen.main(common + ["verify", "adas", "--preset", "navigation"]) == 1
+    assert fpk_screen.main(common + ["list"]) == 0
+    assert capsys.readouterr().out.splitlines()[-1] == "adas"
@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from fpk_sim.shell import FakeShell, parse_dpid_error
+from fpk_sim.state import StateStore
+
+
+@pytest.fixture
+def store(sim):
+    return sim.store
+
+
+def _shell(store, stdin=None):
+    out, err = [], []
+    return FakeShell(store, out.append, err.append, stdin), out, err
+
+
+def test_shell_connectors_redirects_and_exit(store):
+    shell, out, err = _shell(store)
+    assert shell.run("false && echo skipped || echo fallback") == 0
+    assert shell.run("echo hidden > /dev/null; echo $?") == 0
+    assert shell.run("echo logged > /tmp/log.txt; cat /tmp/missing 2>&1") == 1
+    assert shell.run("exit 7; echo never") == 7
+    assert "".join(out) == "fallback\n0\ncat: /tmp/missing: No such file or directory\n"
+    assert err == []
+    assert store.load()["files"]["/tmp/log.txt"]["content"] == "logged\n"
+
+
+def test_ipc_sender_writes_and_rejects_unknown_dpids(sim, store):
+    shell, out, _ = _shell(store)
+    assert shell.run("IpcSender --dpid DP_ID_HMI_ZPM_ANZEIGEID 0 42490") == 0
+    assert shell.run("IpcSender --dpid DP_ID_NOT_IN_LUT 0 1") == 0
+    assert "".join(out) == parse_dpid_error("DP_ID_NOT_IN_LUT")
+    assert sim.dpid_values() == {"DP_ID_HMI_ZPM_ANZEIGEID": "42490"}
+    counters = sim.snapshot()["counters"]
+    assert counters["ipc_writes"] == 2 and counters["parse_errors"] == 1
+
+    sim.configure(ipc_sender=False)
+    shell, _, err = _shell(store)
+    assert shell.run("IpcSender --dpid DP_ID_HMI_ZPM_ANZEIGEID 0 1") == 127
+    assert "not found" in "".join(err)
+
+
+def test_fake_adb_reports_the_connection_state(sim):
+    devices = subprocess.run(["adb", "devices"], capture_output=True, text=True, timeout=30)
+    assert "ABC-0123456789\tdevice" in devices.stdout
+    sim.set_connection("unauthorized")
+    shell = subprocess.run(["adb", "-s", "ABC-0123456789", "shell", "echo", "hi"], capture_output=True, text=True,
+                           timeout=30)
+    assert shell.returncode != 0 and "unauthorized" in shell.stderr
+
+
+def test_state_lock_serializes_concurrent_writers(store):
+    def bump():
+        for _ in range(20):
+            with store.locked() as state:
+                state["counters"]["adb_calls"] += 1
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert store.load()["counters"]["adb_calls"] == 80
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="dead-holder detection is POSIX only")
+def test_a_lock_left_by_a_killed_process_is_broken(store):
+    holder = subprocess.Popen(["true"])
+    holder.wait()
+    with open(store.lock_path, "w", encoding="ascii") as f:
+        f.write(str(holder.pid))
+    with store.locked() as state:
+        state["counters"]["adb_calls"] = 5
+    assert not os.path.exists(store.lock_path)
+    assert StateStore(store.path).load()["counters"]["adb_calls"] == 5
+
+
+def test_repeat_block_matches_what_the_simulator_interprets():
+    # The simulator does not run the repeat loop as sh would; it recognises these lines of the generated script
+    from fpk_client import MFL_SCRIPT
+    from fpk_sim import shell
+
+    assert shell._MFL_REPEAT.search(MFL_SCRIPT)
+    assert shell._MFL_REEXEC.search(MFL_SCRIPT).group(1) == "sh "
+    assert shell._MFL_REPEAT_RC.search(MFL_SCRIPT)
+    assert shell._MFL_VERSION.search(MFL_SCRIPT)
+    assert {verb for verb, _ in shell._MFL_BLOCK.findall(MFL_SCRIPT)} >= {"up", "ok", "signal", "batch"}
+
+
+def test_counted_press_runs_without_exec_permission_and_reports_failures(sim, client):
+    sim.configure(chmod_denied=True)
+    assert client.ensure_script()
+    before = sim.snapshot()["counters"]["ipc_writes"]
+    assert client.press("up", 3).ok
+    assert sim.snapshot()["counters"]["ipc_writes"] == before + 3 * 4
+
+    # Every press fails inside the script; the burst exits with the first failure's code
+    sim.configure(ipc_sender=False)
+    result = client.press("up", 2)
+    assert not result.ok and result.returncode == 127 and result.stdout == "up.\nup.\n"
@@ -0,0 +1,44 @@
+import threading
+import time
+
+from fpk_soak import SoakRun
+
+STEPS = [("DP_ID_HMI_ZPM_ANZEIGEID", "42490"), ("WAIT", "300"), ("DP_ID_B_ACC_STATUSICON", "5")]
+
+
+def _drop(sim, seconds):
+    """Make the simulated device disappear for seconds, as an injected disconnect does."""
+    with sim.store.locked() as state:
+        state["disconnected_until"] = time.time() + seconds
+
+
+def test_soak_loops_the_preset(client, sim):
+    progress = []
+    soak = SoakRun(client, STEPS, iterations=3, on_progress=progress.append)
+    report = soak.run()
+    assert report["state"] == "done"
+    assert report["iterations"] == 3 and report["clean_iterations"] == 3
+    assert report["steps_ok"] == 6 and report["steps_failed"] == 0
+    assert [entry["iterations"] for entry in progress] == [1, 2, 3]
+    assert len(report["samples"]) >= 2
+
+
+def test_soak_rides_out_a_disconnect(client, sim):
+    assert client.ensure_script()
+    soak = SoakRun(client, STEPS, iterations=1, reconnect_timeout=30)
+    threading.Timer(0.1, _drop, (sim, 1.0)).start()  # inside the WAIT step
+    soak.start().wait(60)
+    report = soak.report()
+    assert report["state"] == "done"
+    assert report["iterations"] == 1 and report["steps_failed"] == 0
+    assert report["disconnects"] == 1 and report["downtime"] > 0
+    assert sim.dpid_values() == {"DP_ID_HMI_ZPM_ANZEIGEID": "42490", "DP_ID_B_ACC_STATUSICON": "5"}
+
+
+def test_soak_gives_up_when_the_device_stays_away(client, sim):
+    sim.set_connection("disconnected")
+    soak = SoakRun(client, STEPS, iterations=2, reconnect_timeout=0.3)
+    report = soak.run()
+    assert report["state"] == "gave_up"
+    assert report["iterations"] == 0 and report["disconnects"] == 1
+    assert report["steps_failed"] == 1 and len(report["failure_details"]) == 1
@@ -0,0 +1,45 @@
+import time
+
+from fpk_client import StatusCache, format_age
+
+
+def test_status_fills_the_cache_without_deploying(client, sim):
+    assert client.status_cache.is_stale()
+    assert client.status().ready
+    cache = client.status_cache
+    assert not cache.is_stale()
+    for check in StatusCache.CHECKS:
+        ok, message, checked_at = cache.get(check)
+        assert ok and message and cache.age(check) < 5
+    assert set(cache.to_dict()) == set(StatusCache.CHECKS)
+    assert sim.snapshot()["counters"]["ipc_writes"] == 0
+
+
+def test_a_disconnect_is_cached_for_every_dependent_check(client, sim):
+    sim.set_connection("disconnected")
+    assert not client.status().ready
+    assert client.status_cache.get("adb")[0]
+    assert not client.status_cache.get("device")[0]
+    assert not client.status_cache.get("shell")[0]
+    # Fresh failures answer writes without a device round trip
+    assert client.known_offline()
+
+
+def test_old_entries_are_stale():
+    cache = StatusCache()
+    now = time.time()
+    for check in StatusCache.CHECKS:
+        cache.update(check, True, "ok", checked_at=now)
+    assert not cache.is_stale(max_age=30)
+    cache.update("shell", True, "ok", checked_at=now - 60)
+    assert cache.is_stale(max_age=30)
+    assert cache.age("shell", now) == 60
+    assert StatusCache().age("shell") is None
+
+
+def test_format_age():
+    assert format_age(None) == "never"
+    assert format_age(1) == "just now"
+    assert format_age(42) == "42s ago"
+    assert format_age(180) == "3m ago"
+    assert format_age(3 * 3600) == "3h ago"
@@ -0,0 +1,22 @@
+import json
+
+import fpk_stress
+
+
+def test_stress_run_writes_through_the_simulator(sim, tmp_path):
+    out = tmp_path / "stress.json"
+    assert fpk_stress.main(["--signal", "DP_ID_HMI_ZPM_ANZEIGEID=0,1", "--rate", "40", "--duration", "0.5",
+                            "--batch-size", "5", "--out", str(out)]) == 0
+    report = json.loads(out.read_text(encoding="utf-8"))
+    assert report["sent"] > 0 and report["ok"] == report["sent"]
+    assert report["errors"] == {}
+    assert sim.snapshot()["counters"]["ipc_writes"] == report["ok"]
+
+
+def test_stress_aborts_when_the_device_never_becomes_ready(sim, tmp_path):
+    sim.set_connection("disconnected")
+    out = tmp_path / "stress.json"
+    assert fpk_stress.main(["--signal", "DP_ID_HMI_ZPM_ANZEIGEID=0", "--rate", "40", "--duration", "0.5",
+                            "--ready-timeout", "0.2", "--out", str(out)]) == 1
+    assert not out.exists()
+    assert sim.snapshot()["counters"]["ipc_writes"] == 0
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from fpk_trace import TRACER, Tracer
+
+
+@pytest.fixture
+def tracer():
+    TRACER.clear()
+    TRACER.enable()
+    yield TRACER
+    TRACER.disable()
+    TRACER.clear()
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    with tracer.span("work"):
+        pass
+    tracer.complete("work", 0.0, 1.0)
+    tracer.async_span("op", 0.0, 1.0, tracer.new_operation())
+    assert tracer.new_operation() is None
+    assert tracer.to_json()["traceEvents"] == []
+
+
+def test_client_operations_export_as_chrome_trace(tracer, client, tmp_path):
+    assert client.ensure_script()
+    trace_id = tracer.new_operation()
+    entry = client.submit_signal("DP_ID_HMI_ZPM_ANZEIGEID", "1", trace_id=trace_id)
+    assert entry.wait(10) and entry.result.ok
+
+    path = tmp_path / "trace.json"
+    count = tracer.save(str(path))
+    data = json.loads(path.read_text(encoding="utf-8"))
+    events = data["traceEvents"]
+    assert count == len(events) and data["displayTimeUnit"] == "ms"
+
+    complete = [event for event in events if event["ph"] == "X"]
+    assert {"deploy", "deploy push", "spawn"} <= {event["name"] for event in complete}
+    assert all(event["dur"] >= 0 for event in complete)
+    # The queued write is one async track under the caller's operation id
+    queued = [event for event in events if event["ph"] in "be" and event["id"] == trace_id]
+    assert [event["ph"] for event in queued] == ["b", "e"]
+    assert queued[0]["name"] == "queued" and queued[0]["ts"] <= queued[1]["ts"]
+    names = {event["args"]["name"] for event in events if event["ph"] == "M"}
+    assert "MainThread" in names